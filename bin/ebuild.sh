@@ -2,14 +2,17 @@
 # Copyright 1999-2015 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
-# Prevent aliases from causing portage to act inappropriately.
-# Make sure it's before everything so we don't mess aliases that follow.
-unalias -a
+# When sourced by metadata-worker.sh, this has already been done.
+if [[ -z ${__PORTAGE_METADATA_WORKER} ]] ; then
+	# Prevent aliases from causing portage to act inappropriately.
+	# Make sure it's before everything so we don't mess aliases that follow.
+	unalias -a
 
-# Make sure this isn't exported to scripts we execute.
-unset BASH_COMPAT
+	# Make sure this isn't exported to scripts we execute.
+	unset BASH_COMPAT
 
-source "${PORTAGE_BIN_PATH}/isolated-functions.sh" || exit 1
+	source "${PORTAGE_BIN_PATH}/isolated-functions.sh" || exit 1
+fi
 
 # Set up the bash version compatibility level.  This does not disable
 # features when running with a newer version, but makes it so that when
@@ -73,6 +73,11 @@ __dump_trace() {
 	if (( n == 0 )) ; then
 		(( n = ${#FUNCNAME[@]} - 1 ))
 		(( p = ${#BASH_ARGV[@]} ))
+		# Skip metadata-worker.sh, which sources ebuild.sh.
+		if [[ ${BASH_SOURCE[${n}]##*/} == metadata-worker.sh ]] ; then
+			(( p -= ${BASH_ARGC[${n}]} ))
+			(( n-- ))
+		fi
 	fi
 
 	eerror "Call stack:"
@@ -165,7 +170,7 @@ die() {
 	# __dump_trace is useless when the main script is a helper binary
 	local main_index
 	(( main_index = ${#BASH_SOURCE[@]} - 1 ))
-	if has ${BASH_SOURCE[$main_index]##*/} ebuild.sh misc-functions.sh ; then
+	if has ${BASH_SOURCE[$main_index]##*/} ebuild.sh metadata-worker.sh misc-functions.sh ; then
 	__dump_trace 2 ${filespacing} ${linespacing}
 	eerror "  $(printf "%${filespacing}s" "${BASH_SOURCE[1]##*/}"), line $(printf "%${linespacing}s" "${BASH_LINENO[0]}"):  Called die"
 	eerror "The specific snippet of code:"
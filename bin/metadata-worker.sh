@@ -0,0 +1,54 @@
+#!/bin/bash
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+# Generate metadata for many ebuilds in one process, so that bash is
+# started and isolated-functions.sh is sourced only once, rather than
+# once per ebuild (see FEATURES=metadata-workers).
+#
+# Each request is read from stdin as a sequence of NUL-terminated
+# NAME=value environment entries, which is terminated by an empty entry.
+# The request is handled by sourcing ebuild.sh in a subshell, with
+# exactly the given environment, just like "ebuild.sh depend" would be
+# run for a single ebuild. The metadata is written to PORTAGE_PIPE_FD,
+# and it is followed by a NUL byte and the exit status of the subshell.
+
+# Prevent aliases from causing portage to act inappropriately.
+unalias -a
+
+# Make sure this isn't exported to scripts we execute.
+unset BASH_COMPAT
+
+source "${PORTAGE_BIN_PATH}/isolated-functions.sh" || exit 1
+
+# This tells ebuild.sh that isolated-functions.sh has been sourced. It
+# is not exported, so it is only visible in the subshells.
+__PORTAGE_METADATA_WORKER=1
+
+__request=()
+while IFS= read -r -d '' __entry ; do
+	if [[ -n ${__entry} ]] ; then
+		__request+=("${__entry}")
+		continue
+	fi
+
+	(
+		# Only keep the variables that isolated-functions.sh exports,
+		# unless they are overridden by the request.
+		for __entry in $(compgen -e) ; do
+			[[ ${__entry} == USERLAND || ${__entry} == XARGS ]] || \
+				unset "${__entry}" 2>/dev/null
+		done
+		for __entry in "${__request[@]}" ; do
+			export "${__entry}" 2>/dev/null
+		done
+		unset __entry __request
+		# Pass the phase as a positional parameter of this script
+		# rather than as an argument of source, so that the stack
+		# trace that is shown by die is correct.
+		set -- depend
+		source "${PORTAGE_BIN_PATH}/ebuild.sh"
+	) < /dev/null
+	printf '\0%d\n' $? >&${PORTAGE_PIPE_FD} || exit $?
+	__request=()
+done
@@ -0,0 +1,86 @@
+#!/usr/bin/python -b
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+"""
+Report the throughput of portage.checksum in MB/s for combinations of
+hash functions, by hashing a synthetic file:
+
+	misc/benchmarks/checksum.py --size 256 SHA256,SHA512 SHA256,SHA512,WHIRLPOOL
+
+Each combination is hashed with a separate pass over the file for each
+hash function, like perform_checksum does, and with a single pass over
+the file, with and without a thread for each hash function. The file
+is usually in the page cache, so the results show the cost of hashing
+rather than the cost of reading the file from disk.
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+	os.path.dirname(os.path.realpath(__file__)))), "pym"))
+
+import portage
+portage._internal_caller = True
+from portage import checksum
+
+default_combinations = ("SHA256", "SHA256,SHA512",
+	"SHA256,SHA512,WHIRLPOOL", "MD5,SHA1,SHA256,SHA512,RMD160")
+
+def separate(filename, hashes):
+	for x in hashes:
+		checksum.perform_checksum(filename, x)
+
+def single_pass(filename, hashes):
+	checksum._checksum_file(filename, hashes, threaded=False)
+
+def threaded(filename, hashes):
+	checksum._checksum_file(filename, hashes, threaded=True)
+
+def main(argv):
+	parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+	parser.add_argument("--size", type=int, default=128,
+		help="size of the file in MB")
+	parser.add_argument("combinations", nargs="*",
+		default=default_combinations, metavar="HASH[,HASH...]",
+		help="combinations of hash functions")
+	args = parser.parse_args(argv)
+
+	tmpdir = tempfile.mkdtemp()
+	try:
+		filename = os.path.join(tmpdir, "distfile")
+		with open(filename, "wb") as f:
+			block = os.urandom(1024 * 1024)
+			for i in range(args.size):
+				f.write(block)
+
+		print("file size: %d MB" % args.size)
+		for combination in args.combinations:
+			hashes = combination.split(",")
+			unavailable = [x for x in hashes
+				if x not in checksum.hashfunc_map]
+			if unavailable:
+				print("%s: unavailable: %s" %
+					(combination, " ".join(unavailable)))
+				continue
+			origins = ", ".join("%s=%s" % (x, checksum.get_hash_origin(x))
+				for x in hashes)
+			print("%s (%s):" % (combination, origins))
+			for func in (separate, single_pass, threaded):
+				start = time.time()
+				func(filename, hashes)
+				elapsed = time.time() - start
+				print("  %-12s %8.1f MB/s" % (func.__name__ + ":",
+					args.size / elapsed))
+	finally:
+		shutil.rmtree(tmpdir)
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -0,0 +1,108 @@
+#!/usr/bin/python -b
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+"""
+Compare the EventLoop and AsyncioEventLoop implementations, by running
+concurrent jobs that write output at regular intervals, like builds do:
+
+	misc/benchmarks/event_loop.py --jobs 32
+
+The output of each job is read with a PipeReader, and the exit status
+is collected with a child watch. Meanwhile, a timeout measures the
+wakeup latency of the loop, which is the delay between the scheduled
+and the actual time of each call. CPU time is the user and system time
+of this process, which excludes the jobs.
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+	os.path.dirname(os.path.realpath(__file__)))), "pym"))
+
+import portage
+portage._internal_caller = True
+from portage.util._async.PopenProcess import PopenProcess
+from portage.util._eventloop.AsyncioEventLoop import AsyncioEventLoop
+from portage.util._eventloop.EventLoop import EventLoop
+from _emerge.PipeReader import PipeReader
+
+_job_cmd = "for i in $(seq %d) ; do echo line $i ; sleep %s ; done"
+
+def run(event_loop, args):
+	latencies = []
+	interval = args.interval
+	def timeout_cb():
+		now = time.time()
+		latencies.append(now - timeout_cb.scheduled)
+		timeout_cb.scheduled = now + interval / 1000
+		return True
+	timeout_cb.scheduled = time.time() + interval / 1000
+	timeout_id = event_loop.timeout_add(interval, timeout_cb)
+
+	usage = resource.getrusage(resource.RUSAGE_SELF)
+	start = time.time()
+	jobs = []
+	for i in range(args.jobs):
+		master_fd, slave_fd = os.pipe()
+		reader = PipeReader(
+			input_files={"producer": os.fdopen(master_fd, 'rb', 0)},
+			scheduler=event_loop)
+		job = PopenProcess(pipe_reader=reader,
+			proc=subprocess.Popen(["bash", "-c", _job_cmd %
+			(args.lines, args.sleep)], stdout=slave_fd),
+			scheduler=event_loop)
+		job.start()
+		os.close(slave_fd)
+		jobs.append(job)
+
+	while any(job.returncode is None for job in jobs):
+		event_loop.iteration()
+	elapsed = time.time() - start
+	end_usage = resource.getrusage(resource.RUSAGE_SELF)
+	event_loop.source_remove(timeout_id)
+
+	cpu = (end_usage.ru_utime - usage.ru_utime) + \
+		(end_usage.ru_stime - usage.ru_stime)
+	latencies.sort()
+	return elapsed, cpu, latencies
+
+def main(argv):
+	parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+	parser.add_argument("--jobs", type=int, default=32,
+		help="number of concurrent jobs")
+	parser.add_argument("--lines", type=int, default=100,
+		help="number of lines that each job writes")
+	parser.add_argument("--sleep", default="0.02",
+		help="seconds between lines")
+	parser.add_argument("--interval", type=int, default=10,
+		help="timeout interval in milliseconds, for wakeup latency")
+	args = parser.parse_args(argv)
+
+	if not AsyncioEventLoop.available():
+		parser.error("AsyncioEventLoop is unavailable")
+
+	print("jobs: %d, lines per job: %d, sleep: %ss" %
+		(args.jobs, args.lines, args.sleep))
+	for name, constructor in (("EventLoop", EventLoop),
+		("AsyncioEventLoop", AsyncioEventLoop)):
+		event_loop = constructor()
+		elapsed, cpu, latencies = run(event_loop, args)
+		if constructor is AsyncioEventLoop:
+			event_loop.close()
+		print("%-17s wall %.3fs, cpu %.3fs, wakeup latency "
+			"median %.2fms, 99th percentile %.2fms, max %.2fms" %
+			(name + ":", elapsed, cpu,
+			1000 * latencies[len(latencies) // 2],
+			1000 * latencies[len(latencies) * 99 // 100],
+			1000 * latencies[-1]))
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -0,0 +1,78 @@
+#!/usr/bin/python -b
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+"""
+Report the throughput in MB/s of every available implementation of
+each hash function that portage.checksum supports on this host:
+
+	misc/benchmarks/hash_providers.py --size 64 SHA512 WHIRLPOOL
+
+The implementation that portage uses is marked with "*". Each
+implementation hashes random data in memory, for at most --max-time
+seconds, so that slow pure Python implementations finish quickly.
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+	os.path.dirname(os.path.realpath(__file__)))), "pym"))
+
+import portage
+portage._internal_caller = True
+from portage import checksum
+from portage.const import HASHING_BLOCKSIZE
+
+def measure(hashobject, block, size, max_time):
+	"""
+	Return the throughput of a hash object constructor in MB/s.
+	"""
+	hash_object = hashobject()
+	hashed = 0
+	start = time.time()
+	elapsed = 0
+	while hashed < size and elapsed < max_time:
+		hash_object.update(block)
+		hashed += len(block)
+		elapsed = time.time() - start
+	hash_object.hexdigest()
+	elapsed = time.time() - start
+	return hashed / (1024 * 1024) / elapsed
+
+def main(argv):
+	parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+	parser.add_argument("--size", type=int, default=64,
+		help="amount of data to hash in MB")
+	parser.add_argument("--max-time", type=float, default=5,
+		help="maximum number of seconds for each implementation")
+	parser.add_argument("hashes", nargs="*", metavar="HASH",
+		help="hash functions to benchmark (default: all)")
+	args = parser.parse_args(argv)
+
+	hashes = args.hashes or sorted(checksum._hash_providers)
+	block = os.urandom(HASHING_BLOCKSIZE)
+	size = args.size * 1024 * 1024
+
+	for hashtype in hashes:
+		if hashtype not in checksum._hash_providers:
+			print("%s: unavailable" % hashtype)
+			continue
+		active = checksum.get_hash_origin(hashtype)
+		for origin in checksum.get_hash_providers(hashtype):
+			hashobject = checksum._hash_providers[hashtype][origin]
+			print("%-10s %s %-10s %10.1f MB/s%s" % (hashtype,
+				"*" if origin == active else " ", origin,
+				measure(hashobject, block, size, args.max_time),
+				" (unaccelerated)"
+				if origin in checksum._unaccelerated_origins else ""))
+		if active not in checksum._hash_providers[hashtype]:
+			print("%-10s * %-10s %15s" % (hashtype, active,
+				"not measured"))
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -0,0 +1,144 @@
+#!/usr/bin/python -b
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+"""
+Compare the sqlite metadata cache module with flat_hash, which is the
+default module for the depcache, by writing and reading a synthetic tree
+of cache entries:
+
+	misc/benchmarks/metadata_cache.py --entries 40000
+
+Entries are written like emerge --regen writes them, both with a commit
+for each entry and with batched commits. Full-tree reads look up every
+entry of the tree like dependency calculation does, with writable and
+readonly (memory-mapped) sqlite connections. Readers run concurrently
+with a writer that rewrites every entry, in order to show that they
+don't block each other.
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+	os.path.dirname(os.path.realpath(__file__)))), "pym"))
+
+import portage
+portage._internal_caller = True
+from portage.cache import flat_hash, sqlite
+from portage.dbapi import dbapi
+
+def make_entries(count):
+	entries = []
+	for i in range(count):
+		cpv = "cat-%d/pkg%d-1.%d" % (i % 150, i // 3, i % 3)
+		entries.append((cpv, {
+			"DEPEND": " ".join(">=dev-libs/lib-%d-1.0" % ((i + j) % 500)
+				for j in range(8)),
+			"RDEPEND": "${DEPEND} virtual/pkg-%d" % (i % 50),
+			"DESCRIPTION": "Synthetic package number %d" % i,
+			"EAPI": "6",
+			"HOMEPAGE": "https://example.org/pkg-%d" % i,
+			"IUSE": " ".join("+flag%d" % j for j in range(i % 10)),
+			"KEYWORDS": "~alpha amd64 arm ~hppa ~ia64 ppc ~sparc x86",
+			"LICENSE": "GPL-2",
+			"SLOT": "0",
+			"SRC_URI": "https://example.org/pkg-%d-1.0.tar.gz" % i,
+			"_eclasses_": {},
+			"_md5_": "%032x" % i,
+			"_mtime_": 1400000000 + i,
+		}))
+	return entries
+
+def write(cache, entries, sync_rate):
+	cache.sync(sync_rate)
+	start = time.time()
+	for cpv, values in entries:
+		cache[cpv] = values
+	cache.sync()
+	return time.time() - start
+
+def read(cache):
+	start = time.time()
+	count = 0
+	for cpv in cache:
+		cache[cpv]
+		count += 1
+	return time.time() - start, count
+
+def concurrent_read(constructor, entries, readers):
+	"""
+	Fork readers that read the full tree while the parent rewrites every
+	entry, and return the elapsed time of the writer and the total
+	elapsed time, which includes the slowest reader.
+	"""
+	pids = []
+	start = time.time()
+	for i in range(readers):
+		pid = os.fork()
+		if pid == 0:
+			try:
+				read(constructor(readonly=True))
+			finally:
+				os._exit(0)
+		pids.append(pid)
+	write_time = write(constructor(), entries, 1000)
+	for pid in pids:
+		os.waitpid(pid, 0)
+	return write_time, time.time() - start
+
+def main(argv):
+	parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+	parser.add_argument("--entries", type=int, default=40000,
+		help="number of cache entries")
+	parser.add_argument("--readers", type=int, default=4,
+		help="number of concurrent readers")
+	args = parser.parse_args(argv)
+
+	entries = make_entries(args.entries)
+	tmpdir = tempfile.mkdtemp()
+	try:
+		def flat_hash_cache(readonly=False):
+			return flat_hash.database(tmpdir, "flat_hash",
+				dbapi._known_keys, readonly=readonly)
+
+		def sqlite_cache(readonly=False):
+			return sqlite.database(tmpdir, "sqlite",
+				dbapi._known_keys, readonly=readonly)
+
+		print("entries: %d" % len(entries))
+		print("write flat_hash:         %.3fs" %
+			write(flat_hash_cache(), entries, 0))
+		print("write sqlite, batched:   %.3fs" %
+			write(sqlite_cache(), entries, 1000))
+		sample = entries[:max(1, len(entries) // 10)]
+		print("write sqlite, unbatched: %.3fs (%d entries)" %
+			(write(sqlite_cache(), sample, 0), len(sample)))
+
+		for name, cache in (
+			("flat_hash", flat_hash_cache(readonly=True)),
+			("sqlite", sqlite_cache()),
+			("sqlite, readonly", sqlite_cache(readonly=True))):
+			elapsed, count = read(cache)
+			print("full-tree read %-17s %.3fs (%d entries)" %
+				(name + ":", elapsed, count))
+
+		if args.readers:
+			for name, constructor in (("flat_hash", flat_hash_cache),
+				("sqlite", sqlite_cache)):
+				write_time, elapsed = concurrent_read(constructor,
+					entries, args.readers)
+				print("%d readers and a writer, %-10s writer %.3fs, "
+					"total %.3fs" % (args.readers, name + ":",
+					write_time, elapsed))
+	finally:
+		shutil.rmtree(tmpdir)
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
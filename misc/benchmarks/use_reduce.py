@@ -0,0 +1,93 @@
+#!/usr/bin/python -b
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+"""
+Compare the cached use_reduce with the uncached implementation, using the
+dependency strings from the md5-cache of a repository snapshot:
+
+	misc/benchmarks/use_reduce.py /usr/portage
+
+Every dependency string is evaluated with the IUSE defaults of its ebuild,
+and the whole set is evaluated several times, since dependency calculation
+evaluates the same strings repeatedly.
+"""
+
+from __future__ import print_function
+
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+	os.path.dirname(os.path.realpath(__file__)))), "pym"))
+
+import portage
+portage._internal_caller = True
+from portage import _encodings
+from portage.dep import Atom, use_reduce, _use_reduce, _use_reduce_cache
+from portage.exception import InvalidDependString
+
+_dep_keys = ("DEPEND", "RDEPEND", "PDEPEND")
+
+def load_entries(repo, limit):
+	cache_dir = os.path.join(repo, "metadata", "md5-cache")
+	entries = []
+	for cat in sorted(os.listdir(cache_dir)):
+		cat_dir = os.path.join(cache_dir, cat)
+		if not os.path.isdir(cat_dir):
+			continue
+		for pf in sorted(os.listdir(cat_dir)):
+			with io.open(os.path.join(cat_dir, pf), mode="r",
+				encoding=_encodings["repo.content"],
+				errors="replace") as f:
+				metadata = dict(line.rstrip("\n").split("=", 1)
+					for line in f if "=" in line)
+			use = frozenset(x[1:] for x in
+				metadata.get("IUSE", "").split() if x[:1] == "+")
+			for k in _dep_keys:
+				depstr = metadata.get(k)
+				if depstr:
+					entries.append((depstr, use, metadata.get("EAPI", "0")))
+			if limit and len(entries) >= limit:
+				return entries
+	return entries
+
+def run(func, entries, passes):
+	start = time.time()
+	for i in range(passes):
+		for depstr, use, eapi in entries:
+			try:
+				func(depstr, uselist=use, eapi=eapi, token_class=Atom)
+			except InvalidDependString:
+				pass
+	return time.time() - start
+
+def main(argv):
+	parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+	parser.add_argument("repo", help="repository with metadata/md5-cache")
+	parser.add_argument("--passes", type=int, default=5,
+		help="number of times that all strings are evaluated")
+	parser.add_argument("--limit", type=int, default=0,
+		help="maximum number of dependency strings")
+	args = parser.parse_args(argv)
+
+	entries = load_entries(args.repo, args.limit)
+	if len(entries) > _use_reduce_cache.max_size:
+		print("note: %d strings exceed the cache size of %d" %
+			(len(entries), _use_reduce_cache.max_size))
+
+	uncached = run(_use_reduce, entries, args.passes)
+	cached = run(use_reduce, entries, args.passes)
+	print("dependency strings: %d, passes: %d" %
+		(len(entries), args.passes))
+	print("uncached: %.3fs" % uncached)
+	print("cached:   %.3fs (%d hits, %d misses)" %
+		(cached, _use_reduce_cache.hits, _use_reduce_cache.misses))
+	if cached:
+		print("speedup:  %.2fx" % (uncached / cached))
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
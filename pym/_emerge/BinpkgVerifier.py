@@ -1,4 +1,4 @@
-# Copyright 1999-2013 Gentoo Foundation
+# Copyright 1999-2016 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 import errno
@@ -8,6 +8,7 @@ import sys
 from _emerge.CompositeTask import CompositeTask
 import portage
 from portage import os
+from portage.cache.index.digest_cache import get_digest_cache
 from portage.checksum import (_apply_hash_filter,
 	_filter_unaccelarated_hashes, _hash_filter)
 from portage.output import EOutput
@@ -15,7 +16,8 @@ from portage.util._async.FileDigester import FileDigester
 from portage.package.ebuild.fetch import _checksum_failure_temp_file
 
 class BinpkgVerifier(CompositeTask):
-	__slots__ = ("logfile", "pkg", "_digests", "_pkg_path")
+	__slots__ = ("logfile", "pkg", "_digest_cache", "_digests", "_pkg_path",
+		"_stat")
 
 	def _start(self):
 
@@ -35,7 +37,7 @@ class BinpkgVerifier(CompositeTask):
 		self._digests = digests
 
 		try:
-			size = os.stat(self._pkg_path).st_size
+			self._stat = os.stat(self._pkg_path)
 		except OSError as e:
 			if e.errno not in (errno.ENOENT, errno.ESTALE):
 				raise
@@ -46,14 +48,25 @@ class BinpkgVerifier(CompositeTask):
 			self._async_wait()
 			return
 		else:
+			size = self._stat.st_size
 			if size != digests["size"]:
 				self._digest_exception("size", size, digests["size"])
 				self.returncode = 1
 				self._async_wait()
 				return
 
+		hash_names = [k for k in digests if k != "size"]
+		self._digest_cache = get_digest_cache(bintree.settings,
+			bintree.pkgdir)
+		if self._digest_cache is not None:
+			cached = self._digest_cache.get(self._stat, hash_names)
+			if len(cached) == len(hash_names):
+				self.returncode = self._check_digests(cached)
+				self._async_wait()
+				return
+
 		self._start_task(FileDigester(file_path=self._pkg_path,
-			hash_names=(k for k in digests if k != "size"),
+			hash_names=hash_names,
 			background=self.background, logfile=self.logfile,
 			scheduler=self.scheduler),
 			self._digester_exit)
@@ -64,19 +77,28 @@ class BinpkgVerifier(CompositeTask):
 			self.wait()
 			return
 
-		for hash_name in digester.hash_names:
-			if digester.digests[hash_name] != self._digests[hash_name]:
+		if self._digest_cache is not None:
+			self._digest_cache.update(self._pkg_path, self._stat,
+				digester.digests)
+
+		self.returncode = self._check_digests(digester.digests)
+		self.wait()
+
+	def _check_digests(self, digests):
+		"""
+		Compare the given digests with the expected ones, and return
+		os.EX_OK if they match, or 1 otherwise.
+		"""
+		for hash_name in sorted(digests):
+			if digests[hash_name] != self._digests[hash_name]:
 				self._digest_exception(hash_name,
-					digester.digests[hash_name], self._digests[hash_name])
-				self.returncode = 1
-				self.wait()
-				return
+					digests[hash_name], self._digests[hash_name])
+				return 1
 
 		if self.pkg.root_config.settings.get("PORTAGE_QUIET") != "1":
 			self._display_success()
 
-		self.returncode = os.EX_OK
-		self.wait()
+		return os.EX_OK
 
 	def _display_success(self):
 		stdout_orig = sys.stdout
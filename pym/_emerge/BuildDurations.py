@@ -0,0 +1,383 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from __future__ import unicode_literals
+
+import errno
+import hashlib
+import re
+import time
+
+from portage import os
+from portage import _encodings
+from portage import _unicode_decode
+from portage import _unicode_encode
+from portage.util import writemsg
+from portage.util._sqlite import SqliteDatabase
+from portage.versions import catpkgsplit
+
+class BuildDurations(SqliteDatabase):
+	"""
+	Estimates of package merge durations, in seconds.
+
+	If a filename is given, then the durations of the "build" (ebuild),
+	"binary" (binary package extraction), "merge" and "fetch" steps of
+	each package are recorded in an sqlite database, indexed by cpv and
+	by a hash of the enabled USE flags. The peak "memory" usage of builds
+	is recorded in the same way, in bytes instead of seconds. Lookups
+	prefer an exact match of the cpv and USE flags, then the most recent
+	record for the same cpv, then the most recent record for another
+	version of the same package.
+
+	Total durations can also be derived from the " >>> emerge" and
+	" ::: completed emerge" lines that emerge writes to emerge.log, which
+	are used for packages that don't have any records in the database.
+	They are imported into the database incrementally, so that only the
+	lines which have been appended since the previous import are read.
+	The most recent duration of each kind of step for each package is
+	also stored separately, so that mean() does not have to read all of
+	the records.
+
+	Since the database is only used for estimates, database errors are
+	reported and otherwise treated like missing records.
+	"""
+
+	kinds = ("binary", "build", "fetch", "memory", "merge")
+
+	_format_version = "2"
+
+	_start_re = re.compile(
+		r'^(\d+):\s+>>> emerge \(\d+ of \d+\) (\S+) to (.*)$')
+	_complete_re = re.compile(
+		r'^(\d+):\s+::: completed emerge \(\d+ of \d+\) (\S+) to (.*)$')
+
+	def __init__(self, filename=None):
+		SqliteDatabase.__init__(self, filename)
+		if filename is None:
+			self._db_module = None
+		self._cpv_durations = {}
+		self._cp_durations = {}
+
+	@staticmethod
+	def use_hash(use):
+		"""
+		Return a short hash of the given enabled USE flags.
+		"""
+		return hashlib.md5(_unicode_encode(" ".join(sorted(use)),
+			encoding=_encodings['repo.content'],
+			errors='strict')).hexdigest()[:16]
+
+	def load_emerge_log(self, log_path):
+		"""
+		Read durations from the given emerge.log file. A missing file
+		is silently ignored. If there is a database which the current user
+		can write, then the durations are imported into it, starting at the
+		offset where the previous import stopped, as long as the inode of
+		the file is the same. Otherwise, the whole file is read, and the
+		durations are only recorded for this instance.
+		"""
+		try:
+			f = open(_unicode_encode(log_path,
+				encoding=_encodings['fs'], errors='strict'), mode='rb')
+		except EnvironmentError as e:
+			if e.errno not in (errno.ENOENT, errno.ESTALE):
+				writemsg("!!! %s: %s\n" % (log_path, e), noiselevel=-1)
+			return
+
+		with f:
+			if self._db_module is not None and self._writable() and \
+				self._import_emerge_log(f):
+				return
+			f.seek(0)
+			for cpv, duration in self._parse_emerge_log(
+				self._emerge_log_lines(f, [0]), {}):
+				self.add(cpv, duration)
+
+	@staticmethod
+	def _emerge_log_lines(f, offset):
+		"""
+		Decode the complete lines that mention an emerge, starting at the
+		current position of f, and add the length of each complete line
+		to offset[0]. A trailing partial line is not consumed, since it
+		may be in the process of being written.
+		"""
+		for line in f:
+			if not line.endswith(b"\n"):
+				break
+			offset[0] += len(line)
+			# Most lines are irrelevant, so avoid decoding those.
+			if b"emerge (" in line:
+				yield _unicode_decode(line[:-1],
+					encoding=_encodings['content'], errors='replace')
+
+	def _parse_emerge_log(self, lines, started):
+		"""
+		Generate (cpv, duration) tuples from the given emerge.log lines.
+		The started dict maps (cpv, root) to the start times of merges that
+		have not completed yet, and it is updated in place, so that merges
+		which span two calls are also found.
+		"""
+		for line in lines:
+			m = self._start_re.match(line)
+			if m is not None:
+				started[(m.group(2), m.group(3))] = int(m.group(1))
+				continue
+			m = self._complete_re.match(line)
+			if m is not None:
+				start = started.pop((m.group(2), m.group(3)), None)
+				if start is not None:
+					yield (m.group(2), int(m.group(1)) - start)
+
+	def _import_emerge_log(self, f):
+		"""
+		Import the durations from the lines of emerge.log that have been
+		appended since the previous import.
+
+		@rtype: bool
+		@return: True if successful, and False otherwise
+		"""
+		st = os.fstat(f.fileno())
+		try:
+			connection = self._connect(create=True)
+			if connection is None:
+				return False
+			with connection:
+				info = dict(connection.execute("SELECT key, value FROM info "
+					"WHERE key IN ('emerge_log_inode', 'emerge_log_offset')"))
+				offset = 0
+				if info.get("emerge_log_inode") == "%s" % st.st_ino:
+					try:
+						offset = int(info.get("emerge_log_offset", 0))
+					except ValueError:
+						pass
+					if offset > st.st_size:
+						# The file has been truncated.
+						offset = 0
+
+				started = {}
+				for cpv, root, start in connection.execute(
+					"SELECT cpv, root, start FROM emerge_log_started"):
+					started[(cpv, root)] = start
+
+				f.seek(offset)
+				offset = [offset]
+				for cpv, duration in self._parse_emerge_log(
+					self._emerge_log_lines(f, offset), started):
+					cp = _cpv_getkey(cpv)
+					if cp is None or duration < 0:
+						continue
+					connection.execute("INSERT OR REPLACE INTO "
+						"emerge_log_cpv VALUES (?, ?)", (cpv, duration))
+					connection.execute("INSERT OR REPLACE INTO "
+						"emerge_log_cp VALUES (?, ?)", (cp, duration))
+
+				connection.execute("DELETE FROM emerge_log_started")
+				connection.executemany("INSERT INTO emerge_log_started "
+					"VALUES (?, ?, ?)", ((cpv, root, start)
+					for (cpv, root), start in started.items()))
+				connection.executemany("INSERT OR REPLACE INTO info "
+					"VALUES (?, ?)", (("emerge_log_inode", "%s" % st.st_ino),
+					("emerge_log_offset", "%s" % offset[0])))
+		except self._db_module.Error as e:
+			self._error(e)
+			return False
+		return True
+
+	def add(self, cpv, duration):
+		"""
+		Record the total duration of a merge of the given cpv, for this
+		instance only.
+		"""
+		cp = _cpv_getkey(cpv)
+		if cp is None or duration < 0:
+			return
+		self._cpv_durations[cpv] = duration
+		self._cp_durations[cp] = duration
+
+	def get(self, cpv, default=None):
+		"""
+		Return the total duration of a merge of the given cpv, according
+		to emerge.log, or default if there is no record of the package.
+		"""
+		duration = self._cpv_durations.get(cpv)
+		if duration is None:
+			rows = self._query("SELECT duration FROM emerge_log_cpv "
+				"WHERE cpv = ?", (cpv,))
+			if rows:
+				return rows[0][0]
+			cp = _cpv_getkey(cpv)
+			duration = self._cp_durations.get(cp)
+			if duration is None:
+				rows = self._query("SELECT duration FROM emerge_log_cp "
+					"WHERE cp = ?", (cp,))
+				if rows:
+					return rows[0][0]
+		if duration is None:
+			return default
+		return duration
+
+	def _error(self, e):
+		SqliteDatabase._error(self, e)
+		# Don't report the same problem repeatedly.
+		self._db_module = None
+
+	def _init_tables(self, connection):
+		connection.execute("CREATE TABLE durations "
+			"(cpv TEXT, use_hash TEXT, kind TEXT, cp TEXT, "
+			"duration REAL, total REAL, count INTEGER, "
+			"timestamp INTEGER, PRIMARY KEY (cpv, use_hash, kind))")
+		connection.execute("CREATE INDEX durations_cp "
+			"ON durations (cp, kind, timestamp)")
+		# The most recent duration of each kind for each package.
+		connection.execute("CREATE TABLE latest_durations "
+			"(cp TEXT, kind TEXT, duration REAL, timestamp INTEGER, "
+			"PRIMARY KEY (cp, kind))")
+		# Durations imported from emerge.log, and the start times of
+		# merges that had not completed at the time of the import.
+		connection.execute("CREATE TABLE emerge_log_cpv "
+			"(cpv TEXT PRIMARY KEY, duration REAL)")
+		connection.execute("CREATE TABLE emerge_log_cp "
+			"(cp TEXT PRIMARY KEY, duration REAL)")
+		connection.execute("CREATE TABLE emerge_log_started "
+			"(cpv TEXT, root TEXT, start INTEGER, "
+			"PRIMARY KEY (cpv, root))")
+
+	def record(self, cpv, kind, duration, use_hash="", timestamp=None):
+		"""
+		Record the duration of a step of a merge of the given cpv in
+		the database.
+
+		@param kind: one of the values of the kinds attribute
+		@type kind: str
+		@param use_hash: a hash from use_hash(), or "" if not applicable
+		@type use_hash: str
+		@rtype: bool
+		@return: True if successful, and False otherwise
+		"""
+		cp = _cpv_getkey(cpv)
+		if cp is None or duration < 0 or self._db_module is None:
+			return False
+		if timestamp is None:
+			timestamp = int(time.time())
+		try:
+			connection = self._connect(create=True)
+			if connection is None:
+				return False
+			with connection:
+				row = connection.execute("SELECT total, count "
+					"FROM durations WHERE cpv = ? AND use_hash = ? "
+					"AND kind = ?", (cpv, use_hash, kind)).fetchone()
+				total, count = row if row is not None else (0, 0)
+				connection.execute("INSERT OR REPLACE INTO durations "
+					"VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+					(cpv, use_hash, kind, cp, duration, total + duration,
+					count + 1, timestamp))
+				connection.execute("INSERT OR REPLACE INTO "
+					"latest_durations SELECT ?, ?, ?, ? WHERE NOT EXISTS "
+					"(SELECT 1 FROM latest_durations WHERE cp = ? AND "
+					"kind = ? AND timestamp > ?)",
+					(cp, kind, duration, timestamp, cp, kind, timestamp))
+		except self._db_module.Error as e:
+			self._error(e)
+			return False
+		return True
+
+	def lookup(self, cpv, kind, use_hash=None):
+		"""
+		Return the duration of a step of a merge of the given cpv,
+		according to the database, or None if there is no record.
+		"""
+		if use_hash is not None:
+			rows = self._query("SELECT duration FROM durations "
+				"WHERE cpv = ? AND use_hash = ? AND kind = ?",
+				(cpv, use_hash, kind))
+			if rows:
+				return rows[0][0]
+		rows = self._query("SELECT duration FROM durations "
+			"WHERE cpv = ? AND kind = ? ORDER BY timestamp DESC LIMIT 1",
+			(cpv, kind))
+		if not rows:
+			rows = self._query("SELECT duration FROM durations "
+				"WHERE cp = ? AND kind = ? ORDER BY timestamp DESC LIMIT 1",
+				(_cpv_getkey(cpv), kind))
+		if rows:
+			return rows[0][0]
+		return None
+
+	def estimate(self, cpv, kinds, use_hash=None, default=None):
+		"""
+		Return the total duration of the given kinds of steps of a merge
+		of the given cpv. If the database has no records of the package,
+		then the total duration from emerge.log is used if available,
+		and otherwise default is returned.
+		"""
+		durations = [self.lookup(cpv, kind, use_hash=use_hash)
+			for kind in kinds]
+		durations = [x for x in durations if x is not None]
+		if durations:
+			return sum(durations)
+		return self.get(cpv, default=default)
+
+	def mean(self, kinds=("build", "merge"), emerge_log=True):
+		"""
+		Return the mean total duration of the given kinds of steps over
+		all recorded packages, or None if there are no records. Total
+		durations from emerge.log are included if emerge_log is True.
+		"""
+		kinds = list(kinds)
+		placeholders = ", ".join("?" * len(kinds))
+		statement = "SELECT SUM(duration) AS total FROM latest_durations " + \
+			"WHERE kind IN (%s) GROUP BY cp" % placeholders
+		params = kinds
+		if emerge_log:
+			statement += " UNION ALL SELECT duration FROM emerge_log_cp " + \
+				"WHERE cp NOT IN (SELECT cp FROM latest_durations " + \
+				"WHERE kind IN (%s))" % placeholders
+			params = kinds + kinds
+		rows = self._query("SELECT SUM(total), COUNT(*) FROM (%s)" %
+			statement, params)
+		total, count = rows[0] if rows else (None, 0)
+		total = total or 0
+
+		if emerge_log:
+			# Durations that were only read into this instance.
+			for cp, duration in self._cp_durations.items():
+				if not self._query("SELECT 1 FROM latest_durations "
+					"WHERE cp = ? AND kind IN (%s) UNION ALL "
+					"SELECT 1 FROM emerge_log_cp WHERE cp = ?" % placeholders,
+					[cp] + kinds + [cp]):
+					total += duration
+					count += 1
+		if not count:
+			return None
+		return total / float(count)
+
+	def records(self, cp=None):
+		"""
+		Return a list of (cpv, use_hash, kind, duration, mean, count,
+		timestamp) tuples for the records of the given package, or for
+		all packages if cp is None.
+		"""
+		statement = "SELECT cpv, use_hash, kind, duration, " + \
+			"total / count, count, timestamp FROM durations"
+		params = ()
+		if cp is not None:
+			statement += " WHERE cp = ?"
+			params = (cp,)
+		return self._query(statement + " ORDER BY cpv, kind, use_hash",
+			params)
+
+	def __len__(self):
+		"""
+		Return the number of packages with durations from emerge.log.
+		"""
+		cps = set(self._cp_durations)
+		cps.update(row[0] for row in
+			self._query("SELECT cp FROM emerge_log_cp"))
+		return len(cps)
+
+def _cpv_getkey(cpv):
+	split = catpkgsplit(cpv)
+	if split is None:
+		return None
+	return split[0] + "/" + split[1]
@@ -1,4 +1,4 @@
-# Copyright 1999-2012 Gentoo Foundation
+# Copyright 1999-2016 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 import copy
@@ -10,6 +10,7 @@ from portage import os
 from portage import _encodings
 from portage import _unicode_encode
 from portage import _unicode_decode
+from portage.cache.index.digest_cache import get_digest_cache
 from portage.checksum import _hash_filter
 from portage.elog.messages import eerror
 from portage.package.ebuild.fetch import _check_distfile, fetch
@@ -59,6 +60,7 @@ class EbuildFetcher(ForkProcess):
 		hash_filter = _hash_filter(settings.get("PORTAGE_CHECKSUM_FILTER", ""))
 		if hash_filter.transparent:
 			hash_filter = None
+		digest_cache = get_digest_cache(settings, distdir)
 		stdout_orig = sys.stdout
 		stderr_orig = sys.stderr
 		global_havecolor = portage.output.havecolor
@@ -80,7 +82,8 @@ class EbuildFetcher(ForkProcess):
 						break
 					continue
 				ok, st = _check_distfile(os.path.join(distdir, filename),
-					mydigests, eout, show_errors=False, hash_filter=hash_filter)
+					mydigests, eout, show_errors=False, hash_filter=hash_filter,
+					digest_cache=digest_cache)
 				if not ok:
 					success = False
 					break
@@ -1,4 +1,4 @@
-# Copyright 1999-2013 Gentoo Foundation
+# Copyright 1999-2016 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 from _emerge.SubProcess import SubProcess
@@ -18,17 +18,21 @@ from portage.eapi import eapi_has_automatic_unpack_dependencies
 import errno
 import fcntl
 import io
+import signal
 
 class EbuildMetadataPhase(SubProcess):
 
 	"""
 	Asynchronous interface for the ebuild "depend" phase which is
-	used to extract metadata from the ebuild.
+	used to extract metadata from the ebuild. If a worker_pool (see
+	MetadataWorkerPool) is given, then the phase is run by one of its
+	workers instead of a new process, unless fd_pipes is given.
 	"""
 
 	__slots__ = ("cpv", "eapi_supported", "ebuild_hash", "fd_pipes",
-		"metadata", "portdb", "repo_path", "settings", "write_auxdb") + \
-		("_eapi", "_eapi_lineno", "_raw_metadata",)
+		"metadata", "portdb", "repo_path", "settings", "worker_pool",
+		"write_auxdb") + \
+		("_eapi", "_eapi_lineno", "_raw_metadata", "_worker")
 
 	_file_names = ("ebuild",)
 	_files_dict = slot_dict_class(_file_names, prefix="")
@@ -86,6 +90,11 @@ class EbuildMetadataPhase(SubProcess):
 				sys.__stderr__.flush()
 				break
 
+		if self.worker_pool is not None and self.fd_pipes is None:
+			self._start_worker_request(ebuild_path, debug, fd_pipes)
+			null_input.close()
+			return
+
 		self._files = self._files_dict()
 		files = self._files
 
@@ -131,6 +140,77 @@ class EbuildMetadataPhase(SubProcess):
 
 		self.pid = retval[0]
 
+	def _start_worker_request(self, ebuild_path, debug, fd_pipes):
+		retval = portage.doebuild(ebuild_path, "depend",
+			settings=self.settings, debug=debug,
+			mydbapi=self.portdb, tree="porttree",
+			fd_pipes=fd_pipes, returnpid=True,
+			_spawn_wrapper=self.worker_pool.spawn_wrapper)
+
+		if isinstance(retval, int):
+			# doebuild failed before spawning
+			self._set_returncode((self.pid, retval << 8))
+			self._async_wait()
+			return
+
+		self._worker = retval
+		self._raw_metadata = []
+		self._reg_id = self.scheduler.io_add_watch(retval.result_fd,
+			self._registered_events, self._worker_output_handler)
+		self._registered = True
+
+	def _worker_output_handler(self, fd, event):
+
+		eof = False
+		if event & self.scheduler.IO_IN:
+			while True:
+				try:
+					buf = os.read(fd, self._bufsize)
+				except OSError as e:
+					if e.errno not in (errno.EAGAIN,):
+						raise
+					break
+				else:
+					if not buf:
+						eof = True
+						break
+					self._raw_metadata.append(buf)
+
+		# The metadata is followed by a NUL byte and the exit status.
+		output = b''.join(self._raw_metadata)
+		self._raw_metadata = [output]
+		status_start = output.find(b'\0')
+		if status_start != -1 and output.endswith(b'\n'):
+			worker = self._worker
+			self._worker = None
+			self._raw_metadata = [output[:status_start]]
+			try:
+				status = int(output[status_start + 1:])
+			except ValueError:
+				self.worker_pool.discard(worker)
+				status = 1
+			else:
+				self.worker_pool.release(worker)
+			self._set_returncode((self.pid, status << 8))
+			self.wait()
+		elif eof or event & (self.scheduler.IO_HUP |
+			self._exceptional_events):
+			# The worker has died.
+			self.worker_pool.discard(self._worker)
+			self._worker = None
+			self._set_returncode((self.pid, 1 << 8))
+			self.wait()
+
+		return True
+
+	def _cancel(self):
+		if self._worker is not None:
+			self.worker_pool.discard(self._worker)
+			self._worker = None
+			self._set_returncode((self.pid, signal.SIGTERM))
+			self._async_wait()
+		SubProcess._cancel(self)
+
 	def _output_handler(self, fd, event):
 
 		if event & self.scheduler.IO_IN:
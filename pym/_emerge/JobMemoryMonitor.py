@@ -0,0 +1,157 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from __future__ import division
+
+import errno
+import os as _os
+
+from portage import os
+
+class JobMemoryMonitor(object):
+	"""
+	Sample the memory usage of running jobs from /proc, and decide
+	whether there is enough available memory to start another job. The
+	memory usage of a job is the sum of the resident set sizes of the
+	processes in its process tree, and its peak is recorded in the build
+	duration database as a "memory" record when the job succeeds. The
+	peak memory usage of a job that has not started yet is predicted
+	from the records of previous builds of the same package, or from
+	the mean of all records.
+	"""
+
+	_meminfo_path = "/proc/meminfo"
+	_proc_path = "/proc"
+
+	def __init__(self, build_durations):
+		self._build_durations = build_durations
+		self._page_size = _os.sysconf("SC_PAGE_SIZE")
+		self._default_peak = None
+		self._predicted = {}
+		self._current = {}
+		self._peaks = {}
+
+	@classmethod
+	def available(cls):
+		"""
+		Return True if the available memory can be determined.
+		"""
+		return cls._mem_available() is not None
+
+	@classmethod
+	def _mem_available(cls):
+		"""
+		Return MemAvailable from /proc/meminfo in bytes, or None if it
+		is unavailable.
+		"""
+		try:
+			with open(cls._meminfo_path) as f:
+				for line in f:
+					if line.startswith("MemAvailable:"):
+						return int(line.split()[1]) * 1024
+		except (EnvironmentError, IndexError, ValueError):
+			pass
+		return None
+
+	def _process_tree(self):
+		"""
+		Return a dict which maps the pid of each process to a tuple of
+		its parent pid and its resident set size in bytes.
+		"""
+		processes = {}
+		try:
+			pids = os.listdir(self._proc_path)
+		except OSError:
+			return processes
+		for pid in pids:
+			if not pid.isdigit():
+				continue
+			try:
+				with open(os.path.join(self._proc_path, pid, "stat")) as f:
+					stat = f.read()
+			except EnvironmentError as e:
+				# The process has exited.
+				if e.errno not in (errno.ENOENT, errno.ESRCH):
+					raise
+				continue
+			# The command name may contain spaces and parentheses.
+			fields = stat[stat.rfind(")") + 2:].split()
+			try:
+				processes[int(pid)] = (int(fields[1]),
+					int(fields[21]) * self._page_size)
+			except (IndexError, ValueError):
+				continue
+		return processes
+
+	def sample(self, jobs):
+		"""
+		Sample the memory usage of the given jobs. Their peaks are
+		remembered until job_exit() is called.
+
+		@param jobs: (pkg, pid) tuples, where pid is the root process of
+			the job, or None if the job has no running process
+		@type jobs: iterable
+		"""
+		processes = self._process_tree()
+		children = {}
+		for pid, (ppid, rss) in processes.items():
+			children.setdefault(ppid, []).append(pid)
+
+		current = {}
+		for pkg, pid in jobs:
+			rss = 0
+			stack = [pid] if pid in processes else []
+			while stack:
+				pid = stack.pop()
+				rss += processes[pid][1]
+				stack.extend(children.get(pid, ()))
+			current[pkg] = current.get(pkg, 0) + rss
+
+		for pkg, rss in current.items():
+			self._peaks[pkg] = max(rss, self._peaks.get(pkg, 0))
+		self._current = current
+
+	def job_exit(self, pkg, record):
+		"""
+		Forget about the given job, and record its peak memory usage
+		if record is True.
+		"""
+		self._current.pop(pkg, None)
+		peak = self._peaks.pop(pkg, None)
+		if record and peak:
+			durations = self._build_durations
+			durations.record(pkg.cpv, "memory", peak,
+				use_hash=durations.use_hash(pkg.use.enabled))
+
+	def predict(self, pkg):
+		"""
+		Return the predicted peak memory usage of the given package in
+		bytes, or 0 if there are no records.
+		"""
+		peak = self._predicted.get(pkg)
+		if peak is None:
+			if self._default_peak is None:
+				self._default_peak = self._build_durations.mean(
+					kinds=("memory",), emerge_log=False) or 0
+			durations = self._build_durations
+			peak = durations.lookup(pkg.cpv, "memory",
+				use_hash=durations.use_hash(pkg.use.enabled))
+			if peak is None:
+				peak = self._default_peak
+			self._predicted[pkg] = peak
+		return peak
+
+	def fits(self, pkg, running):
+		"""
+		Return True if there is enough available memory for the
+		predicted peak of the given package, after reserving the memory
+		that the given running packages are predicted to use in
+		addition to what they use currently.
+		"""
+		available = self._mem_available()
+		if available is None:
+			return True
+		for running_pkg in running:
+			available -= max(0, self.predict(running_pkg) -
+				self._current.get(running_pkg, 0))
+		return self.predict(pkg) <= available
@@ -21,7 +21,7 @@ if sys.hexversion >= 0x3000000:
 
 class JobStatusDisplay(object):
 
-	_bound_properties = ("curval", "failed", "running")
+	_bound_properties = ("critical_path", "curval", "failed", "running")
 
 	# Don't update the display unless at least this much
 	# time has passed, in units of seconds.
@@ -44,6 +44,7 @@ class JobStatusDisplay(object):
 		object.__setattr__(self, "xterm_titles", xterm_titles)
 		object.__setattr__(self, "maxval", 0)
 		object.__setattr__(self, "merges", 0)
+		object.__setattr__(self, "eta_time", None)
 		object.__setattr__(self, "_changed", False)
 		object.__setattr__(self, "_displayed", False)
 		object.__setattr__(self, "_last_display_time", 0)
@@ -172,6 +173,8 @@ class JobStatusDisplay(object):
 	def reset(self):
 		self.maxval = 0
 		self.merges = 0
+		# The estimated time of completion, as a time.time() value.
+		self.eta_time = None
 		for name in self._bound_properties:
 			object.__setattr__(self, name, 0)
 
@@ -208,6 +211,11 @@ class JobStatusDisplay(object):
 
 		return ", ".join(("%%.%df" % digits ) % x for x in avg)
 
+	def _duration_str(self, seconds):
+		minutes, seconds = divmod(int(seconds), 60)
+		hours, minutes = divmod(minutes, 60)
+		return "%d:%02d:%02d" % (hours, minutes, seconds)
+
 	def display(self):
 		"""
 		Display status on stdout, but only if something has
@@ -274,6 +282,21 @@ class JobStatusDisplay(object):
 			f.pop_style()
 			f.add_literal_data(" failed")
 
+		if self.critical_path:
+			# The estimated duration of the longest chain of merges
+			# that remain to be started.
+			f.add_literal_data(", critical path ")
+			f.push_style(number_style)
+			f.add_literal_data(self._duration_str(self.critical_path))
+			f.pop_style()
+
+		if self.eta_time is not None:
+			f.add_literal_data(", ETA ")
+			f.push_style(number_style)
+			f.add_literal_data(self._duration_str(
+				max(0, self.eta_time - time.time())))
+			f.pop_style()
+
 		padding = self._jobs_column_width - len(plain_output.getvalue())
 		if padding > 0:
 			f.add_literal_data(padding * " ")
@@ -1,15 +1,20 @@
-# Copyright 1999-2013 Gentoo Foundation
+# Copyright 1999-2016 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 import portage
 from portage import os
 from portage.dep import _repo_separator
 from _emerge.EbuildMetadataPhase import EbuildMetadataPhase
+from _emerge.MetadataWorkerPool import MetadataWorkerPool
 from portage.cache.cache_errors import CacheError
 from portage.util._async.AsyncScheduler import AsyncScheduler
 
 class MetadataRegen(AsyncScheduler):
 
+	# Number of cache entries that are written by each transaction of
+	# cache modules that don't autocommit.
+	_auxdb_sync_rate = 1000
+
 	def __init__(self, portdb, cp_iter=None, consumer=None,
 		write_auxdb=True, **kwargs):
 		AsyncScheduler.__init__(self, **kwargs)
@@ -26,8 +31,20 @@ class MetadataRegen(AsyncScheduler):
 
 		self._valid_pkgs = set()
 		self._cp_set = set()
+		# {repo_path: {cpv: eclasses}}, for the eclass index
+		self._eclass_entries = {}
 		self._process_iter = self._iter_metadata_processes()
 		self._running_tasks = set()
+		self._worker_pool = None
+		if "metadata-workers" in portdb.settings.features:
+			self._worker_pool = MetadataWorkerPool()
+
+	def _start(self):
+		if self._write_auxdb:
+			# Batch cache writes until flush_cache() is called by _wait.
+			for auxdb in self._portdb.auxdb.values():
+				auxdb.sync(self._auxdb_sync_rate)
+		AsyncScheduler._start(self)
 
 	def _next_task(self):
 		return next(self._process_iter)
@@ -67,6 +84,8 @@ class MetadataRegen(AsyncScheduler):
 					metadata, ebuild_hash = portdb._pull_valid_cache(
 						cpv, ebuild_path, repo_path)
 					if metadata is not None:
+						self._eclass_entries.setdefault(repo_path, {})[cpv] = \
+							metadata.get("_eclasses_", ())
 						if consumer is not None:
 							consumer(cpv, repo_path, metadata, ebuild_hash, True)
 						continue
@@ -75,12 +94,16 @@ class MetadataRegen(AsyncScheduler):
 						ebuild_hash=ebuild_hash,
 						portdb=portdb, repo_path=repo_path,
 						settings=portdb.doebuild_settings,
+						worker_pool=self._worker_pool,
 						write_auxdb=self._write_auxdb)
 
 	def _wait(self):
 
 		AsyncScheduler._wait(self)
 
+		if self._worker_pool is not None:
+			self._worker_pool.close()
+
 		portdb = self._portdb
 		dead_nodes = {}
 
@@ -117,6 +140,18 @@ class MetadataRegen(AsyncScheduler):
 					dead_nodes = None
 					break
 
+		index = portdb._eclass_index
+		if index is not None:
+			# The index is complete for a repository only if every cp
+			# has been processed.
+			for mytree in portdb.porttrees:
+				repo = portdb.repositories.get_name_for_location(mytree)
+				entries = self._eclass_entries.get(mytree, {}).items()
+				if self._global_cleanse:
+					index.rebuild(repo, entries)
+				else:
+					index.update_cps(repo, self._cp_set, entries)
+
 		if dead_nodes:
 			for y in self._valid_pkgs:
 				for mytree in portdb.porttrees:
@@ -141,6 +176,10 @@ class MetadataRegen(AsyncScheduler):
 			if not self._terminated_tasks:
 				portage.writemsg("Error processing %s, continuing...\n" % \
 					(metadata_process.cpv,), noiselevel=-1)
+		elif metadata_process.eapi_supported:
+			self._eclass_entries.setdefault(metadata_process.repo_path,
+				{})[metadata_process.cpv] = \
+				metadata_process.metadata.get("_eclasses_", ())
 
 		if self._consumer is not None:
 			# On failure, still notify the consumer (in this case the metadata
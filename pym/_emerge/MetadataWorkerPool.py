@@ -0,0 +1,167 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import errno
+import fcntl
+import signal
+import sys
+
+from portage import os
+from portage import _encodings
+from portage import _shell_quote
+from portage import _unicode_encode
+from portage.util.SlotObject import SlotObject
+
+class MetadataWorker(SlotObject):
+	"""
+	A bash process which runs metadata-worker.sh. Requests are written
+	to request_fd, and results are read from result_fd, which is in
+	non-blocking mode. The worker writes results to pipe_fd, which is
+	the value of PORTAGE_PIPE_FD in its environment.
+	"""
+	__slots__ = ("pid", "pipe_fd", "request_fd", "result_fd")
+
+class MetadataWorkerPool(object):
+	"""
+	A pool of long-lived bash processes which run the "depend" phase of
+	many ebuilds each (see bin/metadata-worker.sh), in order to avoid the
+	cost of starting bash and sourcing isolated-functions.sh for every
+	ebuild. The spawn_wrapper method is passed to doebuild, so that
+	doebuild still verifies the ebuild and prepares the environment of
+	the phase, but the phase is run by an idle worker instead of a new
+	bash process. New workers are started with the spawn function that
+	doebuild has selected, so that they have the usual privileges and
+	sandbox.
+
+	The spawn function returns the MetadataWorker that handles the
+	request, and the caller must pass it to release() after the result
+	has been read, or to discard() if the result is not read.
+	"""
+
+	_worker_binary = "metadata-worker.sh"
+
+	def __init__(self):
+		self._idle = []
+		self._workers = set()
+
+	def spawn_wrapper(self, spawn_func):
+		def spawn(mystring, env=None, fd_pipes=None, **keywords):
+			return self._request(spawn_func, env, fd_pipes, keywords)
+		return spawn
+
+	def _request(self, spawn_func, env, fd_pipes, keywords):
+		"""
+		Send the environment of a "depend" phase to an idle worker, and
+		return the worker, or an integer exit status if a new worker
+		fails to start.
+		"""
+		while True:
+			if self._idle:
+				worker = self._idle.pop()
+			else:
+				worker = self._start_worker(spawn_func, env, fd_pipes,
+					keywords)
+				if isinstance(worker, int):
+					return worker
+
+			request = b"".join(_unicode_encode("%s=%s\0" % (k, v),
+				encoding=_encodings['content'])
+				for k, v in env.items() if k != "PORTAGE_PIPE_FD")
+			request += _unicode_encode("PORTAGE_PIPE_FD=%s\0\0" %
+				worker.pipe_fd, encoding=_encodings['content'])
+			try:
+				while request:
+					request = request[os.write(worker.request_fd, request):]
+			except OSError as e:
+				if e.errno != errno.EPIPE:
+					raise
+				# The worker has died, so try another one.
+				self.discard(worker)
+				continue
+			return worker
+
+	def _start_worker(self, spawn_func, env, fd_pipes, keywords):
+		request_fd, request_write = os.pipe()
+		result_fd, pipe_fd = os.pipe()
+
+		fcntl.fcntl(result_fd, fcntl.F_SETFL,
+			fcntl.fcntl(result_fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+		# FD_CLOEXEC is enabled by default in Python >=3.4.
+		if sys.hexversion < 0x3040000:
+			try:
+				fcntl.FD_CLOEXEC
+			except AttributeError:
+				pass
+			else:
+				for fd in (request_write, result_fd):
+					fcntl.fcntl(fd, fcntl.F_SETFD,
+						fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+
+		worker_fd_pipes = {}
+		if fd_pipes is not None:
+			worker_fd_pipes.update(fd_pipes)
+		worker_fd_pipes[0] = request_fd
+		worker_fd_pipes[pipe_fd] = pipe_fd
+		env = dict(env)
+		env["PORTAGE_PIPE_FD"] = str(pipe_fd)
+		keywords = dict(keywords)
+		keywords["opt_name"] = "[metadata worker]"
+		keywords["returnpid"] = True
+
+		try:
+			retval = spawn_func(_shell_quote(os.path.join(
+				env["PORTAGE_BIN_PATH"], self._worker_binary)),
+				env=env, fd_pipes=worker_fd_pipes, **keywords)
+		finally:
+			os.close(request_fd)
+			os.close(pipe_fd)
+
+		if isinstance(retval, int):
+			os.close(request_write)
+			os.close(result_fd)
+			return retval
+
+		worker = MetadataWorker(pid=retval[0], pipe_fd=pipe_fd,
+			request_fd=request_write, result_fd=result_fd)
+		self._workers.add(worker)
+		return worker
+
+	def release(self, worker):
+		"""
+		Return a worker to the pool after its result has been read.
+		"""
+		self._idle.append(worker)
+
+	def discard(self, worker):
+		"""
+		Kill a worker, for example when its request has been cancelled.
+		"""
+		try:
+			os.kill(worker.pid, signal.SIGTERM)
+		except OSError as e:
+			if e.errno != errno.ESRCH:
+				raise
+		self._close_worker(worker)
+
+	def _close_worker(self, worker):
+		self._workers.discard(worker)
+		os.close(worker.request_fd)
+		os.close(worker.result_fd)
+		try:
+			os.waitpid(worker.pid, 0)
+		except OSError as e:
+			if e.errno != errno.ECHILD:
+				raise
+
+	def close(self):
+		"""
+		Stop all workers. Idle workers exit when their requests are
+		closed, and others are killed.
+		"""
+		idle = self._idle
+		self._idle = []
+		for worker in idle:
+			self._close_worker(worker)
+		for worker in list(self._workers):
+			self.discard(worker)
@@ -12,7 +12,7 @@ from portage import _encodings, _unicode_decode, _unicode_encode
 from portage.cache.mappings import slot_dict_class
 from portage.const import EBUILD_PHASES
 from portage.dep import Atom, check_required_use, use_reduce, \
-	paren_enclose, _slot_separator, _repo_separator
+	paren_enclose, _intern_atom, _slot_separator, _repo_separator
 from portage.dep.soname.parse import parse_soname_deps
 from portage.versions import _pkg_str, _unknown_repo
 from portage.eapi import _get_eapi_attrs, eapi_has_use_aliases
@@ -76,7 +76,8 @@ class Package(Task):
 		self.version = self.cpv.version
 		self.slot = self.cpv.slot
 		self.sub_slot = self.cpv.sub_slot
-		self.slot_atom = Atom("%s%s%s" % (self.cp, _slot_separator, self.slot))
+		self.slot_atom = _intern_atom("%s%s%s" % (self.cp,
+			_slot_separator, self.slot))
 		# sync metadata with validated repo (may be UNKNOWN_REPO)
 		self._metadata['repository'] = self.cpv.repo
 
@@ -772,40 +773,44 @@ class Package(Task):
 	def __lt__(self, other):
 		if other.cp != self.cp:
 			return self.cp < other.cp
-		result = portage.vercmp(self.version, other.version)
-		if result < 0:
+		self_key = self.cpv.version_key
+		other_key = other.cpv.version_key
+		if self_key < other_key:
 			return True
-		if result == 0 and self.built and other.built:
+		if self_key == other_key and self.built and other.built:
 			return self.build_time < other.build_time
 		return False
 
 	def __le__(self, other):
 		if other.cp != self.cp:
 			return self.cp <= other.cp
-		result = portage.vercmp(self.version, other.version)
-		if result <= 0:
+		self_key = self.cpv.version_key
+		other_key = other.cpv.version_key
+		if self_key <= other_key:
 			return True
-		if result == 0 and self.built and other.built:
+		if self_key == other_key and self.built and other.built:
 			return self.build_time <= other.build_time
 		return False
 
 	def __gt__(self, other):
 		if other.cp != self.cp:
 			return self.cp > other.cp
-		result = portage.vercmp(self.version, other.version)
-		if result > 0:
+		self_key = self.cpv.version_key
+		other_key = other.cpv.version_key
+		if self_key > other_key:
 			return True
-		if result == 0 and self.built and other.built:
+		if self_key == other_key and self.built and other.built:
 			return self.build_time > other.build_time
 		return False
 
 	def __ge__(self, other):
 		if other.cp != self.cp:
 			return self.cp >= other.cp
-		result = portage.vercmp(self.version, other.version)
-		if result >= 0:
+		self_key = self.cpv.version_key
+		other_key = other.cpv.version_key
+		if self_key >= other_key:
 			return True
-		if result == 0 and self.built and other.built:
+		if self_key == other_key and self.built and other.built:
 			return self.build_time >= other.build_time
 		return False
 
@@ -0,0 +1,287 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import errno
+import hashlib
+import sys
+import time
+
+import portage
+from portage import os
+from portage import _encodings, _unicode_encode
+from portage.const import (CACHE_PATH, USER_CONFIG_PATH, VCS_DIRS,
+	WORLD_FILE, WORLD_SETS_FILE)
+from portage.data import secpass
+from portage._sets import SETPREFIX
+from portage.util import writemsg
+
+try:
+	import cPickle as pickle
+except ImportError:
+	import pickle
+
+if sys.hexversion >= 0x3000000:
+	basestring = str
+	_unicode = str
+else:
+	_unicode = unicode
+
+class ResolverCache(object):
+	"""
+	This caches the result of a successful dependency calculation, so that
+	an identical emerge invocation (typically `emerge -uDN @world`) does
+	not have to resolve the whole graph again when nothing relevant has
+	changed. Each entry is keyed on a fingerprint of the global inputs of
+	the calculation:
+		1) the emerge action, arguments, options and depgraph parameters
+		2) configuration and profile files, and important variables
+		3) the set of installed packages (including COUNTER)
+		4) binary package indexes, if binary packages are used
+		5) eclasses and repository level configuration
+	Additionally, each entry records a fingerprint of the ebuilds for every
+	package name (cp) that was consulted during the calculation. Changes to
+	ebuilds of other package names can not influence the result, so they
+	do not invalidate the entry.
+
+	A valid entry is replayed through depgraph._loadResumeCommand(), which
+	is much cheaper than a full calculation with backtracking.
+	"""
+
+	# Maximum number of cached calculations (distinct invocations).
+	_max_entries = 4
+
+	# Options that do not influence the result of dependency calculation.
+	_ignored_opts = frozenset([
+		"--alert", "--ask", "--ask-enter-invalid", "--color", "--columns",
+		"--debug", "--jobs", "--load-average", "--nospinner", "--pretend",
+		"--quiet", "--quiet-build", "--quiet-fail", "--quiet-repo-display",
+		"--tree", "--unordered-display", "--verbose",
+	])
+
+	# Variables that influence the result of dependency calculation and
+	# that are not entirely defined by the files that are fingerprinted.
+	_settings_keys = ("ACCEPT_KEYWORDS", "ACCEPT_LICENSE",
+		"ACCEPT_PROPERTIES", "ACCEPT_RESTRICT", "ARCH", "CHOST",
+		"ELIBC", "FEATURES", "KERNEL", "USE", "USERLAND")
+
+	def __init__(self, settings, trees, myopts, myparams, myaction, myfiles):
+		self._trees = trees
+		self._cache_filename = os.path.join(settings["EROOT"],
+			CACHE_PATH, "depgraph_resolver.pickle")
+		self._cache_version = "1"
+		self._cache_data = None
+		self._modified = False
+		self._key = self._global_key(settings, trees, myopts,
+			myparams, myaction, myfiles)
+		self._load()
+
+	@classmethod
+	def eligible(cls, myopts, myfiles):
+		"""
+		Cached results are only used for selective updates of package
+		sets, since other arguments may need to be recorded in the world
+		file by depgraph.saveNomergeFavorites(), which relies on state
+		that is not restored from the cache.
+		"""
+		if myopts.get("--resolver-cache") != "y":
+			return False
+		if "--update" not in myopts or "--nodeps" in myopts:
+			return False
+		if not myfiles:
+			return False
+		for x in myfiles:
+			if not (x.startswith(SETPREFIX) or
+				x in ("system", "world")):
+				return False
+		return True
+
+	def _load(self):
+		try:
+			with open(_unicode_encode(self._cache_filename,
+				encoding=_encodings['fs'], errors='strict'), 'rb') as f:
+				mypickle = pickle.Unpickler(f)
+				try:
+					mypickle.find_global = None
+				except AttributeError:
+					# TODO: If py3k, override Unpickler.find_class().
+					pass
+				self._cache_data = mypickle.load()
+		except (SystemExit, KeyboardInterrupt):
+			raise
+		except Exception as e:
+			if isinstance(e, EnvironmentError) and \
+				getattr(e, 'errno', None) in (errno.ENOENT, errno.EACCES):
+				pass
+			else:
+				writemsg("!!! Error loading '%s': %s\n" % \
+					(self._cache_filename, str(e)), noiselevel=-1)
+			del e
+
+		cache_valid = self._cache_data and \
+			isinstance(self._cache_data, dict) and \
+			self._cache_data.get("version") == self._cache_version and \
+			isinstance(self._cache_data.get("entries"), dict)
+
+		if not cache_valid:
+			self._cache_data = {"version":self._cache_version}
+			self._cache_data["entries"] = {}
+
+	def flush(self):
+		"""
+		If the current user has permission and the cache has been updated,
+		save it to disk. The cache is stored as a pickled dict object with
+		the following format:
+
+		{
+			version : "1",
+			"entries" : {key1:{"cps":{cp1:stamp1, cp2...},
+				"mergelist":[[type_name, root, cpv, "merge"], ...],
+				"repos":{cpv1:repo1, ...}, "favorites":[...],
+				"time":timestamp}, key2...},
+		}
+		"""
+		if not self._modified or secpass < 2:
+			return
+		try:
+			portage.util.ensure_dirs(os.path.dirname(self._cache_filename))
+			f = portage.util.atomic_ofstream(self._cache_filename, mode='wb')
+			pickle.dump(self._cache_data, f, protocol=2)
+			f.close()
+			portage.util.apply_secpass_permissions(
+				self._cache_filename, gid=portage.portage_gid, mode=0o644)
+		except (IOError, OSError, portage.exception.PortageException):
+			pass
+		self._modified = False
+
+	def get(self):
+		"""
+		Return the cached result for the current inputs, or None if there
+		is no valid entry.
+
+		@rtype: dict
+		@return: resume data with "mergelist", "favorites" and "repos" keys
+		"""
+		entry = self._cache_data["entries"].get(self._key)
+		if not isinstance(entry, dict):
+			return None
+		cps = entry.get("cps")
+		if not isinstance(cps, dict):
+			return None
+		for cp, stamp in cps.items():
+			if self._cp_stamp(cp) != stamp:
+				return None
+		return entry
+
+	def store(self, cps, mergelist, favorites):
+		"""
+		Store the result of a successful dependency calculation.
+
+		@param cps: package names that were consulted during the calculation
+		@type cps: set
+		@param mergelist: Package instances that are scheduled for merge
+		@type mergelist: list
+		@param favorites: favorites returned from depgraph.select_files()
+		@type favorites: list
+		"""
+		entries = self._cache_data["entries"]
+		entries[self._key] = {
+			"cps" : dict((_unicode(cp), self._cp_stamp(cp)) for cp in cps),
+			"mergelist" : [[_unicode(x) for x in pkg] for pkg in mergelist],
+			"repos" : dict((_unicode(pkg.cpv), pkg.repo) for pkg in mergelist),
+			"favorites" : [_unicode(x) for x in favorites],
+			"time" : time.time(),
+		}
+		while len(entries) > self._max_entries:
+			del entries[min(entries,
+				key=lambda k: entries[k].get("time", 0))]
+		self._modified = True
+
+	def _cp_stamp(self, cp):
+		stamp = []
+		for root in sorted(self._trees):
+			portdb = self._trees[root]["porttree"].dbapi
+			for location in portdb.porttrees:
+				pkgdir = os.path.join(location, cp)
+				try:
+					names = os.listdir(pkgdir)
+				except OSError:
+					continue
+				for name in sorted(names):
+					if not name.endswith(".ebuild"):
+						continue
+					stamp.append((location, name) +
+						self._file_stamp(os.path.join(pkgdir, name)))
+		return tuple(stamp)
+
+	@staticmethod
+	def _file_stamp(path):
+		try:
+			st = os.stat(path)
+		except OSError:
+			return (None, None)
+		return (st.st_mtime, st.st_size)
+
+	def _dir_stamps(self, path, recursive=True):
+		stamps = []
+		try:
+			names = sorted(os.listdir(path))
+		except OSError:
+			return stamps
+		for name in names:
+			if name in VCS_DIRS:
+				continue
+			child = os.path.join(path, name)
+			if os.path.isdir(child):
+				# Profile directories contain sub-profiles, so only
+				# descend into directories that are used in place
+				# of files, such as package.use/.
+				if recursive or name.startswith(("package.", "use.")):
+					stamps.extend(self._dir_stamps(child, recursive=recursive))
+			else:
+				stamps.append((child,) + self._file_stamp(child))
+		return stamps
+
+	def _global_key(self, settings, trees, myopts, myparams,
+		myaction, myfiles):
+		key = [self._cache_version, myaction, sorted(myfiles)]
+		key.append(sorted((k, repr(v)) for k, v in myopts.items()
+			if k not in self._ignored_opts))
+		key.append(sorted((k, repr(v)) for k, v in myparams.items()))
+
+		for root in sorted(trees):
+			root_trees = trees[root]
+			root_settings = root_trees["vartree"].settings
+			key.append(root)
+			key.append([(k, root_settings.get(k))
+				for k in self._settings_keys])
+			key.append(self._dir_stamps(os.path.join(
+				root_settings["PORTAGE_CONFIGROOT"], USER_CONFIG_PATH)))
+			for profile in root_settings.profiles:
+				key.append(self._dir_stamps(profile, recursive=False))
+			for filename in (WORLD_FILE, WORLD_SETS_FILE):
+				filename = os.path.join(root_settings["EROOT"], filename)
+				key.append((filename,) + self._file_stamp(filename))
+
+			vardb = root_trees["vartree"].dbapi
+			key.append([(cpv, vardb.aux_get(cpv, ["COUNTER"])[0])
+				for cpv in sorted(vardb.cpv_all())])
+
+			if "--usepkg" in myopts or "--getbinpkg" in myopts:
+				bintree = root_trees["bintree"]
+				key.append(sorted(bintree.dbapi.cpv_all()))
+				pkgindex = os.path.join(bintree.pkgdir, "Packages")
+				key.append((pkgindex,) + self._file_stamp(pkgindex))
+
+			portdb = root_trees["porttree"].dbapi
+			for repo in portdb.repositories:
+				key.append((repo.name, repo.location))
+				key.append(self._dir_stamps(os.path.join(
+					repo.location, "profiles"), recursive=False))
+				if repo.eclass_db is not None:
+					key.append(sorted(
+						(name, self._file_stamp(eclass.location))
+						for name, eclass in repo.eclass_db.eclasses.items()))
+
+		return hashlib.sha1(_unicode_encode(repr(key),
+			encoding=_encodings['repo.content'],
+			errors='backslashreplace')).hexdigest()
@@ -1,4 +1,4 @@
-# Copyright 1999-2014 Gentoo Foundation
+# Copyright 1999-2016 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 from __future__ import division, print_function, unicode_literals
@@ -20,6 +20,7 @@ from portage import os
 from portage import _encodings
 from portage import _unicode_encode
 from portage.cache.mappings import slot_dict_class
+from portage.const import CACHE_PATH
 from portage.elog.messages import eerror
 from portage.localization import _
 from portage.output import colorize, create_color_func, red
@@ -42,6 +43,7 @@ from _emerge.BinpkgPrefetcher import BinpkgPrefetcher
 from _emerge.BinpkgVerifier import BinpkgVerifier
 from _emerge.Blocker import Blocker
 from _emerge.BlockerDB import BlockerDB
+from _emerge.BuildDurations import BuildDurations
 from _emerge.clear_caches import clear_caches
 from _emerge.create_depgraph_params import create_depgraph_params
 from _emerge.create_world_atom import create_world_atom
@@ -53,6 +55,7 @@ from _emerge.EbuildPhase import EbuildPhase
 from _emerge.emergelog import emergelog
 from _emerge.FakeVartree import FakeVartree
 from _emerge.getloadavg import getloadavg
+from _emerge.JobMemoryMonitor import JobMemoryMonitor
 from _emerge._find_deep_system_runtime_deps import _find_deep_system_runtime_deps
 from _emerge._flush_elog_mod_echo import _flush_elog_mod_echo
 from _emerge.JobStatusDisplay import JobStatusDisplay
@@ -77,6 +80,9 @@ class Scheduler(PollScheduler):
 	# max time between display status updates (milliseconds)
 	_max_display_latency = 3000
 
+	# time between samples of job memory usage (milliseconds)
+	_memory_sample_latency = 5000
+
 	_opts_ignore_blockers = \
 		frozenset(["--buildpkgonly",
 		"--fetchonly", "--fetch-all-uri",
@@ -225,6 +231,25 @@ class Scheduler(PollScheduler):
 
 		self._fetch_log = os.path.join(_emerge.emergelog._emerge_log_dir,
 			'emerge-fetch.log')
+		self._build_durations = BuildDurations(os.path.join(
+			self._running_root.settings["EROOT"], CACHE_PATH,
+			"build_durations.sqlite"))
+		self._build_durations.load_emerge_log(os.path.join(
+			_emerge.emergelog._emerge_log_dir, 'emerge.log'))
+		# Start times of running tasks, for the build duration database.
+		self._task_start_times = {}
+		# Start times of packages which have been chosen, but have not
+		# been merged yet, for the estimated completion time.
+		self._pkg_start_times = {}
+		self._memory_monitor = None
+		if "--memory-aware" in myopts:
+			if JobMemoryMonitor.available():
+				self._memory_monitor = \
+					JobMemoryMonitor(self._build_durations)
+			else:
+				writemsg_level("!!! --memory-aware is not supported "
+					"since MemAvailable is missing from /proc/meminfo\n",
+					level=logging.WARNING, noiselevel=-1)
 		fetch_iface = self._fetch_iface_class(log_file=self._fetch_log,
 			schedule=self._schedule_fetch)
 		self._sched_iface = self._iface_class(
@@ -429,6 +454,12 @@ class Scheduler(PollScheduler):
 
 	def _set_graph_config(self, graph_config):
 
+		self._default_duration = None
+		self._pkg_durations = {}
+		self._pkg_weights = {}
+		self._pkg_merge_order = {}
+		self._pkg_weight_order = []
+
 		if graph_config is None:
 			self._graph_config = None
 			self._pkg_cache = {}
@@ -441,6 +472,7 @@ class Scheduler(PollScheduler):
 		self._pkg_cache = graph_config.pkg_cache
 		self._digraph = graph_config.graph
 		self._mergelist = graph_config.mergelist
+		self._calc_pkg_durations()
 
 		if "--nodeps" in self.myopts or \
 			(self._max_jobs is not True and self._max_jobs < 2):
@@ -456,6 +488,7 @@ class Scheduler(PollScheduler):
 		self._find_system_deps()
 		self._prune_digraph()
 		self._prevent_builddir_collisions()
+		self._calc_pkg_weights()
 		if '--debug' in self.myopts:
 			writemsg("\nscheduler digraph:\n\n", noiselevel=-1)
 			self._digraph.debug_print()
@@ -521,6 +554,85 @@ class Scheduler(PollScheduler):
 					priority=DepPriority(buildtime=True))
 			cpv_map[pkg.cpv].append(pkg)
 
+	def _calc_pkg_durations(self):
+		"""
+		Estimate the build and merge duration of each package that will
+		be merged, for _calc_pkg_weights() and the estimated completion
+		time. Packages without any record are assumed to take the mean
+		duration, and no estimates are made if there are no records at all.
+		"""
+		durations = self._build_durations
+		self._default_duration = durations.mean()
+		if self._default_duration is None:
+			return
+		for pkg in self._mergelist:
+			if not isinstance(pkg, Package) or pkg.operation != "merge":
+				continue
+			if pkg.type_name == "ebuild":
+				kinds = ("build", "merge")
+			else:
+				kinds = ("binary", "merge")
+			self._pkg_durations[pkg] = durations.estimate(pkg.cpv, kinds,
+				use_hash=durations.use_hash(pkg.use.enabled),
+				default=self._default_duration)
+
+	def _calc_pkg_weights(self):
+		"""
+		Weight each package that will be merged by the estimated duration
+		of the longest chain of merges which can't complete until it has
+		been merged, including its own duration. Without any recorded
+		durations, each package counts as one second, so the weight is
+		the length of the chain. When there are more packages ready than
+		free job slots, _choose_pkg() starts the heaviest one first, so
+		that long chains of merges are not started late. For this purpose,
+		the packages are sorted by weight here, once, and the position of
+		each package in merge order is recorded.
+		"""
+		pkg_durations = self._pkg_durations
+		default_duration = self._default_duration or 1
+		graph = self._digraph
+
+		def merge_parents(node):
+			return [parent for parent in graph.parent_nodes(node)
+				if isinstance(parent, Package) and
+				parent.operation == "merge"]
+
+		weights = self._pkg_weights
+		weights.clear()
+		for pkg in self._mergelist:
+			if not isinstance(pkg, Package) or \
+				pkg.operation != "merge" or \
+				pkg in weights or pkg not in graph:
+				continue
+			# Iterative depth-first traversal of reverse dependencies.
+			# Packages that are already on the stack are ignored, which
+			# breaks dependency cycles.
+			visiting = set([pkg])
+			stack = [(pkg, iter(merge_parents(pkg)))]
+			while stack:
+				node, parents = stack[-1]
+				for parent in parents:
+					if parent not in weights and parent not in visiting:
+						visiting.add(parent)
+						stack.append((parent, iter(merge_parents(parent))))
+						break
+				else:
+					stack.pop()
+					visiting.discard(node)
+					weight = 0
+					for parent in merge_parents(node):
+						weight = max(weight, weights.get(parent, 0))
+					weights[node] = weight + \
+						pkg_durations.get(node, default_duration)
+
+		merge_order = self._pkg_merge_order
+		merge_order.clear()
+		for pkg in self._mergelist:
+			if isinstance(pkg, Package) and pkg not in merge_order:
+				merge_order[pkg] = len(merge_order)
+		self._pkg_weight_order = sorted(merge_order,
+			key=lambda pkg: (-weights.get(pkg, 0), merge_order[pkg]))
+
 	class _pkg_failure(portage.exception.PortageException):
 		"""
 		An instance of this class is raised by unmerge() when
@@ -716,7 +828,8 @@ class Scheduler(PollScheduler):
 			if ebuild_path is None:
 				raise AssertionError("ebuild not found for '%s'" % x.cpv)
 			quiet_config["O"] = os.path.dirname(ebuild_path)
-			if not digestcheck([], quiet_config, strict=True):
+			if not digestcheck([], quiet_config, strict=True,
+				load_average=self._max_load):
 				failures |= 1
 
 		if failures:
@@ -744,6 +857,8 @@ class Scheduler(PollScheduler):
 					# prefetcher to occupy the fetch queue before the first
 					# fetcher has an opportunity to execute.
 					prefetchers[pkg] = prefetcher
+					prefetcher.addStartListener(self._task_started)
+					prefetcher.addExitListener(self._prefetch_exit)
 					self._task_queues.fetch.add(prefetcher)
 
 	def _create_prefetcher(self, pkg):
@@ -1267,8 +1382,37 @@ class Scheduler(PollScheduler):
 		self._merge_wait_scheduled.remove(task)
 		self._merge_exit(task)
 
+	def _task_started(self, task):
+		self._task_start_times[id(task)] = time.time()
+
+	def _record_duration(self, task, pkg, kind):
+		"""
+		Record the duration of the given task in the build duration
+		database, if it was successful.
+		"""
+		start_time = self._task_start_times.pop(id(task), None)
+		if start_time is None or task.returncode != os.EX_OK or \
+			portage.data.secpass < 2:
+			return
+		durations = self._build_durations
+		durations.record(pkg.cpv, kind, time.time() - start_time,
+			use_hash=durations.use_hash(pkg.use.enabled))
+
+	def _prefetch_exit(self, prefetcher):
+		self._record_duration(prefetcher, prefetcher.pkg, "fetch")
+
 	def _merge_exit(self, merge):
 		self._running_tasks.pop(id(merge), None)
+		pkg = merge.merge.pkg
+		self._pkg_start_times.pop(pkg, None)
+		if not pkg.installed:
+			self._record_duration(merge, pkg, "merge")
+		if self._memory_monitor is not None:
+			# Binary packages don't predict the memory usage of builds.
+			self._memory_monitor.job_exit(pkg,
+				merge.returncode == os.EX_OK and
+				pkg.type_name == "ebuild" and
+				portage.data.secpass >= 2)
 		self._do_merge_exit(merge)
 		self._deallocate_config(merge.merge.settings)
 		if merge.returncode == os.EX_OK and \
@@ -1333,6 +1477,13 @@ class Scheduler(PollScheduler):
 
 	def _build_exit(self, build):
 		self._running_tasks.pop(id(build), None)
+		if not build.build_opts.fetchonly:
+			self._record_duration(build, build.pkg,
+				"build" if build.pkg.type_name == "ebuild" else "binary")
+		if build.returncode != os.EX_OK or self._terminated_tasks:
+			self._pkg_start_times.pop(build.pkg, None)
+			if self._memory_monitor is not None:
+				self._memory_monitor.job_exit(build.pkg, False)
 		if build.returncode == os.EX_OK and self._terminated_tasks:
 			# We've been interrupted, so we won't
 			# add this to the merge queue.
@@ -1342,6 +1493,7 @@ class Scheduler(PollScheduler):
 			self.curval += 1
 			merge = PackageMerge(merge=build)
 			self._running_tasks[id(merge)] = merge
+			merge.addStartListener(self._task_started)
 			if not build.build_opts.buildpkgonly and \
 				build.pkg in self._deep_system_deps:
 				# Since dependencies on system packages are frequently
@@ -1389,6 +1541,11 @@ class Scheduler(PollScheduler):
 			# average has changed since the last call.
 			loadavg_check_id = self._event_loop.timeout_add(
 				self._loadavg_latency, self._schedule)
+		memory_check_id = None
+		if self._memory_monitor is not None and \
+			(self._max_jobs is True or self._max_jobs > 1):
+			memory_check_id = self._event_loop.timeout_add(
+				self._memory_sample_latency, self._sample_memory)
 
 		try:
 			# Populate initial event sources. Unless we're scheduling
@@ -1410,6 +1567,8 @@ class Scheduler(PollScheduler):
 			self._event_loop.source_remove(term_check_id)
 			if loadavg_check_id is not None:
 				self._event_loop.source_remove(loadavg_check_id)
+			if memory_check_id is not None:
+				self._event_loop.source_remove(memory_check_id)
 
 	def _merge(self):
 
@@ -1442,6 +1601,7 @@ class Scheduler(PollScheduler):
 
 	def _main_loop_cleanup(self):
 		del self._pkg_queue[:]
+		self._pkg_start_times.clear()
 		self._completed_tasks.clear()
 		self._deep_system_deps.clear()
 		self._unsatisfied_system_deps.clear()
@@ -1467,9 +1627,12 @@ class Scheduler(PollScheduler):
 				(self._max_jobs is True or self._max_jobs > 1)):
 				self._choose_pkg_return_early = True
 				return None
+			if not self._memory_fits(self._pkg_queue[0]):
+				self._choose_pkg_return_early = True
+				return None
 			return self._pkg_queue.pop(0)
 
-		if not self._is_work_scheduled():
+		if not (self._is_work_scheduled() or self._pkg_weights):
 			return self._pkg_queue.pop(0)
 
 		self._prune_digraph()
@@ -1485,13 +1648,22 @@ class Scheduler(PollScheduler):
 				break
 
 		if chosen_pkg is None:
-			later = set(self._pkg_queue)
-			for pkg in self._pkg_queue:
-				later.remove(pkg)
-				if not self._dependent_on_scheduled_merges(pkg, later):
+			# Check the heaviest packages first, so that the critical
+			# path is started as early as possible. Merge list order
+			# is preserved for equal weights.
+			queued = set(self._pkg_queue)
+			for pkg in self._pkg_weight_order:
+				if pkg in queued and \
+					not self._dependent_on_scheduled_merges(pkg, queued) and \
+					self._memory_fits(pkg):
 					chosen_pkg = pkg
 					break
 
+		if chosen_pkg is None and not self._is_work_scheduled():
+			# The first package is always ready when nothing is
+			# scheduled, since it's first in merge order.
+			chosen_pkg = self._pkg_queue[0]
+
 		if chosen_pkg is not None:
 			self._pkg_queue.remove(chosen_pkg)
 
@@ -1503,23 +1675,65 @@ class Scheduler(PollScheduler):
 
 		return chosen_pkg
 
-	def _dependent_on_scheduled_merges(self, pkg, later):
+	def _memory_fits(self, pkg):
+		"""
+		Return False if --memory-aware is enabled and the predicted peak
+		memory usage of the given package does not fit in the available
+		memory. A package is always allowed if no other jobs are running.
+		"""
+		if self._memory_monitor is None or not self._jobs or \
+			pkg.operation != "merge":
+			return True
+		return self._memory_monitor.fits(pkg, self._pkg_start_times)
+
+	def _sample_memory(self):
+		jobs = []
+		for task in self._running_tasks.values():
+			if isinstance(task, PackageMerge):
+				pkg = task.merge.pkg
+			else:
+				pkg = task.pkg
+			jobs.append((pkg, self._task_pid(task)))
+		self._memory_monitor.sample(jobs)
+		# Memory may have been freed, so check again for
+		# packages that did not fit previously.
+		self._choose_pkg_return_early = False
+		self._schedule()
+		return True
+
+	@staticmethod
+	def _task_pid(task):
+		"""
+		Return the pid of the process that the given task is currently
+		waiting for, or None if there is no such process.
+		"""
+		while task is not None:
+			pid = getattr(task, "pid", None)
+			if pid is not None:
+				return pid
+			task = getattr(task, "_current_task", None)
+		return None
+
+	def _dependent_on_scheduled_merges(self, pkg, queued):
 		"""
 		Traverse the subgraph of the given packages deep dependencies
 		to see if it contains any scheduled merges.
 		@param pkg: a package to check dependencies for
 		@type pkg: Package
-		@param later: packages for which dependence should be ignored
-			since they will be merged later than pkg anyway and therefore
-			delaying the merge of pkg will not result in a more optimal
-			merge order
-		@type later: set
+		@param queued: packages that are still queued, where dependence
+			on the ones that come later than pkg in merge order is
+			ignored, since they will be merged later than pkg anyway and
+			therefore delaying the merge of pkg will not result in a more
+			optimal merge order
+		@type queued: set
 		@rtype: bool
 		@return: True if the package is dependent, False otherwise.
 		"""
 
 		graph = self._digraph
 		completed_tasks = self._completed_tasks
+		merge_order = self._pkg_merge_order
+		position = merge_order.get(pkg, -1)
 
 		dependent = False
 		traversed_nodes = set([pkg])
@@ -1535,7 +1749,7 @@ class Scheduler(PollScheduler):
 				(node.operation == "uninstall" and \
 				node not in direct_deps) or \
 				node in completed_tasks or \
-				node in later):
+				(node in queued and merge_order.get(node, -1) > position)):
 				dependent = True
 				break
 
@@ -1599,6 +1813,7 @@ class Scheduler(PollScheduler):
 			if self._schedule_tasks_imp():
 				state_change += 1
 
+			self._update_eta()
 			self._status_display.display()
 
 			# Cancel prefetchers if they're the only reason
@@ -1615,6 +1830,37 @@ class Scheduler(PollScheduler):
 				not self._task_queues.merge)):
 				break
 
+	def _update_eta(self):
+		"""
+		Update the remaining critical path and the estimated completion
+		time of the status display, from the estimated durations of the
+		queued packages and the remaining durations of the packages that
+		have been started.
+		"""
+		if not self._pkg_durations:
+			return
+
+		current_time = time.time()
+		remaining = 0
+		critical_path = 0
+		for pkg in self._pkg_queue:
+			remaining += self._pkg_durations.get(pkg, 0)
+			critical_path = max(critical_path,
+				self._pkg_weights.get(pkg, 0))
+		for pkg, start_time in self._pkg_start_times.items():
+			elapsed = current_time - start_time
+			remaining += max(0, self._pkg_durations.get(pkg, 0) - elapsed)
+			critical_path = max(critical_path,
+				self._pkg_weights.get(pkg, 0) - elapsed)
+
+		if self._max_jobs is True:
+			jobs = max(1, len(self._pkg_queue) + len(self._pkg_start_times))
+		else:
+			jobs = self._max_jobs
+		self._status_display.critical_path = int(critical_path)
+		self._status_display.eta_time = current_time + \
+			max(remaining / jobs, critical_path)
+
 	def _sigcont_handler(self, signum, frame):
 		self._sigcont_time = time.time()
 
@@ -1700,6 +1946,7 @@ class Scheduler(PollScheduler):
 				return bool(state_change)
 
 			state_change += 1
+			self._pkg_start_times[pkg] = time.time()
 
 			if not pkg.installed:
 				self._pkg_count.curval += 1
@@ -1717,6 +1964,7 @@ class Scheduler(PollScheduler):
 				self._previous_job_start_time = time.time()
 				self._status_display.running = self._jobs
 				self._running_tasks[id(task)] = task
+				task.addStartListener(self._task_started)
 				task.addExitListener(self._extract_exit)
 				self._task_queues.jobs.add(task)
 
@@ -1725,6 +1973,7 @@ class Scheduler(PollScheduler):
 				self._previous_job_start_time = time.time()
 				self._status_display.running = self._jobs
 				self._running_tasks[id(task)] = task
+				task.addStartListener(self._task_started)
 				task.addExitListener(self._build_exit)
 				self._task_queues.jobs.add(task)
 
@@ -0,0 +1,172 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import io
+import tempfile
+
+import portage
+from portage import os, _encodings, _unicode_encode
+from portage.dbapi._MergeProcess import MergeProcess
+from portage.dep import Atom, use_reduce
+from portage.exception import InvalidAtom, InvalidDependString
+from portage.util import writemsg_stdout
+from portage.util._async.AsyncScheduler import AsyncScheduler
+
+class UnmergeScheduler(AsyncScheduler):
+	"""
+	Unmerge packages concurrently, each in a MergeProcess subprocess.
+	Packages that have files (other than directories) in common are never
+	unmerged at the same time. If ordered is True, then a package is not
+	unmerged until the packages before it in cpv_list which depend on it
+	have been unmerged, which preserves the guarantee of the serial unmerge
+	order that each package is unmerged before its dependencies.
+
+	Scheduling of new unmerges stops after the first failure, and the
+	failed cpv is available from the failed attribute. The task_start and
+	task_exit callbacks are called with the cpv (and the returncode for
+	task_exit) of each unmerge. The output of each unmerge is written to
+	a temporary log, which is shown when the unmerge exits, so that the
+	output of concurrent unmerges is not interleaved.
+	"""
+
+	_dep_keys = ("DEPEND", "HDEPEND", "PDEPEND", "RDEPEND")
+
+	def __init__(self, cpv_list, vartree, settings, ordered=False,
+		ldpath_mtimes=None, task_start=None, task_exit=None, **kwargs):
+		AsyncScheduler.__init__(self, **kwargs)
+		self._vartree = vartree
+		self._settings = settings
+		self._ldpath_mtimes = ldpath_mtimes
+		self._task_start = task_start
+		self._task_exit_cb = task_exit
+		self._pending = list(cpv_list)
+		self._running_cpvs = set()
+		self._log_paths = {}
+		self._conflicts = self._find_conflicts(cpv_list)
+		if ordered:
+			self._unmerge_after = self._find_dependents(cpv_list)
+		else:
+			self._unmerge_after = {}
+		self.failed = None
+
+	def _find_conflicts(self, cpv_list):
+		"""
+		Return a mapping of each cpv to the cpvs that own some of
+		the same files.
+		"""
+		vardb = self._vartree.dbapi
+		path_owners = {}
+		for cpv in cpv_list:
+			for path, data in vardb._dblink(cpv).getcontents().items():
+				if data[0] != "dir":
+					path_owners.setdefault(path, set()).add(cpv)
+
+		conflicts = dict((cpv, set()) for cpv in cpv_list)
+		for owners in path_owners.values():
+			if len(owners) > 1:
+				for cpv in owners:
+					conflicts[cpv].update(owners)
+					conflicts[cpv].discard(cpv)
+		return conflicts
+
+	def _find_dependents(self, cpv_list):
+		"""
+		Return a mapping of each cpv to the cpvs before it in cpv_list
+		which depend on it. Alternatives of || deps are all considered
+		to be dependencies, so the result may be more strict than the
+		order that was used to create cpv_list.
+		"""
+		vardb = self._vartree.dbapi
+		index = dict((cpv, i) for i, cpv in enumerate(cpv_list))
+		dependents = dict((cpv, set()) for cpv in cpv_list)
+		for cpv in cpv_list:
+			metadata = dict(zip(self._dep_keys + ("EAPI", "USE"),
+				vardb.aux_get(cpv, self._dep_keys + ("EAPI", "USE"))))
+			use = metadata["USE"].split()
+			for k in self._dep_keys:
+				try:
+					atoms = use_reduce(metadata[k], uselist=use,
+						eapi=metadata["EAPI"], flat=True)
+				except InvalidDependString:
+					# Ignore invalid deps of packages that will
+					# be uninstalled anyway.
+					continue
+				for atom in atoms:
+					if atom == "||" or atom[:1] == "!":
+						continue
+					try:
+						atom = Atom(atom)
+					except InvalidAtom:
+						continue
+					for match in vardb.match(atom):
+						if match in index and index[match] > index[cpv]:
+							dependents[match].add(cpv)
+		return dependents
+
+	def _ready(self, cpv):
+		if self._running_cpvs.intersection(self._conflicts[cpv]):
+			return False
+		for dependent in self._unmerge_after.get(cpv, ()):
+			if dependent in self._running_cpvs or dependent in self._pending:
+				return False
+		return True
+
+	def _next_cpv(self):
+		for cpv in self._pending:
+			if self._ready(cpv):
+				return cpv
+		return None
+
+	def _keep_scheduling(self):
+		return bool(self._pending) and self.failed is None and \
+			not self._terminated.is_set()
+
+	def _can_add_job(self):
+		return AsyncScheduler._can_add_job(self) and \
+			self._next_cpv() is not None
+
+	def _next_task(self):
+		cpv = self._next_cpv()
+		self._pending.remove(cpv)
+		self._running_cpvs.add(cpv)
+		if self._task_start is not None:
+			self._task_start(cpv)
+
+		fd, log_path = tempfile.mkstemp(prefix="unmerge-")
+		os.close(fd)
+		self._log_paths[cpv] = log_path
+		cat, pf = portage.catsplit(cpv)
+		return MergeProcess(mycat=cat, mypkg=pf,
+			settings=portage.config(clone=self._settings),
+			treetype="vartree", vartree=self._vartree,
+			mydbapi=self._vartree.dbapi, prev_mtimes=self._ldpath_mtimes,
+			background=True, logfile=log_path, unmerge=True,
+			parallel_unmerge=True)
+
+	def _show_log(self, cpv):
+		log_path = self._log_paths.pop(cpv)
+		try:
+			with io.open(_unicode_encode(log_path,
+				encoding=_encodings['fs'], errors='strict'),
+				mode='r', encoding=_encodings['content'],
+				errors='replace') as f:
+				writemsg_stdout(f.read(), noiselevel=-1)
+		except IOError:
+			pass
+		finally:
+			try:
+				os.unlink(log_path)
+			except OSError:
+				pass
+
+	def _task_exit(self, task):
+		# Update the state before AsyncScheduler._task_exit() schedules
+		# the packages that were waiting for this one.
+		cpv = "%s/%s" % (task.mycat, task.mypkg)
+		self._show_log(cpv)
+		self._running_cpvs.discard(cpv)
+		if task.returncode != os.EX_OK and self.failed is None:
+			self.failed = cpv
+		if self._task_exit_cb is not None:
+			self._task_exit_cb(cpv, task.returncode)
+		AsyncScheduler._task_exit(self, task)
@@ -5,11 +5,13 @@ from __future__ import division, print_function, unicode_literals
 
 import collections
 import errno
+import functools
 import io
 import logging
 import stat
 import sys
 import textwrap
+import time
 import warnings
 from collections import deque
 from itertools import chain
@@ -46,6 +48,7 @@ from portage.util import cmp_sort_key, writemsg, writemsg_stdout
 from portage.util import ensure_dirs
 from portage.util import writemsg_level, write_atomic
 from portage.util.digraph import digraph
+from portage.util._async.AsyncFunction import AsyncFunction
 from portage.util._async.TaskScheduler import TaskScheduler
 from portage.util._eventloop.EventLoop import EventLoop
 from portage.util._eventloop.global_event_loop import global_event_loop
@@ -71,6 +74,7 @@ from _emerge.is_valid_package_atom import insert_category_into_atom, \
 from _emerge.Package import Package
 from _emerge.PackageArg import PackageArg
 from _emerge.PackageVirtualDbapi import PackageVirtualDbapi
+from _emerge.ResolverCache import ResolverCache
 from _emerge.RootConfig import RootConfig
 from _emerge.search import search
 from _emerge.SetArg import SetArg
@@ -85,6 +89,7 @@ from _emerge.resolver.package_tracker import PackageTracker, PackageTrackerDbapi
 from _emerge.resolver.slot_collision import slot_conflict_handler
 from _emerge.resolver.circular_dependency import circular_dependency_handler
 from _emerge.resolver.output import Display, format_unmatched_atom
+from _emerge.resolver.timing import ResolverTiming
 
 if sys.hexversion >= 0x3000000:
 	basestring = str
@@ -100,6 +105,20 @@ class _scheduler_graph_config(object):
 		self.graph = graph
 		self.mergelist = mergelist
 
+def _timed(func):
+	"""
+	Record calls of a depgraph method as a phase in the ResolverTiming
+	instance of the frozen config, if timing is enabled.
+	"""
+	name = func.__name__
+	@functools.wraps(func)
+	def wrapper(self, *args, **kwargs):
+		timing = self._frozen_config.timing
+		if timing is None:
+			return func(self, *args, **kwargs)
+		return timing.call(name, func, self, *args, **kwargs)
+	return wrapper
+
 def _wildcard_set(atoms):
 	pkgs = InternalPackageSet(allow_wildcard=True)
 	for x in atoms:
@@ -112,10 +131,12 @@ def _wildcard_set(atoms):
 
 class _frozen_depgraph_config(object):
 
-	def __init__(self, settings, trees, myopts, params, spinner):
+	def __init__(self, settings, trees, myopts, params, spinner,
+		timing=None):
 		self.settings = settings
 		self.target_root = settings["EROOT"]
 		self.myopts = myopts
+		self.timing = timing
 		self.edebug = 0
 		if settings.get("PORTAGE_DEBUG", "") == "1":
 			self.edebug = 1
@@ -128,6 +149,16 @@ class _frozen_depgraph_config(object):
 		self.roots = {}
 		# All Package instances
 		self._pkg_cache = {}
+		# Index of available ebuilds and binary packages, shared by
+		# all backtracking runs (see _iter_match_pkgs_atom). Maps
+		# (root, pkg_type, cp) to cpvs in descending order.
+		self._pkg_index = {}
+		# Maps (root, pkg_type, atom) to the subset of the indexed
+		# cpvs that match the atom.
+		self._pkg_index_matches = {}
+		# Keys of (root, pkg_type, cpv, build_id, repo) combinations
+		# for which aux_get raised PackageNotFound.
+		self._pkg_index_missing = set()
 		self._highest_license_masked = {}
 		# We can't know that an soname dep is unsatisfied if there are
 		# any unbuilt ebuilds in the graph, since unbuilt ebuilds have
@@ -161,6 +192,9 @@ class _frozen_depgraph_config(object):
 			if self.soname_deps_enabled and "remove" not in params:
 				self.trees[myroot]["bintree"] = DummyTree(
 					DbapiProvidesIndex(trees[myroot]["bintree"].dbapi))
+			if timing is not None:
+				timing.instrument_dbapi(self.trees[myroot]["vartree"].dbapi,
+					"fakevartree")
 
 		self._required_set_names = set(["world"])
 
@@ -181,6 +215,12 @@ class _frozen_depgraph_config(object):
 		self.rebuild_if_new_ver = "--rebuild-if-new-ver" in myopts
 		self.rebuild_if_unbuilt = "--rebuild-if-unbuilt" in myopts
 
+		# Package names (cp) that have been consulted during dependency
+		# calculation, for validation of ResolverCache entries.
+		self.resolver_cache_cps = None
+		if myopts.get("--resolver-cache") == "y":
+			self.resolver_cache_cps = set()
+
 class _depgraph_sets(object):
 	def __init__(self):
 		# contains all sets added to the graph
@@ -567,6 +607,7 @@ class depgraph(object):
 				bindb._provides_inject(
 					self._pkg(cpv, "binary", root_config))
 
+	@_timed
 	def _load_vdb(self):
 		"""
 		Load installed package metadata if appropriate. This used to be called
@@ -2389,6 +2430,7 @@ class depgraph(object):
 
 		return changed
 
+	@_timed
 	def _create_graph(self, allow_unsatisfied=False):
 		dep_stack = self._dynamic_config._dep_stack
 		dep_disjunctive_stack = self._dynamic_config._dep_disjunctive_stack
@@ -3556,6 +3598,8 @@ class depgraph(object):
 		return deps
 
 	def _have_new_virt(self, root, atom_cp):
+		if self._frozen_config.resolver_cache_cps is not None:
+			self._frozen_config.resolver_cache_cps.add(atom_cp)
 		ret = False
 		for db, pkg_type, built, installed, db_keys in \
 			self._dynamic_config._filtered_trees[root]["dbs"]:
@@ -5244,6 +5288,39 @@ class depgraph(object):
 				yield self._pkg(cpv, pkg_type, root_config,
 					installed=installed, onlydeps=onlydeps)
 
+	def _pkg_index_cp_list(self, root_config, pkg_type, db, cp):
+		"""
+		Return a tuple of all cpvs for the given cp in descending order.
+		The result is cached in the frozen config, so that the dbapi
+		is only consulted once per cp for the whole calculation.
+		"""
+		key = (root_config.root, pkg_type, cp)
+		cp_list = self._frozen_config._pkg_index.get(key)
+		if cp_list is None:
+			cp_list = db.cp_list(cp)
+			cp_list.reverse()
+			cp_list = tuple(cp_list)
+			self._frozen_config._pkg_index[key] = cp_list
+		return cp_list
+
+	def _pkg_index_match(self, root_config, pkg_type, atom_exp, cp_list):
+		"""
+		Return a tuple of cpvs from cp_list that match the given expanded
+		atom, in descending order. Since the same atoms are pulled in by
+		many parents, results are cached for each distinct atom.
+		"""
+		key = (root_config.root, pkg_type, atom_exp)
+		matches = self._frozen_config._pkg_index_matches.get(key)
+		if matches is None:
+			if atom_exp.operator is None and atom_exp.slot is None and \
+				atom_exp.repo is None and atom_exp.unevaluated_atom.use is None:
+				# Only the cp is relevant, and it is the same for all cpvs.
+				matches = cp_list
+			else:
+				matches = tuple(match_from_list(atom_exp, cp_list))
+			self._frozen_config._pkg_index_matches[key] = matches
+		return matches
+
 	def _iter_match_pkgs_atom(self, root_config, pkg_type, atom,
 		onlydeps=False):
 		"""
@@ -5255,9 +5332,19 @@ class depgraph(object):
 
 		db = root_config.trees[self.pkg_tree_map[pkg_type]].dbapi
 		atom_exp = dep_expand(atom, mydb=db, settings=root_config.settings)
-		cp_list = db.cp_list(atom_exp.cp)
+		if self._frozen_config.resolver_cache_cps is not None:
+			self._frozen_config.resolver_cache_cps.add(atom_exp.cp)
 		matched_something = False
 		installed = pkg_type == 'installed'
+		if installed:
+			# The FakeVartree is populated on demand by _load_vdb,
+			# so its contents are not indexed.
+			cp_list = db.cp_list(atom_exp.cp)
+			# descending order
+			cp_list.reverse()
+		else:
+			cp_list = self._pkg_index_cp_list(root_config, pkg_type, db,
+				atom_exp.cp)
 
 		if cp_list:
 			atom_set = InternalPackageSet(initial_atoms=(atom,),
@@ -5267,21 +5354,32 @@ class depgraph(object):
 			else:
 				repo_list = [atom.repo]
 
-			# descending order
-			cp_list.reverse()
-			for cpv in cp_list:
+			if installed:
 				# Call match_from_list on one cpv at a time, in order
 				# to avoid unnecessary match_from_list comparisons on
 				# versions that are never yielded from this method.
-				if not match_from_list(atom_exp, [cpv]):
-					continue
+				matches = (cpv for cpv in cp_list
+					if match_from_list(atom_exp, [cpv]))
+			else:
+				matches = self._pkg_index_match(root_config, pkg_type,
+					atom_exp, cp_list)
+
+			missing = self._frozen_config._pkg_index_missing
+			for cpv in matches:
 				for repo in repo_list:
 
+					missing_key = None
+					if not installed:
+						missing_key = (root_config.root, pkg_type, cpv,
+							getattr(cpv, "build_id", None), repo)
+						if missing_key in missing:
+							continue
 					try:
 						pkg = self._pkg(cpv, pkg_type, root_config,
 							installed=installed, onlydeps=onlydeps, myrepo=repo)
 					except portage.exception.PackageNotFound:
-						pass
+						if missing_key is not None:
+							missing.add(missing_key)
 					else:
 						# A cpv can be returned from dbapi.match() as an
 						# old-style virtual match even in cases when the
@@ -6356,6 +6454,7 @@ class depgraph(object):
 
 		return pkg, in_graph
 
+	@_timed
 	def _complete_graph(self, required_sets=None):
 		"""
 		Add any deep dependencies of required sets (args, system, world) that
@@ -6576,6 +6675,8 @@ class depgraph(object):
 				root_config=root_config, type_name=type_name)
 
 			self._frozen_config._pkg_cache[pkg] = pkg
+			if self._frozen_config.resolver_cache_cps is not None:
+				self._frozen_config.resolver_cache_cps.add(pkg.cp)
 
 			if not self._pkg_visibility_check(pkg) and \
 				'LICENSE' in pkg.masks and len(pkg.masks) == 1:
@@ -7067,6 +7168,7 @@ class depgraph(object):
 			self._frozen_config._trees_orig[
 				root_config.root]["root_config"] = root_config
 
+	@_timed
 	def _resolve_conflicts(self):
 
 		if "complete" not in self._dynamic_config.myparams and \
@@ -7089,6 +7191,7 @@ class depgraph(object):
 			# conflicts (or by blind luck).
 			raise self._unknown_internal_error()
 
+	@_timed
 	def _serialize_tasks(self):
 
 		debug = "--debug" in self._frozen_config.myopts
@@ -8939,6 +9042,32 @@ class depgraph(object):
 	def get_backtrack_infos(self):
 		return self._dynamic_config._backtrack_infos
 
+	def _resolver_cache_eligible(self):
+		"""
+		Returns True if the result of this dependency calculation can
+		be stored in the ResolverCache. Results that have problems to
+		display or that require user intervention are never cached,
+		since that information is not restored from the cache.
+		"""
+		dynamic_config = self._dynamic_config
+		if self.need_config_change() or \
+			dynamic_config._circular_deps_for_display is not None or \
+			dynamic_config._unsatisfied_blockers_for_display is not None or \
+			dynamic_config._unsatisfied_deps_for_display or \
+			dynamic_config._missing_args or \
+			dynamic_config._pprovided_args or \
+			dynamic_config._masked_installed or \
+			dynamic_config._masked_license_updates or \
+			dynamic_config.ignored_binaries or \
+			dynamic_config._conflict_missed_update or \
+			any(dynamic_config._package_tracker.slot_conflicts()):
+			return False
+		for depgraph_sets in dynamic_config.sets.values():
+			for pset in depgraph_sets.sets.values():
+				if pset.errors:
+					return False
+		return True
+
 
 class _dep_check_composite_db(dbapi):
 	"""
@@ -9241,26 +9370,92 @@ def backtrack_depgraph(settings, trees, myopts, myparams,
 	"""
 	Raises PackageSetNotFound if myfiles contains a missing package set.
 	"""
+	timing = None
+	timing_file = ResolverTiming.report_file(settings, myopts)
+	if timing_file:
+		timing = ResolverTiming()
+		timing.instrument_trees(trees)
 	_spinner_start(spinner, myopts)
 	try:
+		if ResolverCache.eligible(myopts, myfiles):
+			return _cached_backtrack_depgraph(settings, trees, myopts,
+				myparams, myaction, myfiles, spinner, timing=timing)
 		return _backtrack_depgraph(settings, trees, myopts, myparams,
-			myaction, myfiles, spinner)
+			myaction, myfiles, spinner, timing=timing)
 	finally:
 		_spinner_stop(spinner)
+		if timing is not None:
+			timing.restore()
+			timing.write(timing_file)
+
+
+def _cached_backtrack_depgraph(settings, trees, myopts, myparams,
+	myaction, myfiles, spinner, timing=None):
+	"""
+	Use a ResolverCache entry for the given inputs if one is valid,
+	and otherwise do a full calculation and store the result.
+	"""
+	debug = "--debug" in myopts
+	resolver_cache = ResolverCache(settings, trees, myopts, myparams,
+		myaction, myfiles)
+	cached = resolver_cache.get()
+	if cached is not None:
+		mydepgraph = depgraph(settings, trees, myopts, myparams, spinner)
+		try:
+			success = mydepgraph._loadResumeCommand(cached,
+				skip_masked=False, skip_missing=False)
+		except (PackageNotFound, depgraph.UnsatisfiedResumeDep):
+			success = False
+		if success:
+			# The resume loader does not take repositories into
+			# account, so make sure that it selected the same ones.
+			repos = cached.get("repos", {})
+			for pkg in mydepgraph.altlist():
+				if isinstance(pkg, Package) and \
+					pkg.operation == "merge" and \
+					repos.get(pkg.cpv) != pkg.repo:
+					success = False
+					break
+		if success:
+			if debug:
+				writemsg_level("\n\nresolver cache hit\n\n",
+					noiselevel=-1, level=logging.DEBUG)
+			return (True, mydepgraph, list(cached["favorites"]))
+		if debug:
+			writemsg_level("\n\nresolver cache entry discarded\n\n",
+				noiselevel=-1, level=logging.DEBUG)
 
+	success, mydepgraph, favorites = _backtrack_depgraph(settings, trees,
+		myopts, myparams, myaction, myfiles, spinner, timing=timing)
 
-def _backtrack_depgraph(settings, trees, myopts, myparams, myaction, myfiles, spinner):
+	if success and mydepgraph._resolver_cache_eligible():
+		mergelist = [x for x in mydepgraph.altlist()
+			if isinstance(x, Package) and x.operation == "merge"]
+		resolver_cache.store(mydepgraph._frozen_config.resolver_cache_cps,
+			mergelist, favorites)
+		resolver_cache.flush()
+
+	return (success, mydepgraph, favorites)
+
+
+def _backtrack_depgraph(settings, trees, myopts, myparams, myaction, myfiles,
+	spinner, timing=None):
 
 	debug = "--debug" in myopts
 	mydepgraph = None
 	max_retries = myopts.get('--backtrack', 3)
 	max_depth = max(1, (max_retries + 1) // 2)
 	allow_backtracking = max_retries > 0
+	backtrack_jobs = myopts.get('--backtrack-jobs', 1)
 	backtracker = Backtracker(max_depth)
 	backtracked = 0
+	# Path of the backtrack node that _backtrack_probe predicted
+	# to be the final one, which is approached by following the
+	# corresponding unexplored nodes.
+	target_path = None
 
 	frozen_config = _frozen_depgraph_config(settings, trees,
-		myopts, myparams, spinner)
+		myopts, myparams, spinner, timing=timing)
 
 	while backtracker:
 
@@ -9270,18 +9465,45 @@ def _backtrack_depgraph(settings, trees, myopts, myparams, myaction, myfiles, sp
 				backtracked, noiselevel=-1, level=logging.DEBUG)
 			mydepgraph.display_problems()
 
-		backtrack_parameters = backtracker.get()
+		if target_path is None and allow_backtracking and \
+			backtrack_jobs > 1 and len(backtracker) > 1:
+			target_path = _backtrack_probe(settings, trees, myopts,
+				myparams, myfiles, frozen_config, backtracker,
+				backtrack_jobs, max_retries - backtracked)
+			if target_path is None:
+				# The serial loop is predicted to fail, so
+				# there's no point in probing again.
+				backtrack_jobs = 1
+			elif debug:
+				writemsg_level(
+					"\n\nbacktracking probe selected %s \n\n" % \
+					(target_path,), noiselevel=-1, level=logging.DEBUG)
+
+		path = None
+		if target_path is not None:
+			for candidate in backtracker.get_candidates():
+				if target_path[:len(candidate)] == candidate:
+					path = candidate
+					break
+			if path is None or path == target_path:
+				target_path = None
+
+		backtrack_parameters = backtracker.get(path=path)
 		if debug and backtrack_parameters.runtime_pkg_mask:
 			writemsg_level(
 				"\n\nruntime_pkg_mask: %s \n\n" %
 				backtrack_parameters.runtime_pkg_mask,
 				noiselevel=-1, level=logging.DEBUG)
 
+		iteration_start = time.time()
 		mydepgraph = depgraph(settings, trees, myopts, myparams, spinner,
 			frozen_config=frozen_config,
 			allow_backtracking=allow_backtracking,
 			backtrack_parameters=backtrack_parameters)
 		success, favorites = mydepgraph.select_files(myfiles)
+		if timing is not None:
+			timing.backtrack_iteration(time.time() - iteration_start,
+				success, mydepgraph.need_restart())
 
 		if success or mydepgraph.need_config_change():
 			break
@@ -9323,6 +9545,98 @@ def _backtrack_depgraph(settings, trees, myopts, myparams, myaction, myfiles, sp
 	return (success, mydepgraph, favorites)
 
 
+def _backtrack_probe(settings, trees, myopts, myparams, myfiles,
+	frozen_config, backtracker, backtrack_jobs, max_retries):
+	"""
+	Explore the subtrees of all unexplored backtrack nodes concurrently,
+	each one in a forked process. The results are then examined in the
+	same order that the serial loop in _backtrack_depgraph would use,
+	including its limit on the number of backtracking steps.
+
+	The serial loop never adds a node that is equal to a node which
+	was added while it explored an earlier subtree, but a forked process
+	only knows about the nodes that existed when it was forked. Therefore,
+	the nodes that each process added are accumulated in order, and the
+	prediction is abandoned as soon as a subtree added a node that an
+	earlier subtree had already added, since the serial loop would have
+	explored that subtree differently.
+
+	@rtype: tuple or None
+	@return: the path of the backtrack node where the serial loop would
+		stop with a successful result (or a result that requires a config
+		change), or None if it would stop with a failure or if the result
+		can not be predicted, in which case the serial loop simply
+		proceeds as usual
+	"""
+	probes = [AsyncFunction(target=_backtrack_subtree,
+		args=(settings, trees, myopts, myparams, myfiles,
+		frozen_config, backtracker, path, max_retries))
+		for path in backtracker.get_candidates()]
+
+	event_loop = (portage._internal_caller and
+		global_event_loop() or EventLoop(main=False))
+	scheduler = TaskScheduler(iter(probes), max_jobs=backtrack_jobs,
+		max_load=myopts.get("--load-average"), event_loop=event_loop)
+	scheduler.start()
+	scheduler.wait()
+
+	backtracked = 0
+	nodes = set()
+	for probe in probes:
+		if probe.result is None:
+			return None
+		events, node_keys = probe.result
+		if not nodes.isdisjoint(node_keys):
+			return None
+		nodes.update(node_keys)
+		for path, status in events:
+			if status == "done":
+				return path
+			elif status == "stop" or backtracked >= max_retries:
+				return None
+			backtracked += 1
+	return None
+
+
+def _backtrack_subtree(settings, trees, myopts, myparams, myfiles,
+	frozen_config, backtracker, path, max_retries):
+	"""
+	Run the serial backtracking loop for the subtree of the backtrack node
+	with the given path. This is called in a forked process, and it
+	returns a tuple of (events, node_keys). The events are a list of
+	(path, status) tuples that describes each backtrack node that was
+	explored, where status is "restart", "stop" or "done". The node_keys
+	are the keys of the nodes that were added to the backtracker while
+	exploring the subtree (see Backtracker.node_keys). Exceptions
+	propagate to AsyncFunction, which prints a traceback, and the main
+	process then proceeds with the serial loop.
+	"""
+	portage.util.noiselimit = -2
+	frozen_config.spinner = None
+	backtracker.restrict(path)
+	node_count = backtracker.node_count()
+	backtracked = 0
+	events = []
+	while backtracker:
+		backtrack_parameters = backtracker.get()
+		mydepgraph = depgraph(settings, trees, myopts, myparams, None,
+			frozen_config=frozen_config,
+			allow_backtracking=True,
+			backtrack_parameters=backtrack_parameters)
+		success, favorites = mydepgraph.select_files(myfiles)
+		if success or mydepgraph.need_config_change():
+			events.append((backtracker.current_path(), "done"))
+			break
+		elif backtracked >= max_retries or \
+			not mydepgraph.need_restart():
+			events.append((backtracker.current_path(), "stop"))
+			break
+		backtracked += 1
+		events.append((backtracker.current_path(), "restart"))
+		backtracker.feedback(mydepgraph.get_backtrack_infos())
+	return events, backtracker.node_keys(node_count)
+
+
 def resume_depgraph(settings, trees, mtimedb, myopts, myparams, spinner):
 	"""
 	Raises PackageSetNotFound if myfiles contains a missing package set.
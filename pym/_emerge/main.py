@@ -157,6 +157,7 @@ def insert_optional_args(args):
 		'--rebuild-if-new-ver'   : y_or_n,
 		'--rebuild-if-unbuilt'   : y_or_n,
 		'--rebuilt-binaries'     : y_or_n,
+		'--resolver-cache'       : y_or_n,
 		'--root-deps'  : ('rdeps',),
 		'--select'               : y_or_n,
 		'--selective'            : y_or_n,
@@ -369,6 +370,15 @@ def parse_opts(tmpcmdline, silent=False):
 			"action" : "store"
 		},
 
+		"--backtrack-jobs": {
+
+			"help"   : "Specifies the number of processes that are used " + \
+				"to explore alternative backtracking choices " + \
+				"simultaneously.",
+
+			"action" : "store"
+		},
+
 		"--binpkg-changed-deps": {
 			"help"    : ("reject binary packages with outdated "
 				"dependencies"),
@@ -419,6 +429,12 @@ def parse_opts(tmpcmdline, silent=False):
 			"choices" : y_or_n
 		},
 
+		"--debug-timing": {
+			"help"   : "write a JSON report of the time spent in the " + \
+				"phases of dependency calculation to the given file",
+			"action" : "store"
+		},
+
 		"--deep": {
 
 			"shortopt" : "-D",
@@ -507,6 +523,12 @@ def parse_opts(tmpcmdline, silent=False):
 			"action" : "store"
 		},
 
+		"--memory-aware": {
+			"help"    : "do not start new jobs unless their predicted " + \
+				"peak memory usage fits in the available memory",
+			"choices" : true_y_or_n
+		},
+
 		"--misspell-suggestions": {
 			"help"    : "enable package name misspell suggestions",
 			"choices" : ("y", "n")
@@ -649,6 +671,12 @@ def parse_opts(tmpcmdline, silent=False):
 			"action" : "store"
 		},
 
+		"--resolver-cache": {
+			"help"     : "reuse the result of a previous identical " + \
+			             "dependency calculation when possible",
+			"choices"  : true_y_or_n
+		},
+
 		"--root": {
 		 "help"   : "specify the target root filesystem for merging packages",
 		 "action" : "store"
@@ -689,6 +717,14 @@ def parse_opts(tmpcmdline, silent=False):
 			"action" : "append",
 		},
 
+		"--unmerge-jobs": {
+
+			"help"   : "Specifies the number of packages to unmerge " + \
+				"simultaneously.",
+
+			"action" : "store"
+		},
+
 		"--use-ebuild-visibility": {
 			"help"     : "use unbuilt ebuild metadata for visibility checks on built packages",
 			"choices"  : true_y_or_n
@@ -885,6 +921,11 @@ def parse_opts(tmpcmdline, silent=False):
 	else:
 		myoptions.keep_going = None
 
+	if myoptions.memory_aware in true_y:
+		myoptions.memory_aware = True
+	else:
+		myoptions.memory_aware = None
+
 	if myoptions.package_moves in true_y:
 		myoptions.package_moves = True
 
@@ -929,6 +970,12 @@ def parse_opts(tmpcmdline, silent=False):
 	if myoptions.rebuilt_binaries in true_y:
 		myoptions.rebuilt_binaries = True
 
+	if myoptions.resolver_cache is not None:
+		if myoptions.resolver_cache in true_y:
+			myoptions.resolver_cache = 'y'
+		else:
+			myoptions.resolver_cache = 'n'
+
 	if myoptions.root_deps in true_y:
 		myoptions.root_deps = True
 
@@ -956,6 +1003,36 @@ def parse_opts(tmpcmdline, silent=False):
 
 		myoptions.backtrack = backtrack
 
+	if myoptions.backtrack_jobs is not None:
+
+		try:
+			backtrack_jobs = int(myoptions.backtrack_jobs)
+		except (OverflowError, ValueError):
+			backtrack_jobs = -1
+
+		if backtrack_jobs < 1:
+			backtrack_jobs = None
+			if not silent:
+				parser.error("Invalid --backtrack-jobs parameter: '%s'\n" % \
+					(myoptions.backtrack_jobs,))
+
+		myoptions.backtrack_jobs = backtrack_jobs
+
+	if myoptions.unmerge_jobs is not None:
+
+		try:
+			unmerge_jobs = int(myoptions.unmerge_jobs)
+		except (OverflowError, ValueError):
+			unmerge_jobs = -1
+
+		if unmerge_jobs < 1:
+			unmerge_jobs = None
+			if not silent:
+				parser.error("Invalid --unmerge-jobs parameter: '%s'\n" % \
+					(myoptions.unmerge_jobs,))
+
+		myoptions.unmerge_jobs = unmerge_jobs
+
 	if myoptions.deep is not None:
 		deep = None
 		if myoptions.deep == "True":
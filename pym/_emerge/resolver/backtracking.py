@@ -1,7 +1,14 @@
-# Copyright 2010-2012 Gentoo Foundation
+# Copyright 2010-2016 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 import copy
+import sys
+
+if sys.hexversion >= 0x3000000:
+	basestring = str
+	_unicode = str
+else:
+	_unicode = unicode
 
 class BacktrackParameter(object):
 
@@ -61,17 +68,43 @@ class BacktrackParameter(object):
 			self.prune_rebuilds == other.prune_rebuilds
 
 
+def _node_key(obj):
+	"""
+	Convert a backtrack parameter (or a part of it) into a picklable,
+	hashable key, such that equal parameters have equal keys.
+	"""
+	hash_key = getattr(obj, "_hash_key", None)
+	if hash_key is not None:
+		# Package instance
+		return _node_key(hash_key)
+	if isinstance(obj, dict):
+		return frozenset((_node_key(k), _node_key(v))
+			for k, v in obj.items())
+	if isinstance(obj, (set, frozenset)):
+		return frozenset(_node_key(x) for x in obj)
+	if isinstance(obj, (list, tuple)):
+		return tuple(_node_key(x) for x in obj)
+	if isinstance(obj, basestring):
+		return _unicode(obj)
+	if obj is None or isinstance(obj, (bool, int)):
+		return obj
+	return (type(obj).__name__, _unicode(obj))
+
+
 class _BacktrackNode(object):
 
 	__slots__ = (
-		"parameter", "depth", "mask_steps", "terminal",
+		"parameter", "depth", "mask_steps", "terminal", "path",
 	)
 
-	def __init__(self, parameter=BacktrackParameter(), depth=0, mask_steps=0, terminal=True):
+	def __init__(self, parameter=BacktrackParameter(), depth=0, mask_steps=0, terminal=True, path=()):
 		self.parameter = parameter
 		self.depth = depth
 		self.mask_steps = mask_steps
 		self.terminal = terminal
+		# Identifies the node by the sequence of feedback steps that
+		# created it, which is stable across processes.
+		self.path = path
 
 	def __eq__(self, other):
 		return self.parameter == other.parameter
@@ -81,6 +114,7 @@ class Backtracker(object):
 
 	__slots__ = (
 		"_max_depth", "_unexplored_nodes", "_current_node", "_nodes", "_root",
+		"_child_count",
 	)
 
 	def __init__(self, max_depth):
@@ -88,6 +122,7 @@ class Backtracker(object):
 		self._unexplored_nodes = []
 		self._current_node = None
 		self._nodes = []
+		self._child_count = 0
 
 		self._root = _BacktrackNode()
 		self._add(self._root)
@@ -107,10 +142,18 @@ class Backtracker(object):
 			self._nodes.append(node)
 
 
-	def get(self):
+	def get(self, path=None):
 		"""
 		Returns a backtrack parameter. The backtrack graph is explored with depth first.
+		If path is given, then the unexplored node with that path is returned instead.
 		"""
+		if path is not None:
+			for i, node in enumerate(self._unexplored_nodes):
+				if node.path == path:
+					del self._unexplored_nodes[i]
+					self._current_node = node
+					return copy.deepcopy(node.parameter)
+			return None
 		if self._unexplored_nodes:
 			node = self._unexplored_nodes.pop()
 			self._current_node = node
@@ -118,6 +161,47 @@ class Backtracker(object):
 		else:
 			return None
 
+	def get_candidates(self):
+		"""
+		Returns the paths of all unexplored nodes, in the order that get() would return them.
+		"""
+		return [node.path for node in reversed(self._unexplored_nodes)]
+
+	def current_path(self):
+		"""
+		Returns the path of the node that was returned by the last get() call.
+		"""
+		return self._current_node.path
+
+	def restrict(self, path):
+		"""
+		Discard all unexplored nodes except for the one with the given path, so that
+		only its subtree is explored.
+		"""
+		self._unexplored_nodes = [node for node in self._unexplored_nodes
+			if node.path == path]
+
+	def node_count(self):
+		"""
+		Returns the number of nodes that have been added so far.
+		"""
+		return len(self._nodes)
+
+	def node_keys(self, start=0):
+		"""
+		Returns picklable keys for the nodes that were added after the
+		first start nodes, such that equal nodes have equal keys.
+		"""
+		return [_node_key(tuple(getattr(node.parameter, attr)
+			for attr in BacktrackParameter.__slots__))
+			for node in self._nodes[start:]]
+
+	def _new_node(self):
+		new_node = copy.deepcopy(self._current_node)
+		new_node.path = self._current_node.path + (self._child_count,)
+		self._child_count += 1
+		return new_node
+
 
 	def __len__(self):
 		return len(self._unexplored_nodes)
@@ -155,7 +239,7 @@ class Backtracker(object):
 
 	def _feedback_slot_conflict(self, conflict_data):
 		for pkg, parent_atoms in conflict_data:
-			new_node = copy.deepcopy(self._current_node)
+			new_node = self._new_node()
 			new_node.depth += 1
 			new_node.mask_steps += 1
 			new_node.terminal = False
@@ -165,7 +249,7 @@ class Backtracker(object):
 
 
 	def _feedback_missing_dep(self, dep):
-		new_node = copy.deepcopy(self._current_node)
+		new_node = self._new_node()
 		new_node.depth += 1
 		new_node.mask_steps += 1
 		new_node.terminal = False
@@ -181,7 +265,7 @@ class Backtracker(object):
 		"""
 		Handle config changes. Don't count config changes for the maximum backtrack depth.
 		"""
-		new_node = copy.deepcopy(self._current_node)
+		new_node = self._new_node()
 		new_node.depth += 1
 		para = new_node.parameter
 
@@ -230,6 +314,7 @@ class Backtracker(object):
 		Takes information from the depgraph and computes new backtrack parameters to try.
 		"""
 		assert self._current_node is not None, "call feedback() only after get() was called"
+		self._child_count = 0
 
 		#Not all config changes require a restart, that's why they can appear together
 		#with other conflicts.
@@ -0,0 +1,160 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from __future__ import unicode_literals
+
+import json
+import sys
+import time
+
+import portage
+from portage import _encodings, _unicode_encode
+from portage.util import atomic_ofstream, writemsg
+
+class ResolverTiming(object):
+	"""
+	Records wall time and call counts for the phases of dependency
+	calculation and for dbapi calls, and writes them as a JSON report
+	that can be compared between runs. Enabled by --debug-timing=FILE
+	or PORTAGE_DEBUG_TIMING=FILE.
+
+	The report has the following format:
+
+	{
+		"version" : "1",
+		"total" : seconds,
+		"phases" : {name : {"calls" : count, "time" : seconds}, ...},
+		"dbapi" : {"porttree.aux_get" : {"calls" : count,
+			"time" : seconds}, ...},
+		"backtrack" : [{"iteration" : 0, "time" : seconds,
+			"success" : bool, "restart" : bool}, ...],
+	}
+
+	Times of nested calls of the same phase are only counted once, for
+	the outermost call.
+	"""
+
+	_report_version = "1"
+
+	_json_write_opts = {
+		"ensure_ascii": False,
+		"indent": "\t",
+		"sort_keys": True
+	}
+	if sys.hexversion < 0x30200F0:
+		# indent only supports int number of spaces
+		_json_write_opts["indent"] = 4
+
+	_dbapi_methods = ("aux_get", "match")
+
+	def __init__(self):
+		self._start_time = time.time()
+		self._phases = {}
+		self._dbapi = {}
+		self._active = set()
+		self._backtrack = []
+		self._restore = []
+
+	@classmethod
+	def report_file(cls, settings, myopts):
+		"""
+		Return the filename that the report should be written to, or
+		None if timing is disabled.
+		"""
+		return myopts.get("--debug-timing") or \
+			settings.get("PORTAGE_DEBUG_TIMING") or None
+
+	def _add(self, records, name, elapsed):
+		record = records.get(name)
+		if record is None:
+			record = records[name] = [0, 0.0]
+		record[0] += 1
+		record[1] += elapsed
+
+	def call(self, name, func, *args, **kwargs):
+		"""
+		Call func with the given arguments and record the elapsed
+		time as the named phase.
+		"""
+		if name in self._active:
+			return func(*args, **kwargs)
+		self._active.add(name)
+		start = time.time()
+		try:
+			return func(*args, **kwargs)
+		finally:
+			self._active.discard(name)
+			self._add(self._phases, name, time.time() - start)
+
+	def backtrack_iteration(self, elapsed, success, restart):
+		self._backtrack.append({
+			"iteration" : len(self._backtrack),
+			"time" : elapsed,
+			"success" : bool(success),
+			"restart" : bool(restart),
+		})
+
+	def instrument_dbapi(self, db, label):
+		"""
+		Replace the aux_get and match methods of the given dbapi instance
+		with wrappers that record their calls. The original methods are
+		restored by the restore method.
+		"""
+		for method in self._dbapi_methods:
+			orig = getattr(db, method, None)
+			if orig is None:
+				continue
+			self._restore.append((db, method, vars(db).get(method)))
+			setattr(db, method,
+				self._wrap(orig, "%s.%s" % (label, method)))
+
+	def instrument_trees(self, trees):
+		for root in trees:
+			for tree in ("porttree", "bintree", "vartree"):
+				try:
+					db = trees[root][tree].dbapi
+				except (AttributeError, KeyError):
+					continue
+				self.instrument_dbapi(db, tree)
+
+	def _wrap(self, orig, name):
+		records = self._dbapi
+		add = self._add
+		def wrapper(*args, **kwargs):
+			start = time.time()
+			try:
+				return orig(*args, **kwargs)
+			finally:
+				add(records, name, time.time() - start)
+		return wrapper
+
+	def restore(self):
+		while self._restore:
+			db, method, orig = self._restore.pop()
+			if orig is None:
+				delattr(db, method)
+			else:
+				setattr(db, method, orig)
+
+	def report(self):
+		def records(d):
+			return dict((k, {"calls" : v[0], "time" : v[1]})
+				for k, v in d.items())
+		return {
+			"version" : self._report_version,
+			"total" : time.time() - self._start_time,
+			"phases" : records(self._phases),
+			"dbapi" : records(self._dbapi),
+			"backtrack" : list(self._backtrack),
+		}
+
+	def write(self, filename):
+		try:
+			f = atomic_ofstream(filename, mode='wb')
+			f.write(_unicode_encode(
+				json.dumps(self.report(), **self._json_write_opts),
+				encoding=_encodings['repo.content'], errors='strict'))
+			f.close()
+		except (IOError, OSError, portage.exception.PortageException) as e:
+			writemsg("!!! Error writing '%s': %s\n" % (filename, e),
+				noiselevel=-1)
@@ -24,6 +24,8 @@ class search(object):
 	#
 	VERSION_SHORT=1
 	VERSION_RELEASE=2
+	# The number of DESCRIPTION lookups that are done at once.
+	_aux_get_many_chunk = 100
 
 	#
 	# public interface
@@ -95,6 +97,34 @@ class search(object):
 				pass
 		raise KeyError(args[0])
 
+	def _aux_get_many(self, cpvs, keys):
+		"""
+		Generate (cpv, values) pairs like dbapi.aux_get_many, where each
+		cpv is looked up in the first db that has it, and values is None
+		if none of the dbs has it.
+		"""
+		results = {}
+		pending = list(cpvs)
+		for db in self._dbs:
+			if not pending:
+				break
+			aux_get_many = getattr(db, "aux_get_many", None)
+			if aux_get_many is None:
+				found = []
+				for cpv in pending:
+					try:
+						found.append((cpv, db.aux_get(cpv, keys)))
+					except KeyError:
+						pass
+			else:
+				found = aux_get_many(pending, keys)
+			for cpv, values in found:
+				if values is not None:
+					results[cpv] = values
+			pending = [cpv for cpv in pending if cpv not in results]
+		for cpv in cpvs:
+			yield cpv, results.get(cpv)
+
 	def _aux_get_error(self, cpv):
 		portage.writemsg("emerge: search: "
 			"aux_get('%s') failed, skipping\n" % cpv,
@@ -273,6 +303,26 @@ class search(object):
 						seq_match.quick_ratio() >= cutoff and
 						seq_match.ratio() >= cutoff)
 
+		# Packages that need a DESCRIPTION lookup are buffered, so that
+		# their descriptions can be looked up with aux_get_many, while
+		# the order of the results is preserved.
+		buffered = []
+		desc_cpvs = []
+
+		def flush():
+			descs = dict(self._aux_get_many(desc_cpvs, ["DESCRIPTION"]))
+			for mtype, package, full_package in buffered:
+				if full_package is None:
+					yield (mtype, package)
+					continue
+				full_desc = descs[full_package]
+				if full_desc is None:
+					self._aux_get_error(full_package)
+				elif self.searchre.search(full_desc[0]):
+					yield (mtype, package)
+			del buffered[:]
+			del desc_cpvs[:]
+
 		for package in self._cp_all():
 			self._spinner_update()
 
@@ -282,9 +332,9 @@ class search(object):
 				match_string  = package.split("/")[-1]
 
 			if self.searchre.search(match_string):
-				yield ("pkg", package)
+				result = ("pkg", package, None)
 			elif fuzzy and fuzzy_search(match_string):
-				yield ("pkg", package)
+				result = ("pkg", package, None)
 			elif self.searchdesc: # DESCRIPTION searching
 				# Use _first_cp to avoid an expensive visibility check,
 				# since the visibility check can be avoided entirely
@@ -292,16 +342,21 @@ class search(object):
 				full_package = self._first_cp(package)
 				if not full_package:
 					continue
-				try:
-					full_desc = self._aux_get(
-						full_package, ["DESCRIPTION"])[0]
-				except KeyError:
-					self._aux_get_error(full_package)
-					continue
-				if not self.searchre.search(full_desc):
-					continue
+				result = ("desc", package, full_package)
+				desc_cpvs.append(full_package)
+			else:
+				continue
+
+			if desc_cpvs:
+				buffered.append(result)
+				if len(desc_cpvs) >= self._aux_get_many_chunk:
+					for result in flush():
+						yield result
+			else:
+				yield result[:2]
 
-				yield ("desc", package)
+		for result in flush():
+			yield result
 
 		self.sdict = self.setconfig.getSets()
 		for setname in self.sdict:
@@ -14,12 +14,15 @@ from portage.localization import _
 from portage.output import bold, colorize, darkgreen, green
 from portage._sets import SETPREFIX
 from portage._sets.base import EditablePackageSet
+from portage.util._async.run_main_scheduler import run_main_scheduler
+from portage.util._eventloop.global_event_loop import global_event_loop
 from portage.versions import cpv_sort_key, _pkg_str
 
 from _emerge.emergelog import emergelog
 from _emerge.Package import Package
 from _emerge.UserQuery import UserQuery
 from _emerge.UninstallFailure import UninstallFailure
+from _emerge.UnmergeScheduler import UnmergeScheduler
 from _emerge.countdown import countdown
 
 def _unmerge_display(root_config, myopts, unmerge_action,
@@ -561,18 +564,60 @@ def unmerge(root_config, myopts, unmerge_action,
 	all_selected.update(*[x["selected"] for x in pkgmap])
 
 	# Set counter variables
-	curval = 1
+	curval = [1]
 	maxval = len(all_selected)
 
+	def unmerge_start(y):
+		emergelog(xterm_titles, "=== Unmerging... ("+y+")")
+		message = ">>> Unmerging ({0} of {1}) {2}...\n".format(
+			colorize("MERGE_LIST_PROGRESS", str(curval[0])),
+			colorize("MERGE_LIST_PROGRESS", str(maxval)),
+			y)
+		writemsg_level(message, noiselevel=-1)
+		curval[0] += 1
+
+	def unmerge_exit(y, retval):
+		if retval != os.EX_OK:
+			emergelog(xterm_titles, " !!! unmerge FAILURE: "+y)
+		else:
+			if clean_world and hasattr(sets["selected"], "cleanPackage")\
+					and hasattr(sets["selected"], "lock"):
+				sets["selected"].lock()
+				if hasattr(sets["selected"], "load"):
+					sets["selected"].load()
+				sets["selected"].cleanPackage(vartree.dbapi, y)
+				sets["selected"].unlock()
+			emergelog(xterm_titles, " >>> unmerge success: "+y)
+
+	unmerge_jobs = myopts.get("--unmerge-jobs") or 1
+	if unmerge_jobs > 1 and maxval > 1:
+		# Unmerge packages with disjoint contents concurrently.
+		cpv_list = []
+		for x in pkgmap:
+			cpv_list.extend(y for y in x["selected"] if y not in cpv_list)
+		retvals = {}
+		def unmerge_parallel_exit(y, retval):
+			retvals[y] = retval
+			unmerge_exit(y, retval)
+		unmerge_scheduler = UnmergeScheduler(cpv_list, vartree, mysettings,
+			ordered=ordered, ldpath_mtimes=ldpath_mtimes,
+			task_start=unmerge_start, task_exit=unmerge_parallel_exit,
+			max_jobs=unmerge_jobs,
+			event_loop=(scheduler._event_loop if scheduler is not None
+			else global_event_loop()))
+		received_signal = run_main_scheduler(unmerge_scheduler)
+		if received_signal is not None:
+			sys.exit(128 + received_signal)
+		if unmerge_scheduler.failed is not None:
+			retval = retvals[unmerge_scheduler.failed]
+			if raise_on_error:
+				raise UninstallFailure(retval)
+			sys.exit(retval)
+		pkgmap = []
+
 	for x in range(len(pkgmap)):
 		for y in pkgmap[x]["selected"]:
-			emergelog(xterm_titles, "=== Unmerging... ("+y+")")
-			message = ">>> Unmerging ({0} of {1}) {2}...\n".format(
-				colorize("MERGE_LIST_PROGRESS", str(curval)),
-				colorize("MERGE_LIST_PROGRESS", str(maxval)),
-				y)
-			writemsg_level(message, noiselevel=-1)
-			curval += 1
+			unmerge_start(y)
 
 			mysplit = y.split("/")
 			#unmerge...
@@ -581,20 +626,11 @@ def unmerge(root_config, myopts, unmerge_action,
 				vartree=vartree, ldpath_mtimes=ldpath_mtimes,
 				scheduler=scheduler)
 
+			unmerge_exit(y, retval)
 			if retval != os.EX_OK:
-				emergelog(xterm_titles, " !!! unmerge FAILURE: "+y)
 				if raise_on_error:
 					raise UninstallFailure(retval)
 				sys.exit(retval)
-			else:
-				if clean_world and hasattr(sets["selected"], "cleanPackage")\
-						and hasattr(sets["selected"], "lock"):
-					sets["selected"].lock()
-					if hasattr(sets["selected"], "load"):
-						sets["selected"].load()
-					sets["selected"].cleanPackage(vartree.dbapi, y)
-					sets["selected"].unlock()
-				emergelog(xterm_titles, " >>> unmerge success: "+y)
 
 	if clean_world and hasattr(sets["selected"], "remove")\
 			and hasattr(sets["selected"], "lock"):
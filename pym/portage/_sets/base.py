@@ -2,7 +2,8 @@
 # Distributed under the terms of the GNU General Public License v2
 
 import sys
-from portage.dep import Atom, ExtendedAtomDict, best_match_to_list, match_from_list
+from portage.dep import Atom, ExtendedAtomDict, best_match_to_list, \
+	match_from_list, _intern_atom
 from portage.exception import InvalidAtom
 from portage.versions import cpv_getkey
 
@@ -79,7 +80,7 @@ class PackageSet(object):
 				if not a:
 					continue
 				try:
-					a = Atom(a, allow_wildcard=True, allow_repo=True)
+					a = _intern_atom(a, allow_wildcard=True, allow_repo=True)
 				except InvalidAtom:
 					self._nonatoms.add(a)
 					continue
@@ -185,7 +186,7 @@ class EditablePackageSet(PackageSet):
 		for a in atoms:
 			if not isinstance(a, Atom):
 				try:
-					a = Atom(a, allow_wildcard=True, allow_repo=True)
+					a = _intern_atom(a, allow_wildcard=True, allow_repo=True)
 				except InvalidAtom:
 					modified = True
 					self._nonatoms.add(a)
@@ -1,4 +1,4 @@
-# Copyright 2007-2014 Gentoo Foundation
+# Copyright 2007-2016 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 from __future__ import division
@@ -481,14 +481,18 @@ class ChangedDepsSet(PackageSet):
 		subslot_repl_re = re.compile(r':[^[]*=')
 
 		atoms = []
-		for cpv in self._vardb.cpv_all():
-			# no ebuild, no update :).
-			if not self._portdb.cpv_exists(cpv):
+		# no ebuild, no update :).
+		cpvs = [cpv for cpv in self._vardb.cpv_all()
+			if self._portdb.cpv_exists(cpv)]
+		for (cpv, vdb_values), (_, pdb_values) in zip(
+			self._vardb.aux_get_many(cpvs, ('USE', 'EAPI') + depvars),
+			self._portdb.aux_get_many(cpvs, depvars)):
+			if vdb_values is None or pdb_values is None:
 				continue
 
 			# USE flags used to build the ebuild and EAPI
 			# (needed for Atom & use_reduce())
-			use, eapi = self._vardb.aux_get(cpv, ('USE', 'EAPI'))
+			use, eapi = vdb_values[:2]
 			usel = use.split()
 
 			# function used to recursively process atoms in nested lists.
@@ -520,9 +524,9 @@ class ChangedDepsSet(PackageSet):
 			# we need to do some cleaning up & expansion to make matching
 			# meaningful since vdb dependencies are conditional-free.
 			vdbvars = [clean_subslots(use_reduce(x, uselist=usel, eapi=eapi))
-					for x in self._vardb.aux_get(cpv, depvars)]
+					for x in vdb_values[2:]]
 			pdbvars = [clean_subslots(use_reduce(x, uselist=usel, eapi=eapi), usel)
-					for x in self._portdb.aux_get(cpv, depvars)]
+					for x in pdb_values]
 
 			# if dependencies don't match, trigger the rebuild.
 			if vdbvars != pdbvars:
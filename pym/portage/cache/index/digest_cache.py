@@ -0,0 +1,189 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import binascii
+import errno
+import random
+import sys
+import time
+
+from portage import os
+from portage import _unicode_decode
+from portage.data import portage_gid
+from portage.util import writemsg
+from portage.util._sqlite import SqliteDatabase
+from portage.localization import _
+
+# The name of the database file in DISTDIR or PKGDIR.
+digest_cache_filename = ".digest-cache"
+
+# The default percentage of cached files that are hashed again with
+# FEATURES=strict.
+_default_sample = 5
+
+def _mtime_ns(st):
+	if sys.hexversion >= 0x3030000:
+		return st.st_mtime_ns
+	return int(st.st_mtime * 1000000000)
+
+def _ctime_ns(st):
+	if sys.hexversion >= 0x3030000:
+		return st.st_ctime_ns
+	return int(st.st_ctime * 1000000000)
+
+def _stat_key(st):
+	return (st.st_dev, st.st_ino, st.st_size, _mtime_ns(st), _ctime_ns(st))
+
+class DigestCache(SqliteDatabase):
+	"""
+	An sqlite database which stores the digests of the files in a
+	directory like DISTDIR or PKGDIR, so that files which have not
+	changed since they were hashed can be verified without reading them.
+	Digests are keyed on the device and inode numbers of a file and the
+	hash type, and they are only valid for the size, mtime and ctime (in
+	nanoseconds) that the file had when it was hashed. The ctime is
+	necessary since the mtime can be restored after a modification, for
+	example by wget, while the ctime can't be set from userspace. Digests
+	are stored in binary form.
+
+	With sample_rate > 0, that fraction of the lookups ignores the cache,
+	so that the files are hashed again, and update() reports a warning if
+	the new digests differ from the cached ones.
+
+	Since the cache is completely disposable, database errors are
+	reported once and otherwise treated like missing entries.
+	"""
+
+	_format_version = "2"
+
+	# The cache is only created in an existing, writable directory.
+	_create_dirs = False
+
+	# Files that have been modified less than this many seconds ago are
+	# not cached, since filesystems with coarse timestamps might not
+	# change the mtime for another modification.
+	_racy_seconds = 2
+
+	def __init__(self, directory, sample_rate=0, gid=-1, perms=-1):
+		SqliteDatabase.__init__(self,
+			os.path.join(directory, digest_cache_filename),
+			gid=gid, perms=perms)
+		self._sample_rate = sample_rate
+		self._readonly = False
+		# {(dev, ino): {hash_name: digest}}, for sampled lookups
+		self._sampled = {}
+
+	def _init_tables(self, connection):
+		connection.execute("CREATE TABLE digests "
+			"(dev INTEGER, ino INTEGER, size INTEGER, mtime INTEGER, "
+			"ctime INTEGER, hash TEXT, digest BLOB, PRIMARY KEY (dev, ino, hash))")
+
+	def _error(self, e):
+		if not self._readonly:
+			SqliteDatabase._error(self, e)
+		self._readonly = True
+		self._connection = None
+
+	def get(self, st, hash_names):
+		"""
+		Return a dict of the cached digests of the given hash types for
+		a file with the given stat result. Hash types which are not
+		cached are omitted.
+		"""
+		hash_names = list(hash_names)
+		if not hash_names:
+			return {}
+		try:
+			connection = self._connect()
+			if connection is None:
+				return {}
+			rows = connection.execute("SELECT hash, digest FROM digests "
+				"WHERE dev = ? AND ino = ? AND size = ? AND mtime = ? "
+				"AND ctime = ? AND hash IN (%s)" %
+				", ".join("?" * len(hash_names)),
+				_stat_key(st) + tuple(hash_names)).fetchall()
+		except self._db_module.Error as e:
+			self._error(e)
+			return {}
+
+		digests = {}
+		for hash_name, digest in rows:
+			digests[hash_name] = _unicode_decode(
+				binascii.hexlify(digest), encoding="ascii")
+		if digests and self._sample_rate and \
+			random.random() < self._sample_rate:
+			self._sampled[(st.st_dev, st.st_ino)] = digests
+			return {}
+		return digests
+
+	def update(self, filename, st, digests):
+		"""
+		Store the given digests, which have been computed for the given
+		file after the given stat result was obtained. Nothing is stored
+		if the file has changed since then, or if it was modified so
+		recently that it might still be modified without a change of
+		its mtime.
+		"""
+		sampled = self._sampled.pop((st.st_dev, st.st_ino), None)
+		if sampled is not None:
+			for hash_name, digest in sampled.items():
+				if digests.get(hash_name, digest) != digest:
+					writemsg(_("!!! The cached %s digest of '%s' was "
+						"wrong, although the file did not change\n") %
+						(hash_name, filename), noiselevel=-1)
+					break
+
+		if self._readonly or not digests:
+			return
+		if not os.access(self._filename, os.W_OK) and \
+			(os.path.exists(self._filename) or
+			not os.access(os.path.dirname(self._filename), os.W_OK)):
+			# Unprivileged users only read the cache.
+			self._readonly = True
+			return
+		try:
+			current = os.stat(filename)
+		except OSError as e:
+			if e.errno not in (errno.ENOENT, errno.ESTALE):
+				raise
+			return
+		key = _stat_key(st)
+		if key != _stat_key(current) or \
+			time.time() - current.st_mtime < self._racy_seconds:
+			return
+		try:
+			connection = self._connect(create=True)
+			if connection is None:
+				return
+			with connection:
+				connection.execute("DELETE FROM digests WHERE "
+					"dev = ? AND ino = ? AND "
+					"(size != ? OR mtime != ? OR ctime != ?)", key)
+				connection.executemany("INSERT OR REPLACE INTO digests "
+					"VALUES (?, ?, ?, ?, ?, ?, ?)", (key + (hash_name,
+					self._db_module.Binary(binascii.unhexlify(digest)))
+					for hash_name, digest in digests.items()))
+		except self._db_module.Error as e:
+			self._error(e)
+
+def get_digest_cache(settings, directory):
+	"""
+	Return a DigestCache for the given directory if FEATURES=digest-cache
+	is enabled and sqlite is available, or None otherwise. With
+	FEATURES=strict, PORTAGE_DIGEST_CACHE_SAMPLE percent of the cached
+	files are hashed again.
+	"""
+	if "digest-cache" not in settings.features or \
+		not DigestCache.available() or not directory:
+		return None
+	sample_rate = 0
+	if "strict" in settings.features:
+		try:
+			sample_rate = float(settings.get(
+				"PORTAGE_DIGEST_CACHE_SAMPLE", _default_sample)) / 100
+		except ValueError:
+			writemsg(_("!!! Invalid PORTAGE_DIGEST_CACHE_SAMPLE: %s\n") %
+				settings["PORTAGE_DIGEST_CACHE_SAMPLE"], noiselevel=-1)
+			sample_rate = float(_default_sample) / 100
+	return DigestCache(directory, sample_rate=sample_rate,
+		gid=portage_gid, perms=0o664)
@@ -0,0 +1,174 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from portage.versions import cpv_getkey
+from portage.util._sqlite import SqliteDatabase
+
+class EclassIndex(SqliteDatabase):
+	"""
+	An sqlite database which maps the names of eclasses to the cpvs of
+	each repository that inherit them, directly or indirectly, according
+	to the _eclasses_ entries of the metadata cache. It is updated as a
+	side product of metadata generation, so that the consumers of an
+	eclass can be found without reading every cache entry.
+
+	Updates are buffered until flush() is called. A repository is
+	complete when all of its cache entries have been indexed, either by
+	a full metadata regeneration or by rebuild(). Entries that are
+	indexed individually do not make a repository complete.
+
+	Since the index is completely disposable, database errors are
+	reported and otherwise treated like missing entries. If readonly is
+	True, then updates are discarded.
+	"""
+
+	_format_version = "1"
+
+	def __init__(self, filename, readonly=False, gid=-1, perms=-1):
+		SqliteDatabase.__init__(self, filename, gid=gid, perms=perms)
+		self._readonly = readonly
+		# {(repo, cpv): eclasses, or None for removal}
+		self._pending = {}
+		# {repo: cps}, for cps that are removed before _pending is applied
+		self._pending_cps = {}
+		# {repo: complete}
+		self._pending_complete = {}
+
+	def _init_tables(self, connection):
+		connection.execute("CREATE TABLE repos "
+			"(repo TEXT PRIMARY KEY, complete INTEGER)")
+		connection.execute("CREATE TABLE inherits "
+			"(eclass TEXT, repo TEXT, cp TEXT, cpv TEXT, "
+			"PRIMARY KEY (repo, cpv, eclass))")
+		connection.execute("CREATE INDEX inherits_eclass "
+			"ON inherits (eclass)")
+		connection.execute("CREATE INDEX inherits_cp "
+			"ON inherits (repo, cp)")
+
+	def update(self, repo, cpv, eclasses):
+		"""
+		Replace the eclasses that are inherited by the given cpv.
+		"""
+		if not self._readonly:
+			self._pending[(repo, cpv)] = tuple(eclasses)
+
+	def remove(self, repo, cpv):
+		"""
+		Remove the given cpv, for example when its cache entry has been
+		removed.
+		"""
+		if not self._readonly:
+			self._pending[(repo, cpv)] = None
+
+	def update_cps(self, repo, cps, entries):
+		"""
+		Replace all cpvs of the given cps with the given (cpv, eclasses)
+		pairs, for example after the metadata of the cps has been
+		regenerated.
+		"""
+		if self._readonly:
+			return
+		cps = frozenset(cps)
+		for key in list(self._pending):
+			if key[0] == repo and cpv_getkey(key[1]) in cps:
+				del self._pending[key]
+		self._pending_cps.setdefault(repo, set()).update(cps)
+		for cpv, eclasses in entries:
+			self._pending[(repo, cpv)] = tuple(eclasses)
+
+	def set_complete(self, repo, complete):
+		"""
+		Record whether all cache entries of the given repository have
+		been indexed.
+		"""
+		if not self._readonly:
+			self._pending_complete[repo] = bool(complete)
+
+	def rebuild(self, repo, entries):
+		"""
+		Replace the index of the given repository with the given
+		(cpv, eclasses) pairs, and mark it complete.
+		"""
+		if self._readonly:
+			return
+		for key in list(self._pending):
+			if key[0] == repo:
+				del self._pending[key]
+		self._pending_cps.pop(repo, None)
+		self._pending_complete.pop(repo, None)
+		try:
+			connection = self._connect(create=True)
+			if connection is None:
+				return
+			with connection:
+				connection.execute("DELETE FROM inherits WHERE repo = ?",
+					(repo,))
+				connection.executemany("INSERT OR IGNORE INTO inherits "
+					"VALUES (?, ?, ?, ?)", ((eclass, repo, cpv_getkey(cpv),
+					cpv) for cpv, eclasses in entries for eclass in eclasses))
+				connection.execute("INSERT OR REPLACE INTO repos "
+					"VALUES (?, 1)", (repo,))
+		except self._db_module.Error as e:
+			self._error(e)
+
+	def flush(self):
+		"""
+		Write the buffered updates.
+		"""
+		if not (self._pending or self._pending_cps or
+			self._pending_complete):
+			return
+		pending = self._pending
+		pending_cps = self._pending_cps
+		pending_complete = self._pending_complete
+		self._pending = {}
+		self._pending_cps = {}
+		self._pending_complete = {}
+		try:
+			connection = self._connect(create=True)
+			if connection is None:
+				return
+			with connection:
+				connection.executemany("DELETE FROM inherits "
+					"WHERE repo = ? AND cp = ?", ((repo, cp)
+					for repo, cps in pending_cps.items() for cp in cps))
+				connection.executemany("DELETE FROM inherits "
+					"WHERE repo = ? AND cpv = ?", pending)
+				connection.executemany("INSERT OR IGNORE INTO inherits "
+					"VALUES (?, ?, ?, ?)", ((eclass, repo, cpv_getkey(cpv),
+					cpv) for (repo, cpv), eclasses in pending.items()
+					if eclasses is not None for eclass in eclasses))
+				connection.executemany("INSERT OR REPLACE INTO repos "
+					"VALUES (?, ?)", ((repo, int(complete))
+					for repo, complete in pending_complete.items()))
+		except self._db_module.Error as e:
+			self._error(e)
+
+	def _query(self, statement, params=()):
+		self.flush()
+		return SqliteDatabase._query(self, statement, params)
+
+	def complete(self, repo):
+		"""
+		Return True if all cache entries of the given repository have
+		been indexed.
+		"""
+		return bool(self._query(
+			"SELECT 1 FROM repos WHERE repo = ? AND complete", (repo,)))
+
+	def lookup(self, eclass, repo=None):
+		"""
+		Return a sorted list of (repo, cpv) pairs for the cpvs that
+		inherit the given eclass, optionally limited to one repository.
+		"""
+		if repo is None:
+			rows = self._query("SELECT repo, cpv FROM inherits "
+				"WHERE eclass = ?", (eclass,))
+		else:
+			rows = self._query("SELECT repo, cpv FROM inherits "
+				"WHERE eclass = ? AND repo = ?", (eclass, repo))
+		return sorted(rows)
+
+	def close(self):
+		self.flush()
+		SqliteDatabase.close(self)
@@ -0,0 +1,183 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+"""
+A packed, single-file copy of the md5-dict cache format, which is read
+through mmap. It consists of a header, a table of entries that is sorted
+by cpv, the cpvs, and the records, which contain the same "KEY=VALUE"
+lines as the files of metadata/md5-cache:
+
+	header: magic, format version, number of entries
+	table: (cpv offset, cpv length, record offset, record length)
+
+All integers are unsigned, 32-bit and big-endian, and offsets are
+relative to the beginning of the file. Since the entries are validated
+like md5-cache entries, a packed cache that is older than the md5-cache
+only results in fallback to the md5-cache for the entries that changed.
+"""
+
+from __future__ import unicode_literals
+
+import errno
+import io
+import mmap
+import struct
+
+from portage.cache import cache_errors
+from portage.cache import template
+from portage.cache.flat_hash import md5_database
+from portage import os
+from portage import _encodings
+from portage import _unicode_decode
+from portage import _unicode_encode
+from portage.util import atomic_ofstream
+
+# The location of the packed cache, relative to the repository.
+packed_cache_path = "metadata/md5-cache.pack"
+
+_magic = b"PMD5PACK"
+_format_version = 1
+_header = struct.Struct(">8sII")
+_table_entry = struct.Struct(">IIII")
+
+class database(template.database):
+
+	autocommits = True
+	validation_chf = 'md5'
+	store_eclass_paths = False
+
+	def __init__(self, location, label, auxdbkeys, readonly=True):
+		if not readonly:
+			raise cache_errors.InitializationError(self.__class__,
+				"packed caches are generated by write_pack()")
+		super(database, self).__init__(location, label, auxdbkeys,
+			readonly=True)
+		self._filename = os.path.join(location, label)
+		self._mmap = None
+		self._count = 0
+
+	def _load(self):
+		"""
+		Map the file on first access. A missing or unrecognized file is
+		treated like an empty cache.
+		"""
+		if self._mmap is not None:
+			return self._mmap
+		self._mmap = b""
+		try:
+			with open(_unicode_encode(self._filename,
+				encoding=_encodings['fs'], errors='strict'), 'rb') as f:
+				if os.fstat(f.fileno()).st_size < _header.size:
+					return self._mmap
+				mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		except (IOError, OSError) as e:
+			if e.errno not in (errno.ENOENT, errno.ESTALE):
+				raise cache_errors.CacheCorruption(self._filename, e)
+			return self._mmap
+		magic, version, count = _header.unpack_from(mm, 0)
+		if magic != _magic or version != _format_version or \
+			_header.size + count * _table_entry.size > len(mm):
+			mm.close()
+			return self._mmap
+		self._mmap = mm
+		self._count = count
+		return mm
+
+	def _entry(self, index):
+		return _table_entry.unpack_from(self._mmap,
+			_header.size + index * _table_entry.size)
+
+	def _find(self, cpv):
+		"""
+		Return the table entry of the given cpv, or None if it is not
+		found, by binary search.
+		"""
+		mm = self._load()
+		key = _unicode_encode(cpv, encoding=_encodings['repo.content'],
+			errors='strict')
+		lo = 0
+		hi = self._count
+		while lo < hi:
+			mid = (lo + hi) // 2
+			entry = self._entry(mid)
+			mid_key = mm[entry[0]:entry[0] + entry[1]]
+			if mid_key < key:
+				lo = mid + 1
+			elif mid_key > key:
+				hi = mid
+			else:
+				return entry
+		return None
+
+	def _getitem(self, cpv):
+		entry = self._find(cpv)
+		if entry is None:
+			raise KeyError(cpv)
+		data = _unicode_decode(self._mmap[entry[2]:entry[2] + entry[3]],
+			encoding=_encodings['repo.content'], errors='replace')
+		lines = data.split("\n")
+		if not lines[-1]:
+			lines.pop()
+		try:
+			return dict(x.split("=", 1) for x in lines)
+		except ValueError as e:
+			# If a line is missing an "=", the split length is 1 instead of 2.
+			raise cache_errors.CacheCorruption(cpv, e)
+
+	def __contains__(self, cpv):
+		return self._find(cpv) is not None
+
+	def __iter__(self):
+		mm = self._load()
+		for i in range(self._count):
+			entry = self._entry(i)
+			yield _unicode_decode(mm[entry[0]:entry[0] + entry[1]],
+				encoding=_encodings['repo.content'], errors='strict')
+
+	def close(self):
+		if self._mmap:
+			self._mmap.close()
+		self._mmap = None
+		self._count = 0
+
+def write_pack(filename, md5_cache_dir):
+	"""
+	Write a packed cache which contains the entries of the given
+	metadata/md5-cache directory, and return the number of entries.
+	"""
+	source = md5_database(os.path.dirname(md5_cache_dir),
+		os.path.basename(md5_cache_dir), (), readonly=True)
+	entries = []
+	for cpv in source:
+		try:
+			with io.open(_unicode_encode(os.path.join(md5_cache_dir, cpv),
+				encoding=_encodings['fs'], errors='strict'), 'rb') as f:
+				record = f.read()
+		except (IOError, OSError) as e:
+			if e.errno not in (errno.ENOENT, errno.ESTALE):
+				raise
+			continue
+		entries.append((_unicode_encode(cpv,
+			encoding=_encodings['repo.content'], errors='strict'), record))
+	entries.sort()
+
+	table_size = _header.size + len(entries) * _table_entry.size
+	key_offset = table_size
+	record_offset = table_size + sum(len(key) for key, record in entries)
+	f = atomic_ofstream(filename, mode='wb')
+	try:
+		f.write(_header.pack(_magic, _format_version, len(entries)))
+		for key, record in entries:
+			f.write(_table_entry.pack(key_offset, len(key),
+				record_offset, len(record)))
+			key_offset += len(key)
+			record_offset += len(record)
+		for key, record in entries:
+			f.write(key)
+		for key, record in entries:
+			f.write(record)
+	except:
+		f.abort()
+		raise
+	f.close()
+	return len(entries)
@@ -1,4 +1,4 @@
-# Copyright 1999-2014 Gentoo Foundation
+# Copyright 1999-2016 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 from __future__ import division, unicode_literals
@@ -15,6 +15,9 @@ from portage.localization import _
 if sys.hexversion >= 0x3000000:
 	# pylint: disable=W0622
 	basestring = str
+	from urllib.parse import quote
+else:
+	from urllib import quote
 
 class database(fs_template.FsBased):
 
@@ -27,6 +30,11 @@ class database(fs_template.FsBased):
 	# to calculate the number of pages requested, according to the following
 	# equation: cache_bytes = page_bytes * page_count
 	cache_bytes = 1024 * 1024 * 10
+	# Readonly connections map up to mmap_bytes of the database file into
+	# memory, so that reads don't need to copy pages into the page cache.
+	mmap_bytes = 1024 * 1024 * 256
+	# Older versions of sqlite allow at most 999 parameters per query.
+	_db_select_many_chunk = 500
 
 	def __init__(self, *args, **config):
 		super(database, self).__init__(*args, **config)
@@ -45,10 +53,14 @@ class database(fs_template.FsBased):
 
 		config.setdefault("autocommit", self.autocommits)
 		config.setdefault("cache_bytes", self.cache_bytes)
+		config.setdefault("mmap_bytes", self.mmap_bytes)
 		config.setdefault("synchronous", self.synchronous)
 		# Set longer timeout for throwing a "database is locked" exception.
 		# Default timeout in sqlite3 module is 5.0 seconds.
 		config.setdefault("timeout", 15)
+		# Writes are buffered until commit(), and then they are written
+		# by a single transaction. {cpv: row, or None for removal}
+		self._db_pending = {}
 		self._db_init_connection(config)
 		self._db_init_structures()
 
@@ -76,20 +88,61 @@ class database(fs_template.FsBased):
 		#	os.unlink(self._dbpath)
 		connection_kwargs = {}
 		connection_kwargs["timeout"] = config["timeout"]
+		# Transactions are controlled explicitly by commit().
+		connection_kwargs["isolation_level"] = None
 		try:
-			if not self.readonly:
+			if self.readonly:
+				self._db_connection = self._db_connect_readonly(
+					connection_kwargs)
+			else:
 				self._ensure_dirs()
-			self._db_connection = self._db_module.connect(
-				database=_unicode_decode(self._dbpath), **connection_kwargs)
+				self._db_connection = self._db_module.connect(
+					database=_unicode_decode(self._dbpath), **connection_kwargs)
 			self._db_cursor = self._db_connection.cursor()
 			self._db_cursor.execute("PRAGMA encoding = %s" % self._db_escape_string("UTF-8"))
 			if not self.readonly and not self._ensure_access(self._dbpath):
 				raise cache_errors.InitializationError(self.__class__, "can't ensure perms on %s" % self._dbpath)
 			self._db_init_cache_size(config["cache_bytes"])
 			self._db_init_synchronous(config["synchronous"])
+			if self.readonly:
+				self._db_cursor.execute("PRAGMA mmap_size = %d" %
+					config["mmap_bytes"])
+			else:
+				# In WAL mode, readers don't block the writer, and the
+				# writer doesn't block readers. The journal mode is
+				# persistent, so readonly connections use it too. If
+				# the filesystem doesn't support WAL mode, then the
+				# current journal mode is retained.
+				self._db_cursor.execute("PRAGMA journal_mode = WAL")
 		except self._db_error as e:
 			raise cache_errors.InitializationError(self.__class__, e)
 
+	def _db_connect_readonly(self, connection_kwargs):
+		"""
+		Open the database in read-only mode. A WAL mode database can only
+		be opened if its -shm file exists or can be created, so if that
+		fails, then the database is opened as immutable, which means that
+		it is read without locks, since the process may be unable to
+		access the lock files of a concurrent writer anyway.
+		"""
+		if sys.hexversion < 0x3040000:
+			# URI filenames are not supported, so rely on query_only.
+			connection = self._db_module.connect(
+				database=_unicode_decode(self._dbpath), **connection_kwargs)
+			connection.execute("PRAGMA query_only = 1")
+			return connection
+
+		uri = "file:%s?mode=ro" % quote(_unicode_decode(self._dbpath))
+		connection = self._db_module.connect(uri, uri=True,
+			**connection_kwargs)
+		try:
+			connection.execute("SELECT name FROM sqlite_master LIMIT 1")
+		except self._db_module.OperationalError:
+			connection.close()
+			connection = self._db_module.connect(uri + "&immutable=1",
+				uri=True, **connection_kwargs)
+		return connection
+
 	def _db_init_structures(self):
 		self._db_table = {}
 		self._db_table["packages"] = {}
@@ -113,34 +166,65 @@ class database(fs_template.FsBased):
 		self._db_table["packages"]["create"] = " ".join(create_statement)
 
 		cursor = self._db_cursor
+		select_keys = self._allowed_keys
 		for k, v in self._db_table.items():
 			if self._db_table_exists(v["table_name"]):
 				create_statement = self._db_table_get_create(v["table_name"])
 				table_ok, missing_keys = self._db_validate_create_statement(create_statement)
 				if table_ok:
-					if missing_keys:
+					if missing_keys and self.readonly:
+						# Missing keys are read as empty values.
+						select_keys = [x for x in select_keys
+							if x not in missing_keys]
+					elif missing_keys:
 						for k in sorted(missing_keys):
 							cursor.execute("ALTER TABLE %s ADD COLUMN %s TEXT" %
 								(self._db_table["packages"]["table_name"], k))
+				elif self.readonly:
+					raise cache_errors.InitializationError(self.__class__,
+						"unrecognized table: %s" % v["table_name"])
 				else:
 					writemsg(_("sqlite: dropping old table: %s\n") % v["table_name"])
 					cursor.execute("DROP TABLE %s" % v["table_name"])
 					cursor.execute(v["create"])
+			elif self.readonly:
+				raise cache_errors.InitializationError(self.__class__,
+					"missing table: %s" % v["table_name"])
 			else:
 				cursor.execute(v["create"])
 
+		# Parameterized statements are prepared only once, since the
+		# sqlite3 module caches them by their text. The UNIQUE
+		# constraint provides the index of package keys, which covers
+		# the statements that only need the key.
+		table_name = self._db_table["packages"]["table_name"]
+		package_key = self._db_table["packages"]["package_key"]
+		self._db_select_keys = tuple(select_keys)
+		self._db_statements = {
+			"select": "SELECT %s FROM %s WHERE %s = ?" %
+				(",".join(select_keys), table_name, package_key),
+			"contains": "SELECT 1 FROM %s WHERE %s = ?" %
+				(table_name, package_key),
+			"iter": "SELECT %s FROM %s" % (package_key, table_name),
+			"replace": "REPLACE INTO %s (%s) VALUES (%s)" %
+				(table_name, ",".join([package_key] + self._allowed_keys),
+				",".join("?" * (len(self._allowed_keys) + 1))),
+			"delete": "DELETE FROM %s WHERE %s = ?" %
+				(table_name, package_key),
+		}
+
 	def _db_table_exists(self, table_name):
 		"""return true/false dependant on a tbl existing"""
 		cursor = self._db_cursor
-		cursor.execute("SELECT name FROM sqlite_master WHERE type=\"table\" AND name=%s" % \
-			self._db_escape_string(table_name))
+		cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?",
+			(table_name,))
 		return len(cursor.fetchall()) == 1
 
 	def _db_table_get_create(self, table_name):
 		"""return true/false dependant on a tbl existing"""
 		cursor = self._db_cursor
-		cursor.execute("SELECT sql FROM sqlite_master WHERE name=%s" % \
-			self._db_escape_string(table_name))
+		cursor.execute("SELECT sql FROM sqlite_master WHERE name=?",
+			(table_name,))
 		return cursor.fetchall()[0][0]
 
 	def _db_validate_create_statement(self, statement):
@@ -197,11 +281,13 @@ class database(fs_template.FsBased):
 			raise cache_errors.InitializationError(self.__class__,"actual synchronous = "+actual_synchronous+" does does not match requested value of "+synchronous)
 
 	def _getitem(self, cpv):
+		if cpv in self._db_pending:
+			row = self._db_pending[cpv]
+			if row is None:
+				raise KeyError(cpv)
+			return dict(zip(self._allowed_keys, row[1:]))
 		cursor = self._db_cursor
-		cursor.execute("select * from %s where %s=%s" % \
-			(self._db_table["packages"]["table_name"],
-			self._db_table["packages"]["package_key"],
-			self._db_escape_string(cpv)))
+		cursor.execute(self._db_statements["select"], (cpv,))
 		result = cursor.fetchall()
 		if len(result) == 1:
 			pass
@@ -209,77 +295,103 @@ class database(fs_template.FsBased):
 			raise KeyError(cpv)
 		else:
 			raise cache_errors.CacheCorruption(cpv, "key is not unique")
-		result = result[0]
-		d = {}
-		allowed_keys_set = self._allowed_keys_set
-		for column_index, column_info in enumerate(cursor.description):
-			k = column_info[0]
-			if k in allowed_keys_set:
-				v = result[column_index]
-				if v is None:
-					# This happens after a new empty column has been added.
-					v = ""
-				d[k] = v
+		return self._db_row_to_dict(result[0])
+
+	def _getitem_many(self, cpvs):
+		"""
+		Read the entries that are not pending with one query for each
+		chunk of cpvs, since a separate query for each cpv is relatively
+		expensive when reading the whole tree.
+		"""
+		pending = []
+		for cpv in cpvs:
+			if cpv in self._db_pending:
+				try:
+					yield cpv, self._getitem(cpv)
+				except KeyError:
+					pass
+			else:
+				pending.append(cpv)
 
+		cursor = self._db_cursor
+		select_keys = (self._db_table["packages"]["package_key"],) + \
+			self._db_select_keys
+		for i in range(0, len(pending), self._db_select_many_chunk):
+			chunk = pending[i:i + self._db_select_many_chunk]
+			cursor.execute("SELECT %s FROM %s WHERE %s IN (%s)" %
+				(",".join(select_keys),
+				self._db_table["packages"]["table_name"],
+				select_keys[0], ",".join("?" * len(chunk))), chunk)
+			for row in cursor.fetchall():
+				yield row[0], self._db_row_to_dict(row[1:])
+
+	def _db_row_to_dict(self, row):
+		d = dict.fromkeys(self._allowed_keys, "")
+		for k, v in zip(self._db_select_keys, row):
+			# None happens after a new empty column has been added.
+			if v is not None:
+				d[k] = v
 		return d
 
 	def _setitem(self, cpv, values):
-		update_statement = []
-		update_statement.append("REPLACE INTO %s" % self._db_table["packages"]["table_name"])
-		update_statement.append("(")
-		update_statement.append(','.join([self._db_table["packages"]["package_key"]] + self._allowed_keys))
-		update_statement.append(")")
-		update_statement.append("VALUES")
-		update_statement.append("(")
-		values_parameters = []
-		values_parameters.append(self._db_escape_string(cpv))
+		row = [cpv]
 		for k in self._allowed_keys:
-			values_parameters.append(self._db_escape_string(values.get(k, '')))
-		update_statement.append(",".join(values_parameters))
-		update_statement.append(")")
+			v = values.get(k, '')
+			if not isinstance(v, basestring):
+				# Avoid potential UnicodeEncodeError in python-2.x by
+				# only calling str() when it's absolutely necessary.
+				v = str(v)
+			row.append(v)
+		self._db_pending[cpv] = tuple(row)
+
+	def commit(self):
+		"""
+		Write the buffered changes with a single transaction. The
+		transaction begins with a write lock, so that it can't fail to
+		upgrade a read lock when there is a concurrent writer.
+		"""
+		if not self._db_pending:
+			return
+		pending = self._db_pending
+		self._db_pending = {}
 		cursor = self._db_cursor
 		try:
-			s = " ".join(update_statement)
-			cursor.execute(s)
+			cursor.execute("BEGIN IMMEDIATE")
+			try:
+				cursor.executemany(self._db_statements["delete"],
+					[(cpv,) for cpv, row in pending.items() if row is None])
+				cursor.executemany(self._db_statements["replace"],
+					[row for row in pending.values() if row is not None])
+			except self._db_error:
+				cursor.execute("ROLLBACK")
+				raise
+			cursor.execute("COMMIT")
 		except self._db_error as e:
-			writemsg("%s: %s\n" % (cpv, str(e)))
-			raise
-
-	def commit(self):
-		self._db_connection.commit()
+			writemsg(_("!!! Error writing '%s': %s\n") %
+				(self._dbpath, e), noiselevel=-1)
+			raise cache_errors.CacheError(e)
 
 	def _delitem(self, cpv):
-		cursor = self._db_cursor
-		cursor.execute("DELETE FROM %s WHERE %s=%s" % \
-			(self._db_table["packages"]["table_name"],
-			self._db_table["packages"]["package_key"],
-			self._db_escape_string(cpv)))
+		self._db_pending[cpv] = None
 
 	def __contains__(self, cpv):
+		if cpv in self._db_pending:
+			return self._db_pending[cpv] is not None
 		cursor = self._db_cursor
-		cursor.execute(" ".join(
-			["SELECT %s FROM %s" %
-			(self._db_table["packages"]["package_id"],
-			self._db_table["packages"]["table_name"]),
-			"WHERE %s=%s" % (
-			self._db_table["packages"]["package_key"],
-			self._db_escape_string(cpv))]))
-		result = cursor.fetchall()
-		if len(result) == 0:
-			return False
-		elif len(result) == 1:
-			return True
-		else:
-			raise cache_errors.CacheCorruption(cpv, "key is not unique")
+		cursor.execute(self._db_statements["contains"], (cpv,))
+		return bool(cursor.fetchall())
 
 	def __iter__(self):
 		"""generator for walking the dir struct"""
 		cursor = self._db_cursor
-		cursor.execute("SELECT %s FROM %s" % \
-			(self._db_table["packages"]["package_key"],
-			self._db_table["packages"]["table_name"]))
+		cursor.execute(self._db_statements["iter"])
 		result = cursor.fetchall()
 		key_list = [x[0] for x in result]
 		del result
+		pending = self._db_pending.copy()
+		if pending:
+			key_list = [x for x in key_list if x not in pending]
+			key_list.extend(cpv for cpv, row in pending.items()
+				if row is not None)
 		while key_list:
 			yield key_list.pop()
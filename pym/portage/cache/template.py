@@ -1,4 +1,4 @@
-# Copyright 2005-2014 Gentoo Foundation
+# Copyright 2005-2016 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 # Author(s): Brian Harring (ferringb@gentoo.org)
 
@@ -45,8 +45,40 @@ class database(object):
 		if self.updates > self.sync_rate:
 			self.commit()
 			self.updates = 0
-		d=self._getitem(cpv)
+		return self._unpack_entry(cpv, self._getitem(cpv))
 
+	def get_many(self, cpvs):
+		"""Generate (cpv, values) pairs for those of the given cpvs which
+		are in the cache, where values are the same as for __getitem__,
+		or None if the entry is corrupt. Derived classes may override
+		_getitem_many in order to read many entries at once."""
+		if self.updates > self.sync_rate:
+			self.commit()
+			self.updates = 0
+		for cpv, d in self._getitem_many(cpvs):
+			if d is not None:
+				try:
+					d = self._unpack_entry(cpv, d)
+				except cache_errors.CacheError:
+					d = None
+			yield cpv, d
+
+	def _getitem_many(self, cpvs):
+		"""get the values of many cpvs, skipping missing ones, as
+		(cpv, values) pairs, where values is None for corrupt entries.
+		override this in derived classess"""
+		for cpv in cpvs:
+			try:
+				d = self._getitem(cpv)
+			except KeyError:
+				continue
+			except cache_errors.CacheError:
+				d = None
+			yield cpv, d
+
+	def _unpack_entry(self, cpv, d):
+		"""convert the raw values returned by _getitem into the values
+		returned by __getitem__"""
 		try:
 			chf_types = self.chf_types
 		except AttributeError:
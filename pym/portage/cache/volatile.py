@@ -1,4 +1,4 @@
-# Copyright 1999-2011 Gentoo Foundation
+# Copyright 1999-2016 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 import copy
@@ -23,6 +23,11 @@ class database(template.database):
 	def __getitem__(self, cpv):
 		return copy.deepcopy(self._data[cpv])
 
+	def get_many(self, cpvs):
+		for cpv in cpvs:
+			if cpv in self._data:
+				yield cpv, copy.deepcopy(self._data[cpv])
+
 	def __iter__(self):
 		return iter(self._data)
 
@@ -1,5 +1,5 @@
 # checksum.py -- core Portage functionality
-# Copyright 1998-2014 Gentoo Foundation
+# Copyright 1998-2016 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 import portage
@@ -8,15 +8,48 @@ from portage.localization import _
 from portage import os
 from portage import _encodings
 from portage import _unicode_decode, _unicode_encode
+from portage.util import writemsg
+from portage.util.cpuinfo import get_cpu_count
 import errno
 import stat
 import subprocess
+import sys
 import tempfile
 
+try:
+	import threading
+except ImportError:
+	threading = None
+
+if sys.hexversion >= 0x3000000:
+	import queue as _queue
+else:
+	import Queue as _queue
+
 #dict of all available hash functions
 hashfunc_map = {}
 hashorigin_map = {}
 
+# {hash_name: {origin: hash object constructor}} for all available
+# implementations of each hash function
+_hash_providers = {}
+
+# The origins of hash implementations, in order of preference. mhash
+# holds the GIL, so it is preferred only over the internal fallbacks and
+# the bundled pure Python WHIRLPOOL implementation, which is hundreds of
+# times slower than the others.
+_hash_origin_preference = ("hashlib", "pycrypto", "mhash", "internal",
+	"bundled")
+_unaccelerated_origins = frozenset(["bundled"])
+
+# Hash objects of these origins release the GIL while they hash large
+# buffers, so that separate threads can update them concurrently.
+_gil_releasing_origins = frozenset(["hashlib"])
+# Files that are smaller than this are never hashed in threads.
+_HASHING_THREAD_MINSIZE = 4 * 1024 * 1024
+# Threads are fed larger blocks, in order to reduce queue overhead.
+_HASHING_THREAD_BLOCKSIZE = 1024 * 1024
+
 def _open_file(filename):
 	try:
 		return open(_unicode_encode(filename,
@@ -61,8 +94,16 @@ class _generate_hash_function(object):
 
 		return (checksum.hexdigest(), size)
 
-# Define hash functions, try to use the best module available. Later definitions
-# override earlier ones
+def _register_hash_provider(hashtype, hashobject, origin):
+	"""
+	Register an implementation of a hash function. The implementation
+	that is used is selected according to _hash_origin_preference, after
+	all implementations have been registered.
+	"""
+	_hash_providers.setdefault(hashtype, {})[origin] = hashobject
+
+# Register every implementation that is available, so that the best one
+# can be selected and the others can be benchmarked.
 
 # Use the internal modules as last fallback
 try:
@@ -70,79 +111,80 @@ try:
 except ImportError:
 	from md5 import new as _new_md5
 
-md5hash = _generate_hash_function("MD5", _new_md5, origin="internal")
+_register_hash_provider("MD5", _new_md5, "internal")
 
 try:
 	from hashlib import sha1 as _new_sha1
 except ImportError:
 	from sha import new as _new_sha1
 
-sha1hash = _generate_hash_function("SHA1", _new_sha1, origin="internal")
+_register_hash_provider("SHA1", _new_sha1, "internal")
+
+# Bundled WHIRLPOOL implementation
+from portage.util.whirlpool import new as _new_whirlpool
+_register_hash_provider("WHIRLPOOL", _new_whirlpool, "bundled")
 
-# Try to use mhash if available
-# mhash causes GIL presently, so it gets less priority than hashlib and
-# pycrypto. However, it might be the only accelerated implementation of
-# WHIRLPOOL available.
+# mhash might be the only accelerated implementation of WHIRLPOOL
+# available.
 try:
 	import mhash, functools
-	md5hash = _generate_hash_function("MD5", functools.partial(mhash.MHASH, mhash.MHASH_MD5), origin="mhash")
-	sha1hash = _generate_hash_function("SHA1", functools.partial(mhash.MHASH, mhash.MHASH_SHA1), origin="mhash")
-	sha256hash = _generate_hash_function("SHA256", functools.partial(mhash.MHASH, mhash.MHASH_SHA256), origin="mhash")
-	sha512hash = _generate_hash_function("SHA512", functools.partial(mhash.MHASH, mhash.MHASH_SHA512), origin="mhash")
-	for local_name, hash_name in (("rmd160", "ripemd160"), ("whirlpool", "whirlpool")):
-		if hasattr(mhash, 'MHASH_%s' % local_name.upper()):
-			globals()['%shash' % local_name] = \
-				_generate_hash_function(local_name.upper(), \
-				functools.partial(mhash.MHASH, getattr(mhash, 'MHASH_%s' % hash_name.upper())), \
-				origin='mhash')
+	for local_name, hash_name in (("MD5", "MD5"), ("SHA1", "SHA1"),
+		("SHA256", "SHA256"), ("SHA512", "SHA512"),
+		("RMD160", "RIPEMD160"), ("WHIRLPOOL", "WHIRLPOOL")):
+		if hasattr(mhash, 'MHASH_%s' % hash_name):
+			_register_hash_provider(local_name,
+				functools.partial(mhash.MHASH,
+				getattr(mhash, 'MHASH_%s' % hash_name)), "mhash")
 except ImportError:
 	pass
 
-# Use pycrypto when available, prefer it over the internal fallbacks
-# Check for 'new' attributes, since they can be missing if the module
-# is broken somehow.
+# Check for pycrypto 'new' attributes, since they can be missing if the
+# module is broken somehow.
 try:
 	from Crypto.Hash import SHA256, RIPEMD
-	sha256hash = getattr(SHA256, 'new', None)
-	if sha256hash is not None:
-		sha256hash = _generate_hash_function("SHA256",
-			sha256hash, origin="pycrypto")
-	rmd160hash = getattr(RIPEMD, 'new', None)
-	if rmd160hash is not None:
-		rmd160hash = _generate_hash_function("RMD160",
-			rmd160hash, origin="pycrypto")
+	for local_name, module in (("SHA256", SHA256), ("RMD160", RIPEMD)):
+		if getattr(module, 'new', None) is not None:
+			_register_hash_provider(local_name, module.new, "pycrypto")
 except ImportError:
 	pass
 
-# Use hashlib from python-2.5 if available and prefer it over pycrypto and internal fallbacks.
-# Need special handling for RMD160/WHIRLPOOL as they may not always be provided by hashlib.
+# hashlib from python-2.5. RMD160, WHIRLPOOL, BLAKE2B and SHA3_256 need
+# special handling, since their availability depends on the python
+# version and on the OpenSSL library that hashlib was built with.
 try:
 	import hashlib, functools
-	
-	md5hash = _generate_hash_function("MD5", hashlib.md5, origin="hashlib")
-	sha1hash = _generate_hash_function("SHA1", hashlib.sha1, origin="hashlib")
-	sha256hash = _generate_hash_function("SHA256", hashlib.sha256, origin="hashlib")
-	sha512hash = _generate_hash_function("SHA512", hashlib.sha512, origin="hashlib")
-	for local_name, hash_name in (("rmd160", "ripemd160"), ("whirlpool", "whirlpool")):
+
+	_register_hash_provider("MD5", hashlib.md5, "hashlib")
+	_register_hash_provider("SHA1", hashlib.sha1, "hashlib")
+	_register_hash_provider("SHA256", hashlib.sha256, "hashlib")
+	_register_hash_provider("SHA512", hashlib.sha512, "hashlib")
+	for local_name, hash_name in (("RMD160", "ripemd160"),
+		("WHIRLPOOL", "whirlpool"), ("BLAKE2B", "blake2b"),
+		("SHA3_256", "sha3_256")):
 		try:
 			hashlib.new(hash_name)
 		except ValueError:
 			pass
 		else:
-			globals()['%shash' % local_name] = \
-				_generate_hash_function(local_name.upper(), \
-				functools.partial(hashlib.new, hash_name), \
-				origin='hashlib')
+			_register_hash_provider(local_name,
+				functools.partial(hashlib.new, hash_name), "hashlib")
 
 except ImportError:
 	pass
 
-_whirlpool_unaccelerated = False
-if "WHIRLPOOL" not in hashfunc_map:
-	# Bundled WHIRLPOOL implementation
-	_whirlpool_unaccelerated = True
-	from portage.util.whirlpool import new as _new_whirlpool
-	whirlpoolhash = _generate_hash_function("WHIRLPOOL", _new_whirlpool, origin="bundled")
+for _hashtype, _providers in _hash_providers.items():
+	for _origin in _hash_origin_preference:
+		if _origin in _providers:
+			_generate_hash_function(_hashtype, _providers[_origin],
+				origin=_origin)
+			break
+del _hashtype, _providers, _origin
+
+# Hash functions for which only an unaccelerated implementation is
+# available.
+_unaccelerated_hashes = frozenset(hashtype
+	for hashtype, origin in hashorigin_map.items()
+	if origin in _unaccelerated_origins)
 
 # Use python-fchksum if available, prefer it over all other MD5 implementations
 try:
@@ -161,6 +203,93 @@ hashfunc_map["size"] = getsize
 
 # end actual hash functions
 
+def _hash_worker(checksum, data_queue):
+	for data in iter(data_queue.get, None):
+		checksum.update(data)
+
+def _update_checksums(f, checksums, threaded):
+	"""
+	Feed the content of a file to all of the given hash objects, and
+	return the size of the file. The file is read only once. If threaded
+	is True, then each hash object is updated by a separate thread, while
+	the calling thread reads the file.
+	"""
+	size = 0
+	if not threaded:
+		data = f.read(HASHING_BLOCKSIZE)
+		while data:
+			for checksum in checksums:
+				checksum.update(data)
+			size += len(data)
+			data = f.read(HASHING_BLOCKSIZE)
+		return size
+
+	queues = []
+	threads = []
+	try:
+		for checksum in checksums:
+			data_queue = _queue.Queue(maxsize=4)
+			thread = threading.Thread(target=_hash_worker,
+				args=(checksum, data_queue))
+			thread.daemon = True
+			thread.start()
+			queues.append(data_queue)
+			threads.append(thread)
+		data = f.read(_HASHING_THREAD_BLOCKSIZE)
+		while data:
+			for data_queue in queues:
+				data_queue.put(data)
+			size += len(data)
+			data = f.read(_HASHING_THREAD_BLOCKSIZE)
+	finally:
+		for data_queue in queues:
+			data_queue.put(None)
+		for thread in threads:
+			thread.join()
+	return size
+
+def _checksum_file(filename, hashnames, threaded=None):
+	"""
+	Run a group of checksums against a file, which is read only once
+	for all hash functions that are implemented by hash objects.
+
+	@param filename: File to run the checksums against
+	@type filename: String
+	@param hashnames: The types of hash functions to run, which must be
+		available in hashfunc_map
+	@type hashnames: List
+	@param threaded: Whether to update each hash object in a separate
+		thread. By default, threads are used for large files if there
+		are multiple CPUs and all hash objects release the GIL.
+	@type threaded: Boolean
+	@rtype: Dict
+	@return: A dictionary in the form:
+		return_value[hash_name] = (hash_result,size)
+	"""
+	results = {}
+	checksums = []
+	for x in set(hashnames):
+		func = hashfunc_map[x]
+		if isinstance(func, _generate_hash_function):
+			checksums.append((x, func._hashobject()))
+		else:
+			results[x] = func(filename)
+
+	if checksums:
+		with _open_file(filename) as f:
+			if threaded is None:
+				threaded = (len(checksums) > 1 and threading is not None and
+					all(hashorigin_map.get(x) in _gil_releasing_origins
+					for x, checksum in checksums) and
+					os.fstat(f.fileno()).st_size >= _HASHING_THREAD_MINSIZE and
+					(get_cpu_count() or 1) > 1)
+			size = _update_checksums(f,
+				[checksum for x, checksum in checksums], threaded)
+		for x, checksum in checksums:
+			results[x] = (checksum.hexdigest(), size)
+
+	return results
+
 prelink_capable = False
 if os.path.exists(PRELINK_BINARY):
 	cmd = [PRELINK_BINARY, "--version"]
@@ -192,8 +321,9 @@ def _perform_md5_merge(x, **kwargs):
 
 def perform_all(x, calc_prelink=0):
 	mydict = {}
-	for k in hashfunc_map:
-		mydict[k] = perform_checksum(x, k, calc_prelink)[0]
+	for k, v in _perform_checksums(x, list(hashfunc_map),
+		calc_prelink).items():
+		mydict[k] = v[0]
 	return mydict
 
 def get_valid_checksum_keys():
@@ -204,6 +334,19 @@ def get_hash_origin(hashtype):
 		raise KeyError(hashtype)
 	return hashorigin_map.get(hashtype, "unknown")
 
+def get_hash_providers(hashtype):
+	"""
+	Return the origins of all available implementations of a hash
+	function, in order of preference. The implementation that is used
+	is reported by get_hash_origin, which differs from the first origin
+	only if MD5 is provided by python-fchksum.
+	"""
+	if hashtype not in hashfunc_map:
+		raise KeyError(hashtype)
+	providers = _hash_providers.get(hashtype, {})
+	return [origin for origin in _hash_origin_preference
+		if origin in providers]
+
 def _filter_unaccelarated_hashes(digests):
 	"""
 	If multiple digests are available and some are unaccelerated,
@@ -213,15 +356,34 @@ def _filter_unaccelarated_hashes(digests):
 	builds where acceleration may not be available for some hashes
 	due to minimization of dependencies.
 	"""
-	if _whirlpool_unaccelerated and "WHIRLPOOL" in digests:
+	unaccelerated = _unaccelerated_hashes.intersection(digests)
+	if unaccelerated:
 		verifiable_hash_types = set(digests).intersection(hashfunc_map)
 		verifiable_hash_types.discard("size")
-		if len(verifiable_hash_types) > 1:
-			digests = dict(digests)
-			digests.pop("WHIRLPOOL")
+		if verifiable_hash_types.difference(unaccelerated):
+			digests = dict((k, v) for (k, v) in digests.items()
+				if k not in unaccelerated)
 
 	return digests
 
+_warned_unaccelerated_hashes = set()
+
+def _warn_unaccelerated_hashes(hash_names):
+	"""
+	Warn once for each of the given hash functions that is only
+	available as an unaccelerated implementation, since computing it
+	for large files takes minutes.
+	"""
+	for hashtype in sorted(_unaccelerated_hashes.intersection(hash_names)):
+		if hashtype in _warned_unaccelerated_hashes:
+			continue
+		_warned_unaccelerated_hashes.add(hashtype)
+		writemsg(_("!!! The %s hash function is only available as a "
+			"slow pure Python implementation, because neither hashlib "
+			"nor mhash provide it. Computing %s digests of large files "
+			"will take a long time.\n") % (hashtype, hashtype),
+			noiselevel=-1)
+
 class _hash_filter(object):
 	"""
 	Implements filtering for PORTAGE_CHECKSUM_FILTER.
@@ -280,7 +442,7 @@ def _apply_hash_filter(digests, hash_filter):
 
 	return digests
 
-def verify_all(filename, mydict, calc_prelink=0, strict=0):
+def verify_all(filename, mydict, calc_prelink=0, strict=0, digest_cache=None):
 	"""
 	Verify all checksums against a file.
 
@@ -290,6 +452,10 @@ def verify_all(filename, mydict, calc_prelink=0, strict=0):
 	@type calc_prelink: Integer
 	@param strict: Enable/Disable strict checking (which stops exactly at a checksum failure and throws an exception)
 	@type strict: Integer
+	@param digest_cache: A DigestCache which provides the digests of files
+		that have not changed since they were last hashed, and which is
+		updated with new digests (ignored if calc_prelink is enabled)
+	@type digest_cache: DigestCache
 	@rtype: Tuple
 	@return: Result of the checks and possible message:
 		1) If size fails, False, and a tuple containing a message, the given size, and the actual size
@@ -302,7 +468,8 @@ def verify_all(filename, mydict, calc_prelink=0, strict=0):
 	file_is_ok = True
 	reason     = "Reason unknown"
 	try:
-		mysize = os.stat(filename)[stat.ST_SIZE]
+		mystat = os.stat(filename)
+		mysize = mystat[stat.ST_SIZE]
 		if mydict.get("size") is not None and mydict["size"] != mysize:
 			return False,(_("Filesize does not match recorded size"), mysize, mydict["size"])
 	except OSError as e:
@@ -325,11 +492,22 @@ def verify_all(filename, mydict, calc_prelink=0, strict=0):
 		got = " ".join(got)
 		return False, (_("Insufficient data for checksum verification"), got, expected)
 
+	myhashes = {}
+	if digest_cache is not None and not calc_prelink:
+		myhashes.update(digest_cache.get(mystat, verifiable_hash_types))
+	missing = verifiable_hash_types.difference(myhashes)
+	if missing:
+		# Compute all checksums in a single pass over the file.
+		computed = dict((k, v[0]) for k, v in _perform_checksums(filename,
+			missing, calc_prelink=calc_prelink).items())
+		if digest_cache is not None and not calc_prelink:
+			digest_cache.update(filename, mystat, computed)
+		myhashes.update(computed)
 	for x in sorted(mydict):
 		if   x == "size":
 			continue
 		elif x in hashfunc_map:
-			myhash = perform_checksum(filename, x, calc_prelink=calc_prelink)[0]
+			myhash = myhashes[x]
 			if mydict[x] != myhash:
 				if strict:
 					raise portage.exception.DigestException(
@@ -359,6 +537,18 @@ def perform_checksum(filename, hashname="MD5", calc_prelink=0):
 	@rtype: Tuple
 	@return: The hash and size of the data
 	"""
+	if hashname not in hashfunc_map:
+		raise portage.exception.DigestException(hashname + \
+			" hash function not available (needs dev-python/pycrypto)")
+	return _perform_checksums(filename, [hashname], calc_prelink)[hashname]
+
+def _perform_checksums(filename, hashnames, calc_prelink=0):
+	"""
+	Run a group of checksums against a file, like perform_checksum
+	does for a single checksum, and return a dictionary which maps
+	each hash name to a (hash, size) tuple. The file is read once
+	for all checksums.
+	"""
 	global prelink_capable
 	# Make sure filename is encoded with the correct encoding before
 	# it is passed to spawn (for prelink) and/or the hash function.
@@ -384,17 +574,13 @@ def perform_checksum(filename, hashname="MD5", calc_prelink=0):
 				# This happens during uninstallation of prelink.
 				prelink_capable = False
 		try:
-			if hashname not in hashfunc_map:
-				raise portage.exception.DigestException(hashname + \
-					" hash function not available (needs dev-python/pycrypto)")
-			myhash, mysize = hashfunc_map[hashname](myfilename)
+			return _checksum_file(myfilename, hashnames)
 		except (OSError, IOError) as e:
 			if e.errno in (errno.ENOENT, errno.ESTALE):
 				raise portage.exception.FileNotFound(myfilename)
 			elif e.errno == portage.exception.PermissionDenied.errno:
 				raise portage.exception.PermissionDenied(myfilename)
 			raise
-		return myhash, mysize
 	finally:
 		if prelink_tmpfile:
 			try:
@@ -420,8 +606,10 @@ def perform_multiple_checksums(filename, hashes=["MD5"], calc_prelink=0):
 		for each given checksum
 	"""
 	rVal = {}
+	hashes = list(hashes)
 	for x in hashes:
 		if x not in hashfunc_map:
 			raise portage.exception.DigestException(x+" hash function not available (needs dev-python/pycrypto or >=dev-lang/python-2.5)")
-		rVal[x] = perform_checksum(filename, x, calc_prelink)[0]
+	for x, v in _perform_checksums(filename, hashes, calc_prelink).items():
+		rVal[x] = v[0]
 	return rVal
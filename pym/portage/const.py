@@ -137,6 +137,7 @@ SUPPORTED_FEATURES       = frozenset([
 	"compress-index",
 	"config-protect-if-modified",
 	"digest",
+	"digest-cache",
 	"distcc",
 	"distcc-pump",
 	"distlocks",
@@ -156,6 +157,7 @@ SUPPORTED_FEATURES       = frozenset([
 	"lmirror",
 	"merge-sync",
 	"metadata-transfer",
+	"metadata-workers",
 	"mirror",
 	"multilib-strict",
 	"network-sandbox",
@@ -168,6 +170,7 @@ SUPPORTED_FEATURES       = frozenset([
 	"noman",
 	"nostrip",
 	"notitles",
+	"owners-index",
 	"parallel-fetch",
 	"parallel-install",
 	"prelink-checksums",
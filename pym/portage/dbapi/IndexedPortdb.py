@@ -1,4 +1,4 @@
-# Copyright 2014 Gentoo Foundation
+# Copyright 2014-2016 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 import errno
@@ -169,3 +169,17 @@ class IndexedPortdb(object):
 			except KeyError:
 				pass
 		return self._portdb.aux_get(cpv, attrs)
+
+	def aux_get_many(self, cpvs, attrs, myrepo=None):
+		if len(attrs) == 1 and attrs[0] == "DESCRIPTION":
+			cpvs = list(cpvs)
+			uncached = [cpv for cpv in cpvs if cpv not in self._desc_cache]
+			results = dict(self._portdb.aux_get_many(uncached, attrs))
+			for cpv in cpvs:
+				if cpv in results:
+					yield cpv, results[cpv]
+				else:
+					yield cpv, [self._desc_cache[cpv]]
+		else:
+			for result in self._portdb.aux_get_many(cpvs, attrs):
+				yield result
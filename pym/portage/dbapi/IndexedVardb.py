@@ -10,7 +10,8 @@ class IndexedVardb(object):
 	"""
 	A vardbapi interface that sacrifices validation in order to
 	improve performance. It takes advantage of vardbdbapi._aux_cache,
-	which is backed by vdb_metadata.pickle. Since _aux_cache is
+	which is backed by vdb_metadata.sqlite (or vdb_metadata.pickle
+	if sqlite is unavailable). Since _aux_cache is
 	not updated for every single merge/unmerge (see
 	_aux_cache_threshold), the list of packages is obtained directly
 	from the real vardbapi instance. If a package is missing from
@@ -24,6 +24,7 @@ class MergeProcess(ForkProcess):
 	__slots__ = ('mycat', 'mypkg', 'settings', 'treetype',
 		'vartree', 'blockers', 'pkgloc', 'infloc', 'myebuild',
 		'mydbapi', 'postinst_failure', 'prev_mtimes', 'unmerge',
+		'parallel_unmerge',
 		'_elog_reader_fd', '_elog_reg_id',
 		'_buf', '_elog_keys', '_locked_vdb')
 
@@ -221,12 +222,19 @@ class MergeProcess(ForkProcess):
 				if self.unmerge:
 					if not mylink.exists():
 						rval = os.EX_OK
-					elif mylink.unmerge(
-						ldpath_mtimes=self.prev_mtimes) == os.EX_OK:
+					elif mylink.unmerge(ldpath_mtimes=self.prev_mtimes,
+						parallel=bool(self.parallel_unmerge)) == os.EX_OK:
+						# If the vdb lock is held by the parent process,
+						# then it does not serialize concurrent unmerges.
+						fs_lock = self.parallel_unmerge and self._locked_vdb
 						mylink.lockdb()
+						if fs_lock:
+							mylink.vartree.dbapi._fs_lock()
 						try:
 							mylink.delete()
 						finally:
+							if fs_lock:
+								mylink.vartree.dbapi._fs_unlock()
 							mylink.unlockdb()
 						rval = os.EX_OK
 				else:
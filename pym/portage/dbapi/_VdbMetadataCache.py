@@ -0,0 +1,355 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import json
+
+from portage.util._sqlite import SqliteDatabase
+
+class VdbMetadataCache(SqliteDatabase):
+	"""
+	An sqlite database which stores the vdb metadata cache, as a
+	replacement for vdb_metadata.pickle. The "packages", "base_names",
+	"base_name_pkgs" and "base_name_lists" mappings that load() returns
+	read single entries from the database when they are looked up, so
+	that it's not necessary to load the whole cache before the first
+	lookup. The commit() method only writes the entries that have been
+	modified since they were loaded.
+
+	The database also contains the index of FEATURES=owners-index, which
+	maps the full paths of installed files to the cpvs that own them. It
+	is updated immediately by owners_index_update().
+
+	Since the cache is completely disposable, database errors are
+	reported and otherwise treated like missing entries.
+	"""
+
+	_format_version = "3"
+
+	def load(self):
+		"""
+		Return a dict containing "packages", "base_names", "base_name_pkgs"
+		and "base_name_lists" mappings, and the "timestamp" of the last
+		commit if the database has a compatible format version.
+		"""
+		info = dict(self._query("SELECT key, value FROM info"))
+		if info.get("version") != self._format_version:
+			info = {}
+		valid = bool(info)
+		cache = {
+			"packages": _LazyTable(self, "packages", "cpv",
+				("mtime", "metadata"), _decode_package, _encode_package,
+				valid),
+			"base_names": _LazyTable(self, "base_names", "name_hash",
+				("pkgs",), _decode_bucket, _encode_bucket, valid),
+			"base_name_pkgs": _LazyTable(self, "base_name_pkgs", "cpv",
+				("pkg_hash",), _decode_pkg_hash, _encode_pkg_hash, valid),
+			"base_name_lists": _LazyTable(self, "base_name_lists", "cpv",
+				("name_hashes",), _decode_name_hashes, _encode_name_hashes,
+				valid),
+		}
+		if "timestamp" in info:
+			try:
+				cache["timestamp"] = float(info["timestamp"])
+			except ValueError:
+				pass
+		return cache
+
+	def commit(self, cache, timestamp):
+		"""
+		Write the entries of the mappings returned by load() which have
+		been modified, and record the timestamp.
+		"""
+		try:
+			connection = self._connect(create=True)
+			if connection is None:
+				return
+			with connection:
+				for table in (cache["packages"], cache["base_names"],
+					cache["base_name_pkgs"], cache["base_name_lists"]):
+					table._commit(connection)
+				connection.execute(
+					"INSERT OR REPLACE INTO info VALUES (?, ?)",
+					("timestamp", repr(timestamp)))
+		except self._db_module.Error as e:
+			self._error(e)
+		else:
+			cache["timestamp"] = timestamp
+
+	def _init_tables(self, connection):
+		# The mtime column intentionally has no type affinity, since
+		# the type of mtime values (int or float) must be preserved.
+		connection.execute("CREATE TABLE packages "
+			"(cpv TEXT PRIMARY KEY, mtime, metadata TEXT)")
+		connection.execute("CREATE TABLE base_names "
+			"(name_hash INTEGER PRIMARY KEY, pkgs TEXT)")
+		connection.execute("CREATE TABLE base_name_pkgs "
+			"(cpv TEXT PRIMARY KEY, pkg_hash TEXT)")
+		connection.execute("CREATE TABLE base_name_lists "
+			"(cpv TEXT PRIMARY KEY, name_hashes TEXT)")
+		connection.execute("CREATE TABLE owners_pkgs "
+			"(cpv TEXT PRIMARY KEY, counter INTEGER)")
+		connection.execute("CREATE TABLE owners_paths "
+			"(path TEXT, cpv TEXT)")
+		connection.execute("CREATE INDEX owners_paths_path "
+			"ON owners_paths (path)")
+		connection.execute("CREATE INDEX owners_paths_cpv "
+			"ON owners_paths (cpv)")
+
+	def owners_index_packages(self):
+		"""
+		Return a dict which maps the cpvs in the owners index to the
+		COUNTER values that they had when they were indexed.
+		"""
+		info = dict(self._query("SELECT key, value FROM info"))
+		if info.get("version") != self._format_version:
+			return {}
+		return dict(self._query("SELECT cpv, counter FROM owners_pkgs"))
+
+	def owners_index_update(self, add=(), remove=()):
+		"""
+		Update the owners index in a single transaction. Packages which
+		are already indexed are replaced by the given entries.
+
+		@param add: packages to index
+		@type add: iterable of (cpv, counter, paths) tuples
+		@param remove: cpvs of packages to remove from the index
+		@type remove: iterable
+		@rtype: bool
+		@return: True if successful, and False otherwise
+		"""
+		try:
+			connection = self._connect(create=True)
+			if connection is None:
+				return False
+			with connection:
+				remove = [(cpv,) for cpv in remove]
+				connection.executemany(
+					"DELETE FROM owners_paths WHERE cpv = ?", remove)
+				connection.executemany(
+					"DELETE FROM owners_pkgs WHERE cpv = ?", remove)
+				for cpv, counter, paths in add:
+					connection.execute(
+						"DELETE FROM owners_paths WHERE cpv = ?", (cpv,))
+					connection.execute(
+						"INSERT OR REPLACE INTO owners_pkgs VALUES (?, ?)",
+						(cpv, counter))
+					connection.executemany(
+						"INSERT INTO owners_paths VALUES (?, ?)",
+						((path, cpv) for path in paths))
+		except self._db_module.Error as e:
+			self._error(e)
+			return False
+		return True
+
+	def owners_index_lookup(self, paths):
+		"""
+		Return a set of cpvs which own any of the given paths, according
+		to the owners index, or None if the index is unusable, so that
+		a database error is not mistaken for the absence of owners.
+		"""
+		paths = list(paths)
+		try:
+			connection = self._connect()
+			if connection is None:
+				return None
+			rows = connection.execute("SELECT DISTINCT cpv "
+				"FROM owners_paths WHERE path IN (%s)" %
+				", ".join("?" * len(paths)), paths).fetchall()
+		except self._db_module.Error as e:
+			self._error(e)
+			return None
+		return set(row[0] for row in rows)
+
+def _decode_package(row):
+	mtime, metadata = row
+	return (mtime, json.loads(metadata))
+
+def _encode_package(value):
+	mtime, metadata = value
+	return (mtime, json.dumps(metadata, ensure_ascii=False, sort_keys=True))
+
+def _decode_bucket(row):
+	return dict((tuple(pkg_hash), None) for pkg_hash in json.loads(row[0]))
+
+def _encode_bucket(value):
+	return (json.dumps(sorted(value), ensure_ascii=False),)
+
+def _decode_pkg_hash(row):
+	return tuple(json.loads(row[0]))
+
+def _encode_pkg_hash(value):
+	return (json.dumps(value, ensure_ascii=False),)
+
+def _decode_name_hashes(row):
+	name_hashes = json.loads(row[0])
+	if not isinstance(name_hashes, list):
+		raise ValueError(name_hashes)
+	return name_hashes
+
+def _encode_name_hashes(value):
+	return (json.dumps(sorted(value)),)
+
+class _LazyTable(object):
+	"""
+	A mapping that loads entries from a VdbMetadataCache table on demand,
+	and records modified keys for VdbMetadataCache.commit(). Values must
+	be assigned again after they are modified in place, since otherwise
+	the modification is not recorded.
+	"""
+
+	_missing = object()
+	# Older versions of sqlite allow at most 999 parameters per query.
+	_load_many_chunk = 500
+
+	def __init__(self, db, table, key_column, value_columns,
+		decode, encode, valid):
+		self._db = db
+		self._table = table
+		self._key_column = key_column
+		self._value_columns = value_columns
+		self._decode = decode
+		self._encode = encode
+		self._entries = {}
+		self._modified = set()
+		# If the table is not valid, then it is considered empty,
+		# and commit() will replace its content.
+		self._valid = valid
+		self._complete = not valid
+
+	def _load(self, key):
+		value = self._missing
+		if not self._complete:
+			rows = self._db._query("SELECT %s FROM %s WHERE %s = ?" %
+				(", ".join(self._value_columns), self._table,
+				self._key_column), (key,))
+			if rows:
+				try:
+					value = self._decode(rows[0])
+				except (TypeError, ValueError):
+					# Corrupt entry.
+					pass
+		self._entries[key] = value
+		return value
+
+	def load_many(self, keys):
+		"""
+		Load the given keys that haven't been loaded yet, with one query
+		for each chunk of keys, instead of one query for each key.
+		"""
+		if self._complete:
+			return
+		keys = [key for key in keys if key not in self._entries]
+		for i in range(0, len(keys), self._load_many_chunk):
+			chunk = keys[i:i + self._load_many_chunk]
+			rows = self._db._query("SELECT %s, %s FROM %s WHERE %s IN (%s)" %
+				(self._key_column, ", ".join(self._value_columns),
+				self._table, self._key_column, ", ".join("?" * len(chunk))),
+				chunk)
+			for row in rows:
+				try:
+					self._entries[row[0]] = self._decode(row[1:])
+				except (TypeError, ValueError):
+					# Corrupt entry.
+					self._entries[row[0]] = self._missing
+			for key in chunk:
+				self._entries.setdefault(key, self._missing)
+
+	def _load_all(self):
+		if not self._complete:
+			rows = self._db._query("SELECT %s, %s FROM %s" %
+				(self._key_column, ", ".join(self._value_columns),
+				self._table))
+			for row in rows:
+				if row[0] not in self._entries:
+					try:
+						self._entries[row[0]] = self._decode(row[1:])
+					except (TypeError, ValueError):
+						pass
+			self._complete = True
+
+	def get(self, key, default=None):
+		value = self._entries.get(key, self._missing)
+		if value is self._missing and key not in self._entries:
+			value = self._load(key)
+		if value is self._missing:
+			return default
+		return value
+
+	def __getitem__(self, key):
+		value = self.get(key, self._missing)
+		if value is self._missing:
+			raise KeyError(key)
+		return value
+
+	def __setitem__(self, key, value):
+		self._entries[key] = value
+		self._modified.add(key)
+
+	def __delitem__(self, key):
+		self[key]
+		self._entries[key] = self._missing
+		self._modified.add(key)
+
+	def pop(self, key, *args):
+		value = self.get(key, self._missing)
+		if value is self._missing:
+			if args:
+				return args[0]
+			raise KeyError(key)
+		del self[key]
+		return value
+
+	def __contains__(self, key):
+		return self.get(key, self._missing) is not self._missing
+
+	def __iter__(self):
+		"""
+		Iterate over a snapshot of the keys, so that entries can be
+		deleted during iteration. Only the key column is read from
+		the database, and values are still loaded on demand.
+		"""
+		keys = set(key for key, value in self._entries.items()
+			if value is not self._missing)
+		if not self._complete:
+			for row in self._db._query("SELECT %s FROM %s" %
+				(self._key_column, self._table)):
+				if row[0] not in self._entries:
+					keys.add(row[0])
+		return iter(list(keys))
+
+	def __len__(self):
+		return len(list(iter(self)))
+
+	def keys(self):
+		return list(iter(self))
+
+	def items(self):
+		self._load_all()
+		return [(key, value) for key, value in self._entries.items()
+			if value is not self._missing]
+
+	def values(self):
+		return [value for key, value in self.items()]
+
+	def _commit(self, connection):
+		if self._valid:
+			modified = self._modified
+		else:
+			connection.execute("DELETE FROM %s" % self._table)
+			modified = list(self._entries)
+		deleted = []
+		replaced = []
+		for key in modified:
+			value = self._entries.get(key, self._missing)
+			if value is self._missing:
+				deleted.append((key,))
+			else:
+				replaced.append((key,) + self._encode(value))
+		if deleted:
+			connection.executemany("DELETE FROM %s WHERE %s = ?" %
+				(self._table, self._key_column), deleted)
+		if replaced:
+			connection.executemany("INSERT OR REPLACE INTO %s VALUES (%s)" %
+				(self._table, ", ".join("?" * len(replaced[0]))), replaced)
+		self._modified.clear()
+		self._valid = True
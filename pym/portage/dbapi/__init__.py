@@ -1,4 +1,4 @@
-# Copyright 1998-2014 Gentoo Foundation
+# Copyright 1998-2016 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 from __future__ import unicode_literals
@@ -12,7 +12,7 @@ portage.proxy.lazyimport.lazyimport(globals(),
 	'portage.dbapi.dep_expand:dep_expand@_dep_expand',
 	'portage.dep:Atom,match_from_list,_match_slot',
 	'portage.output:colorize',
-	'portage.util:cmp_sort_key,writemsg',
+	'portage.util:writemsg',
 	'portage.versions:catsplit,catpkgsplit,vercmp,_pkg_str',
 )
 
@@ -65,6 +65,12 @@ class dbapi(object):
 				(cpv1.build_time < cpv2.build_time))
 		return result
 
+	@staticmethod
+	def _cpv_sort_key(cpv):
+		# Equivalent to _cmp_cpv, since build_time is never None
+		# for _pkg_str instances.
+		return (cpv.version_key, cpv.build_time)
+
 	@staticmethod
 	def _cpv_sort_ascending(cpv_list):
 		"""
@@ -75,7 +81,7 @@ class dbapi(object):
 			# If the cpv includes explicit -r0, it has to be preserved
 			# for consistency in findname and aux_get calls, so use a
 			# dict to map strings back to their original values.
-			cpv_list.sort(key=cmp_sort_key(dbapi._cmp_cpv))
+			cpv_list.sort(key=dbapi._cpv_sort_key)
 
 	def cpv_all(self):
 		"""Return all CPVs in the db
@@ -114,7 +120,25 @@ class dbapi(object):
 			["0",">=sys-libs/bar-1.0","http://www.foo.com"] or [] if mycpv not found'
 		"""
 		raise NotImplementedError
-	
+
+	def aux_get_many(self, cpvs, mylist, myrepo=None):
+		"""Generate the metadata keys in mylist for each of the given cpvs.
+		Subclasses may override this in order to look up many cpvs at once.
+		Args:
+			cpvs - an iterable of cpvs
+			mylist - ["SLOT","DEPEND","HOMEPAGE"]
+			myrepo - The repository name.
+		Returns:
+			a generator of (cpv, values) pairs, in order of cpvs, where
+			values is a list like aux_get returns, or None if the cpv is
+			not found
+		"""
+		for cpv in cpvs:
+			try:
+				yield cpv, self.aux_get(cpv, mylist, myrepo=myrepo)
+			except KeyError:
+				yield cpv, None
+
 	def aux_update(self, cpv, metadata_updates):
 		"""
 		Args:
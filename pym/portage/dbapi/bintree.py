@@ -1,4 +1,4 @@
-# Copyright 1998-2014 Gentoo Foundation
+# Copyright 1998-2016 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 from __future__ import unicode_literals
@@ -7,6 +7,7 @@ __all__ = ["bindbapi", "binarytree"]
 
 import portage
 portage.proxy.lazyimport.lazyimport(globals(),
+	'portage.cache.index.digest_cache:get_digest_cache',
 	'portage.checksum:hashfunc_map,perform_multiple_checksums,' + \
 		'verify_all,_apply_hash_filter,_hash_filter',
 	'portage.dbapi.dep_expand:dep_expand',
@@ -1567,9 +1568,12 @@ class binarytree(object):
 			digests = _apply_hash_filter(digests, hash_filter)
 		eout = EOutput()
 		eout.quiet = self.settings.get("PORTAGE_QUIET") == "1"
-		ok, st = _check_distfile(pkg_path, digests, eout, show_errors=0)
+		digest_cache = get_digest_cache(self.settings, self.pkgdir)
+		ok, st = _check_distfile(pkg_path, digests, eout, show_errors=0,
+			digest_cache=digest_cache)
 		if not ok:
-			ok, reason = verify_all(pkg_path, digests)
+			ok, reason = verify_all(pkg_path, digests,
+				digest_cache=digest_cache)
 			if not ok:
 				raise portage.exception.DigestException(
 					(pkg_path,) + tuple(reason))
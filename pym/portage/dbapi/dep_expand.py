@@ -8,7 +8,7 @@ __all__ = ["dep_expand"]
 import re
 
 from portage.dbapi.cpv_expand import cpv_expand
-from portage.dep import Atom, isvalidatom
+from portage.dep import Atom, isvalidatom, _intern_atom
 from portage.exception import InvalidAtom
 from portage.versions import catsplit
 
@@ -32,12 +32,12 @@ def dep_expand(mydep, mydb=None, use_cache=1, settings=None):
 				mydep = orig_dep[:alphanum.start()] + "null/" + \
 					orig_dep[alphanum.start():]
 		try:
-			mydep = Atom(mydep, allow_repo=True)
+			mydep = _intern_atom(mydep, allow_repo=True)
 		except InvalidAtom:
 			# Missing '=' prefix is allowed for backward compatibility.
 			if not isvalidatom("=" + mydep, allow_repo=True):
 				raise
-			mydep = Atom('=' + mydep, allow_repo=True)
+			mydep = _intern_atom('=' + mydep, allow_repo=True)
 			orig_dep = '=' + orig_dep
 		if not has_cat:
 			null_cat, pn = catsplit(mydep.cp)
@@ -55,4 +55,4 @@ def dep_expand(mydep, mydb=None, use_cache=1, settings=None):
 
 	expanded = cpv_expand(mydep, mydb=mydb,
 		use_cache=use_cache, settings=settings)
-	return Atom(orig_dep.replace(mydep, expanded, 1), allow_repo=True)
+	return _intern_atom(orig_dep.replace(mydep, expanded, 1), allow_repo=True)
@@ -1,4 +1,4 @@
-# Copyright 1998-2015 Gentoo Foundation
+# Copyright 1998-2016 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 from __future__ import unicode_literals
@@ -19,8 +19,10 @@ portage.proxy.lazyimport.lazyimport(globals(),
 	'portage.versions:best,catpkgsplit,_pkgsplit@pkgsplit,ver_regexp,_pkg_str',
 )
 
-from portage.cache import volatile
+from portage.cache import packed, volatile
+from portage.cache.flat_hash import md5_database
 from portage.cache.cache_errors import CacheError
+from portage.cache.index.eclass_index import EclassIndex
 from portage.cache.mappings import Mapping
 from portage.dbapi import dbapi
 from portage.exception import PortageException, PortageKeyError, \
@@ -39,6 +41,7 @@ from portage.util._eventloop.EventLoop import EventLoop
 from portage.util._eventloop.global_event_loop import global_event_loop
 from _emerge.EbuildMetadataPhase import EbuildMetadataPhase
 
+from itertools import islice
 import os as _os
 import sys
 import traceback
@@ -105,6 +108,8 @@ class portdbapi(dbapi):
 	"""this tree will scan a portage directory located at root (passed to init)"""
 	portdbapi_instances = _dummy_list()
 	_use_mutable = True
+	# The number of cpvs that aux_get_many looks up at once.
+	_aux_get_many_chunk = 1000
 
 	@property
 	def _categories(self):
@@ -187,6 +192,9 @@ class portdbapi(dbapi):
 		self.auxdbmodule = self.settings.load_best_module("portdbapi.auxdbmodule")
 		self.auxdb = {}
 		self._pregen_auxdb = {}
+		# Packed copies of md5-dict caches (see portage.cache.packed),
+		# which are tried before the corresponding _pregen_auxdb.
+		self._pregen_packed = {}
 		# If the current user doesn't have depcachedir write permission,
 		# then the depcachedir cache is kept here read-only access.
 		self._ro_auxdb = {}
@@ -221,7 +229,9 @@ class portdbapi(dbapi):
 		# If secpass < 1, we don't want to write to the cache
 		# since then we won't be able to apply group permissions
 		# to the cache entries/directories.
-		if (secpass < 1 and not depcachedir_unshared) or not depcachedir_w_ok:
+		volatile_auxdb = (secpass < 1 and not depcachedir_unshared) or \
+			not depcachedir_w_ok
+		if volatile_auxdb:
 			for x in self.porttrees:
 				self.auxdb[x] = volatile.database(
 					self.depcachedir, x, self._known_keys,
@@ -238,6 +248,14 @@ class portdbapi(dbapi):
 				# location, label, auxdbkeys
 				self.auxdb[x] = self.auxdbmodule(
 					self.depcachedir, x, self._known_keys, **cache_kwargs)
+		# Maps eclasses to the cpvs that inherit them (see
+		# _eclass_consumers).
+		self._eclass_index = None
+		if EclassIndex.available():
+			self._eclass_index = EclassIndex(
+				os.path.join(self.depcachedir, "eclass_index.sqlite"),
+				readonly=volatile_auxdb, gid=cache_kwargs.get("gid", -1),
+				perms=cache_kwargs.get("perms", -1))
 		if "metadata-transfer" not in self.settings.features:
 			for x in self.porttrees:
 				if x in self._pregen_auxdb:
@@ -245,6 +263,9 @@ class portdbapi(dbapi):
 				cache = self._create_pregen_cache(x)
 				if cache is not None:
 					self._pregen_auxdb[x] = cache
+					packed_cache = self._create_pregen_packed_cache(x, cache)
+					if packed_cache is not None:
+						self._pregen_packed[x] = packed_cache
 		# Selectively cache metadata in order to optimize dep matching.
 		self._aux_cache_keys = set(
 			["DEPEND", "EAPI", "HDEPEND",
@@ -284,6 +305,23 @@ class portdbapi(dbapi):
 
 		return cache
 
+	def _create_pregen_packed_cache(self, tree, pregen_cache):
+		"""
+		Return a packed cache for the given md5-dict cache, if one has
+		been generated by egencache --update-cache-pack, either in the
+		repository or, if the repository is not writable, in depcachedir.
+		The file is not opened until the first lookup.
+		"""
+		if not isinstance(pregen_cache, md5_database):
+			return None
+		outside_repo = os.path.join(self.depcachedir, tree.lstrip(os.sep))
+		for parent_dir in (tree, outside_repo):
+			if os.path.exists(os.path.join(parent_dir,
+				packed.packed_cache_path)):
+				return packed.database(parent_dir,
+					packed.packed_cache_path, self._known_keys)
+		return None
+
 	def _init_cache_dirs(self):
 		"""Create /var/cache/edb/dep and adjust permissions for the portage
 		group."""
@@ -304,10 +342,64 @@ class portdbapi(dbapi):
 		for x in self.auxdb:
 			self.auxdb[x].sync()
 		self.auxdb.clear()
+		for x in getattr(self, "_pregen_packed", {}).values():
+			x.close()
+		if getattr(self, "_eclass_index", None) is not None:
+			self._eclass_index.close()
 
 	def flush_cache(self):
 		for x in self.auxdb.values():
 			x.sync()
+		if self._eclass_index is not None:
+			self._eclass_index.flush()
+
+	def _eclass_consumers(self, eclasses, repo):
+		"""
+		Return a set of the cpvs of the given repository which inherit
+		any of the given eclasses, directly or indirectly, according to
+		the metadata cache. The eclass index is used if it is complete
+		for the repository, and otherwise it is rebuilt from the cache
+		entries. Returns None if the repository has no cache entries
+		that record inherited eclasses.
+
+		@param eclasses: eclass names
+		@type eclasses: frozenset
+		@param repo: repository name
+		@type repo: str
+		@rtype: set or None
+		"""
+		index = self._eclass_index
+		if index is not None and index.complete(repo):
+			cpvs = set()
+			for eclass in eclasses:
+				cpvs.update(cpv for _repo, cpv in
+					index.lookup(eclass, repo=repo))
+			return cpvs
+
+		location = self.repositories.treemap.get(repo)
+		cache = self._pregen_auxdb.get(location)
+		if cache is None:
+			cache = self._ro_auxdb.get(location, self.auxdb.get(location))
+		if cache is None or not cache.complete_eclass_entries:
+			return None
+
+		entries = []
+		try:
+			for cpv in cache:
+				try:
+					inherited = cache[cpv].get("_eclasses_", ())
+				except (KeyError, CacheError):
+					continue
+				entries.append((cpv, tuple(inherited)))
+		except CacheError:
+			return None
+		if not entries:
+			return None
+
+		if index is not None:
+			index.rebuild(repo, entries)
+		return set(cpv for cpv, inherited in entries
+			if not eclasses.isdisjoint(inherited))
 
 	def findLicensePath(self, license_name):
 		for x in reversed(self.porttrees):
@@ -424,8 +516,13 @@ class portdbapi(dbapi):
 				# Normally this shouldn't happen, so we'll show
 				# a traceback for debugging purposes.
 				traceback.print_exc()
+			else:
+				if self._eclass_index is not None:
+					self._eclass_index.update(
+						self.repositories.get_name_for_location(repo_path),
+						cpv, metadata.get("_eclasses_", ()))
 
-	def _pull_valid_cache(self, cpv, ebuild_path, repo_path):
+	def _ebuild_hash(self, cpv, ebuild_path):
 		try:
 			ebuild_hash = eclass_cache.hashed_path(ebuild_path)
 			# snag mtime since we use it later, and to trigger stat failure
@@ -436,21 +533,13 @@ class portdbapi(dbapi):
 				"'%s' does not exist at:\n") % (cpv,), noiselevel=-1)
 			writemsg("!!!            %s\n" % ebuild_path, noiselevel=-1)
 			raise PortageKeyError(cpv)
+		return ebuild_hash
 
-		# Pull pre-generated metadata from the metadata/cache/
-		# directory if it exists and is valid, otherwise fall
-		# back to the normal writable cache.
-		auxdbs = []
-		pregen_auxdb = self._pregen_auxdb.get(repo_path)
-		if pregen_auxdb is not None:
-			auxdbs.append(pregen_auxdb)
-		ro_auxdb = self._ro_auxdb.get(repo_path)
-		if ro_auxdb is not None:
-			auxdbs.append(ro_auxdb)
-		auxdbs.append(self.auxdb[repo_path])
+	def _pull_valid_cache(self, cpv, ebuild_path, repo_path):
+		ebuild_hash = self._ebuild_hash(cpv, ebuild_path)
 		eclass_db = self.repositories.get_repo_for_location(repo_path).eclass_db
 
-		for auxdb in auxdbs:
+		for auxdb in self._auxdbs(repo_path):
 			try:
 				metadata = auxdb[cpv]
 			except KeyError:
@@ -462,22 +551,78 @@ class portdbapi(dbapi):
 					except (KeyError, CacheError):
 						pass
 				continue
-			eapi = metadata.get('EAPI', '').strip()
-			if not eapi:
-				eapi = '0'
-				metadata['EAPI'] = eapi
-			if not eapi_is_supported(eapi):
-				# Since we're supposed to be able to efficiently obtain the
-				# EAPI from _parse_eapi_ebuild_head, we disregard cache entries
-				# for unsupported EAPIs.
-				continue
-			if auxdb.validate_entry(metadata, ebuild_hash, eclass_db):
+			if self._validate_cache_entry(auxdb, metadata,
+				ebuild_hash, eclass_db):
 				break
 		else:
 			metadata = None
 
 		return (metadata, ebuild_hash)
 
+	def _auxdbs(self, repo_path):
+		"""
+		Return the caches of the given repository, in the order in which
+		they are searched for valid entries. Pre-generated metadata from
+		the repository is used if it exists and is valid, otherwise the
+		normal writable cache is used.
+		"""
+		auxdbs = []
+		pregen_packed = self._pregen_packed.get(repo_path)
+		if pregen_packed is not None:
+			auxdbs.append(pregen_packed)
+		pregen_auxdb = self._pregen_auxdb.get(repo_path)
+		if pregen_auxdb is not None:
+			auxdbs.append(pregen_auxdb)
+		ro_auxdb = self._ro_auxdb.get(repo_path)
+		if ro_auxdb is not None:
+			auxdbs.append(ro_auxdb)
+		auxdbs.append(self.auxdb[repo_path])
+		return auxdbs
+
+	@staticmethod
+	def _validate_cache_entry(auxdb, metadata, ebuild_hash, eclass_db):
+		eapi = metadata.get('EAPI', '').strip()
+		if not eapi:
+			eapi = '0'
+			metadata['EAPI'] = eapi
+		if not eapi_is_supported(eapi):
+			# Since we're supposed to be able to efficiently obtain the
+			# EAPI from _parse_eapi_ebuild_head, we disregard cache entries
+			# for unsupported EAPIs.
+			return False
+		return auxdb.validate_entry(metadata, ebuild_hash, eclass_db)
+
+	def _pull_valid_cache_many(self, entries, repo_path):
+		"""
+		Like _pull_valid_cache, for a list of (cpv, ebuild_hash) pairs
+		of the given repository. Each cache is searched once for all of
+		the cpvs that haven't been found in the previous caches, so that
+		cache modules can read many entries at once. Returns a dict
+		which maps the cpvs that have valid cache entries to their
+		metadata.
+		"""
+		eclass_db = self.repositories.get_repo_for_location(repo_path).eclass_db
+		ebuild_hashes = dict(entries)
+		valid = {}
+		for auxdb in self._auxdbs(repo_path):
+			pending = [cpv for cpv, ebuild_hash in entries
+				if cpv not in valid]
+			if not pending:
+				break
+			for cpv, metadata in auxdb.get_many(pending):
+				if metadata is None:
+					# Corrupt entry.
+					if not auxdb.readonly:
+						try:
+							del auxdb[cpv]
+						except (KeyError, CacheError):
+							pass
+					continue
+				if self._validate_cache_entry(auxdb, metadata,
+					ebuild_hashes[cpv], eclass_db):
+					valid[cpv] = metadata
+		return valid
+
 	def aux_get(self, mycpv, mylist, mytree=None, myrepo=None):
 		"stub code for returning auxilliary db information, such as SLOT, DEPEND, etc."
 		'input: "sys-apps/foo-1.0",["SLOT","DEPEND","HOMEPAGE"]'
@@ -521,23 +666,124 @@ class portdbapi(dbapi):
 		doregen = mydata is None
 
 		if doregen:
-			if myebuild in self._broken_ebuilds:
-				raise PortageKeyError(mycpv)
+			mydata = self._regen_metadata(mycpv, myebuild, ebuild_hash,
+				mylocation)
+
+		return self._aux_get_result(mycpv, mydata, ebuild_hash, mylocation,
+			mylist, cache_me)
+
+	def aux_get_many(self, cpvs, mylist, mytree=None, myrepo=None):
+		"""
+		Generate the metadata keys in mylist for each of the given cpvs,
+		like aux_get. The cpvs are processed in chunks, and the caches of
+		each repository are searched once for all cpvs of a chunk which
+		belong to that repository, so that cache modules can read many
+		entries at once. Metadata is only generated for the cpvs that
+		don't have valid cache entries.
+
+		@param cpvs: an iterable of cpvs
+		@type cpvs: iterable
+		@param mylist: metadata keys
+		@type mylist: list
+		@rtype: iterator
+		@return: (cpv, values) pairs, in order of cpvs, where values is
+			None if the cpv is not found
+		"""
+		cache_me = False
+		if myrepo is not None:
+			mytree = self.treemap.get(myrepo)
+			if mytree is None:
+				raise PortageKeyError(myrepo)
+
+		if mytree is not None and len(self.porttrees) == 1 \
+			and mytree == self.porttrees[0]:
+			mytree = None
+			myrepo = None
+
+		if mytree is None:
+			cache_me = True
+		use_aux_cache = mytree is None and not self._known_keys.intersection(
+			mylist).difference(self._aux_cache_keys)
+
+		cpvs = iter(cpvs)
+		while True:
+			chunk = list(islice(cpvs, self._aux_get_many_chunk))
+			if not chunk:
+				break
+
+			results = {}
+			locations = {}
+			repo_entries = {}
+			for mycpv in chunk:
+				if use_aux_cache:
+					aux_cache = self._aux_cache.get(mycpv)
+					if aux_cache is not None:
+						results[mycpv] = [aux_cache.get(x, "") for x in mylist]
+						continue
+
+				if "/" not in mycpv:
+					results[mycpv] = None
+					continue
+
+				myebuild, mylocation = self.findname2(mycpv, mytree)
+				if not myebuild:
+					writemsg("!!! aux_get(): %s\n" % \
+						_("ebuild not found for '%s'") % mycpv, noiselevel=1)
+					results[mycpv] = None
+					continue
+
+				try:
+					ebuild_hash = self._ebuild_hash(mycpv, myebuild)
+				except PortageKeyError:
+					results[mycpv] = None
+					continue
+
+				locations[mycpv] = (myebuild, mylocation, ebuild_hash)
+				repo_entries.setdefault(mylocation, []).append(
+					(mycpv, ebuild_hash))
 
-			proc = EbuildMetadataPhase(cpv=mycpv,
-				ebuild_hash=ebuild_hash, portdb=self,
-				repo_path=mylocation, scheduler=self._event_loop,
-				settings=self.doebuild_settings)
+			valid = {}
+			for mylocation, entries in repo_entries.items():
+				valid.update(self._pull_valid_cache_many(entries, mylocation))
 
-			proc.start()
-			proc.wait()
+			for mycpv in chunk:
+				if mycpv in results:
+					yield mycpv, results[mycpv]
+					continue
+				myebuild, mylocation, ebuild_hash = locations[mycpv]
+				mydata = valid.get(mycpv)
+				if mydata is None:
+					try:
+						mydata = self._regen_metadata(mycpv, myebuild,
+							ebuild_hash, mylocation)
+					except PortageKeyError:
+						results[mycpv] = None
+						yield mycpv, None
+						continue
+				results[mycpv] = self._aux_get_result(mycpv, mydata,
+					ebuild_hash, mylocation, mylist, cache_me)
+				yield mycpv, results[mycpv]
 
-			if proc.returncode != os.EX_OK:
-				self._broken_ebuilds.add(myebuild)
-				raise PortageKeyError(mycpv)
+	def _regen_metadata(self, mycpv, myebuild, ebuild_hash, mylocation):
+		if myebuild in self._broken_ebuilds:
+			raise PortageKeyError(mycpv)
+
+		proc = EbuildMetadataPhase(cpv=mycpv,
+			ebuild_hash=ebuild_hash, portdb=self,
+			repo_path=mylocation, scheduler=self._event_loop,
+			settings=self.doebuild_settings)
+
+		proc.start()
+		proc.wait()
+
+		if proc.returncode != os.EX_OK:
+			self._broken_ebuilds.add(myebuild)
+			raise PortageKeyError(mycpv)
 
-			mydata = proc.metadata
+		return proc.metadata
 
+	def _aux_get_result(self, mycpv, mydata, ebuild_hash, mylocation,
+		mylist, cache_me):
 		mydata["repository"] = self.repositories.get_name_for_location(mylocation)
 		mydata["_mtime_"] = ebuild_hash.mtime
 		eapi = mydata.get("EAPI")
@@ -1,4 +1,4 @@
-# Copyright 1998-2014 Gentoo Foundation
+# Copyright 1998-2016 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 from __future__ import division, unicode_literals
@@ -65,6 +65,7 @@ from portage import _os_merge
 from portage import _selinux_merge
 from portage import _unicode_decode
 from portage import _unicode_encode
+from ._VdbMetadataCache import VdbMetadataCache
 from ._VdbMetadataDelta import VdbMetadataDelta
 
 from _emerge.EbuildBuildDir import EbuildBuildDir
@@ -79,7 +80,7 @@ import fnmatch
 import gc
 import grp
 import io
-from itertools import chain
+from itertools import chain, islice
 import logging
 import os as _os
 import platform
@@ -113,7 +114,7 @@ class vardbapi(dbapi):
 		"|".join(_excluded_dirs) + r')$')
 
 	_aux_cache_version        = "1"
-	_owners_cache_version     = "1"
+	_owners_cache_version     = "2"
 
 	# Number of uncached packages to trigger cache update, since
 	# it's wasteful to update it for every vdb change.
@@ -121,6 +122,8 @@ class vardbapi(dbapi):
 
 	_aux_cache_keys_re = re.compile(r'^NEEDED\..*$')
 	_aux_multi_line_re = re.compile(r'^(CONTENTS|NEEDED\..*)$')
+	# The number of cpvs that aux_get_many looks up at once.
+	_aux_get_many_chunk = 1000
 
 	def __init__(self, _unused_param=DeprecationWarning,
 		categories=None, settings=None, vartree=None):
@@ -182,8 +185,14 @@ class vardbapi(dbapi):
 			"PROVIDES", "REQUIRES"
 			])
 		self._aux_cache_obj = None
-		self._aux_cache_filename = os.path.join(self._eroot,
-			CACHE_PATH, "vdb_metadata.pickle")
+		if VdbMetadataCache.available():
+			self._aux_cache_filename = os.path.join(self._eroot,
+				CACHE_PATH, "vdb_metadata.sqlite")
+			self._aux_cache_db = VdbMetadataCache(self._aux_cache_filename)
+		else:
+			self._aux_cache_filename = os.path.join(self._eroot,
+				CACHE_PATH, "vdb_metadata.pickle")
+			self._aux_cache_db = None
 		self._cache_delta_filename = os.path.join(self._eroot,
 			CACHE_PATH, "vdb_metadata_delta.json")
 		self._cache_delta = VdbMetadataDelta(self)
@@ -553,10 +562,15 @@ class vardbapi(dbapi):
 	def _add(self, pkg_dblink):
 		self._pkgs_changed = True
 		self._clear_pkg_cache(pkg_dblink)
+		self._owners._index_add(pkg_dblink)
 
 	def _remove(self, pkg_dblink):
 		self._pkgs_changed = True
 		self._clear_pkg_cache(pkg_dblink)
+		if pkg_dblink.dbdir is pkg_dblink.dbpkgdir:
+			# Otherwise, this is a replaced instance of a package
+			# which has already been indexed by _add.
+			self._owners._index_remove(pkg_dblink.mycpv)
 
 	def _clear_pkg_cache(self, pkg_dblink):
 		# Due to 1 second mtime granularity in <python-2.5, mtime checks
@@ -623,13 +637,25 @@ class vardbapi(dbapi):
 			for cpv in list(self._aux_cache["packages"]):
 				if cpv not in valid_nodes:
 					del self._aux_cache["packages"][cpv]
-			del self._aux_cache["modified"]
 			timestamp = time.time()
-			self._aux_cache["timestamp"] = timestamp
 
-			f = atomic_ofstream(self._aux_cache_filename, 'wb')
-			pickle.dump(self._aux_cache, f, protocol=2)
-			f.close()
+			if self._aux_cache_db is not None:
+				# Only modified entries are written.
+				self._aux_cache_db.commit({
+					"packages": self._aux_cache["packages"],
+					"base_names": self._aux_cache["owners"]["base_names"],
+					"base_name_pkgs":
+						self._aux_cache["owners"]["base_name_pkgs"],
+					"base_name_lists":
+						self._aux_cache["owners"]["base_name_lists"],
+				}, timestamp)
+				self._aux_cache["timestamp"] = timestamp
+			else:
+				del self._aux_cache["modified"]
+				self._aux_cache["timestamp"] = timestamp
+				f = atomic_ofstream(self._aux_cache_filename, 'wb')
+				pickle.dump(self._aux_cache, f, protocol=2)
+				f.close()
 			apply_secpass_permissions(
 				self._aux_cache_filename, mode=0o644)
 
@@ -646,6 +672,26 @@ class vardbapi(dbapi):
 		return self._aux_cache_obj
 
 	def _aux_cache_init(self):
+		if self._aux_cache_db is not None:
+			# Entries are loaded lazily by the aux_get and
+			# _owners_cache lookups.
+			cache = self._aux_cache_db.load()
+			aux_cache = {
+				"version": self._aux_cache_version,
+				"packages": cache["packages"],
+				"owners": {
+					"base_names": cache["base_names"],
+					"base_name_pkgs": cache["base_name_pkgs"],
+					"base_name_lists": cache["base_name_lists"],
+					"version": self._owners_cache_version,
+				},
+				"modified": set(),
+			}
+			if "timestamp" in cache:
+				aux_cache["timestamp"] = cache["timestamp"]
+			self._aux_cache_obj = aux_cache
+			return
+
 		aux_cache = None
 		open_kwargs = {}
 		if sys.hexversion >= 0x3000000 and sys.hexversion < 0x3020000:
@@ -696,10 +742,16 @@ class vardbapi(dbapi):
 				owners = None
 			elif not isinstance(owners["base_names"], dict):
 				owners = None
+			elif not isinstance(owners.get("base_name_pkgs"), dict):
+				owners = None
+			elif not isinstance(owners.get("base_name_lists"), dict):
+				owners = None
 
 		if owners is None:
 			owners = {
 				"base_names" : {},
+				"base_name_pkgs" : {},
+				"base_name_lists" : {},
 				"version"    : self._owners_cache_version
 			}
 			aux_cache["owners"] = owners
@@ -711,12 +763,13 @@ class vardbapi(dbapi):
 		"""This automatically caches selected keys that are frequently needed
 		by emerge for dependency calculations.  The cached metadata is
 		considered valid if the mtime of the package directory has not changed
-		since the data was cached.  The cache is stored in a pickled dict
-		object with the following format:
+		since the data was cached.  The cache is stored in an sqlite database
+		(see VdbMetadataCache) which is read lazily, or in a pickled dict
+		object with the following format if sqlite is unavailable:
 
 		{version:"1", "packages":{cpv1:(mtime,{k1,v1, k2,v2, ...}), cpv2...}}
 
-		If an error occurs while loading the cache pickle or the version is
+		If an error occurs while loading the cache or the version is
 		unrecognized, the cache will simple be recreated from scratch (it is
 		completely disposable).
 		"""
@@ -803,6 +856,28 @@ class vardbapi(dbapi):
 
 		return [mydata[x] for x in wants]
 
+	def aux_get_many(self, cpvs, wants, myrepo=None):
+		"""
+		Generate the values of wants for each of the given cpvs, like
+		aux_get. The cpvs are processed in chunks, and the cache entries
+		of each chunk are loaded with a single query when the cache is
+		stored in an sqlite database.
+		"""
+		cpvs = iter(cpvs)
+		while True:
+			chunk = list(islice(cpvs, self._aux_get_many_chunk))
+			if not chunk:
+				break
+			load_many = getattr(self._aux_cache["packages"],
+				"load_many", None)
+			if load_many is not None:
+				load_many(chunk)
+			for mycpv in chunk:
+				try:
+					yield mycpv, self.aux_get(mycpv, wants, myrepo=myrepo)
+				except KeyError:
+					yield mycpv, None
+
 	def _aux_get(self, mycpv, wants, st=None):
 		mydir = self.getpath(mycpv)
 		if st is None:
@@ -1117,6 +1192,10 @@ class vardbapi(dbapi):
 		contents by mapping the basename of file to a list of possible
 		packages that own it. This is used to optimize owner lookups
 		by narrowing the search down to a smaller number of packages.
+		The "base_name_pkgs" and "base_name_lists" tables map the cpv of
+		each cached package to its hash and to the hashes of its
+		basenames, so that stale packages can be removed without
+		scanning all of the buckets.
 		"""
 		try:
 			from hashlib import md5 as _new_hash
@@ -1133,12 +1212,42 @@ class vardbapi(dbapi):
 			eroot_len = len(self._vardb._eroot)
 			pkg_hash = self._hash_pkg(cpv)
 			db = self._vardb._dblink(cpv)
+			name_hashes = set()
 			if not db.getcontents():
 				# Empty path is a code used to represent empty contents.
-				self._add_path("", pkg_hash)
+				name_hashes.add(self._add_path("", pkg_hash))
 
 			for x in db._contents.keys():
-				self._add_path(x[eroot_len:], pkg_hash)
+				name_hashes.add(self._add_path(x[eroot_len:], pkg_hash))
+
+			name_hashes.discard(None)
+			owners = self._vardb._aux_cache["owners"]
+			owners["base_name_pkgs"][cpv] = pkg_hash
+			owners["base_name_lists"][cpv] = sorted(name_hashes)
+			self._vardb._aux_cache["modified"].add(cpv)
+
+		def remove(self, cpv):
+			"""
+			Remove the cached package with the given cpv, reading only
+			the buckets that contain its basenames.
+			"""
+			owners = self._vardb._aux_cache["owners"]
+			base_names = owners["base_names"]
+			pkg_hash = owners["base_name_pkgs"].pop(cpv, None)
+			if pkg_hash is None:
+				return
+			# Stale entries that remain in the buckets if the list of
+			# basenames is missing are ignored by iter_owners, since
+			# their package hashes do not match.
+			for name_hash in owners["base_name_lists"].pop(cpv, ()):
+				bucket = base_names.get(name_hash)
+				if bucket is None or pkg_hash not in bucket:
+					continue
+				del bucket[pkg_hash]
+				if bucket:
+					base_names[name_hash] = bucket
+				else:
+					del base_names[name_hash]
 
 			self._vardb._aux_cache["modified"].add(cpv)
 
@@ -1149,7 +1258,7 @@ class vardbapi(dbapi):
 			if path:
 				name = os.path.basename(path.rstrip(os.path.sep))
 				if not name:
-					return
+					return None
 			else:
 				name = path
 			name_hash = self._hash_str(name)
@@ -1157,8 +1266,11 @@ class vardbapi(dbapi):
 			pkgs = base_names.get(name_hash)
 			if pkgs is None:
 				pkgs = {}
-				base_names[name_hash] = pkgs
 			pkgs[pkg_hash] = None
+			# Assign the bucket even if it exists, so that the
+			# modification is recorded by VdbMetadataCache.
+			base_names[name_hash] = pkgs
+			return name_hash
 
 		def _hash_str(self, s):
 			h = self._new_hash()
@@ -1189,40 +1301,143 @@ class vardbapi(dbapi):
 		def populate(self):
 			self._populate()
 
-		def _populate(self):
-			owners_cache = vardbapi._owners_cache(self._vardb)
-			cached_hashes = set()
-			base_names = self._vardb._aux_cache["owners"]["base_names"]
+		def _index_enabled(self):
+			"""
+			The FEATURES=owners-index index maps full paths to owners,
+			and it is stored in the VdbMetadataCache database.
+			"""
+			features = self._vardb.settings.features
+			return self._vardb._aux_cache_db is not None and \
+				"owners-index" in features and \
+				"case-insensitive-fs" not in features
 
-			# Take inventory of all cached package hashes.
-			for name, hash_values in list(base_names.items()):
-				if not isinstance(hash_values, dict):
-					del base_names[name]
-					continue
-				cached_hashes.update(hash_values)
+		def _index_counter(self, cpv):
+			try:
+				return int(self._vardb.aux_get(cpv, ["COUNTER"])[0])
+			except ValueError:
+				return 0
 
-			# Create sets of valid package hashes and uncached packages.
-			uncached_pkgs = set()
-			hash_pkg = owners_cache._hash_pkg
-			valid_pkg_hashes = set()
+		def _index_paths(self, pkg_dblink):
+			"""
+			Return the contents paths of a package, together with
+			alternative paths that have the symlinks in their parent
+			directories resolved.
+			"""
+			paths = set()
+			real_parents = {}
+			for path in pkg_dblink.getcontents():
+				paths.add(path)
+				parent, name = os.path.split(path)
+				real_parent = real_parents.get(parent)
+				if real_parent is None:
+					real_parent = os.path.realpath(parent)
+					real_parents[parent] = real_parent
+				if real_parent != parent:
+					paths.add(os.path.join(real_parent, name))
+			return paths
+
+		def _index_add(self, pkg_dblink):
+			if self._index_enabled() and secpass >= 2:
+				cpv = pkg_dblink.mycpv
+				self._vardb._aux_cache_db.owners_index_update(add=[(cpv,
+					self._index_counter(cpv), self._index_paths(pkg_dblink))])
+
+		def _index_remove(self, cpv):
+			if self._index_enabled() and secpass >= 2:
+				self._vardb._aux_cache_db.owners_index_update(remove=[cpv])
+
+		def _index_populate(self):
+			"""
+			Index any unindexed packages, and remove packages which are no
+			longer installed from the index.
+
+			@rtype: bool
+			@return: True if the index is up to date, and False otherwise
+				(the index can only be updated with superuser privileges)
+			"""
+			cache_db = self._vardb._aux_cache_db
+			indexed = cache_db.owners_index_packages()
+			installed = {}
 			for cpv in self._vardb.cpv_all():
-				hash_value = hash_pkg(cpv)
-				valid_pkg_hashes.add(hash_value)
-				if hash_value not in cached_hashes:
-					uncached_pkgs.add(cpv)
+				installed[cpv] = self._index_counter(cpv)
+			if indexed == installed:
+				return True
+			if secpass < 2:
+				return False
 
-			# Cache any missing packages.
-			for cpv in uncached_pkgs:
-				owners_cache.add(cpv)
+			def add_iter():
+				for cpv, counter in installed.items():
+					if indexed.get(cpv) != counter:
+						yield (cpv, counter,
+							self._index_paths(self._vardb._dblink(cpv)))
 
-			# Delete any stale cache.
-			stale_hashes = cached_hashes.difference(valid_pkg_hashes)
-			if stale_hashes:
-				for base_name_hash, bucket in list(base_names.items()):
-					for hash_value in stale_hashes.intersection(bucket):
-						del bucket[hash_value]
-					if not bucket:
-						del base_names[base_name_hash]
+			return cache_db.owners_index_update(add=add_iter(),
+				remove=[cpv for cpv in indexed if cpv not in installed])
+
+		def _iter_owners_index(self, path_list, unindexed):
+			"""
+			Iterate over tuples of (dblink, path), using a single index
+			lookup for each path. The ownership of each match is confirmed
+			by dblink._match_contents, so that index entries which have
+			become stale due to removeFromContents are ignored. If the
+			index becomes unusable, then the paths which have not been
+			searched yet are appended to the unindexed list.
+			"""
+			vardb = self._vardb
+			root = vardb._eroot
+			destroot = vardb.settings["ROOT"]
+			real_parents = {}
+			dblink_cache = {}
+
+			for i, path in enumerate(path_list):
+				destfile = normalize_path(os.path.join(destroot,
+					path.lstrip(os.path.sep)))
+				parent, name = os.path.split(destfile)
+				real_parent = real_parents.get(parent)
+				if real_parent is None:
+					real_parent = os.path.realpath(parent)
+					real_parents[parent] = real_parent
+
+				owners = vardb._aux_cache_db.owners_index_lookup(
+					set([destfile, os.path.join(real_parent, name)]))
+				if owners is None:
+					unindexed.extend(path_list[i:])
+					return
+				for cpv in sorted(owners):
+					pkg_dblink = dblink_cache.get(cpv)
+					if pkg_dblink is None:
+						if len(dblink_cache) > 20:
+							# Ensure that we don't run out of memory.
+							dblink_cache.clear()
+						pkg_dblink = vardb._dblink(cpv)
+						dblink_cache[cpv] = pkg_dblink
+					key = pkg_dblink._match_contents(path)
+					if key is not False:
+						yield (pkg_dblink, key[len(root):])
+
+		def _populate(self):
+			owners_cache = vardbapi._owners_cache(self._vardb)
+			base_name_pkgs = \
+				self._vardb._aux_cache["owners"]["base_name_pkgs"]
+			installed = self._vardb.cpv_all()
+			load_many = getattr(base_name_pkgs, "load_many", None)
+			if load_many is not None:
+				load_many(installed)
+
+			# Delete any packages that are no longer installed. Only
+			# the cpvs of the cached packages are read here.
+			installed_set = set(installed)
+			for cpv in list(base_name_pkgs):
+				if cpv not in installed_set:
+					owners_cache.remove(cpv)
+
+			# Cache any missing packages, and replace any stale ones.
+			hash_pkg = owners_cache._hash_pkg
+			for cpv in installed:
+				if base_name_pkgs.get(cpv) == hash_pkg(cpv):
+					continue
+				owners_cache.remove(cpv)
+				owners_cache.add(cpv)
 
 			return owners_cache
 
@@ -1263,6 +1478,22 @@ class vardbapi(dbapi):
 
 			if not isinstance(path_iter, list):
 				path_iter = list(path_iter)
+
+			if path_iter and self._index_enabled() and \
+				self._index_populate():
+				# The index only contains full paths, so basenames
+				# are searched with the basename cache below, together
+				# with any paths that could not be searched due to a
+				# database error.
+				full_paths = [path for path in path_iter
+					if os.sep == path[:1]]
+				path_iter = [path for path in path_iter
+					if os.sep != path[:1]]
+				for x in self._iter_owners_index(full_paths, path_iter):
+					yield x
+				if not path_iter:
+					return
+
 			owners_cache = self._populate()
 			vardb = self._vardb
 			root = vardb._eroot
@@ -1952,7 +2183,7 @@ class dblink(object):
 	@_slot_locked
 	def unmerge(self, pkgfiles=None, trimworld=None, cleanup=True,
 		ldpath_mtimes=None, others_in_slot=None, needed=None,
-		preserve_paths=None):
+		preserve_paths=None, parallel=False):
 		"""
 		Calls prerm
 		Unmerges a given package (CPV)
@@ -1977,6 +2208,11 @@ class dblink(object):
 			LinkageMap, since they are not registered in the
 			PreservedLibsRegistry yet.
 		@type preserve_paths: set
+		@param parallel: The caller guarantees that no concurrent unmerge
+			has files in common with this one, so files are removed without
+			holding the lock that serializes merges and unmerges. Config
+			memory updates are still serialized.
+		@type parallel: Boolean
 		@rtype: Integer
 		@return:
 		1. os.EX_OK if everything went well.
@@ -2118,11 +2354,14 @@ class dblink(object):
 					showMessage(_("!!! FAILED prerm: %s\n") % retval,
 						level=logging.ERROR, noiselevel=-1)
 
-			self.vartree.dbapi._fs_lock()
-			try:
+			if parallel:
 				self._unmerge_pkgfiles(pkgfiles, others_in_slot)
-			finally:
-				self.vartree.dbapi._fs_unlock()
+			else:
+				self.vartree.dbapi._fs_lock()
+				try:
+					self._unmerge_pkgfiles(pkgfiles, others_in_slot)
+				finally:
+					self.vartree.dbapi._fs_unlock()
 			self._clear_contents_cache()
 
 			if not eapi_unsupported and os.path.isfile(myebuildpath):
@@ -2649,9 +2888,15 @@ class dblink(object):
 
 		# Remove stale entries from config memory.
 		if stale_confmem:
-			for filename in stale_confmem:
-				del cfgfiledict[filename]
-			writedict(cfgfiledict, self.vartree.dbapi._conf_mem_file)
+			self.vartree.dbapi._fs_lock()
+			try:
+				# Reload, in case a concurrent unmerge has modified it.
+				cfgfiledict = grabdict(self.vartree.dbapi._conf_mem_file)
+				for filename in stale_confmem:
+					cfgfiledict.pop(filename, None)
+				writedict(cfgfiledict, self.vartree.dbapi._conf_mem_file)
+			finally:
+				self.vartree.dbapi._fs_unlock()
 
 		#remove self from vartree database so that our own virtual gets zapped if we're the last node
 		self.vartree.zap(self.mycpv)
@@ -31,6 +31,7 @@ from portage.localization import _
 from portage.versions import catpkgsplit, catsplit, \
 	vercmp, ververify, _cp, _cpv, _pkg_str, _slot, _unknown_repo, _vr
 import portage.cache.mappings
+from portage.util._lru_cache import LRUCache
 
 if sys.hexversion >= 0x3000000:
 	# pylint: disable=W0622
@@ -407,6 +408,78 @@ def paren_enclose(mylist, unevaluated_atom=False, opconvert=False):
 			mystrparts.append(x)
 	return " ".join(mystrparts)
 
+class _CompiledDepString(object):
+	"""
+	The parts of a dependency string that determine the result of
+	use_reduce for a given set of USE flags, together with the results
+	that have been computed for each distinct combination.
+	"""
+
+	__slots__ = ('conditionals', 'atom_flags', 'valid_flags', 'results')
+
+	# Maximum number of results per dependency string.
+	_max_results = 16
+
+	def __init__(self, depstr, atoms):
+		conditionals = []
+		atom_flags = []
+		for token in depstr.split():
+			if token[-1:] == "?":
+				if token[:1] == "!":
+					conditional = (True, token[1:-1])
+				else:
+					conditional = (False, token[:-1])
+				if conditional not in conditionals:
+					conditionals.append(conditional)
+			elif atoms and "[" in token:
+				# Flags of conditional USE deps, which are evaluated
+				# by Atom.evaluate_conditionals() and validated by
+				# is_valid_flag in the Atom constructor.
+				use = token[token.find("[")+1:token.rfind("]")]
+				for x in use.split(","):
+					if x[-1:] not in ("?", "="):
+						continue
+					flag = x.lstrip("!").rstrip("?=")
+					if flag[-3:] in ("(+)", "(-)"):
+						flag = flag[:-3]
+					if flag not in atom_flags:
+						atom_flags.append(flag)
+		self.conditionals = tuple(conditionals)
+		self.atom_flags = tuple(atom_flags)
+		self.valid_flags = frozenset(chain(
+			(flag for negated, flag in conditionals), atom_flags))
+		self.results = {}
+
+def _copy_dep_list(deplist):
+	"""
+	Copy a cached use_reduce result. Atoms are copied too, since callers
+	like dep_check rely on the identity of the atoms of each call.
+	"""
+	result = []
+	for x in deplist:
+		if isinstance(x, list):
+			x = _copy_dep_list(x)
+		elif isinstance(x, Atom):
+			x = _copy_atom(x)
+		result.append(x)
+	return result
+
+def _copy_atom(atom):
+	"""
+	Return a new Atom instance which is equal to the given one, without
+	parsing it again.
+	"""
+	copy = _unicode.__new__(Atom, atom)
+	copy.__dict__.update(atom.__dict__)
+	for k in ("unevaluated_atom", "without_use"):
+		if atom.__dict__.get(k) is atom:
+			copy.__dict__[k] = copy
+	return copy
+
+# Maps dependency strings and the use_reduce parameters that influence
+# parsing to _CompiledDepString instances.
+_use_reduce_cache = LRUCache(4096)
+
 def use_reduce(depstr, uselist=[], masklist=[], matchall=False, excludeall=[], is_src_uri=False, \
 	eapi=None, opconvert=False, flat=False, is_valid_flag=None, token_class=None, matchnone=False):
 	"""
@@ -439,6 +512,14 @@ def use_reduce(depstr, uselist=[], masklist=[], matchall=False, excludeall=[], i
 	@type matchnone: Bool
 	@rtype: List
 	@return: The use reduced depend array
+
+	The result only depends on the dependency string, the parameters that
+	influence parsing, and the values of the USE conditionals that occur
+	in it. Therefore, the result for each distinct combination of those is
+	cached (in a bounded LRU cache), and a copy of it is returned when the
+	same combination occurs again. The copy contains new Atom instances,
+	since callers like dep_check rely on their identity. Errors are never cached, so that invalid
+	dependency strings raise the same exceptions every time.
 	"""
 	if isinstance(depstr, list):
 		if portage._internal_caller:
@@ -447,6 +528,66 @@ def use_reduce(depstr, uselist=[], masklist=[], matchall=False, excludeall=[], i
 				('portage.dep.use_reduce',), DeprecationWarning, stacklevel=2)
 		depstr = paren_enclose(depstr)
 
+	if not isinstance(depstr, basestring) or \
+		(token_class is not None and token_class is not Atom):
+		return _use_reduce(depstr, uselist=uselist, masklist=masklist,
+			matchall=matchall, excludeall=excludeall, is_src_uri=is_src_uri,
+			eapi=eapi, opconvert=opconvert, flat=flat,
+			is_valid_flag=is_valid_flag, token_class=token_class,
+			matchnone=matchnone)
+
+	atoms = token_class is not None and not is_src_uri
+	key = (depstr, eapi, is_src_uri, opconvert, flat, atoms)
+	compiled = _use_reduce_cache.get(key)
+	if compiled is None:
+		compiled = _CompiledDepString(depstr, atoms)
+		_use_reduce_cache[key] = compiled
+
+	if is_valid_flag is not None:
+		for flag in compiled.valid_flags:
+			if not is_valid_flag(flag):
+				# Let _use_reduce raise the appropriate exception.
+				return _use_reduce(depstr, uselist=uselist,
+					masklist=masklist, matchall=matchall,
+					excludeall=excludeall, is_src_uri=is_src_uri,
+					eapi=eapi, opconvert=opconvert, flat=flat,
+					is_valid_flag=is_valid_flag, token_class=token_class,
+					matchnone=matchnone)
+
+	state = [bool(matchall), bool(matchnone)]
+	for negated, flag in compiled.conditionals:
+		if negated and flag in excludeall:
+			state.append(False)
+		elif flag in masklist:
+			state.append(negated)
+		elif matchall:
+			state.append(True)
+		elif matchnone:
+			state.append(False)
+		else:
+			state.append((flag in uselist) != negated)
+	if atoms and not matchall:
+		for flag in compiled.atom_flags:
+			state.append(flag in uselist)
+	state = tuple(state)
+
+	result = compiled.results.get(state)
+	if result is None:
+		result = _use_reduce(depstr, uselist=uselist, masklist=masklist,
+			matchall=matchall, excludeall=excludeall, is_src_uri=is_src_uri,
+			eapi=eapi, opconvert=opconvert, flat=flat,
+			is_valid_flag=is_valid_flag, token_class=token_class,
+			matchnone=matchnone)
+		if len(compiled.results) >= compiled._max_results:
+			compiled.results.clear()
+		compiled.results[state] = result
+	return _copy_dep_list(result)
+
+def _use_reduce(depstr, uselist=[], masklist=[], matchall=False, excludeall=[], is_src_uri=False, \
+	eapi=None, opconvert=False, flat=False, is_valid_flag=None, token_class=None, matchnone=False):
+	"""
+	Uncached implementation of use_reduce.
+	"""
 	if opconvert and flat:
 		raise ValueError("portage.dep.use_reduce: 'opconvert' and 'flat' are mutually exclusive")
 
@@ -1609,6 +1750,33 @@ class Atom(_unicode):
 						self.replace(self.cp, provided_cp, 1), [pkg]))
 		return False
 
+# Interned Atom instances, see _intern_atom. The hits and misses
+# attributes of the cache can be used to measure its effectiveness.
+_atom_cache = LRUCache(16384)
+
+def _intern_atom(s, allow_wildcard=False, allow_repo=None, eapi=None,
+	is_valid_flag=None, allow_build_id=None):
+	"""
+	Return an Atom for the given arguments, sharing the instance with
+	previous calls that used the same arguments. Since Atom instances are
+	immutable, this is safe for most callers. Callers that store private
+	attributes in atoms, or that rely on the identity of atoms (like the
+	atom_graph of dep_check), must call the Atom constructor instead.
+	Invalid atoms are not cached, so InvalidAtom is raised every time.
+	"""
+	if isinstance(s, Atom):
+		# Let the constructor raise TypeError.
+		return Atom(s)
+	key = (s, allow_wildcard, allow_repo, eapi, is_valid_flag,
+		allow_build_id)
+	atom = _atom_cache.get(key)
+	if atom is None:
+		atom = Atom(s, allow_wildcard=allow_wildcard,
+			allow_repo=allow_repo, eapi=eapi,
+			is_valid_flag=is_valid_flag, allow_build_id=allow_build_id)
+		_atom_cache[key] = atom
+	return atom
+
 _extended_cp_re_cache = {}
 
 def extended_cp_match(extended_cp, other_cp):
@@ -2004,7 +2172,7 @@ def dep_getkey(mydep):
 	@return: The package category/package-name
 	"""
 	if not isinstance(mydep, Atom):
-		mydep = Atom(mydep, allow_wildcard=True, allow_repo=True)
+		mydep = _intern_atom(mydep, allow_wildcard=True, allow_repo=True)
 
 	return mydep.cp
 
@@ -2126,7 +2294,7 @@ def match_from_list(mydep, candidate_list):
 		else:
 			mydep = mydep[1:]
 	if not isinstance(mydep, Atom):
-		mydep = Atom(mydep, allow_wildcard=True, allow_repo=True)
+		mydep = _intern_atom(mydep, allow_wildcard=True, allow_repo=True)
 
 	mycpv     = mydep.cpv
 	mycpv_cps = catpkgsplit(mycpv) # Can be None if not specific
@@ -2271,6 +2439,7 @@ def match_from_list(mydep, candidate_list):
 			mylist.append(x)
 
 	elif operator in [">", ">=", "<", "<="]:
+		mydep_key = getattr(mydep.cpv, 'version_key', None)
 		for x in candidate_list:
 			if hasattr(x, 'cp'):
 				pkg = x
@@ -2282,11 +2451,17 @@ def match_from_list(mydep, candidate_list):
 
 			if pkg.cp != mydep.cp:
 				continue
-			try:
-				result = vercmp(pkg.version, mydep.version)
-			except ValueError: # pkgcmp may return ValueError during int() conversion
-				writemsg(_("\nInvalid package name: %s\n") % x, noiselevel=-1)
-				raise
+			pkg_key = getattr(getattr(pkg, 'cpv', None), 'version_key', None)
+			if pkg_key is not None and mydep_key is not None:
+				# Compare the cached keys, instead of parsing
+				# both versions for each candidate.
+				result = (pkg_key > mydep_key) - (pkg_key < mydep_key)
+			else:
+				try:
+					result = vercmp(pkg.version, mydep.version)
+				except ValueError: # pkgcmp may return ValueError during int() conversion
+					writemsg(_("\nInvalid package name: %s\n") % x, noiselevel=-1)
+					raise
 			if result is None:
 				continue
 			elif operator == ">":
@@ -3,6 +3,7 @@
 
 from __future__ import unicode_literals
 
+import collections
 import errno
 import io
 import logging
@@ -14,7 +15,10 @@ import warnings
 import portage
 portage.proxy.lazyimport.lazyimport(globals(),
 	'portage.checksum:hashfunc_map,perform_multiple_checksums,' + \
-		'verify_all,_apply_hash_filter,_filter_unaccelarated_hashes',
+		'verify_all,_apply_hash_filter,_filter_unaccelarated_hashes,' + \
+		'_warn_unaccelerated_hashes',
+	'portage.package.ebuild._parallel_manifest.ManifestVerifier:' + \
+		'ManifestVerifier',
 	'portage.repository.config:_find_invalid_path_char',
 	'portage.util:write_atomic,writemsg_level',
 )
@@ -451,6 +455,7 @@ class Manifest(object):
 		specified."""
 		if not self.allow_create:
 			return
+		_warn_unaccelerated_hashes(self.hashes)
 		if checkExisting:
 			self.checkAllHashes()
 		if assumeDistHashesSometimes or assumeDistHashesAlways:
@@ -599,17 +604,26 @@ class Manifest(object):
 		for t in MANIFEST2_IDENTIFIERS:
 			self.checkTypeHashes(t, ignoreMissingFiles=ignoreMissingFiles)
 	
-	def checkTypeHashes(self, idtype, ignoreMissingFiles=False, hash_filter=None):
+	def checkTypeHashes(self, idtype, ignoreMissingFiles=False, hash_filter=None,
+		digest_cache=None):
 		for f in self.fhashdict[idtype]:
 			self.checkFileHashes(idtype, f, ignoreMissing=ignoreMissingFiles,
-				hash_filter=hash_filter)
+				hash_filter=hash_filter, digest_cache=digest_cache)
 	
-	def checkFileHashes(self, ftype, fname, ignoreMissing=False, hash_filter=None):
+	def checkFileHashes(self, ftype, fname, ignoreMissing=False, hash_filter=None,
+		digest_cache=None):
+		"""
+		Verify the digests of a file. The optional digest_cache is a
+		DigestCache for distdir, which is only used for DIST entries.
+		"""
 		digests = _filter_unaccelarated_hashes(self.fhashdict[ftype][fname])
 		if hash_filter is not None:
 			digests = _apply_hash_filter(digests, hash_filter)
+		if ftype != "DIST":
+			digest_cache = None
 		try:
-			ok, reason = verify_all(self._getAbsname(ftype, fname), digests)
+			ok, reason = verify_all(self._getAbsname(ftype, fname), digests,
+				digest_cache=digest_cache)
 			if not ok:
 				raise DigestException(tuple([self._getAbsname(ftype, fname)]+list(reason)))
 			return ok, reason
@@ -618,6 +632,43 @@ class Manifest(object):
 				raise
 			return False, _("File Not Found: '%s'") % str(e)
 
+	def checkHashesParallel(self, entries=None, ignoreMissingFiles=False,
+		hash_filter=None, digest_cache=None, max_jobs=None, max_load=None):
+		"""
+		Verify the digests of the given (ftype, fname) entries, or of all
+		entries if entries is None, with up to max_jobs concurrent
+		processes while the load average is below max_load. This is a
+		generator which yields a (ftype, fname, exception) tuple for each
+		failure as soon as it is detected, where exception is the
+		DigestException or FileNotFound that checkFileHashes would raise.
+		If the generator is closed before it is exhausted, verification
+		of the remaining entries is cancelled.
+		"""
+		if entries is None:
+			entries = [(ftype, fname) for ftype in MANIFEST2_IDENTIFIERS
+				for fname in self.fhashdict[ftype]]
+		failures = collections.deque()
+
+		def failure_callback(ftype, fname, e):
+			if not (ignoreMissingFiles and isinstance(e, FileNotFound)):
+				failures.append((ftype, fname, e))
+
+		verifier = ManifestVerifier(manifest=self, entries=entries,
+			failure_callback=failure_callback, hash_filter=hash_filter,
+			digest_cache=digest_cache, max_jobs=max_jobs, max_load=max_load)
+		verifier.start()
+		try:
+			while True:
+				while failures:
+					yield failures.popleft()
+				if verifier.returncode is not None:
+					break
+				verifier._event_loop.iteration()
+		finally:
+			if verifier.returncode is None:
+				verifier.cancel()
+				verifier.wait()
+
 	def checkCpvHashes(self, cpv, checkDistfiles=True, onlyDistfiles=False, checkMiscfiles=False):
 		""" check the hashes for all files associated to the given cpv, include all
 		AUX files and optionally all MISC files. """
@@ -0,0 +1,189 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import errno
+import functools
+
+from portage import os
+from portage.checksum import (hashfunc_map, verify_all,
+	_apply_hash_filter, _filter_unaccelarated_hashes)
+from portage.exception import DigestException, FileNotFound
+from portage.localization import _
+from portage.util._async.AsyncFunction import AsyncFunction
+from portage.util._async.AsyncScheduler import AsyncScheduler
+from portage.util._async.FileDigester import FileDigester
+
+def _verify_batch(batch, digest_cache):
+	"""
+	Verify the digests of a batch of (ftype, fname, file_path, digests,
+	use_cache) tuples in a forked process, and return a list of
+	(ftype, fname, reason) tuples for the files that fail verification,
+	where reason is None for missing files.
+	"""
+	failures = []
+	for ftype, fname, file_path, digests, use_cache in batch:
+		try:
+			ok, reason = verify_all(file_path, digests,
+				digest_cache=(digest_cache if use_cache else None))
+		except FileNotFound:
+			failures.append((ftype, fname, None))
+		else:
+			if not ok:
+				failures.append((ftype, fname, tuple(reason)))
+	return failures
+
+class ManifestVerifier(AsyncScheduler):
+	"""
+	Verify the digests of Manifest entries concurrently. The entries
+	iterable yields (ftype, fname) tuples, and failure_callback is
+	called with (ftype, fname, exception) for each entry that fails
+	verification, where exception is a DigestException or FileNotFound
+	instance like Manifest.checkFileHashes would raise.
+
+	Large files are hashed by separate FileDigester processes, and the
+	digests are compared in this process. Small files are verified in
+	batches by AsyncFunction processes, so that each of them does not
+	cost a fork. Sizes are compared before any process is started, and
+	the optional digest_cache is only used for DIST entries.
+	"""
+
+	# Recheck the load average periodically, for max_load.
+	_loadavg_latency = 30000
+
+	# Files smaller than this are verified in batches.
+	_batch_file_size = 1024 * 1024
+
+	# A batch is started when the total size or the number of its files
+	# reaches one of these limits.
+	_batch_size = 4 * 1024 * 1024
+	_batch_max_files = 64
+
+	def __init__(self, manifest, entries, failure_callback,
+		hash_filter=None, digest_cache=None, **kwargs):
+		AsyncScheduler.__init__(self, **kwargs)
+		self._manifest = manifest
+		self._entries = entries
+		self._failure_callback = failure_callback
+		self._hash_filter = hash_filter
+		self._digest_cache = digest_cache
+		self._task_iter = self._iter_tasks()
+
+	def _next_task(self):
+		return next(self._task_iter)
+
+	def _failure(self, ftype, fname, e):
+		self._error_count += 1
+		self._failure_callback(ftype, fname, e)
+
+	def _iter_tasks(self):
+		manifest = self._manifest
+		batch = []
+		batch_size = 0
+
+		for ftype, fname in self._entries:
+			if self._terminated.is_set():
+				return
+			file_path = manifest._getAbsname(ftype, fname)
+			digests = _filter_unaccelarated_hashes(
+				manifest.fhashdict[ftype][fname])
+			if self._hash_filter is not None:
+				digests = _apply_hash_filter(digests, self._hash_filter)
+			use_cache = self._digest_cache is not None and ftype == "DIST"
+
+			try:
+				st = os.stat(file_path)
+			except OSError as e:
+				if e.errno == errno.ENOENT:
+					self._failure(ftype, fname, FileNotFound(file_path))
+				else:
+					self._failure(ftype, fname,
+						DigestException((file_path, str(e), None, None)))
+				continue
+
+			if digests.get("size") is not None and \
+				digests["size"] != st.st_size:
+				self._failure(ftype, fname, DigestException((file_path,
+					_("Filesize does not match recorded size"),
+					st.st_size, digests["size"])))
+				continue
+
+			hash_names = set(digests).intersection(hashfunc_map)
+			hash_names.discard("size")
+
+			if st.st_size < self._batch_file_size or not hash_names:
+				# verify_all reports insufficient data if there
+				# are no hash_names.
+				batch.append((ftype, fname, file_path, digests, use_cache))
+				batch_size += st.st_size
+				if batch_size >= self._batch_size or \
+					len(batch) >= self._batch_max_files:
+					yield self._batch_task(batch)
+					batch = []
+					batch_size = 0
+				continue
+
+			cached = {}
+			if use_cache:
+				cached = self._digest_cache.get(st, hash_names)
+			missing = hash_names.difference(cached)
+			if not missing:
+				self._compare(ftype, fname, file_path, digests, cached)
+				continue
+
+			task = FileDigester(file_path=file_path, hash_names=missing,
+				background=True)
+			task.addExitListener(functools.partial(self._digester_exit,
+				ftype, fname, file_path, digests, st, cached, use_cache))
+			yield task
+
+		if batch:
+			yield self._batch_task(batch)
+
+	def _batch_task(self, batch):
+		task = AsyncFunction(target=_verify_batch,
+			args=(batch, self._digest_cache), background=True)
+		task.addExitListener(functools.partial(self._batch_exit, batch))
+		return task
+
+	def _compare(self, ftype, fname, file_path, digests, computed):
+		for hash_name in sorted(computed):
+			if digests[hash_name] != computed[hash_name]:
+				self._failure(ftype, fname, DigestException((file_path,
+					"Failed on %s verification" % hash_name,
+					computed[hash_name], digests[hash_name])))
+				break
+
+	def _digester_exit(self, ftype, fname, file_path, digests, st,
+		cached, use_cache, task):
+		if task.cancelled:
+			return
+		if task.returncode != os.EX_OK or task.digests is None:
+			if not os.path.exists(file_path):
+				self._failure(ftype, fname, FileNotFound(file_path))
+			else:
+				self._failure(ftype, fname, DigestException((file_path,
+					_("Failed to compute digests"), None, None)))
+			return
+		if use_cache:
+			self._digest_cache.update(file_path, st, task.digests)
+		computed = dict(cached)
+		computed.update(task.digests)
+		self._compare(ftype, fname, file_path, digests, computed)
+
+	def _batch_exit(self, batch, task):
+		if task.cancelled:
+			return
+		if task.returncode != os.EX_OK or task.result is None:
+			for ftype, fname, file_path, digests, use_cache in batch:
+				self._failure(ftype, fname, DigestException((file_path,
+					_("Failed to compute digests"), None, None)))
+			return
+		file_paths = dict(((ftype, fname), file_path)
+			for ftype, fname, file_path, digests, use_cache in batch)
+		for ftype, fname, reason in task.result:
+			file_path = file_paths[(ftype, fname)]
+			if reason is None:
+				self._failure(ftype, fname, FileNotFound(file_path))
+			else:
+				self._failure(ftype, fname,
+					DigestException((file_path,) + reason))
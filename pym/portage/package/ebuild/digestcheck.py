@@ -1,4 +1,4 @@
-# Copyright 2010-2012 Gentoo Foundation
+# Copyright 2010-2016 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 __all__ = ['digestcheck']
@@ -6,15 +6,19 @@ __all__ = ['digestcheck']
 import warnings
 
 from portage import os, _encodings, _unicode_decode
+from portage.cache.index.digest_cache import get_digest_cache
 from portage.checksum import _hash_filter
 from portage.exception import DigestException, FileNotFound
 from portage.localization import _
 from portage.output import EOutput
 from portage.util import writemsg
 
-def digestcheck(myfiles, mysettings, strict=False, justmanifest=None, mf=None):
+def digestcheck(myfiles, mysettings, strict=False, justmanifest=None, mf=None,
+	load_average=None):
 	"""
-	Verifies checksums. Assumes all files have been downloaded.
+	Verifies checksums. Assumes all files have been downloaded. If
+	PORTAGE_CHECKSUM_JOBS is greater than 1, then the files are verified
+	concurrently, while the load average is below load_average.
 	@rtype: int
 	@return: 1 on success and 0 on failure
 	"""
@@ -36,35 +40,49 @@ def digestcheck(myfiles, mysettings, strict=False, justmanifest=None, mf=None):
 		mf = mysettings.repositories.get_repo_for_location(
 			os.path.dirname(os.path.dirname(pkgdir)))
 		mf = mf.load_manifest(pkgdir, mysettings["DISTDIR"])
+	digest_cache = get_digest_cache(mysettings, mysettings["DISTDIR"])
 	eout = EOutput()
 	eout.quiet = mysettings.get("PORTAGE_QUIET", None) == "1"
+	jobs = mysettings.get("PORTAGE_CHECKSUM_JOBS", "1")
 	try:
-		if not mf.thin and strict and "PORTAGE_PARALLEL_FETCHONLY" not in mysettings:
-			if mf.fhashdict.get("EBUILD"):
-				eout.ebegin(_("checking ebuild checksums ;-)"))
-				mf.checkTypeHashes("EBUILD", hash_filter=hash_filter)
-				eout.eend(0)
-			if mf.fhashdict.get("AUX"):
-				eout.ebegin(_("checking auxfile checksums ;-)"))
-				mf.checkTypeHashes("AUX", hash_filter=hash_filter)
-				eout.eend(0)
-			if mf.fhashdict.get("MISC"):
-				eout.ebegin(_("checking miscfile checksums ;-)"))
-				mf.checkTypeHashes("MISC", ignoreMissingFiles=True,
-					hash_filter=hash_filter)
-				eout.eend(0)
-		for f in myfiles:
-			eout.ebegin(_("checking %s ;-)") % f)
-			ftype = mf.findFile(f)
-			if ftype is None:
-				if mf.allow_missing:
-					continue
-				eout.eend(1)
-				writemsg(_("\n!!! Missing digest for '%s'\n") % (f,),
-					noiselevel=-1)
+		jobs = int(jobs)
+	except ValueError:
+		writemsg(_("!!! Invalid PORTAGE_CHECKSUM_JOBS: %s\n") % (jobs,),
+			noiselevel=-1)
+		jobs = 1
+	try:
+		if jobs > 1:
+			if not _digestcheck_parallel(myfiles, mysettings, strict, mf,
+				hash_filter, digest_cache, eout, jobs, load_average):
 				return 0
-			mf.checkFileHashes(ftype, f, hash_filter=hash_filter)
-			eout.eend(0)
+		else:
+			if not mf.thin and strict and "PORTAGE_PARALLEL_FETCHONLY" not in mysettings:
+				if mf.fhashdict.get("EBUILD"):
+					eout.ebegin(_("checking ebuild checksums ;-)"))
+					mf.checkTypeHashes("EBUILD", hash_filter=hash_filter)
+					eout.eend(0)
+				if mf.fhashdict.get("AUX"):
+					eout.ebegin(_("checking auxfile checksums ;-)"))
+					mf.checkTypeHashes("AUX", hash_filter=hash_filter)
+					eout.eend(0)
+				if mf.fhashdict.get("MISC"):
+					eout.ebegin(_("checking miscfile checksums ;-)"))
+					mf.checkTypeHashes("MISC", ignoreMissingFiles=True,
+						hash_filter=hash_filter)
+					eout.eend(0)
+			for f in myfiles:
+				eout.ebegin(_("checking %s ;-)") % f)
+				ftype = mf.findFile(f)
+				if ftype is None:
+					if mf.allow_missing:
+						continue
+					eout.eend(1)
+					writemsg(_("\n!!! Missing digest for '%s'\n") % (f,),
+						noiselevel=-1)
+					return 0
+				mf.checkFileHashes(ftype, f, hash_filter=hash_filter,
+					digest_cache=digest_cache)
+				eout.eend(0)
 	except FileNotFound as e:
 		eout.eend(1)
 		writemsg(_("\n!!! A file listed in the Manifest could not be found: %s\n") % str(e),
@@ -153,3 +171,41 @@ def digestcheck(myfiles, mysettings, strict=False, justmanifest=None, mf=None):
 				if strict:
 					return 0
 	return 1
+
+def _digestcheck_parallel(myfiles, mysettings, strict, mf, hash_filter,
+	digest_cache, eout, jobs, load_average):
+	"""
+	Verify the same files as the sequential checks in digestcheck, with
+	up to the given number of jobs, and raise the first failure.
+	@rtype: int
+	@return: 1 on success and 0 if a digest is missing
+	"""
+	entries = []
+	if not mf.thin and strict and "PORTAGE_PARALLEL_FETCHONLY" not in mysettings:
+		for ftype in ("EBUILD", "AUX", "MISC"):
+			entries.extend((ftype, f) for f in mf.fhashdict.get(ftype, ()))
+	for f in myfiles:
+		ftype = mf.findFile(f)
+		if ftype is None:
+			if mf.allow_missing:
+				continue
+			writemsg(_("\n!!! Missing digest for '%s'\n") % (f,),
+				noiselevel=-1)
+			return 0
+		entries.append((ftype, f))
+	if not entries:
+		return 1
+
+	eout.ebegin(_("checking %d files with %d jobs ;-)") %
+		(len(entries), jobs))
+	failures = mf.checkHashesParallel(entries, hash_filter=hash_filter,
+		digest_cache=digest_cache, max_jobs=jobs, max_load=load_average)
+	try:
+		for ftype, f, e in failures:
+			if ftype == "MISC" and isinstance(e, FileNotFound):
+				continue
+			raise e
+	finally:
+		failures.close()
+	eout.eend(0)
+	return 1
@@ -528,7 +528,7 @@ _doebuild_commands_without_builddir = (
 def doebuild(myebuild, mydo, _unused=DeprecationWarning, settings=None, debug=0, listonly=0,
 	fetchonly=0, cleanup=0, dbkey=DeprecationWarning, use_cache=1, fetchall=0, tree=None,
 	mydbapi=None, vartree=None, prev_mtimes=None,
-	fd_pipes=None, returnpid=False):
+	fd_pipes=None, returnpid=False, _spawn_wrapper=None):
 	"""
 	Wrapper function that invokes specific ebuild phases through the spawning
 	of ebuild.sh
@@ -795,7 +795,8 @@ def doebuild(myebuild, mydo, _unused=DeprecationWarning, settings=None, debug=0,
 			writemsg("!!! DEBUG: dbkey: %s\n" % str(dbkey), 2)
 			if returnpid:
 				return _spawn_phase(mydo, mysettings,
-					fd_pipes=fd_pipes, returnpid=returnpid)
+					fd_pipes=fd_pipes, returnpid=returnpid,
+					spawn_wrapper=_spawn_wrapper)
 			elif dbkey and dbkey is not DeprecationWarning:
 				mysettings["dbkey"] = dbkey
 			else:
@@ -1494,6 +1495,10 @@ def spawn(mystring, mysettings, debug=False, free=False, droppriv=False,
 
 	check_config_instance(mysettings)
 
+	# This is a function which takes the selected spawn function as its
+	# argument, and returns a replacement with the same signature.
+	spawn_wrapper = keywords.pop("spawn_wrapper", None)
+
 	fd_pipes = keywords.get("fd_pipes")
 	if fd_pipes is None:
 		fd_pipes = {
@@ -1625,6 +1630,9 @@ def spawn(mystring, mysettings, debug=False, free=False, droppriv=False,
 		spawn_func = selinux.spawn_wrapper(spawn_func,
 			mysettings["PORTAGE_SANDBOX_T"])
 
+	if spawn_wrapper is not None:
+		spawn_func = spawn_wrapper(spawn_func)
+
 	logname_backup = None
 	if logname is not None:
 		logname_backup = mysettings.configdict["env"].get("LOGNAME")
@@ -1,4 +1,4 @@
-# Copyright 2010-2015 Gentoo Foundation
+# Copyright 2010-2016 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 from __future__ import print_function
@@ -6,6 +6,7 @@ from __future__ import print_function
 __all__ = ['fetch']
 
 import errno
+import functools
 import io
 import logging
 import random
@@ -21,10 +22,13 @@ except ImportError:
 
 import portage
 portage.proxy.lazyimport.lazyimport(globals(),
+	'portage.cache.index.digest_cache:get_digest_cache',
 	'portage.package.ebuild.config:check_config_instance,config',
 	'portage.package.ebuild.doebuild:doebuild_environment,' + \
 		'_doebuild_spawn',
 	'portage.package.ebuild.prepare_build_dirs:prepare_build_dirs',
+	'portage.util._async.AsyncFunction:AsyncFunction',
+	'portage.util._async.TaskScheduler:TaskScheduler',
 )
 
 from portage import OrderedDict, os, selinux, shutil, _encodings, \
@@ -176,12 +180,13 @@ def _checksum_failure_temp_file(distdir, basename):
 	os.rename(filename, temp_filename)
 	return temp_filename
 
-def _check_digests(filename, digests, show_errors=1):
+def _check_digests(filename, digests, show_errors=1, digest_cache=None):
 	"""
 	Check digests and display a message if an error occurs.
 	@return True if all digests match, False otherwise.
 	"""
-	verified_ok, reason = verify_all(filename, digests)
+	verified_ok, reason = verify_all(filename, digests,
+		digest_cache=digest_cache)
 	if not verified_ok:
 		if show_errors:
 			writemsg(_("!!! Previously fetched"
@@ -194,7 +199,8 @@ def _check_digests(filename, digests, show_errors=1):
 		return False
 	return True
 
-def _check_distfile(filename, digests, eout, show_errors=1, hash_filter=None):
+def _check_distfile(filename, digests, eout, show_errors=1, hash_filter=None,
+	digest_cache=None):
 	"""
 	@return a tuple of (match, stat_obj) where match is True if filename
 	matches all given digests (if any) and stat_obj is a stat result, or
@@ -223,7 +229,8 @@ def _check_distfile(filename, digests, eout, show_errors=1, hash_filter=None):
 		digests = _filter_unaccelarated_hashes(digests)
 		if hash_filter is not None:
 			digests = _apply_hash_filter(digests, hash_filter)
-		if _check_digests(filename, digests, show_errors=show_errors):
+		if _check_digests(filename, digests, show_errors=show_errors,
+			digest_cache=digest_cache):
 			eout.ebegin("%s %s ;-)" % (os.path.basename(filename),
 				" ".join(sorted(digests))))
 			eout.eend(0)
@@ -245,6 +252,59 @@ _size_suffix_map = {
 	'Y' : 80,
 }
 
+def _fetch_concurrently(myuris, mysettings, jobs, fetchonly, **kwargs):
+	"""
+	Fetch the files of an OrderedDict that maps file names to lists of
+	URIs with up to the given number of concurrent jobs, by calling fetch
+	for each file in a separate process. The output of each process is
+	shown when it exits, so that the output of concurrent downloads is
+	not interleaved. Unless fetchonly is enabled, no more files are
+	fetched after the first failure.
+	@rtype: int
+	@return: 1 if all files were fetched successfully, and 0 otherwise
+	"""
+	failed_files = []
+
+	def task_exit(myfile, log_path, task):
+		try:
+			with io.open(_unicode_encode(log_path,
+				encoding=_encodings['fs'], errors='strict'),
+				mode='r', encoding=_encodings['content'],
+				errors='replace') as f:
+				writemsg_stdout(f.read(), noiselevel=-1)
+		except IOError:
+			pass
+		finally:
+			try:
+				os.unlink(log_path)
+			except OSError:
+				pass
+		if task.returncode != os.EX_OK or task.result != 1:
+			failed_files.append(myfile)
+
+	def task_iter():
+		for myfile, uris in myuris.items():
+			if failed_files and not fetchonly:
+				break
+			fd, log_path = tempfile.mkstemp(prefix="fetch-")
+			os.close(fd)
+			task = AsyncFunction(target=fetch,
+				args=(OrderedDict([(myfile, uris)]), mysettings),
+				kwargs=dict(kwargs, fetchonly=fetchonly),
+				background=True, logfile=log_path)
+			task.addExitListener(functools.partial(task_exit,
+				myfile, log_path))
+			yield task
+
+	writemsg_stdout(_(">>> Fetching %d files with up to %d jobs\n") %
+		(len(myuris), jobs), noiselevel=-1)
+	scheduler = TaskScheduler(task_iter(), max_jobs=jobs)
+	scheduler.start()
+	scheduler.wait()
+	if failed_files:
+		return 0
+	return 1
+
 def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 	locks_in_subdir=".locks", use_locks=1, try_mirrors=1, digests=None,
 	allow_missing_digests=True):
@@ -294,6 +354,16 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 	checksum_failure_max_tries = v
 	del v
 
+	fetch_jobs = 1
+	try:
+		fetch_jobs = int(mysettings.get("PORTAGE_FETCH_JOBS", 1))
+	except (ValueError, OverflowError):
+		writemsg(_("!!! Variable PORTAGE_FETCH_JOBS"
+			" contains non-integer value: '%s'\n") % \
+			mysettings["PORTAGE_FETCH_JOBS"], noiselevel=-1)
+		writemsg(_("!!! Using PORTAGE_FETCH_JOBS "
+			"default value: 1\n"), noiselevel=-1)
+
 	fetch_resume_size_default = "350K"
 	fetch_resume_size = mysettings.get("PORTAGE_FETCH_RESUME_MIN_SIZE")
 	if fetch_resume_size is not None:
@@ -369,6 +439,7 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 	hash_filter = _hash_filter(mysettings.get("PORTAGE_CHECKSUM_FILTER", ""))
 	if hash_filter.transparent:
 		hash_filter = None
+	digest_cache = get_digest_cache(mysettings, mysettings["DISTDIR"])
 	skip_manifest = mysettings.get("EBUILD_SKIP_MANIFEST") == "1"
 	if skip_manifest:
 		allow_missing_digests = True
@@ -548,6 +619,21 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 			noiselevel=-1)
 		can_fetch = False
 
+	if fetch_jobs > 1 and can_fetch and not restrict_fetch and \
+		len(filedict) > 1:
+		# Each file is fetched by a separate fetch call, which keeps
+		# its own distlock, mirror fallback and checksum verification.
+		file_uris = OrderedDict()
+		for myfile, myuri in file_uri_tuples:
+			uris = file_uris.setdefault(myfile, [])
+			if myuri is not None:
+				uris.append(myuri)
+		return _fetch_concurrently(file_uris, mysettings, fetch_jobs,
+			fetchonly, locks_in_subdir=locks_in_subdir,
+			use_locks=use_locks, try_mirrors=try_mirrors,
+			digests=mydigests,
+			allow_missing_digests=allow_missing_digests)
+
 	distdir_writable = can_fetch and not fetch_to_ro
 	failed_files = set()
 	restrict_fetch_msg = False
@@ -661,7 +747,8 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 				eout = EOutput()
 				eout.quiet = mysettings.get("PORTAGE_QUIET") == "1"
 				match, mystat = _check_distfile(
-					myfile_path, pruned_digests, eout, hash_filter=hash_filter)
+					myfile_path, pruned_digests, eout, hash_filter=hash_filter,
+					digest_cache=digest_cache)
 				if match:
 					# Skip permission adjustment for symlinks, since we don't
 					# want to modify anything outside of the primary DISTDIR,
@@ -823,7 +910,8 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 							digests = _filter_unaccelarated_hashes(mydigests[myfile])
 							if hash_filter is not None:
 								digests = _apply_hash_filter(digests, hash_filter)
-							verified_ok, reason = verify_all(myfile_path, digests)
+							verified_ok, reason = verify_all(myfile_path, digests,
+								digest_cache=digest_cache)
 							if not verified_ok:
 								writemsg(_("!!! Previously fetched"
 									" file: '%s'\n") % myfile, noiselevel=-1)
@@ -1082,7 +1170,9 @@ def fetch(myuris, mysettings, listonly=0, fetchonly=0,
 								# File is the correct size--check the checksums for the fetched
 								# file NOW, for those users who don't have a stable/continuous
 								# net connection. This way we have a chance to try to download
-								# from another mirror...
+								# from another mirror... The digest cache is not
+								# used, since a freshly fetched file must always
+								# be hashed.
 								digests = _filter_unaccelarated_hashes(mydigests[myfile])
 								if hash_filter is not None:
 									digests = _apply_hash_filter(digests, hash_filter)
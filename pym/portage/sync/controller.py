@@ -1,4 +1,4 @@
-# Copyright 2014 Gentoo Foundation
+# Copyright 2014-2016 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 from __future__ import print_function
@@ -343,6 +343,14 @@ class SyncManager(object):
 		if proc.returncode == os.EX_OK:
 			exitcode, message, updatecache_flg, hooks_enabled = proc.result
 
+		if proc.returncode == os.EX_OK:
+			# The pregenerated cache of the repository may have changed,
+			# so the eclass index must be rebuilt when it is needed.
+			eclass_index = self.portdb._eclass_index
+			if eclass_index is not None:
+				eclass_index.set_complete(repo.name, False)
+				eclass_index.flush()
+
 		if updatecache_flg and "metadata-transfer" not in self.settings.features:
 			updatecache_flg = False
 
@@ -0,0 +1,106 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import time
+
+from portage import os
+from portage.dbapi.porttree import portdbapi
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+class AuxGetManyTestCase(TestCase):
+
+	def testAuxGetMany(self):
+		"""
+		Check that aux_get_many returns the same values as aux_get,
+		in the same order as the given cpvs, and None for cpvs that
+		are not found.
+		"""
+		debug = False
+
+		ebuilds = {
+			"dev-libs/A-1": {"DESCRIPTION": "package A", "SLOT": "1"},
+			"dev-libs/A-2": {"DESCRIPTION": "package A", "SLOT": "2"},
+			"dev-libs/B-1": {"DESCRIPTION": "package B",
+				"RDEPEND": "dev-libs/A"},
+			"sys-apps/C-1": {"DESCRIPTION": "package C", "EAPI": "5"},
+		}
+
+		installed = {
+			"dev-libs/A-1": {"DESCRIPTION": "package A", "SLOT": "1"},
+			"dev-libs/B-1": {"DESCRIPTION": "package B",
+				"RDEPEND": "dev-libs/A"},
+		}
+
+		# Ebuilds are modified without updating the Manifest.
+		user_config = {
+			"make.conf": ('FEATURES="${FEATURES} -strict"',),
+		}
+
+		playground = ResolverPlayground(ebuilds=ebuilds,
+			installed=installed, user_config=user_config, debug=debug)
+		settings = playground.settings
+		test_repo_location = settings.repositories["test_repo"].location
+		vardb = playground.trees[playground.eroot]["vartree"].dbapi
+		keys = ["DESCRIPTION", "EAPI", "RDEPEND", "SLOT", "repository"]
+		cpvs = ["sys-apps/C-1", "dev-libs/Z-1", "dev-libs/A-2",
+			"invalid", "dev-libs/A-1", "dev-libs/B-1", "dev-libs/A-2"]
+
+		def expected(db, cpvs):
+			results = []
+			for cpv in cpvs:
+				try:
+					results.append((cpv, db.aux_get(cpv, keys)))
+				except KeyError:
+					results.append((cpv, None))
+			return results
+
+		def check(portdb):
+			try:
+				results = list(portdb.aux_get_many(cpvs, keys))
+				self.assertEqual(results, expected(portdb, cpvs))
+				return results
+			finally:
+				portdb.close_caches()
+
+		try:
+			# Metadata is generated for all cpvs, and then it is
+			# read from the cache.
+			results = check(portdbapi(mysettings=settings))
+			self.assertEqual([cpv for cpv, values in results], cpvs)
+			self.assertEqual(results[1], ("dev-libs/Z-1", None))
+			self.assertEqual(results[3], ("invalid", None))
+			self.assertEqual(results[0][1][:2], ["package C", "5"])
+			check(portdbapi(mysettings=settings))
+
+			# Small chunks.
+			portdb = portdbapi(mysettings=settings)
+			portdb._aux_get_many_chunk = 2
+			check(portdb)
+
+			# Cache entries are not used after the ebuild has changed.
+			ebuild = os.path.join(test_repo_location, "dev-libs/B/B-1.ebuild")
+			with open(ebuild) as f:
+				content = f.read()
+			with open(ebuild, "w") as f:
+				f.write(content.replace("package B", "changed B"))
+			mtime = int(time.time()) + 2
+			os.utime(ebuild, (mtime, mtime))
+			portdb = portdbapi(mysettings=settings)
+			results = dict(portdb.aux_get_many(["dev-libs/B-1"], keys))
+			self.assertEqual(results["dev-libs/B-1"][0], "changed B")
+			check(portdb)
+
+			# The frozen cache of aux_get is shared.
+			portdb = portdbapi(mysettings=settings)
+			portdb.freeze()
+			check(portdb)
+
+			vardb_cpvs = ["dev-libs/B-1", "dev-libs/A-2", "dev-libs/A-1"]
+			self.assertEqual(list(vardb.aux_get_many(vardb_cpvs, keys)),
+				expected(vardb, vardb_cpvs))
+			self.assertEqual(
+				list(vardb.aux_get_many(vardb_cpvs, keys))[1],
+				("dev-libs/A-2", None))
+		finally:
+			playground.cleanup()
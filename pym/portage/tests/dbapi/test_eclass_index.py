@@ -0,0 +1,107 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import time
+
+from portage import os
+from portage.cache.index.eclass_index import EclassIndex
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+from _emerge.MetadataRegen import MetadataRegen
+
+class EclassIndexTestCase(TestCase):
+
+	def testEclassIndex(self):
+
+		if not EclassIndex.available():
+			self.skipTest("sqlite is unavailable")
+
+		ebuilds = {
+			"dev-libs/A-1": {},
+			"dev-libs/B-1": {},
+			"dev-libs/B-2": {},
+			"sys-apps/C-1": {},
+		}
+
+		# Ebuilds are modified without updating the Manifest.
+		user_config = {
+			"make.conf": ('FEATURES="${FEATURES} -strict"',),
+		}
+
+		playground = ResolverPlayground(ebuilds=ebuilds,
+			user_config=user_config)
+		try:
+			eroot = playground.settings["EROOT"]
+			portdb = playground.trees[eroot]["porttree"].dbapi
+			repo_location = portdb.repositories["test_repo"].location
+			index = portdb._eclass_index
+
+			# Cache entries are validated by mtime with a granularity of
+			# one second, so every write advances the mtime by one second.
+			mtimes = [int(time.time())]
+
+			def write(path, content, mode="w"):
+				path = os.path.join(repo_location, path)
+				with open(path, mode) as f:
+					f.write(content)
+				mtimes[0] += 1
+				os.utime(path, (mtimes[0], mtimes[0]))
+
+			def consumers(eclass):
+				return [cpv for repo, cpv in index.lookup(eclass)]
+
+			def regen(cp_iter=None):
+				regen = MetadataRegen(portdb, cp_iter=cp_iter, max_jobs=1)
+				regen.start()
+				regen.wait()
+				self.assertEqual(regen.returncode, os.EX_OK)
+
+			write("eclass/foo.eclass", "")
+			write("eclass/bar.eclass", "inherit foo\n")
+			portdb.repositories["test_repo"].eclass_db.update_eclasses()
+			write("dev-libs/A/A-1.ebuild", "inherit bar\n", mode="a")
+			write("dev-libs/B/B-1.ebuild", "inherit foo\n", mode="a")
+			write("dev-libs/B/B-2.ebuild", "inherit foo\n", mode="a")
+
+			self.assertFalse(index.complete("test_repo"))
+			regen()
+			self.assertTrue(index.complete("test_repo"))
+			self.assertEqual(consumers("foo"),
+				["dev-libs/A-1", "dev-libs/B-1", "dev-libs/B-2"])
+			self.assertEqual(consumers("bar"), ["dev-libs/A-1"])
+			self.assertEqual(portdb._eclass_consumers(
+				frozenset(["bar", "missing"]), "test_repo"),
+				set(["dev-libs/A-1"]))
+
+			# Metadata that is generated by aux_get is indexed.
+			write("sys-apps/C/C-1.ebuild", "inherit bar\n", mode="a")
+			portdb.aux_get("sys-apps/C-1", ["INHERITED"])
+			portdb.flush_cache()
+			self.assertEqual(consumers("bar"),
+				["dev-libs/A-1", "sys-apps/C-1"])
+
+			# Regeneration of some cps removes the cpvs that no longer
+			# exist.
+			os.unlink(os.path.join(repo_location, "dev-libs/B/B-2.ebuild"))
+			regen(cp_iter=iter(["dev-libs/B"]))
+			self.assertEqual(consumers("foo"),
+				["dev-libs/A-1", "dev-libs/B-1", "sys-apps/C-1"])
+			self.assertTrue(index.complete("test_repo"))
+
+			# After a sync, the index is rebuilt from the cache.
+			index.set_complete("test_repo", False)
+			index.update("test_repo", "dev-libs/B-1", ())
+			self.assertEqual(consumers("foo"),
+				["dev-libs/A-1", "sys-apps/C-1"])
+			self.assertEqual(portdb._eclass_consumers(
+				frozenset(["foo"]), "test_repo"),
+				set(["dev-libs/A-1", "dev-libs/B-1", "sys-apps/C-1"]))
+			self.assertTrue(index.complete("test_repo"))
+
+			# The index is discarded if the format version changes.
+			index.close()
+			index._format_version = "0"
+			self.assertFalse(index.complete("test_repo"))
+			self.assertEqual(consumers("foo"), [])
+		finally:
+			playground.cleanup()
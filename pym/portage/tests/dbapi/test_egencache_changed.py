@@ -0,0 +1,172 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import subprocess
+import sys
+import time
+
+import portage
+from portage import os
+from portage import _unicode_decode
+from portage.cache.index.eclass_index import EclassIndex
+from portage.const import PORTAGE_PYM_PATH
+from portage.process import find_binary
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+class EgencacheChangedTestCase(TestCase):
+
+	def testEgencacheChanged(self):
+		"""
+		Check that egencache --update --changed-files and --changed-since
+		only regenerate the packages that are affected by changed ebuilds
+		and eclasses.
+		"""
+		debug = False
+
+		ebuilds = {
+			"dev-libs/A-1": {},
+			"dev-libs/B-1": {},
+			"sys-apps/C-1": {},
+		}
+
+		playground = ResolverPlayground(ebuilds=ebuilds, debug=debug)
+		settings = playground.settings
+		eprefix = settings["EPREFIX"]
+		test_repo_location = settings.repositories["test_repo"].location
+		md5_cache_dir = os.path.join(test_repo_location,
+			"metadata", "md5-cache")
+		changed_files = os.path.join(eprefix, "changed_files")
+
+		# Cache entries are validated by mtime with a granularity of one
+		# second, so every write advances the mtime by one second.
+		mtimes = [int(time.time())]
+
+		def write(path, content, mode="w"):
+			path = os.path.join(test_repo_location, path)
+			with open(path, mode) as f:
+				f.write(content)
+			mtimes[0] += 1
+			os.utime(path, (mtimes[0], mtimes[0]))
+
+		def homepage(cpv):
+			with open(os.path.join(md5_cache_dir, cpv)) as f:
+				for line in f:
+					if line.startswith("HOMEPAGE="):
+						return line[len("HOMEPAGE="):].rstrip("\n")
+
+		portage_python = portage._python_interpreter
+		egencache_cmd = (portage_python, "-b", "-Wd",
+			os.path.join(self.bindir, "egencache"),
+			"--repo", "test_repo", "--strict-manifests=n",
+			"--repositories-configuration",
+			settings.repositories.config_string(), "--update")
+
+		pythonpath =  os.environ.get("PYTHONPATH")
+		if pythonpath is not None and not pythonpath.strip():
+			pythonpath = None
+		if pythonpath is not None and \
+			pythonpath.split(":")[0] == PORTAGE_PYM_PATH:
+			pass
+		else:
+			if pythonpath is None:
+				pythonpath = ""
+			else:
+				pythonpath = ":" + pythonpath
+			pythonpath = PORTAGE_PYM_PATH + pythonpath
+
+		env = {
+			"PATH" : os.environ.get("PATH", ""),
+			"PORTAGE_OVERRIDE_EPREFIX" : eprefix,
+			"PORTAGE_PYTHON" : portage_python,
+			"PORTAGE_REPOSITORIES" : settings.repositories.config_string(),
+			"PYTHONDONTWRITEBYTECODE" : os.environ.get("PYTHONDONTWRITEBYTECODE", ""),
+			"PYTHONPATH" : pythonpath,
+		}
+
+		if "__PORTAGE_TEST_HARDLINK_LOCKS" in os.environ:
+			env["__PORTAGE_TEST_HARDLINK_LOCKS"] = \
+				os.environ["__PORTAGE_TEST_HARDLINK_LOCKS"]
+
+		def run(args, cwd=None):
+			if debug:
+				stdout = None
+			else:
+				stdout = subprocess.PIPE
+			proc = subprocess.Popen(args, cwd=cwd, env=env, stdout=stdout)
+			if not debug:
+				output = proc.stdout.readlines()
+				proc.stdout.close()
+			proc.wait()
+			if not debug and proc.returncode != os.EX_OK:
+				for line in output:
+					sys.stderr.write(_unicode_decode(line))
+			self.assertEqual(os.EX_OK, proc.returncode,
+				"command failed with args %s" % (args,))
+
+		try:
+			# A and B inherit foo.eclass indirectly, through bar.eclass.
+			write("eclass/foo.eclass", 'HOMEPAGE="foo-1"\n')
+			write("eclass/bar.eclass", "inherit foo\n")
+			write("dev-libs/A/A-1.ebuild", "inherit bar\n", mode="a")
+			write("dev-libs/B/B-1.ebuild", "inherit bar\n", mode="a")
+			run(egencache_cmd)
+			if EclassIndex.available():
+				# The eclass index is built by the full update, so
+				# the consumers of eclasses are found with it.
+				index = EclassIndex(os.path.join(settings.depcachedir,
+					"eclass_index.sqlite"), readonly=True)
+				self.assertTrue(index.complete("test_repo"))
+				self.assertEqual(index.lookup("foo"),
+					[("test_repo", "dev-libs/A-1"),
+					("test_repo", "dev-libs/B-1")])
+				index.close()
+			self.assertEqual(homepage("dev-libs/A-1"), "foo-1")
+			self.assertEqual(homepage("dev-libs/B-1"), "foo-1")
+			self.assertEqual(homepage("sys-apps/C-1"), None)
+
+			# C is not listed, so its cache entry is not updated.
+			write("eclass/foo.eclass", 'HOMEPAGE="foo-2"\n')
+			write("sys-apps/C/C-1.ebuild", 'HOMEPAGE="c-2"\n', mode="a")
+			with open(changed_files, "w") as f:
+				f.write("eclass/foo.eclass\n")
+			run(egencache_cmd + ("--changed-files", changed_files))
+			self.assertEqual(homepage("dev-libs/A-1"), "foo-2")
+			self.assertEqual(homepage("dev-libs/B-1"), "foo-2")
+			self.assertEqual(homepage("sys-apps/C-1"), None)
+
+			# Removed packages are not errors.
+			with open(changed_files, "w") as f:
+				f.write("%s\ndev-libs/D/D-1.ebuild\n" %
+					os.path.join(test_repo_location, "sys-apps/C/C-1.ebuild"))
+			run(egencache_cmd + ("--changed-files", changed_files))
+			self.assertEqual(homepage("sys-apps/C-1"), "c-2")
+
+			git_binary = find_binary("git")
+			if git_binary is None:
+				return
+
+			git_env = {
+				"GIT_AUTHOR_NAME": "Test",
+				"GIT_AUTHOR_EMAIL": "test@example.org",
+				"GIT_COMMITTER_NAME": "Test",
+				"GIT_COMMITTER_EMAIL": "test@example.org",
+			}
+			env.update(git_env)
+			# C is changed before the given commit, B is changed by a
+			# later commit, and A is changed in the working tree.
+			write("sys-apps/C/C-1.ebuild", 'HOMEPAGE="c-3"\n', mode="a")
+			run((git_binary, "init", "-q"), cwd=test_repo_location)
+			run((git_binary, "add", "."), cwd=test_repo_location)
+			run((git_binary, "commit", "-q", "-m", "initial"),
+				cwd=test_repo_location)
+			write("dev-libs/B/B-1.ebuild", 'HOMEPAGE="b-3"\n', mode="a")
+			run((git_binary, "commit", "-q", "-a", "-m", "B"),
+				cwd=test_repo_location)
+			write("dev-libs/A/A-1.ebuild", 'HOMEPAGE="a-3"\n', mode="a")
+			run(egencache_cmd + ("--changed-since", "HEAD~1"))
+			self.assertEqual(homepage("dev-libs/A-1"), "a-3")
+			self.assertEqual(homepage("dev-libs/B-1"), "b-3")
+			self.assertEqual(homepage("sys-apps/C-1"), "c-2")
+		finally:
+			playground.cleanup()
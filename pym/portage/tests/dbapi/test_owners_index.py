@@ -0,0 +1,101 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from portage import os
+from portage import shutil
+from portage.dbapi._VdbMetadataCache import VdbMetadataCache
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+class OwnersIndexTestCase(TestCase):
+
+	def testOwnersIndex(self):
+
+		if not VdbMetadataCache.available():
+			self.skipTest("sqlite is unavailable")
+
+		installed = {
+			"dev-libs/A-1": {"EAPI": "5", "COUNTER": "1"},
+			"dev-libs/B-1": {"EAPI": "5", "COUNTER": "2"},
+			"dev-libs/C-1": {"EAPI": "5", "COUNTER": "3"},
+		}
+
+		contents = {
+			"dev-libs/A-1": ("/usr/lib64/A/__init__.py", "/usr/share/Makefile"),
+			"dev-libs/B-1": ("/usr/lib/B/__init__.py",),
+			"dev-libs/C-1": ("/usr/lib64/C/__init__.py",),
+		}
+
+		user_config = {
+			"make.conf": ('FEATURES="owners-index"',),
+		}
+
+		playground = ResolverPlayground(installed=installed,
+			user_config=user_config)
+		try:
+			eroot = playground.settings["EROOT"]
+			eprefix = playground.settings["EPREFIX"]
+			vardb = playground.trees[eroot]["vartree"].dbapi
+			cache_db = vardb._aux_cache_db
+
+			# The lib directory is a symlink to lib64.
+			for pkg in ("A", "B", "C"):
+				os.makedirs(os.path.join(eprefix, "usr", "lib64", pkg))
+			os.symlink("lib64", os.path.join(eprefix, "usr", "lib"))
+			for cpv, paths in contents.items():
+				with open(os.path.join(vardb.getpath(cpv), "CONTENTS"),
+					"w") as f:
+					for path in paths:
+						f.write("obj %s%s d41d8cd98f00b204e9800998ecf8427e 0\n"
+							% (eprefix, path))
+
+			def owners(paths):
+				return sorted((x.mycpv, path) for x, path in
+					vardb._owners.iter_owners(
+					[eprefix + path if path[:1] == os.sep else path
+					for path in paths]))
+
+			self.assertEqual(owners(["/usr/lib64/A/__init__.py"]),
+				[("dev-libs/A-1", "usr/lib64/A/__init__.py")])
+			self.assertEqual(sorted(cache_db.owners_index_packages()),
+				sorted(installed))
+
+			# Paths with symlinked parent directories are resolved.
+			self.assertEqual(owners(["/usr/lib/C/__init__.py",
+				"/usr/lib64/B/__init__.py"]),
+				[("dev-libs/B-1", "usr/lib/B/__init__.py"),
+				("dev-libs/C-1", "usr/lib64/C/__init__.py")])
+
+			# Basenames are searched with the basename cache.
+			self.assertEqual(owners(["Makefile", "/usr/lib/missing.py"]),
+				[("dev-libs/A-1", "usr/share/Makefile")])
+
+			# Unindexed packages are indexed before lookups.
+			vardb._owners._index_remove("dev-libs/C-1")
+			self.assertEqual(cache_db.owners_index_lookup(
+				[eprefix + "/usr/lib64/C/__init__.py"]), set())
+			self.assertEqual(owners(["/usr/lib64/C/__init__.py"]),
+				[("dev-libs/C-1", "usr/lib64/C/__init__.py")])
+
+			# Stale index entries are ignored.
+			vardb.removeFromContents("dev-libs/A-1",
+				[eprefix + "/usr/share/Makefile"])
+			self.assertEqual(owners(["/usr/share/Makefile"]), [])
+
+			# Uninstalled packages are removed from the index.
+			shutil.rmtree(vardb.getpath("dev-libs/B-1"))
+			vardb._clear_cache()
+			self.assertEqual(owners(["/usr/lib/B/__init__.py"]), [])
+			self.assertEqual(sorted(cache_db.owners_index_packages()),
+				["dev-libs/A-1", "dev-libs/C-1"])
+
+			# If the index is unusable, then paths are searched without
+			# it, instead of reporting that they have no owners.
+			with cache_db._connect() as connection:
+				connection.execute("DROP TABLE owners_paths")
+			self.assertEqual(cache_db.owners_index_lookup(
+				[eprefix + "/usr/lib64/C/__init__.py"]), None)
+			self.assertEqual(owners(["/usr/lib64/C/__init__.py"]),
+				[("dev-libs/C-1", "usr/lib64/C/__init__.py")])
+		finally:
+			playground.cleanup()
@@ -0,0 +1,167 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import subprocess
+import sys
+import time
+
+import portage
+from portage import os
+from portage import _unicode_decode
+from portage.cache import packed
+from portage.cache.flat_hash import md5_database
+from portage.const import PORTAGE_PYM_PATH
+from portage.dbapi.porttree import portdbapi
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+class PackedCacheTestCase(TestCase):
+
+	def testPackedCache(self):
+		"""
+		Check that egencache --update-cache-pack packs the md5-cache,
+		that portdbapi prefers the packed cache, and that it falls back
+		to the md5-cache for outdated entries.
+		"""
+		debug = False
+
+		ebuilds = {
+			"dev-libs/A-1": {"DESCRIPTION": "package A"},
+			"dev-libs/A-2": {"DESCRIPTION": "package A"},
+			"dev-libs/B-1": {"DESCRIPTION": "package B"},
+			"sys-apps/C-1": {"DESCRIPTION": "package C"},
+		}
+
+		# Ebuilds are modified without updating the Manifest.
+		user_config = {
+			"make.conf": ('FEATURES="${FEATURES} -strict"',),
+		}
+
+		repo_configs = {
+			"test_repo": {
+				"layout.conf": ("cache-formats = md5-dict",),
+			},
+		}
+
+		playground = ResolverPlayground(ebuilds=ebuilds,
+			repo_configs=repo_configs, user_config=user_config,
+			debug=debug)
+		settings = playground.settings
+		eprefix = settings["EPREFIX"]
+		test_repo_location = settings.repositories["test_repo"].location
+		md5_cache_dir = os.path.join(test_repo_location,
+			"metadata", "md5-cache")
+		pack_file = os.path.join(test_repo_location,
+			packed.packed_cache_path)
+
+		portage_python = portage._python_interpreter
+		egencache_cmd = (portage_python, "-b", "-Wd",
+			os.path.join(self.bindir, "egencache"),
+			"--repo", "test_repo", "--strict-manifests=n",
+			"--repositories-configuration",
+			settings.repositories.config_string())
+
+		pythonpath =  os.environ.get("PYTHONPATH")
+		if pythonpath is not None and not pythonpath.strip():
+			pythonpath = None
+		if pythonpath is not None and \
+			pythonpath.split(":")[0] == PORTAGE_PYM_PATH:
+			pass
+		else:
+			if pythonpath is None:
+				pythonpath = ""
+			else:
+				pythonpath = ":" + pythonpath
+			pythonpath = PORTAGE_PYM_PATH + pythonpath
+
+		env = {
+			"PATH" : os.environ.get("PATH", ""),
+			"PORTAGE_OVERRIDE_EPREFIX" : eprefix,
+			"PORTAGE_PYTHON" : portage_python,
+			"PORTAGE_REPOSITORIES" : settings.repositories.config_string(),
+			"PYTHONDONTWRITEBYTECODE" : os.environ.get("PYTHONDONTWRITEBYTECODE", ""),
+			"PYTHONPATH" : pythonpath,
+		}
+
+		if "__PORTAGE_TEST_HARDLINK_LOCKS" in os.environ:
+			env["__PORTAGE_TEST_HARDLINK_LOCKS"] = \
+				os.environ["__PORTAGE_TEST_HARDLINK_LOCKS"]
+
+		def run(args):
+			if debug:
+				stdout = None
+			else:
+				stdout = subprocess.PIPE
+			proc = subprocess.Popen(args, env=env, stdout=stdout)
+			if not debug:
+				output = proc.stdout.readlines()
+				proc.stdout.close()
+			proc.wait()
+			if not debug and proc.returncode != os.EX_OK:
+				for line in output:
+					sys.stderr.write(_unicode_decode(line))
+			self.assertEqual(os.EX_OK, proc.returncode,
+				"command failed with args %s" % (args,))
+
+		def description(cpv):
+			portdb = portdbapi(mysettings=settings)
+			try:
+				return portdb.aux_get(cpv, ["DESCRIPTION"])[0]
+			finally:
+				portdb.close_caches()
+
+		try:
+			run(egencache_cmd + ("--update", "--update-cache-pack"))
+			md5_cache = md5_database(os.path.dirname(md5_cache_dir),
+				os.path.basename(md5_cache_dir), (), readonly=True)
+			pack = packed.database(test_repo_location,
+				packed.packed_cache_path, ())
+			self.assertEqual(list(pack), sorted(ebuilds))
+			for cpv in ebuilds:
+				self.assertTrue(cpv in pack)
+				# The md5-cache adds _mtime_ from the file, but it is not
+				# used for validation.
+				expected = md5_cache._getitem(cpv)
+				expected.pop("_mtime_")
+				self.assertEqual(pack._getitem(cpv), expected)
+			self.assertFalse("dev-libs/A-3" in pack)
+			self.assertFalse("dev-libs/0-1" in pack)
+			self.assertFalse("virtual/Z-1" in pack)
+			self.assertRaises(KeyError, pack._getitem, "dev-libs/A-3")
+			pack.close()
+
+			# The packed cache is tried first.
+			md5_file = os.path.join(md5_cache_dir, "dev-libs/B-1")
+			with open(md5_file) as f:
+				content = f.read()
+			with open(md5_file, "w") as f:
+				f.write(content.replace("package B", "unpacked B"))
+			self.assertEqual(description("dev-libs/B-1"), "package B")
+
+			# An entry of the packed cache is not used after the
+			# ebuild has changed, while other entries still are.
+			ebuild = os.path.join(test_repo_location,
+				"sys-apps/C/C-1.ebuild")
+			with open(ebuild) as f:
+				content = f.read()
+			with open(ebuild, "w") as f:
+				f.write(content.replace("package C", "changed C"))
+			mtime = int(time.time()) + 2
+			os.utime(ebuild, (mtime, mtime))
+			run(egencache_cmd + ("--update",))
+			self.assertEqual(description("sys-apps/C-1"), "changed C")
+			self.assertEqual(description("dev-libs/B-1"), "package B")
+
+			# An unrecognized file is treated like an empty cache.
+			with open(pack_file, "w") as f:
+				f.write("unrecognized content")
+			self.assertEqual(list(packed.database(test_repo_location,
+				packed.packed_cache_path, ())), [])
+			md5_file = os.path.join(md5_cache_dir, "dev-libs/A-1")
+			with open(md5_file) as f:
+				content = f.read()
+			with open(md5_file, "w") as f:
+				f.write(content.replace("package A", "unpacked A"))
+			self.assertEqual(description("dev-libs/A-1"), "unpacked A")
+		finally:
+			playground.cleanup()
@@ -0,0 +1,119 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import shutil
+import tempfile
+
+from portage import os
+from portage import _unicode_decode
+from portage.cache.cache_errors import InitializationError
+from portage.tests import TestCase
+
+try:
+	import sqlite3
+except ImportError:
+	sqlite3 = None
+else:
+	from portage.cache.sqlite import database
+
+class SqliteCacheTestCase(TestCase):
+
+	auxdbkeys = ("DESCRIPTION", "EAPI", "SLOT")
+
+	def _entry(self, description):
+		return {
+			"DESCRIPTION": description,
+			"EAPI": "5",
+			"SLOT": "0",
+			"_eclasses_": {},
+			"_md5_": "d41d8cd98f00b204e9800998ecf8427e",
+			"_mtime_": 1,
+		}
+
+	def testSqliteCache(self):
+
+		if sqlite3 is None:
+			self.skipTest("sqlite is unavailable")
+
+		tmpdir = tempfile.mkdtemp()
+		try:
+			self.assertRaises(InitializationError, database,
+				tmpdir, "repo", self.auxdbkeys, readonly=True)
+
+			cache = database(tmpdir, "repo", self.auxdbkeys)
+			dbpath = cache._dbpath
+			self.assertEqual(cache._db_cursor.execute(
+				"PRAGMA journal_mode").fetchone()[0], "wal")
+
+			# Writes are visible before they are committed.
+			cache.sync(100)
+			cache["dev-libs/A-1"] = self._entry("package A")
+			cache["dev-libs/B-1"] = self._entry("package B")
+			cache["dev-libs/C-1"] = self._entry("package C")
+			del cache["dev-libs/C-1"]
+			self.assertEqual(cache["dev-libs/A-1"]["DESCRIPTION"],
+				"package A")
+			self.assertFalse("dev-libs/C-1" in cache)
+			self.assertEqual(sorted(cache),
+				["dev-libs/A-1", "dev-libs/B-1"])
+
+			reader = database(tmpdir, "repo", self.auxdbkeys,
+				readonly=True)
+			self.assertEqual(list(reader), [])
+
+			cache.sync()
+			self.assertEqual(cache._db_pending, {})
+			self.assertEqual(sorted(reader),
+				["dev-libs/A-1", "dev-libs/B-1"])
+			self.assertEqual(reader["dev-libs/B-1"],
+				cache["dev-libs/B-1"])
+			self.assertEqual(reader["dev-libs/B-1"]["_mtime_"], 1)
+			self.assertRaises(KeyError, reader.__getitem__, "dev-libs/C-1")
+
+			# Entries are read in chunks, and missing ones are skipped.
+			reader._db_select_many_chunk = 1
+			cache.sync(100)
+			cache["dev-libs/E-1"] = self._entry("package E")
+			cpvs = ["dev-libs/E-1", "dev-libs/C-1", "dev-libs/A-1",
+				"dev-libs/B-1"]
+			self.assertEqual(dict(cache.get_many(cpvs)),
+				dict((cpv, cache[cpv]) for cpv in cpvs if cpv in cache))
+			self.assertEqual(sorted(reader.get_many(cpvs)),
+				[("dev-libs/A-1", reader["dev-libs/A-1"]),
+				("dev-libs/B-1", reader["dev-libs/B-1"])])
+			del cache["dev-libs/E-1"]
+			cache.sync()
+
+			# Quotes are stored literally.
+			cache["dev-libs/C-1"] = self._entry("it's \"C\"")
+			self.assertEqual(reader["dev-libs/C-1"]["DESCRIPTION"],
+				"it's \"C\"")
+
+			# A reader with an open transaction does not block the
+			# writer, and it keeps reading the same snapshot.
+			connection = sqlite3.connect(_unicode_decode(dbpath),
+				timeout=0, isolation_level=None)
+			connection.execute("BEGIN")
+			self.assertEqual(connection.execute(
+				"SELECT COUNT(*) FROM portage_packages").fetchone()[0], 3)
+			del cache["dev-libs/A-1"]
+			cache["dev-libs/D-1"] = self._entry("package D")
+			self.assertEqual(connection.execute(
+				"SELECT COUNT(*) FROM portage_packages").fetchone()[0], 3)
+			connection.execute("COMMIT")
+			connection.close()
+			self.assertEqual(sorted(reader),
+				["dev-libs/B-1", "dev-libs/C-1", "dev-libs/D-1"])
+
+			# Missing columns are read as empty values by readonly
+			# connections, and they are added by writable ones.
+			reader = database(tmpdir, "repo", self.auxdbkeys + ("IUSE",),
+				readonly=True)
+			self.assertEqual(reader["dev-libs/D-1"]["IUSE"], "")
+			self.assertEqual(reader["dev-libs/D-1"]["DESCRIPTION"],
+				"package D")
+			cache = database(tmpdir, "repo", self.auxdbkeys + ("IUSE",))
+			self.assertEqual(cache["dev-libs/D-1"]["IUSE"], "")
+			self.assertEqual(cache._db_select_keys, tuple(cache._allowed_keys))
+		finally:
+			shutil.rmtree(tmpdir)
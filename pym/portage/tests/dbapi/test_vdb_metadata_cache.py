@@ -0,0 +1,97 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import shutil
+
+from portage import os
+from portage.dbapi._VdbMetadataCache import VdbMetadataCache
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+class VdbMetadataCacheTestCase(TestCase):
+
+	def testVdbMetadataCache(self):
+
+		if not VdbMetadataCache.available():
+			self.skipTest("sqlite is unavailable")
+
+		installed = {
+			"dev-libs/A-1": {"EAPI": "5", "DESCRIPTION": "package A"},
+			"dev-libs/B-1": {"EAPI": "5", "DESCRIPTION": "package B"},
+			"dev-libs/C-1": {"EAPI": "5", "DESCRIPTION": "package C"},
+		}
+
+		playground = ResolverPlayground(installed=installed)
+		try:
+			eroot = playground.settings["EROOT"]
+			eprefix = playground.settings["EPREFIX"]
+			vardb = playground.trees[eroot]["vartree"].dbapi
+			for cpv in installed:
+				contents = os.path.join(vardb.getpath(cpv), "CONTENTS")
+				with open(contents, "w") as f:
+					f.write("obj %s/usr/lib/%s/lib.so "
+						"d41d8cd98f00b204e9800998ecf8427e 0\n" %
+						(eprefix, cpv.split("/")[1]))
+			for cpv in installed:
+				vardb.aux_get(cpv, ["DESCRIPTION"])
+
+			vardb.flush_cache()
+			self.assertTrue(os.path.exists(vardb._aux_cache_filename))
+			timestamp = vardb._aux_cache["timestamp"]
+
+			# Entries are only loaded when they are looked up.
+			vardb._clear_cache()
+			packages = vardb._aux_cache["packages"]
+			self.assertEqual(vardb._aux_cache["timestamp"], timestamp)
+			self.assertEqual(packages._entries, {})
+			self.assertEqual(vardb.aux_get("dev-libs/B-1", ["DESCRIPTION"]),
+				["package B"])
+			self.assertEqual(list(packages._entries), ["dev-libs/B-1"])
+			self.assertEqual(vardb._aux_cache["modified"], set())
+			self.assertEqual(sorted(packages), sorted(installed))
+
+			owners = vardb._owners.get_owners(
+				[eprefix + "/usr/lib/A-1/lib.so"])
+			self.assertEqual([x.mycpv for x in owners], ["dev-libs/A-1"])
+			# Only the bucket of the basename is read.
+			base_names = vardb._aux_cache["owners"]["base_names"]
+			self.assertFalse(base_names._complete)
+			self.assertEqual(len(base_names._entries), 1)
+
+			# Stale packages are removed by reading only their buckets.
+			shutil.rmtree(vardb.getpath("dev-libs/C-1"))
+			vardb._clear_cache()
+			owners = vardb._owners.get_owners(
+				[eprefix + "/usr/lib/C-1/lib.so",
+				eprefix + "/usr/lib/B-1/lib.so"])
+			self.assertEqual([x.mycpv for x in owners], ["dev-libs/B-1"])
+			base_names = vardb._aux_cache["owners"]["base_names"]
+			self.assertFalse(base_names._complete)
+			self.assertTrue(len(base_names._entries) < len(base_names))
+			self.assertTrue("dev-libs/C-1" not in
+				vardb._aux_cache["owners"]["base_name_pkgs"])
+
+			# Only modified entries are written.
+			cache_db = VdbMetadataCache(vardb._aux_cache_filename)
+			cache = cache_db.load()
+			mtime, metadata = cache["packages"]["dev-libs/C-1"]
+			metadata["DESCRIPTION"] = "modified"
+			cache["packages"]["dev-libs/C-1"] = (mtime, metadata)
+			del cache["packages"]["dev-libs/A-1"]
+			self.assertEqual(sorted(cache["packages"]._entries),
+				["dev-libs/A-1", "dev-libs/C-1"])
+			cache_db.commit(cache, timestamp + 1)
+
+			cache = VdbMetadataCache(vardb._aux_cache_filename).load()
+			self.assertEqual(cache["timestamp"], timestamp + 1)
+			self.assertEqual(sorted(cache["packages"]),
+				["dev-libs/B-1", "dev-libs/C-1"])
+			self.assertEqual(
+				cache["packages"]["dev-libs/C-1"][1]["DESCRIPTION"], "modified")
+			self.assertEqual(
+				cache["packages"]["dev-libs/B-1"][1]["DESCRIPTION"], "package B")
+			self.assertTrue("dev-libs/A-1" not in cache["packages"])
+			self.assertEqual(cache["packages"].pop("dev-libs/A-1", None), None)
+			self.assertTrue(len(cache["base_names"]) > 0)
+		finally:
+			playground.cleanup()
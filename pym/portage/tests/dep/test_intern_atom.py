@@ -0,0 +1,31 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from portage.tests import TestCase
+from portage.dep import Atom, _atom_cache, _intern_atom
+from portage.exception import InvalidAtom
+
+class InternAtomTestCase(TestCase):
+
+	def testInternAtom(self):
+		_atom_cache.clear()
+
+		atom = _intern_atom("dev-libs/A:1", eapi="5")
+		self.assertTrue(isinstance(atom, Atom))
+		self.assertEqual(atom.slot, "1")
+		self.assertTrue(_intern_atom("dev-libs/A:1", eapi="5") is atom)
+		self.assertEqual((_atom_cache.hits, _atom_cache.misses), (1, 1))
+
+		# Different arguments yield different instances.
+		self.assertFalse(_intern_atom("dev-libs/A:1") is atom)
+		self.assertFalse(_intern_atom("dev-libs/A:1",
+			allow_wildcard=True) is atom)
+
+		# Invalid atoms are not cached.
+		for i in range(2):
+			self.assertRaises(InvalidAtom, _intern_atom, "dev-libs/A::repo",
+				eapi="5")
+			self.assertRaises(InvalidAtom, _intern_atom, "=dev-libs/A")
+
+		# The constructor's efficiency assertion is preserved.
+		self.assertRaises(TypeError, _intern_atom, atom)
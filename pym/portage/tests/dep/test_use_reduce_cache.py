@@ -0,0 +1,95 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from portage.tests import TestCase
+from portage.exception import InvalidDependString
+from portage.dep import Atom, use_reduce, _use_reduce, _use_reduce_cache
+from portage.util._lru_cache import LRUCache
+
+class UseReduceCacheTestCase(TestCase):
+
+	def testUseReduceCache(self):
+
+		depstrs = (
+			"a? ( x/a ) !b? ( x/b ) c? ( || ( x/c1 x/c2 ) ) d? ( b? ( x/d ) )",
+			"|| ( a? ( x/a ) !a? ( x/b ) ) x/c[a?,!b=,c(+)?] x/d[-e]",
+			"a? ( http://a/a.tar.gz -> a.tar.gz ) b.tar.gz",
+		)
+		uselists = ([], ["a"], ["b"], ["a", "b", "c", "d"], ["c", "d"])
+		options = (
+			{},
+			{"token_class": Atom},
+			{"opconvert": True},
+			{"flat": True},
+			{"matchall": True},
+			{"matchnone": True},
+			{"masklist": ["a"]},
+			{"excludeall": ["b"]},
+		)
+
+		_use_reduce_cache.clear()
+		# Evaluate everything twice, in order to compare cached results.
+		for i in range(2):
+			for depstr in depstrs:
+				is_src_uri = "->" in depstr
+				for uselist in uselists:
+					for kwargs in options:
+						if is_src_uri and "token_class" in kwargs:
+							continue
+						kwargs = dict(kwargs, uselist=uselist,
+							is_src_uri=is_src_uri, eapi="5")
+						expected = _use_reduce(depstr, **kwargs)
+						result = use_reduce(depstr, **kwargs)
+						self.assertEqual(result, expected,
+							"%s %s: %s != %s" % (depstr, kwargs, result, expected))
+						# The result must be a copy which is safe to modify.
+						result.append("modified")
+		self.assertTrue(_use_reduce_cache.hits > 0)
+
+		# Each call returns new Atom instances, which are equal to the
+		# parsed ones.
+		depstr = "x/a[a?] x/b"
+		first = use_reduce(depstr, uselist=["a"], token_class=Atom)
+		second = use_reduce(depstr, uselist=["a"], token_class=Atom)
+		for atom, other in zip(first, second):
+			self.assertFalse(atom is other)
+			self.assertEqual(sorted(atom.__dict__), sorted(other.__dict__))
+			for k, v in atom.__dict__.items():
+				if v is atom:
+					self.assertTrue(other.__dict__[k] is other)
+				else:
+					self.assertEqual(v, other.__dict__[k])
+
+	def testUseReduceCacheErrors(self):
+
+		depstr = "a? ( x/a ) x/b[c?]"
+		_use_reduce_cache.clear()
+		self.assertEqual(use_reduce(depstr, uselist=["a", "c"],
+			token_class=Atom, eapi="5",
+			is_valid_flag=lambda flag: True), ["x/a", "x/b[c]"])
+
+		# A cached result must not hide errors for a different IUSE.
+		for invalid in ("a", "c"):
+			self.assertRaises(InvalidDependString, use_reduce, depstr,
+				uselist=["a", "c"], token_class=Atom, eapi="5",
+				is_valid_flag=lambda flag: flag != invalid)
+
+		# Errors are raised every time.
+		for i in range(2):
+			self.assertRaises(InvalidDependString, use_reduce,
+				"a? ( x/a", uselist=["a"])
+
+	def testLRUCache(self):
+		cache = LRUCache(4)
+		for i in range(4):
+			cache[i] = i
+		self.assertEqual(cache.get(0), 0)
+		# The least recently used quarter is evicted, in addition
+		# to the entry that exceeds the limit.
+		cache[4] = 4
+		self.assertEqual(len(cache), 3)
+		self.assertTrue(0 in cache)
+		self.assertFalse(1 in cache)
+		self.assertFalse(2 in cache)
+		self.assertEqual(cache.get(1), None)
+		self.assertEqual((cache.hits, cache.misses), (1, 1))
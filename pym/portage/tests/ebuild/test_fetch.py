@@ -0,0 +1,114 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import shutil
+import stat
+import tempfile
+
+from portage import OrderedDict, os
+from portage.checksum import perform_multiple_checksums
+from portage.package.ebuild.config import config
+from portage.package.ebuild.fetch import fetch
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+class FetchTestCase(TestCase):
+
+	def testConcurrentFetch(self):
+		"""
+		Check that PORTAGE_FETCH_JOBS fetches files concurrently, with
+		the same results as sequential fetching.
+		"""
+		user_config = {
+			"make.conf": (
+				'FEATURES="${FEATURES} -userfetch"',
+				'GENTOO_MIRRORS=""',
+			),
+		}
+		playground = ResolverPlayground(user_config=user_config)
+		tmpdir = tempfile.mkdtemp()
+		try:
+			# The fetcher records the number of concurrent fetchers.
+			fetcher = os.path.join(tmpdir, "fetcher")
+			running = os.path.join(tmpdir, "running")
+			counts = os.path.join(tmpdir, "counts")
+			os.makedirs(running)
+			with open(fetcher, "w") as f:
+				f.write('#!/bin/sh\n'
+					'touch "%(running)s/${2##*/}"\n'
+					'ls "%(running)s" | wc -l >> "%(counts)s"\n'
+					'sleep 0.2\n'
+					'cp "${1#file://}" "$2"\n'
+					'rm "%(running)s/${2##*/}"\n' %
+					{"running": running, "counts": counts})
+			os.chmod(fetcher, stat.S_IRWXU)
+
+			def max_concurrency():
+				with open(counts) as f:
+					result = max(int(x) for x in f)
+				os.unlink(counts)
+				return result
+
+			settings = config(clone=playground.settings)
+			settings["FETCHCOMMAND"] = \
+				'"%s" "${URI}" "${DISTDIR}/${FILE}"' % fetcher
+			settings["RESUMECOMMAND"] = settings["FETCHCOMMAND"]
+			settings["PORTAGE_QUIET"] = "1"
+			distdir = settings["DISTDIR"]
+
+			mirror = os.path.join(tmpdir, "mirror")
+			os.makedirs(mirror)
+			myuris = OrderedDict()
+			digests = {}
+			for i in range(6):
+				filename = "distfile-%d.tar.gz" % i
+				path = os.path.join(mirror, filename)
+				with open(path, "wb") as f:
+					f.write(("content %d\n" % i).encode("ascii") * 1000)
+				myuris[filename] = ["file://" + path]
+				digests[filename] = perform_multiple_checksums(path,
+					["SHA256", "SHA512"])
+				digests[filename]["size"] = os.stat(path).st_size
+
+			def distfiles():
+				return sorted(x for x in os.listdir(distdir)
+					if not x.startswith("."))
+
+			for jobs in ("1", "3"):
+				settings["PORTAGE_FETCH_JOBS"] = jobs
+				self.assertEqual(fetch(myuris, settings,
+					digests=digests), 1)
+				self.assertEqual(distfiles(), sorted(myuris))
+				if jobs == "1":
+					self.assertEqual(max_concurrency(), 1)
+				else:
+					self.assertTrue(max_concurrency() > 1)
+				shutil.rmtree(distdir)
+				os.makedirs(distdir)
+
+			# Files which fail do not prevent other files from being
+			# fetched with fetchonly.
+			with open(myuris["distfile-1.tar.gz"][0][len("file://"):],
+				"wb") as f:
+				f.write(b"corrupt" * 1000)
+			os.unlink(myuris["distfile-4.tar.gz"][0][len("file://"):])
+			expected = sorted(x for x in myuris
+				if x not in ("distfile-1.tar.gz", "distfile-4.tar.gz"))
+			for jobs in ("1", "3"):
+				settings["PORTAGE_FETCH_JOBS"] = jobs
+				self.assertEqual(fetch(myuris, settings, fetchonly=1,
+					digests=digests), 0)
+				self.assertEqual([x for x in distfiles()
+					if not x.startswith("distfile-1.tar.gz._checksum_failure_")],
+					expected)
+				shutil.rmtree(distdir)
+				os.makedirs(distdir)
+
+			# Without fetchonly, no more files are started after a
+			# failure.
+			settings["PORTAGE_FETCH_JOBS"] = "2"
+			self.assertEqual(fetch(myuris, settings, digests=digests), 0)
+			self.assertFalse("distfile-5.tar.gz" in distfiles())
+		finally:
+			shutil.rmtree(tmpdir)
+			playground.cleanup()
@@ -0,0 +1,91 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import shutil
+import tempfile
+
+from portage import os
+from portage import _shell_quote
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+from portage.util._eventloop.global_event_loop import global_event_loop
+from _emerge.EbuildMetadataPhase import EbuildMetadataPhase
+from _emerge.MetadataWorkerPool import MetadataWorkerPool
+
+class MetadataWorkersTestCase(TestCase):
+
+	def testMetadataWorkers(self):
+		"""
+		Generate metadata with a MetadataWorkerPool, and check that it
+		is identical to the metadata that is generated by a new process
+		for each ebuild, that a single worker is reused for sequential
+		requests, and that the environment of an ebuild does not leak
+		into the next one.
+		"""
+
+		# Digest generation sources the ebuilds, so C-1 only dies
+		# when the marker file exists.
+		tmpdir = tempfile.mkdtemp()
+		die_marker = os.path.join(tmpdir, "die")
+
+		ebuilds = {
+			"dev-libs/A-1": {
+				"EAPI": "5",
+				"IUSE": "+foo",
+				"RDEPEND": "foo? ( dev-libs/B )",
+				"MISC_CONTENT": "export LEAKED=1\nLEAKED2=1\n",
+			},
+			"dev-libs/B-1": {
+				"EAPI": "5",
+				"MISC_CONTENT": 'DESCRIPTION="${LEAKED:-clean}${LEAKED2}"\n',
+			},
+			"dev-libs/C-1": {
+				"EAPI": "5",
+				"MISC_CONTENT": "[[ -e %s ]] && die 'global scope die'\n:\n" %
+					_shell_quote(die_marker),
+			},
+			"dev-libs/D-1": {
+				"EAPI": "4",
+				"SLOT": "1",
+			},
+		}
+
+		playground = ResolverPlayground(ebuilds=ebuilds)
+		try:
+			with open(die_marker, "w"):
+				pass
+			portdb = playground.trees[playground.eroot]["porttree"].dbapi
+			event_loop = global_event_loop()
+
+			def generate(cpv, worker_pool):
+				ebuild_path, repo_path = portdb.findname2(cpv)
+				metadata, ebuild_hash = portdb._pull_valid_cache(
+					cpv, ebuild_path, repo_path)
+				proc = EbuildMetadataPhase(cpv=cpv,
+					ebuild_hash=ebuild_hash, portdb=portdb,
+					repo_path=repo_path, scheduler=event_loop,
+					settings=portdb.doebuild_settings,
+					worker_pool=worker_pool, write_auxdb=False)
+				proc.start()
+				proc.wait()
+				return proc.returncode, proc.metadata
+
+			worker_pool = MetadataWorkerPool()
+			try:
+				for cpv in sorted(ebuilds):
+					expected = generate(cpv, None)
+					result = generate(cpv, worker_pool)
+					self.assertEqual(result, expected)
+					if cpv == "dev-libs/C-1":
+						self.assertNotEqual(result[0], os.EX_OK)
+					else:
+						self.assertEqual(result[0], os.EX_OK)
+					self.assertEqual(len(worker_pool._workers), 1)
+					if cpv == "dev-libs/B-1":
+						self.assertEqual(result[1]["DESCRIPTION"], "clean")
+			finally:
+				worker_pool.close()
+			self.assertEqual(len(worker_pool._workers), 0)
+		finally:
+			playground.cleanup()
+			shutil.rmtree(tmpdir)
@@ -0,0 +1,93 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import shutil
+import tempfile
+
+from portage import os
+from portage.exception import DigestException, FileNotFound
+from portage.manifest import Manifest
+from portage.package.ebuild._parallel_manifest.ManifestVerifier import \
+	ManifestVerifier
+from portage.tests import TestCase
+
+class ParallelManifestTestCase(TestCase):
+
+	def _sequential_failures(self, mf, entries):
+		failures = []
+		for ftype, fname in entries:
+			try:
+				mf.checkFileHashes(ftype, fname)
+			except (DigestException, FileNotFound) as e:
+				failures.append((ftype, fname, type(e), e.value))
+		return sorted(failures)
+
+	def _parallel_failures(self, mf, entries, **kwargs):
+		return sorted((ftype, fname, type(e), e.value) for ftype, fname, e
+			in mf.checkHashesParallel(entries, **kwargs))
+
+	def testParallelManifest(self):
+		tmpdir = tempfile.mkdtemp()
+		try:
+			pkgdir = os.path.join(tmpdir, "dev-libs", "A")
+			distdir = os.path.join(tmpdir, "distfiles")
+			os.makedirs(os.path.join(pkgdir, "files"))
+			os.makedirs(distdir)
+
+			large = ManifestVerifier._batch_file_size
+			files = {
+				("EBUILD", "A-1.ebuild"): b"EAPI=5\n",
+				("AUX", "A-1.patch"): b"patch\n",
+				("MISC", "metadata.xml"): b"<pkgmetadata/>\n",
+			}
+			for i in range(10):
+				files[("DIST", "small-%d.tar.gz" % i)] = \
+					("small %d\n" % i).encode("ascii")
+			for i in range(4):
+				files[("DIST", "large-%d.tar.gz" % i)] = \
+					("%d" % i).encode("ascii") * large
+
+			mf = Manifest(pkgdir, distdir, from_scratch=True,
+				hashes=frozenset(["SHA256", "SHA512"]))
+			for (ftype, fname), content in files.items():
+				with open(mf._getAbsname(ftype, fname), "wb") as f:
+					f.write(content)
+				mf.updateFileHashes(ftype, fname, checkExisting=False)
+			entries = sorted(files)
+
+			self.assertEqual(self._sequential_failures(mf, entries), [])
+			self.assertEqual(self._parallel_failures(mf, entries,
+				max_jobs=4), [])
+
+			# Corrupt, truncate and remove some of the files.
+			for ftype, fname in (("DIST", "small-1.tar.gz"),
+				("DIST", "large-1.tar.gz"), ("AUX", "A-1.patch")):
+				path = mf._getAbsname(ftype, fname)
+				with open(path, "rb") as f:
+					content = f.read()
+				with open(path, "wb") as f:
+					f.write(b"x" + content[1:])
+			with open(mf._getAbsname("DIST", "large-2.tar.gz"), "wb") as f:
+				f.write(b"2")
+			for ftype, fname in (("DIST", "small-2.tar.gz"),
+				("DIST", "large-3.tar.gz"), ("MISC", "metadata.xml")):
+				os.unlink(mf._getAbsname(ftype, fname))
+
+			expected = self._sequential_failures(mf, entries)
+			self.assertEqual(len(expected), 7)
+			for max_jobs in (1, 4):
+				self.assertEqual(self._parallel_failures(mf, entries,
+					max_jobs=max_jobs), expected)
+			self.assertEqual(self._parallel_failures(mf, None,
+				max_jobs=4, ignoreMissingFiles=True),
+				[x for x in expected if x[2] is not FileNotFound])
+
+			# Failures are streamed, and the remaining entries are
+			# cancelled when the generator is closed.
+			failures = mf.checkHashesParallel(entries, max_jobs=2)
+			ftype, fname, e = next(failures)
+			self.assertTrue((ftype, fname) in
+				[(x[0], x[1]) for x in expected])
+			failures.close()
+		finally:
+			shutil.rmtree(tmpdir)
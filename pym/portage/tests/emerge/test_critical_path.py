@@ -0,0 +1,266 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from __future__ import unicode_literals
+
+import io
+import tempfile
+import time
+
+import _emerge.emergelog
+from _emerge.BuildDurations import BuildDurations
+from _emerge.JobMemoryMonitor import JobMemoryMonitor
+from _emerge.Scheduler import Scheduler
+from portage import os
+from portage import shutil
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+class CriticalPathTestCase(TestCase):
+
+	_emerge_log = (
+		"1000:  >>> emerge (1 of 3) dev-libs/long-0 to /",
+		"1000:  >>> emerge (2 of 3) dev-libs/short-1 to /",
+		"1010:  ::: completed emerge (2 of 3) dev-libs/short-1 to /",
+		"1500:  *** terminating.",
+		"2000:  >>> emerge (1 of 2) dev-libs/long-0 to /",
+		"2000:  === (1 of 2) Compiling/Merging (dev-libs/long-0::test_repo)",
+		"3000:  ::: completed emerge (1 of 2) dev-libs/long-0 to /",
+		"3000:  >>> emerge (2 of 2) app-misc/top-1 to /",
+		"3490:  ::: completed emerge (2 of 2) app-misc/top-1 to /",
+	)
+
+	def testBuildDurations(self):
+		tempdir = tempfile.mkdtemp()
+		try:
+			log_path = os.path.join(tempdir, "emerge.log")
+			with io.open(log_path, mode="w") as f:
+				for line in self._emerge_log:
+					f.write("%s\n" % line)
+
+			durations = BuildDurations()
+			durations.load_emerge_log(os.path.join(tempdir, "missing.log"))
+			self.assertEqual(len(durations), 0)
+			self.assertEqual(durations.mean(), None)
+
+			durations.load_emerge_log(log_path)
+			self.assertEqual(len(durations), 3)
+			self.assertEqual(durations.get("dev-libs/long-0"), 1000)
+			self.assertEqual(durations.get("dev-libs/long-1"), 1000)
+			self.assertEqual(durations.get("dev-libs/short-1"), 10)
+			self.assertEqual(durations.get("app-misc/top-1"), 490)
+			self.assertEqual(durations.get("app-misc/other-1", 1), 1)
+			self.assertEqual(durations.mean(), 500)
+
+			# Records in the database take precedence over emerge.log.
+			durations = BuildDurations(os.path.join(tempdir,
+				"build_durations.sqlite"))
+			durations.load_emerge_log(log_path)
+			if durations._db_module is None:
+				self.skipTest("sqlite is unavailable")
+			use_hash = durations.use_hash(["a", "b"])
+			self.assertEqual(use_hash, durations.use_hash(["b", "a"]))
+			self.assertTrue(durations.record("dev-libs/long-1", "build",
+				100, use_hash=use_hash, timestamp=1))
+			self.assertTrue(durations.record("dev-libs/long-1", "build",
+				300, use_hash=use_hash, timestamp=2))
+			self.assertTrue(durations.record("dev-libs/long-1", "build",
+				50, timestamp=3))
+			self.assertTrue(durations.record("dev-libs/long-1", "merge",
+				10, use_hash=use_hash, timestamp=2))
+
+			self.assertEqual(durations.lookup("dev-libs/long-1", "build",
+				use_hash=use_hash), 300)
+			self.assertEqual(durations.lookup("dev-libs/long-1", "build"), 50)
+			self.assertEqual(durations.lookup("dev-libs/long-2", "build"), 50)
+			self.assertEqual(durations.lookup("dev-libs/long-1", "fetch"), None)
+			self.assertEqual(durations.estimate("dev-libs/long-1",
+				("build", "merge"), use_hash=use_hash), 310)
+			self.assertEqual(durations.estimate("app-misc/top-1",
+				("build", "merge")), 490)
+			self.assertEqual(durations.estimate("app-misc/other-1",
+				("build", "merge"), default=1), 1)
+			self.assertEqual(durations.mean(), (60 + 10 + 490) / 3.0)
+			self.assertEqual(durations.records(cp="dev-libs/long"), [
+				("dev-libs/long-1", "", "build", 50, 50, 1, 3),
+				("dev-libs/long-1", use_hash, "build", 300, 200, 2, 2),
+				("dev-libs/long-1", use_hash, "merge", 10, 10, 1, 2),
+			])
+		finally:
+			shutil.rmtree(tempdir)
+
+	def testEmergeLogImport(self):
+		tempdir = tempfile.mkdtemp()
+		try:
+			log_path = os.path.join(tempdir, "emerge.log")
+			db_path = os.path.join(tempdir, "build_durations.sqlite")
+			with io.open(log_path, mode="w") as f:
+				for line in self._emerge_log:
+					f.write("%s\n" % line)
+
+			durations = BuildDurations(db_path)
+			if durations._db_module is None:
+				self.skipTest("sqlite is unavailable")
+			durations.load_emerge_log(log_path)
+			self.assertEqual(len(durations), 3)
+			self.assertEqual(durations._cp_durations, {})
+			self.assertEqual(durations.get("dev-libs/short-1"), 10)
+			self.assertEqual(durations.mean(), 500)
+
+			# Only appended lines are read, and a partial line is read
+			# when it is complete.
+			with io.open(log_path, mode="r+") as f:
+				f.write("1001")
+			with io.open(log_path, mode="a") as f:
+				f.write("4000:  >>> emerge (1 of 1) dev-libs/new-1 to /\n"
+					"4100:  ::: completed emerge (1 of 1) dev-libs/new-1 to /")
+			durations.load_emerge_log(log_path)
+			self.assertEqual(durations.get("dev-libs/new-1"), None)
+			with io.open(log_path, mode="a") as f:
+				f.write("\n")
+			durations = BuildDurations(db_path)
+			durations.load_emerge_log(log_path)
+			self.assertEqual(durations.get("dev-libs/new-1"), 100)
+			self.assertEqual(durations.get("dev-libs/short-1"), 10)
+
+			# A new file is read from the beginning.
+			with io.open(log_path + ".new", mode="w") as f:
+				f.write("1000:  >>> emerge (1 of 1) dev-libs/short-1 to /\n"
+					"1020:  ::: completed emerge (1 of 1) dev-libs/short-1 to /\n")
+			os.rename(log_path + ".new", log_path)
+			durations.load_emerge_log(log_path)
+			self.assertEqual(durations.get("dev-libs/short-1"), 20)
+			self.assertEqual(durations.get("dev-libs/new-1"), 100)
+			self.assertEqual(len(durations), 4)
+
+			# If the database can't be created, then emerge.log is only
+			# read into the instance.
+			durations = BuildDurations(os.path.join(log_path, "cache",
+				"build_durations.sqlite"))
+			durations.load_emerge_log(log_path)
+			self.assertEqual(durations.get("dev-libs/short-1"), 20)
+			self.assertEqual(len(durations), 1)
+			self.assertFalse(durations.record("dev-libs/short-1",
+				"build", 10))
+		finally:
+			shutil.rmtree(tempdir)
+
+	def testJobMemoryMonitor(self):
+		if not JobMemoryMonitor.available():
+			self.skipTest("/proc/meminfo is unavailable")
+
+		class FakePackage(object):
+			def __init__(self, cpv, use=()):
+				self.cpv = cpv
+				self.use = self
+				self.enabled = frozenset(use)
+
+		tempdir = tempfile.mkdtemp()
+		try:
+			durations = BuildDurations(os.path.join(tempdir,
+				"build_durations.sqlite"))
+			if durations._db_module is None:
+				self.skipTest("sqlite is unavailable")
+			monitor = JobMemoryMonitor(durations)
+			available = monitor._mem_available()
+			big = FakePackage("dev-libs/big-1", use=["x"])
+			small = FakePackage("dev-libs/small-1")
+			other = FakePackage("dev-libs/other-1")
+
+			# The memory usage of this process is sampled, and the
+			# peak is recorded when the job exits.
+			monitor.sample([(big, os.getpid()), (small, None)])
+			self.assertTrue(monitor._current[big] > 0)
+			self.assertEqual(monitor._current[small], 0)
+			monitor.job_exit(small, True)
+			self.assertEqual(durations.records(), [])
+			monitor.job_exit(big, False)
+			self.assertEqual(durations.records(), [])
+			monitor._peaks[big] = available * 2
+			monitor.job_exit(big, True)
+			self.assertEqual(durations.lookup(big.cpv, "memory",
+				use_hash=durations.use_hash(["x"])), available * 2)
+			durations.record(small.cpv, "memory", 0)
+
+			# Packages without records take the mean. The available
+			# memory is fixed, since it changes between samples.
+			monitor = JobMemoryMonitor(durations)
+			monitor._mem_available = lambda: available
+			self.assertEqual(monitor.predict(big), available * 2)
+			self.assertEqual(monitor.predict(small), 0)
+			self.assertEqual(monitor.predict(other), available)
+			self.assertFalse(monitor.fits(big, []))
+			self.assertTrue(monitor.fits(small, [other]))
+			self.assertFalse(monitor.fits(small, [big]))
+			monitor._current[big] = available * 2
+			self.assertTrue(monitor.fits(small, [big]))
+		finally:
+			shutil.rmtree(tempdir)
+
+	def testCriticalPath(self):
+
+		ebuilds = {
+			"dev-libs/short-1": {"EAPI": "5"},
+			"dev-libs/long-1": {"EAPI": "5"},
+			"app-misc/top-1": {"EAPI": "5", "DEPEND": "dev-libs/long"},
+			"app-misc/meta-1": {
+				"EAPI": "5",
+				"RDEPEND": "dev-libs/short app-misc/top",
+			},
+		}
+
+		playground = ResolverPlayground(ebuilds=ebuilds)
+		emerge_log_dir = _emerge.emergelog._emerge_log_dir
+		try:
+			_emerge.emergelog._emerge_log_dir = playground.eroot
+			with io.open(os.path.join(playground.eroot, "emerge.log"),
+				mode="w") as f:
+				for line in self._emerge_log:
+					f.write("%s\n" % line)
+
+			result = playground.run(["app-misc/meta"])
+			self.assertEqual(result.success, True)
+			depgraph = result.depgraph
+			settings = playground.settings
+			scheduler = Scheduler(settings, playground.trees, {},
+				{"--jobs": 3}, None,
+				graph_config=depgraph.schedulerGraph())
+			scheduler._status_display.quiet = True
+
+			weights = dict((pkg.cpv, weight) for pkg, weight in
+				scheduler._pkg_weights.items())
+			# Packages without a record take the mean duration.
+			self.assertEqual(weights, {
+				"app-misc/meta-1": 500,
+				"app-misc/top-1": 990,
+				"dev-libs/long-1": 1990,
+				"dev-libs/short-1": 510,
+			})
+
+			# The critical path is started first, and packages that
+			# depend on running merges are not chosen.
+			scheduler._add_packages()
+			status_display = scheduler._status_display
+			pkg = scheduler._choose_pkg()
+			self.assertEqual(pkg.cpv, "dev-libs/long-1")
+			scheduler._running_tasks[id(pkg)] = pkg
+			scheduler._pkg_start_times[pkg] = time.time() - 1000
+			scheduler._update_eta()
+			self.assertEqual(status_display.critical_path, 990)
+			pkg = scheduler._choose_pkg()
+			self.assertEqual(pkg.cpv, "dev-libs/short-1")
+			scheduler._pkg_start_times[pkg] = time.time()
+			self.assertEqual(scheduler._choose_pkg(), None)
+			scheduler._update_eta()
+
+			# The remaining durations of all packages are divided among
+			# the jobs, unless that is shorter than the critical path.
+			self.assertEqual(int(round(status_display.eta_time -
+				time.time())), 990)
+			scheduler._set_max_jobs(1)
+			scheduler._update_eta()
+			self.assertEqual(int(round(status_display.eta_time -
+				time.time())), 490 + 500 + 10)
+		finally:
+			_emerge.emergelog._emerge_log_dir = emerge_log_dir
+			playground.cleanup()
@@ -124,6 +124,18 @@ pkg_preinst() {
 				"KEYWORDS": "x86",
 				"LICENSE": "GPL-2",
 			},
+			"dev-libs/unmerge-me-1": {
+				"EAPI" : "5",
+				"KEYWORDS": "x86",
+				"LICENSE": "GPL-2",
+				"MISC_CONTENT": install_something,
+			},
+			"app-misc/unmerge-me-1": {
+				"EAPI" : "5",
+				"KEYWORDS": "x86",
+				"LICENSE": "GPL-2",
+				"RDEPEND": "dev-libs/unmerge-me",
+			},
 		}
 
 		installed = {
@@ -181,6 +193,7 @@ pkg_preinst() {
 		eroot = settings["EROOT"]
 		trees = playground.trees
 		portdb = trees[eroot]["porttree"].dbapi
+		vardb = trees[eroot]["vartree"].dbapi
 		test_repo_location = settings.repositories["test_repo"].location
 		var_cache_edb = os.path.join(eprefix, "var", "cache", "edb")
 		cachedir = os.path.join(var_cache_edb, "dep")
@@ -282,6 +295,11 @@ pkg_preinst() {
 			emerge_cmd + ("--pretend", "--depclean", "--verbose", "dev-libs/B"),
 			emerge_cmd + ("--pretend", "--depclean",),
 			emerge_cmd + ("--depclean",),
+			lambda: self.assertEqual([], vardb.match("dev-libs/depclean-me")),
+			emerge_cmd + ("--oneshot", "app-misc/unmerge-me"),
+			emerge_cmd + ("--depclean", "--unmerge-jobs", "2"),
+			lambda: self.assertEqual([], vardb.match("dev-libs/unmerge-me")),
+			lambda: self.assertEqual([], vardb.match("app-misc/unmerge-me")),
 			quickpkg_cmd + ("--include-config", "y", "dev-libs/A",),
 			# Test bug #523684, where a file renamed or removed by the
 			# admin forces replacement files to be merged with config
@@ -306,6 +324,7 @@ pkg_preinst() {
 			portageq_cmd + ("metadata", eroot, "binary", "dev-libs/A-1", "EAPI", "USE", "RDEPEND"),
 			portageq_cmd + ("metadata", eroot, "installed", "dev-libs/A-1", "EAPI", "USE", "RDEPEND"),
 			portageq_cmd + ("owners", eroot, eroot + "usr"),
+			portageq_cmd + ("build_durations", eroot, "dev-libs/A"),
 			emerge_cmd + ("-p", eroot + "usr"),
 			emerge_cmd + ("-p", "--unmerge", "-q", eroot + "usr"),
 			emerge_cmd + ("--unmerge", "--quiet", "dev-libs/A"),
@@ -315,6 +334,10 @@ pkg_preinst() {
 			# Verify that the above --autounmask-continue command caused
 			# USE=flag to be applied correctly to dev-libs/D.
 			portageq_cmd + ("match", eroot, "dev-libs/D[flag]"),
+			emerge_cmd + ("-C", "--quiet", "--unmerge-jobs=2",
+				"dev-libs/C", "dev-libs/D"),
+			lambda: self.assertEqual([], vardb.match("dev-libs/C")),
+			lambda: self.assertEqual([], vardb.match("dev-libs/D")),
 
 			# Test cross-prefix usage, including chpathtool for binpkgs.
 			({"EPREFIX" : cross_prefix},) + \
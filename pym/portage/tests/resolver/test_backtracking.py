@@ -1,6 +1,9 @@
-# Copyright 2010-2015 Gentoo Foundation
+# Copyright 2010-2016 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
+import copy
+
+from _emerge.resolver.backtracking import Backtracker
 from portage.tests import TestCase
 from portage.tests.resolver.ResolverPlayground import ResolverPlayground, ResolverPlaygroundTestCase
 
@@ -177,3 +180,85 @@ class BacktrackingTestCase(TestCase):
 				self.assertEqual(test_case.test_success, True, test_case.fail_msg)
 		finally:
 			playground.cleanup()
+
+	def testBacktrackJobs(self):
+		"""
+		Ensure that --backtrack-jobs does not influence the result.
+		"""
+
+		ebuilds = {
+			"dev-libs/A-1": { },
+			"dev-libs/A-2": { },
+			"dev-libs/B-1": { "RDEPEND": "dev-libs/D"},
+			"dev-libs/C-1": { },
+			"dev-libs/C-2": { "RDEPEND": ">=dev-libs/A-2" },
+			"dev-libs/D-1": { "RDEPEND": "<dev-libs/A-2" },
+			}
+
+		installed = {
+			"dev-libs/A-1": { },
+			"dev-libs/B-1": { "RDEPEND": "dev-libs/D" },
+			"dev-libs/C-1": { },
+			"dev-libs/D-1": { "RDEPEND": "<dev-libs/A-2" },
+			}
+
+		world = ["dev-libs/B", "dev-libs/C"]
+
+		test_cases = []
+		for backtrack_jobs in (1, 2, 4):
+			test_cases.append(ResolverPlaygroundTestCase(
+				["@world"],
+				options = {
+					'--backtrack': 6,
+					'--backtrack-jobs': backtrack_jobs,
+					'--deep' : True,
+					'--selective' : True,
+					'--update' : True,
+				},
+				mergelist = [],
+				success = True))
+
+		playground = ResolverPlayground(ebuilds=ebuilds, installed=installed, world=world)
+
+		try:
+			for test_case in test_cases:
+				playground.run_TestCase(test_case)
+				self.assertEqual(test_case.test_success, True, test_case.fail_msg)
+		finally:
+			playground.cleanup()
+
+	def testBacktrackJobsSharedNodes(self):
+		"""
+		Sibling subtrees can add equal nodes, which the serial loop only
+		explores once. Since the processes forked by --backtrack-jobs do
+		not know about the nodes of their siblings, check that
+		Backtracker.node_keys reveals the overlap.
+		"""
+
+		def slot_conflict(*pkgs):
+			return {"slot conflict": [[(pkg, set([("P", pkg.lower())]))
+				for pkg in pkgs]]}
+
+		backtracker = Backtracker(2)
+		backtracker.get()
+		backtracker.feedback(slot_conflict("A", "B"))
+		self.assertEqual(backtracker.get_candidates(), [(1,), (0,)])
+		conflicts = {(1,): "A", (0,): "B"}
+
+		node_keys = []
+		for path in backtracker.get_candidates():
+			child = copy.deepcopy(backtracker)
+			child.restrict(path)
+			node_count = child.node_count()
+			child.get()
+			child.feedback(slot_conflict(conflicts[path]))
+			node_keys.append(child.node_keys(node_count))
+		self.assertEqual(len(node_keys[0]), 1)
+		self.assertEqual(node_keys[0], node_keys[1])
+
+		# The serial loop does not add the node for the second subtree.
+		node_count = backtracker.node_count()
+		for path in backtracker.get_candidates():
+			backtracker.get(path=path)
+			backtracker.feedback(slot_conflict(conflicts[path]))
+		self.assertEqual(backtracker.node_count(), node_count + 1)
@@ -0,0 +1,63 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from portage.dep import Atom
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+from _emerge.create_depgraph_params import create_depgraph_params
+from _emerge.depgraph import backtrack_depgraph
+
+class PackageIndexTestCase(TestCase):
+
+	def testPackageIndex(self):
+
+		ebuilds = {
+			"dev-libs/A-1": {},
+			"dev-libs/A-1::repo1": {},
+			"dev-libs/A-2::repo1": {"SLOT": "2"},
+			"dev-libs/A-3": {"SLOT": "2"},
+			"dev-libs/B-1::repo2": {},
+		}
+
+		# Each atom is mapped to the expected (cpv, repo) pairs,
+		# in the order that _iter_match_pkgs yields them.
+		expected = (
+			("dev-libs/A", [("dev-libs/A-3", "test_repo"),
+				("dev-libs/A-2", "repo1"), ("dev-libs/A-1", "repo1"),
+				("dev-libs/A-1", "test_repo")]),
+			("dev-libs/A:2", [("dev-libs/A-3", "test_repo"),
+				("dev-libs/A-2", "repo1")]),
+			("<dev-libs/A-3", [("dev-libs/A-2", "repo1"),
+				("dev-libs/A-1", "repo1"), ("dev-libs/A-1", "test_repo")]),
+			("=dev-libs/A-1::repo1", [("dev-libs/A-1", "repo1")]),
+			("dev-libs/A:0::test_repo", [("dev-libs/A-1", "test_repo")]),
+			("dev-libs/B", [("dev-libs/B-1", "repo2")]),
+			("dev-libs/C", []),
+		)
+
+		playground = ResolverPlayground(ebuilds=ebuilds)
+		try:
+			options = {}
+			params = create_depgraph_params(options, None)
+			success, depgraph, favorites = backtrack_depgraph(
+				playground.settings, playground.trees, options, params,
+				None, ["dev-libs/B"], None)
+			self.assertEqual(success, True)
+
+			root_config = playground.trees[playground.eroot]["root_config"]
+			# Query twice, in order to check results from the index.
+			for i in range(2):
+				for atom, pkgs in expected:
+					result = [(pkg.cpv, pkg.repo) for pkg in
+						depgraph._iter_match_pkgs(root_config, "ebuild",
+						Atom(atom, allow_repo=True))]
+					self.assertEqual(result, pkgs,
+						"%s: %s != %s" % (atom, result, pkgs))
+
+			# A-2 only exists in repo1, so lookups for other repos
+			# are remembered as missing.
+			missing = depgraph._frozen_config._pkg_index_missing
+			self.assertTrue((playground.eroot, "ebuild", "dev-libs/A-2",
+				None, "test_repo") in missing)
+		finally:
+			playground.cleanup()
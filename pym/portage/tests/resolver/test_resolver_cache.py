@@ -0,0 +1,89 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import time
+
+from portage import os
+from portage.data import secpass
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import (ResolverPlayground,
+	ResolverPlaygroundTestCase)
+from _emerge.create_depgraph_params import create_depgraph_params
+from _emerge.ResolverCache import ResolverCache
+
+class ResolverCacheTestCase(TestCase):
+
+	def testResolverCache(self):
+
+		ebuilds = {
+			"dev-libs/A-1": {},
+			"dev-libs/A-2": {"RDEPEND": "dev-libs/B"},
+			"dev-libs/B-1": {},
+			"dev-libs/Z-1": {},
+		}
+
+		installed = {
+			"dev-libs/A-1": {},
+		}
+
+		world = ["dev-libs/A"]
+
+		options = {
+			"--update": True,
+			"--deep": True,
+			"--resolver-cache": "y",
+		}
+
+		test_case = ResolverPlaygroundTestCase(
+			["@world"],
+			options=options,
+			success=True,
+			mergelist=["dev-libs/B-1", "dev-libs/A-2"])
+
+		playground = ResolverPlayground(ebuilds=ebuilds,
+			installed=installed, world=world)
+
+		def cache_entry():
+			myopts = options.copy()
+			myopts["--pretend"] = True
+			myparams = create_depgraph_params(myopts, None)
+			return ResolverCache(playground.settings, playground.trees,
+				myopts, myparams, None, ["@world"]).get()
+
+		def touch(cpv):
+			cat, pf = cpv.split("/")
+			pn = pf.rsplit("-", 1)[0]
+			ebuild_path = os.path.join(
+				playground.settings.repositories["test_repo"].location,
+				cat, pn, pf + ".ebuild")
+			mtime = time.time() + 10
+			os.utime(ebuild_path, (mtime, mtime))
+
+		try:
+			self.assertEqual(ResolverCache.eligible(options, ["@world"]), True)
+			self.assertEqual(ResolverCache.eligible(options, ["dev-libs/A"]),
+				False)
+
+			# The first run populates the cache, and the second one
+			# is satisfied from the cache.
+			for i in range(2):
+				playground.run_TestCase(test_case)
+				self.assertEqual(test_case.test_success, True,
+					test_case.fail_msg)
+
+			if secpass >= 2:
+				self.assertNotEqual(cache_entry(), None)
+
+				# An ebuild that was not considered does not
+				# invalidate the entry.
+				touch("dev-libs/Z-1")
+				self.assertNotEqual(cache_entry(), None)
+
+				touch("dev-libs/B-1")
+				self.assertEqual(cache_entry(), None)
+
+			playground.run_TestCase(test_case)
+			self.assertEqual(test_case.test_success, True,
+				test_case.fail_msg)
+		finally:
+			playground.cleanup()
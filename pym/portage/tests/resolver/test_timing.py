@@ -0,0 +1,57 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import io
+import json
+
+from portage import os, _encodings
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import (ResolverPlayground,
+	ResolverPlaygroundTestCase)
+
+class ResolverTimingTestCase(TestCase):
+
+	def testResolverTiming(self):
+
+		ebuilds = {
+			"dev-libs/A-1": {"RDEPEND": "dev-libs/B"},
+			"dev-libs/B-1": {},
+		}
+
+		installed = {
+			"dev-libs/B-1": {},
+		}
+
+		playground = ResolverPlayground(ebuilds=ebuilds,
+			installed=installed)
+		report_file = os.path.join(playground.eroot, "timing.json")
+
+		test_case = ResolverPlaygroundTestCase(
+			["dev-libs/A"],
+			options={"--debug-timing": report_file},
+			success=True,
+			mergelist=["dev-libs/A-1"])
+
+		try:
+			playground.run_TestCase(test_case)
+			self.assertEqual(test_case.test_success, True,
+				test_case.fail_msg)
+
+			with io.open(report_file, mode='r',
+				encoding=_encodings['repo.content']) as f:
+				report = json.load(f)
+
+			self.assertEqual(report["version"], "1")
+			for phase in ("_load_vdb", "_create_graph",
+				"_complete_graph", "_serialize_tasks"):
+				self.assertTrue(report["phases"][phase]["calls"] >= 1,
+					phase)
+			self.assertTrue(report["dbapi"]["porttree.aux_get"]["calls"] >= 1)
+			self.assertEqual(len(report["backtrack"]), 1)
+			self.assertEqual(report["backtrack"][0]["success"], True)
+
+			# The dbapi instances are restored after the calculation.
+			portdb = playground.trees[playground.eroot]["porttree"].dbapi
+			self.assertFalse("aux_get" in vars(portdb))
+		finally:
+			playground.cleanup()
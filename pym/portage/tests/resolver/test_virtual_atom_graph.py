@@ -0,0 +1,62 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import portage
+from portage.dep import Atom
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+from portage.util.digraph import digraph
+
+class VirtualAtomGraphTestCase(TestCase):
+
+	def testIdenticalVirtualRdepend(self):
+		"""
+		The atoms of virtuals with identical RDEPEND strings must be
+		distinct nodes of the atom_graph of dep_check, even though the
+		parsed dependency strings are cached by use_reduce. The virtuals
+		are in different slots, so that both of them are expanded.
+		"""
+		ebuilds = {
+			"app-misc/P-1": {"EAPI": "5", "RDEPEND": "virtual/v"},
+			"virtual/v-1": {"EAPI": "5", "SLOT": "1",
+				"RDEPEND": "dev-libs/A"},
+			"virtual/v-2": {"EAPI": "5", "SLOT": "2",
+				"RDEPEND": "dev-libs/A"},
+			"dev-libs/A-1": {"EAPI": "5"},
+		}
+		playground = ResolverPlayground(ebuilds=ebuilds)
+		try:
+			result = playground.run(["app-misc/P"])
+			self.assertEqual(result.success, True)
+			depgraph = result.depgraph
+			eroot = playground.eroot
+			parent, existing_node = depgraph._select_package(eroot,
+				Atom("app-misc/P"))
+
+			trees = depgraph._dynamic_config._filtered_trees
+			mytrees = trees[eroot]
+			atom_graph = digraph()
+			mytrees["pkg_use_enabled"] = depgraph._pkg_use_enabled
+			mytrees["parent"] = parent
+			mytrees["atom_graph"] = atom_graph
+			try:
+				mycheck = portage.dep_check("virtual/v", None,
+					depgraph._frozen_config.pkgsettings[eroot],
+					myuse=[], myroot=eroot, trees=trees)
+			finally:
+				for k in ("pkg_use_enabled", "parent", "atom_graph"):
+					mytrees.pop(k, None)
+			self.assertEqual(mycheck[0], 1)
+
+			virtuals = [node for node in atom_graph
+				if getattr(node, "cp", None) == "virtual/v"]
+			self.assertEqual(sorted(pkg.cpv for pkg in virtuals),
+				["virtual/v-1", "virtual/v-2"])
+			for pkg in virtuals:
+				atom_nodes = atom_graph.child_nodes(pkg)
+				self.assertEqual([node[0] for node in atom_nodes],
+					["dev-libs/A"])
+				for node in atom_nodes:
+					self.assertEqual(atom_graph.parent_nodes(node), [pkg])
+		finally:
+			playground.cleanup()
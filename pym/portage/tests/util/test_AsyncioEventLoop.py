@@ -0,0 +1,99 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import signal
+import subprocess
+import threading
+
+from portage import os
+from portage.tests import TestCase
+from portage.util._async.PopenProcess import PopenProcess
+from portage.util._eventloop.AsyncioEventLoop import AsyncioEventLoop
+from _emerge.PipeReader import PipeReader
+
+class AsyncioEventLoopTestCase(TestCase):
+
+	def testPipeReader(self):
+		if not AsyncioEventLoop.available():
+			self.skipTest("asyncio is unavailable")
+		event_loop = AsyncioEventLoop()
+		try:
+			master_fd, slave_fd = os.pipe()
+			master_file = os.fdopen(master_fd, 'rb', 0)
+			consumer = PipeReader(input_files={"producer": master_file},
+				scheduler=event_loop)
+			producer = PopenProcess(pipe_reader=consumer,
+				proc=subprocess.Popen(["bash", "-c",
+				"echo -n a; sleep 0.1; echo -n b; exit 3"], stdout=slave_fd),
+				scheduler=event_loop)
+			producer.start()
+			os.close(slave_fd)
+			producer.wait()
+			self.assertEqual(producer.returncode, 3)
+			self.assertEqual(consumer.returncode, os.EX_OK)
+			self.assertEqual(consumer.getvalue(), b"ab")
+		finally:
+			event_loop.close()
+
+	def testChildWatch(self):
+		if not AsyncioEventLoop.available():
+			self.skipTest("asyncio is unavailable")
+		event_loop = AsyncioEventLoop()
+		try:
+			proc = PopenProcess(proc=subprocess.Popen(["sleep", "10"]),
+				scheduler=event_loop)
+			proc.start()
+			os.kill(proc.pid, signal.SIGTERM)
+			self.assertEqual(proc.wait(), -signal.SIGTERM)
+
+			# Nested iteration calls from callbacks, like SubProcess.wait()
+			# from the exit listener of another process.
+			results = []
+			def exit_listener(task):
+				results.append(second.wait())
+			first = PopenProcess(proc=subprocess.Popen(["true"]),
+				scheduler=event_loop)
+			second = PopenProcess(proc=subprocess.Popen(["sleep", "0.1"]),
+				scheduler=event_loop)
+			first.addExitListener(exit_listener)
+			second.start()
+			first.start()
+			while not results:
+				event_loop.iteration()
+			self.assertEqual(results, [os.EX_OK])
+			self.assertEqual(first.returncode, os.EX_OK)
+		finally:
+			event_loop.close()
+
+	def testTimeouts(self):
+		if not AsyncioEventLoop.available():
+			self.skipTest("asyncio is unavailable")
+		event_loop = AsyncioEventLoop()
+		try:
+			calls = []
+			def timeout_cb(name, count):
+				calls.append(name)
+				return calls.count(name) < count
+			event_loop.timeout_add(10, timeout_cb, "a", 3)
+			removed_id = event_loop.timeout_add(10, timeout_cb, "b", 3)
+			idle_id = event_loop.idle_add(timeout_cb, "idle", 2)
+			self.assertTrue(event_loop.source_remove(removed_id))
+			self.assertFalse(event_loop.source_remove(removed_id))
+			while calls.count("a") < 3:
+				event_loop.iteration()
+			self.assertEqual(calls.count("b"), 0)
+			self.assertEqual(calls.count("idle"), 2)
+			self.assertFalse(event_loop.source_remove(idle_id))
+			self.assertFalse(event_loop.iteration(False))
+			# Without any event sources, iteration does not block.
+			self.assertFalse(event_loop.iteration())
+
+			# idle_add is thread-safe.
+			thread = threading.Thread(target=event_loop.idle_add,
+				args=(timeout_cb, "thread", 1))
+			thread.start()
+			thread.join()
+			while "thread" not in calls:
+				event_loop.iteration()
+		finally:
+			event_loop.close()
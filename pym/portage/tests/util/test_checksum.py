@@ -0,0 +1,124 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import hashlib
+import shutil
+import tempfile
+
+from portage import os
+from portage import checksum
+from portage.const import HASHING_BLOCKSIZE
+from portage.exception import DigestException, FileNotFound
+from portage.tests import TestCase
+
+class ChecksumTestCase(TestCase):
+
+	def testMultipleChecksums(self):
+		"""
+		Check that multiple checksums are computed in a single pass
+		over the file, with and without threads.
+		"""
+		tmpdir = tempfile.mkdtemp()
+		try:
+			filename = os.path.join(tmpdir, "distfile")
+			content = "".join("%d\n" % i
+				for i in range(40000)).encode("ascii")
+			self.assertTrue(len(content) > 3 * HASHING_BLOCKSIZE)
+			with open(filename, "wb") as f:
+				f.write(content)
+
+			hashes = ["MD5", "SHA1", "SHA256", "SHA512", "size"]
+			expected = {
+				"MD5": hashlib.md5(content).hexdigest(),
+				"SHA1": hashlib.sha1(content).hexdigest(),
+				"SHA256": hashlib.sha256(content).hexdigest(),
+				"SHA512": hashlib.sha512(content).hexdigest(),
+				"size": len(content),
+			}
+
+			opened = []
+			open_file = checksum._open_file
+			def counting_open_file(filename):
+				opened.append(filename)
+				return open_file(filename)
+			checksum._open_file = counting_open_file
+			try:
+				self.assertEqual(checksum.perform_multiple_checksums(
+					filename, hashes), expected)
+				self.assertEqual(len(opened), 1)
+				del opened[:]
+				self.assertEqual(checksum.verify_all(filename, expected),
+					(True, "Reason unknown"))
+				self.assertEqual(len(opened), 1)
+			finally:
+				checksum._open_file = open_file
+
+			for threaded in (False, True):
+				results = checksum._checksum_file(filename, hashes,
+					threaded=threaded)
+				self.assertEqual(dict((k, v[0])
+					for k, v in results.items()), expected)
+				self.assertEqual(results["SHA512"][1], len(content))
+
+			self.assertEqual(checksum.perform_checksum(filename, "SHA256"),
+				(expected["SHA256"], len(content)))
+
+			wrong = dict(expected)
+			wrong["SHA512"] = hashlib.sha512(b"").hexdigest()
+			ok, reason = checksum.verify_all(filename, wrong)
+			self.assertFalse(ok)
+			self.assertEqual(reason, ("Failed on SHA512 verification",
+				expected["SHA512"], wrong["SHA512"]))
+			self.assertRaises(DigestException, checksum.verify_all,
+				filename, wrong, strict=1)
+
+			self.assertRaises(DigestException,
+				checksum.perform_multiple_checksums, filename,
+				["SHA256", "UNKNOWN"])
+			self.assertRaises(FileNotFound,
+				checksum.perform_multiple_checksums,
+				os.path.join(tmpdir, "missing"), ["SHA256", "SHA512"])
+		finally:
+			shutil.rmtree(tmpdir)
+
+	def testHashProviders(self):
+		"""
+		Check that the preferred implementation of each hash function
+		is used, and that unaccelerated ones are filtered.
+		"""
+		for hashtype in checksum.hashfunc_map:
+			if hashtype == "size" or \
+				checksum.get_hash_origin(hashtype) == "python-fchksum":
+				continue
+			providers = checksum.get_hash_providers(hashtype)
+			self.assertEqual(checksum.get_hash_origin(hashtype),
+				providers[0])
+			if "hashlib" in providers:
+				self.assertEqual(providers[0], "hashlib")
+		self.assertTrue("bundled" in
+			checksum.get_hash_providers("WHIRLPOOL"))
+		self.assertRaises(KeyError, checksum.get_hash_providers, "UNKNOWN")
+
+		if "BLAKE2B" in checksum.hashfunc_map:
+			tmpdir = tempfile.mkdtemp()
+			try:
+				filename = os.path.join(tmpdir, "distfile")
+				with open(filename, "wb") as f:
+					f.write(b"content")
+				self.assertEqual(checksum.perform_checksum(filename,
+					"BLAKE2B")[0],
+					hashlib.new("blake2b", b"content").hexdigest())
+			finally:
+				shutil.rmtree(tmpdir)
+
+		unaccelerated_hashes = checksum._unaccelerated_hashes
+		checksum._unaccelerated_hashes = frozenset(["WHIRLPOOL", "SHA512"])
+		try:
+			self.assertEqual(checksum._filter_unaccelarated_hashes(
+				{"SHA256": "a", "SHA512": "b", "WHIRLPOOL": "c", "size": 1}),
+				{"SHA256": "a", "size": 1})
+			digests = {"SHA512": "b", "WHIRLPOOL": "c", "size": 1}
+			self.assertEqual(checksum._filter_unaccelarated_hashes(digests),
+				digests)
+		finally:
+			checksum._unaccelerated_hashes = unaccelerated_hashes
@@ -0,0 +1,108 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import hashlib
+import shutil
+import tempfile
+import time
+
+from portage import os
+from portage import checksum
+from portage.cache.index.digest_cache import DigestCache
+from portage.tests import TestCase
+
+class DigestCacheTestCase(TestCase):
+
+	def testDigestCache(self):
+
+		if not DigestCache.available():
+			self.skipTest("sqlite is unavailable")
+
+		tmpdir = tempfile.mkdtemp()
+		opened = []
+		open_file = checksum._open_file
+		def counting_open_file(filename):
+			opened.append(filename)
+			return open_file(filename)
+		checksum._open_file = counting_open_file
+		try:
+			filename = os.path.join(tmpdir, "distfile")
+
+			def write(content, age=10):
+				with open(filename, "wb") as f:
+					f.write(content)
+				mtime = time.time() - age
+				os.utime(filename, (mtime, mtime))
+				return {
+					"SHA256": hashlib.sha256(content).hexdigest(),
+					"SHA512": hashlib.sha512(content).hexdigest(),
+					"size": len(content),
+				}
+
+			def verify(digests, cache):
+				del opened[:]
+				return checksum.verify_all(filename, digests,
+					digest_cache=cache)[0]
+
+			cache = DigestCache(tmpdir)
+			digests = write(b"content 1")
+			self.assertTrue(verify(digests, cache))
+			self.assertEqual(len(opened), 1)
+			self.assertTrue(verify(digests, cache))
+			self.assertEqual(len(opened), 0)
+
+			# The cache persists, and digests of other hash types are
+			# computed and added.
+			cache = DigestCache(tmpdir)
+			md5 = dict(digests)
+			md5["MD5"] = hashlib.md5(b"content 1").hexdigest()
+			self.assertTrue(verify(md5, cache))
+			self.assertEqual(len(opened), 1)
+			self.assertTrue(verify(md5, cache))
+			self.assertEqual(len(opened), 0)
+
+			# A cached digest is used without reading the file.
+			wrong = dict(digests)
+			wrong["SHA512"] = hashlib.sha512(b"").hexdigest()
+			self.assertFalse(verify(wrong, cache))
+			self.assertEqual(len(opened), 0)
+
+			# A modified file is hashed again.
+			digests = write(b"content 2", age=20)
+			self.assertTrue(verify(digests, cache))
+			self.assertEqual(len(opened), 1)
+			self.assertTrue(verify(digests, cache))
+			self.assertEqual(len(opened), 0)
+
+			# A file which is modified in place is hashed again, even
+			# if its size and mtime are restored.
+			st = os.stat(filename)
+			with open(filename, "r+b") as f:
+				f.write(b"CONTENT 2")
+			os.utime(filename, (st.st_atime, st.st_mtime))
+			self.assertFalse(verify(digests, cache))
+			self.assertEqual(len(opened), 1)
+
+			# Recently modified files are not cached.
+			digests = write(b"content 3", age=0)
+			self.assertTrue(verify(digests, cache))
+			self.assertTrue(verify(digests, cache))
+			self.assertEqual(len(opened), 1)
+
+			# Sampled files are hashed again, even though they are
+			# cached.
+			digests = write(b"content 4")
+			self.assertTrue(verify(digests, cache))
+			cache = DigestCache(tmpdir, sample_rate=1)
+			self.assertTrue(verify(digests, cache))
+			self.assertEqual(len(opened), 1)
+			self.assertEqual(cache._sampled, {})
+
+			# Prelink verification does not use the cache.
+			del opened[:]
+			self.assertTrue(checksum.verify_all(filename, digests,
+				calc_prelink=1, digest_cache=DigestCache(tmpdir))[0])
+			self.assertEqual(len(opened), 1)
+		finally:
+			checksum._open_file = open_file
+			shutil.rmtree(tmpdir)
@@ -0,0 +1,62 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import shutil
+import stat
+import tempfile
+
+from portage import os
+from portage.tests import TestCase
+from portage.util._sqlite import SqliteDatabase
+
+class _TestDatabase(SqliteDatabase):
+
+	_format_version = "1"
+
+	def _init_tables(self, connection):
+		connection.execute("CREATE TABLE entries (key TEXT PRIMARY KEY)")
+
+class _NewTestDatabase(_TestDatabase):
+
+	_format_version = "2"
+
+class SqliteDatabaseTestCase(TestCase):
+
+	def testSqliteDatabase(self):
+
+		if not SqliteDatabase.available():
+			self.skipTest("sqlite is unavailable")
+
+		tmpdir = tempfile.mkdtemp()
+		try:
+			filename = os.path.join(tmpdir, "cache", "test.sqlite")
+			db = _TestDatabase(filename, perms=0o600)
+			self.assertEqual(db._connect(), None)
+			self.assertEqual(db._query("SELECT key FROM entries"), [])
+			self.assertFalse(os.path.exists(filename))
+
+			connection = db._connect(create=True)
+			self.assertEqual(stat.S_IMODE(os.stat(filename).st_mode), 0o600)
+			with connection:
+				connection.execute("INSERT INTO entries VALUES ('a')")
+			self.assertEqual(_TestDatabase(filename)._query(
+				"SELECT key FROM entries"), [("a",)])
+			db.close()
+
+			# A database with another format version is treated like a
+			# missing database, and replaced when it is created.
+			db = _NewTestDatabase(filename)
+			self.assertEqual(db._connect(), None)
+			self.assertEqual(db._query("SELECT key FROM entries"), [])
+			self.assertNotEqual(db._connect(create=True), None)
+			self.assertEqual(db._query("SELECT key FROM entries"), [])
+			self.assertEqual(db._query(
+				"SELECT value FROM info WHERE key = 'version'"), [("2",)])
+			db.close()
+
+			# Without _create_dirs, a missing directory is not created.
+			db = _TestDatabase(os.path.join(tmpdir, "missing", "test.sqlite"))
+			db._create_dirs = False
+			self.assertEqual(db._connect(create=True), None)
+		finally:
+			shutil.rmtree(tmpdir)
@@ -2,8 +2,10 @@
 # Copyright 2006 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
+import itertools
+
 from portage.tests import TestCase
-from portage.versions import vercmp
+from portage.versions import vercmp, _vercmp_key
 
 class VerCmpTestCase(TestCase):
 	""" A simple testCase for portage.versions.vercmp()
@@ -82,3 +84,21 @@ class VerCmpTestCase(TestCase):
 		]
 		for test in tests:
 			self.assertFalse(vercmp(test[0], test[1]) == 0, msg="%s == %s? Wrong!" % (test[0], test[1]))
+
+	def testVerCmpKey(self):
+
+		versions = [
+			"0", "0.0", "1", "1.0", "1.00", "1.0.0", "1.01", "1.010", "1.001",
+			"1.1", "1.02", "1.10", "1.9", "1.0b", "1b", "1z", "1.1b",
+			"1_alpha", "1_alpha1", "1_beta", "1_pre", "1_pre2", "1_rc1", "1_p",
+			"1_p0", "1_p1", "1_p1_alpha", "1_alpha_p1", "1b_p1", "1-r1",
+			"1.0-r0", "1.0-r1", "1.0-r10", "12.2.5", "12.2b", "9999",
+			"cvs.9999", "cvs.1.0-r1", "999999999999999999999999999999",
+		]
+		for v1, v2 in itertools.product(versions, repeat=2):
+			k1 = _vercmp_key(v1)
+			k2 = _vercmp_key(v2)
+			self.assertEqual((k1 > k2) - (k1 < k2), vercmp(v1, v2),
+				msg="%s <=> %s: %s != %s" % (v1, v2, k1, k2))
+
+		self.assertEqual(_vercmp_key("1.0-x"), None)
@@ -32,7 +32,7 @@ import glob
 import portage
 portage.proxy.lazyimport.lazyimport(globals(),
 	'pickle',
-	'portage.dep:Atom',
+	'portage.dep:Atom,_intern_atom',
 	'subprocess',
 )
 
@@ -451,7 +451,7 @@ def grabdict_package(myfilename, juststrings=0, recursive=0, newlines=0,
 
 		for k, v in d.items():
 			try:
-				k = Atom(k, allow_wildcard=allow_wildcard,
+				k = _intern_atom(k, allow_wildcard=allow_wildcard,
 					allow_repo=allow_repo,
 					allow_build_id=allow_build_id, eapi=eapi)
 			except InvalidAtom as e:
@@ -487,7 +487,7 @@ def grabfile_package(myfilename, compatlevel=0, recursive=0,
 		if pkg[:1] == '*' and mybasename == 'packages':
 			pkg = pkg[1:]
 		try:
-			pkg = Atom(pkg, allow_wildcard=allow_wildcard,
+			pkg = _intern_atom(pkg, allow_wildcard=allow_wildcard,
 				allow_repo=allow_repo, allow_build_id=allow_build_id,
 				eapi=eapi)
 		except InvalidAtom as e:
@@ -0,0 +1,353 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from __future__ import division
+
+import collections
+import select
+import threading
+
+try:
+	import asyncio
+except ImportError:
+	asyncio = None
+
+from ..SlotObject import SlotObject
+
+class AsyncioEventLoop(object):
+	"""
+	An implementation of the EventLoop interface which is backed by an
+	asyncio event loop. Timeouts are scheduled with call_later, SIGCHLD
+	is handled by an asyncio SafeChildWatcher (so that child processes
+	are reaped as soon as the signal arrives, instead of polling them
+	periodically), and IO watches are registered with an epoll instance
+	whose file descriptor is watched by the asyncio loop, so that
+	callbacks receive the same event masks as with EventLoop.
+
+	Callbacks commonly call the iteration method in order to wait for
+	other tasks, but an asyncio loop can not run while it is already
+	running. Therefore, the callbacks that are registered with the
+	asyncio loop only queue events and stop the loop, and the iteration
+	method calls the queued callbacks after the asyncio loop has
+	stopped.
+
+	SafeChildWatcher requires signal handlers, so this is only available
+	in the main thread.
+	"""
+
+	supports_multiprocessing = True
+
+	class _child_callback_class(SlotObject):
+		__slots__ = ("callback", "data", "pid", "source_id")
+
+	class _idle_callback_class(SlotObject):
+		__slots__ = ("args", "callback", "calling", "source_id")
+
+	class _io_handler_class(SlotObject):
+		__slots__ = ("args", "callback", "f", "source_id")
+
+	class _timeout_handler_class(SlotObject):
+		__slots__ = ("args", "function", "calling", "handle", "interval",
+			"source_id")
+
+	@staticmethod
+	def available():
+		"""
+		Return True if an instance can be created in the current thread.
+		"""
+		return asyncio is not None and \
+			hasattr(asyncio, "SafeChildWatcher") and \
+			hasattr(select, "epoll") and \
+			threading.current_thread() is threading.main_thread()
+
+	def __init__(self):
+		self._loop = asyncio.new_event_loop()
+		self._epoll = select.epoll()
+		self._loop.add_reader(self._epoll.fileno(), self._epoll_ready)
+		self.IO_ERR = select.EPOLLERR
+		self.IO_HUP = select.EPOLLHUP
+		self.IO_IN = select.EPOLLIN
+		self.IO_NVAL = 0
+		self.IO_OUT = select.EPOLLOUT
+		self.IO_PRI = select.EPOLLPRI
+
+		self._thread_ident = threading.get_ident()
+		self._thread_rlock = threading.RLock()
+		# Increment id for each new handler.
+		self._event_handler_id = 0
+		# Callbacks which are ready to be called by iteration().
+		self._pending = collections.deque()
+		self._child_handlers = {}
+		self._child_watcher = None
+		self._idle_callbacks = {}
+		self._io_handlers = {}
+		self._io_handler_ids = {}
+		self._timeout_handlers = {}
+
+	def _new_source_id(self):
+		"""
+		Generate a new source id. This method is thread-safe.
+		"""
+		with self._thread_rlock:
+			self._event_handler_id += 1
+			return self._event_handler_id
+
+	def _call_threadsafe(self, function, *args):
+		if threading.get_ident() == self._thread_ident:
+			function(*args)
+		else:
+			self._loop.call_soon_threadsafe(function, *args)
+
+	def _queue(self, function, *args):
+		"""
+		Queue a call for iteration(), and stop the asyncio loop so that
+		iteration() can make the call. This is the only kind of callback
+		that is called by the asyncio loop.
+		"""
+		self._pending.append((function, args))
+		if self._loop.is_running():
+			self._loop.stop()
+
+	def iteration(self, *args):
+		"""
+		Like EventLoop.iteration(), runs a single iteration. If events
+		are already queued (because this is a nested call from a
+		callback), then they are handled without polling. If there are
+		no event sources, then it returns False immediately.
+		@type may_block: bool
+		@param may_block: if True the call may block waiting for an event
+			(default is True).
+		@rtype: bool
+		@return: True if events were dispatched.
+		"""
+
+		may_block = True
+
+		if args:
+			if len(args) > 1:
+				raise TypeError(
+					"expected at most 1 argument (%s given)" % len(args))
+			may_block = args[0]
+
+		pending = self._pending
+		if not pending:
+			with self._thread_rlock:
+				registered = self._idle_callbacks or \
+					self._timeout_handlers
+			if not (registered or self._io_handlers or
+				self._child_handlers):
+				# Like EventLoop, don't block forever when there
+				# are no event sources.
+				return False
+			if not may_block:
+				self._loop.call_soon(self._loop.stop)
+			self._loop.run_forever()
+
+		events_handled = 0
+		# NOTE: Callbacks may be re-entrant, and nested calls consume
+		# the same queue.
+		while pending:
+			function, args = pending.popleft()
+			events_handled += 1
+			function(*args)
+
+		return bool(events_handled)
+
+	def child_watch_add(self, pid, callback, data=None):
+		"""
+		Like glib.child_watch_add(), sets callback to be called with the
+		user data specified by data when the child indicated by pid exits.
+		The signature for the callback is:
+
+			def callback(pid, condition, user_data)
+
+		where pid is is the child process id, condition is the status
+		information about the child process and user_data is data.
+
+		@type int
+		@param pid: process id of a child process to watch
+		@type callback: callable
+		@param callback: a function to call
+		@type data: object
+		@param data: the optional data to pass to function
+		@rtype: int
+		@return: an integer ID
+		"""
+		source_id = self._new_source_id()
+		self._child_handlers[source_id] = self._child_callback_class(
+			callback=callback, data=data, pid=pid, source_id=source_id)
+		if self._child_watcher is None:
+			self._child_watcher = asyncio.SafeChildWatcher()
+			self._child_watcher.attach_loop(self._loop)
+		# This calls _child_exit immediately if the process has
+		# already exited.
+		self._child_watcher.add_child_handler(pid, self._child_exit)
+		return source_id
+
+	def _child_exit(self, pid, returncode):
+		# Convert the returncode back into a wait status, which is what
+		# EventLoop passes to callbacks.
+		if returncode < 0:
+			condition = -returncode
+		else:
+			condition = returncode << 8
+		self._queue(self._dispatch_child, pid, condition)
+
+	def _dispatch_child(self, pid, condition):
+		for x in list(self._child_handlers.values()):
+			if x.pid == pid and x.source_id in self._child_handlers:
+				self.source_remove(x.source_id)
+				x.callback(pid, condition, x.data)
+
+	def idle_add(self, callback, *args):
+		"""
+		Like glib.idle_add(), if callback returns False it is
+		automatically removed from the list of event sources and will
+		not be called again. This method is thread-safe.
+
+		@type callback: callable
+		@param callback: a function to call
+		@rtype: int
+		@return: an integer ID
+		"""
+		source_id = self._new_source_id()
+		x = self._idle_callback_class(args=args, callback=callback,
+			calling=False, source_id=source_id)
+		with self._thread_rlock:
+			self._idle_callbacks[source_id] = x
+		self._call_threadsafe(self._schedule_idle, x)
+		return source_id
+
+	def _schedule_idle(self, x):
+		if x.source_id in self._idle_callbacks:
+			self._loop.call_soon(self._queue, self._dispatch_idle, x)
+
+	def _dispatch_idle(self, x):
+		if x.source_id not in self._idle_callbacks or x.calling:
+			# It was cancelled, or it is already being called (and
+			# it will be scheduled again when that call returns).
+			return
+		x.calling = True
+		try:
+			if x.callback(*x.args):
+				self._schedule_idle(x)
+			else:
+				self.source_remove(x.source_id)
+		finally:
+			x.calling = False
+
+	def timeout_add(self, interval, function, *args):
+		"""
+		Like glib.timeout_add(), interval argument is the number of
+		milliseconds between calls to your function, and your function
+		should return False to stop being called, or True to continue
+		being called. Any additional positional arguments given here
+		are passed to your function when it's called. This method is
+		thread-safe.
+		"""
+		source_id = self._new_source_id()
+		x = self._timeout_handler_class(args=args, function=function,
+			calling=False, handle=None, interval=interval,
+			source_id=source_id)
+		with self._thread_rlock:
+			self._timeout_handlers[source_id] = x
+		self._call_threadsafe(self._schedule_timeout, x)
+		return source_id
+
+	def _schedule_timeout(self, x):
+		if x.source_id in self._timeout_handlers:
+			x.handle = self._loop.call_later(x.interval / 1000,
+				self._queue, self._dispatch_timeout, x)
+
+	def _dispatch_timeout(self, x):
+		if x.source_id not in self._timeout_handlers:
+			return
+		# The next call is relative to the start of this one.
+		self._schedule_timeout(x)
+		if x.calling:
+			# don't call it recursively
+			return
+		x.calling = True
+		try:
+			if not x.function(*x.args):
+				self.source_remove(x.source_id)
+		finally:
+			x.calling = False
+
+	def io_add_watch(self, f, condition, callback, *args):
+		"""
+		Like glib.io_add_watch(), your function should return False to
+		stop being called, or True to continue being called. Any
+		additional positional arguments given here are passed to your
+		function when it's called.
+
+		@type f: int or object with fileno() method
+		@param f: a file descriptor to monitor
+		@type condition: int
+		@param condition: a condition mask
+		@type callback: callable
+		@param callback: a function to call
+		@rtype: int
+		@return: an integer ID of the event source
+		"""
+		if f in self._io_handler_ids:
+			raise AssertionError("fd %d is already registered" % f)
+		source_id = self._new_source_id()
+		self._io_handler_ids[f] = source_id
+		self._io_handlers[source_id] = self._io_handler_class(
+			args=args, callback=callback, f=f, source_id=source_id)
+		self._epoll.register(f, condition)
+		return source_id
+
+	def _epoll_ready(self):
+		for f, event in self._epoll.poll(0):
+			source_id = self._io_handler_ids.get(f)
+			if source_id is not None:
+				self._queue(self._dispatch_io, source_id, f, event)
+
+	def _dispatch_io(self, source_id, f, event):
+		# Events that were queued for a removed source are discarded,
+		# in case the file descriptor has been reallocated.
+		x = self._io_handlers.get(source_id)
+		if x is not None and not x.callback(f, event, *x.args):
+			self.source_remove(source_id)
+
+	def source_remove(self, reg_id):
+		"""
+		Like glib.source_remove(), this returns True if the given reg_id
+		is found and removed, and False if the reg_id is invalid or has
+		already been removed.
+		"""
+		x = self._child_handlers.pop(reg_id, None)
+		if x is not None:
+			if not any(y.pid == x.pid for y in
+				self._child_handlers.values()):
+				self._child_watcher.remove_child_handler(x.pid)
+			return True
+
+		with self._thread_rlock:
+			if self._idle_callbacks.pop(reg_id, None) is not None:
+				return True
+			x = self._timeout_handlers.pop(reg_id, None)
+			if x is not None:
+				if x.handle is not None:
+					x.handle.cancel()
+				return True
+
+		x = self._io_handlers.pop(reg_id, None)
+		if x is None:
+			return False
+		del self._io_handler_ids[x.f]
+		self._epoll.unregister(x.f)
+		return True
+
+	def close(self):
+		"""
+		Close the asyncio loop, and restore the default SIGCHLD handler.
+		The instance must not be used afterwards.
+		"""
+		if self._child_watcher is not None:
+			self._child_watcher.close()
+			self._child_watcher = None
+		self._loop.close()
+		self._epoll.close()
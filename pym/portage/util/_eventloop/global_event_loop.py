@@ -1,4 +1,4 @@
-# Copyright 2012 Gentoo Foundation
+# Copyright 2012-2016 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
 import os
@@ -29,6 +29,11 @@ def global_event_loop():
 	constructor = _default_constructor
 	if not constructor.supports_multiprocessing and pid != _MAIN_PID:
 		constructor = _multiprocessing_constructor
+	if os.environ.get("PORTAGE_EVENT_LOOP") == "asyncio":
+		# Imported on demand, since importing asyncio is slow.
+		from .AsyncioEventLoop import AsyncioEventLoop
+		if AsyncioEventLoop.available():
+			constructor = AsyncioEventLoop
 
 	instance = constructor()
 	_instances[pid] = instance
@@ -0,0 +1,57 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+__all__ = ['LRUCache']
+
+class LRUCache(object):
+	"""
+	A bounded mapping that discards the least recently used entries when
+	it grows beyond max_size. In order to keep lookups cheap, eviction is
+	done in batches: when the limit is exceeded, the least recently used
+	quarter of the entries is discarded at once. Hit and miss counts are
+	recorded for diagnostic purposes.
+	"""
+
+	__slots__ = ('max_size', 'hits', 'misses', '_data', '_tick')
+
+	def __init__(self, max_size):
+		if max_size < 1:
+			raise ValueError("max_size must be at least 1: %s" % (max_size,))
+		self.max_size = max_size
+		self.hits = 0
+		self.misses = 0
+		self._data = {}
+		self._tick = 0
+
+	def get(self, key, default=None):
+		entry = self._data.get(key)
+		if entry is None:
+			self.misses += 1
+			return default
+		self.hits += 1
+		self._tick += 1
+		entry[0] = self._tick
+		return entry[1]
+
+	def __setitem__(self, key, value):
+		self._tick += 1
+		self._data[key] = [self._tick, value]
+		if len(self._data) > self.max_size:
+			self._evict()
+
+	def __contains__(self, key):
+		return key in self._data
+
+	def __len__(self):
+		return len(self._data)
+
+	def clear(self):
+		self._data.clear()
+		self.hits = 0
+		self.misses = 0
+
+	def _evict(self):
+		data = self._data
+		count = max(1, len(data) - self.max_size + self.max_size // 4)
+		for key in sorted(data, key=lambda k: data[k][0])[:count]:
+			del data[key]
@@ -0,0 +1,154 @@
+# Copyright 2016 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from portage import os
+from portage import _unicode_decode
+from portage.exception import PortageException
+from portage.localization import _
+from portage.util import apply_secpass_permissions, ensure_dirs, writemsg
+
+class SqliteDatabase(object):
+	"""
+	A base class for the disposable sqlite databases that portage uses
+	as caches and indexes. It manages a connection, which is replaced in
+	forked processes since it can't be shared with the parent process,
+	and an "info" table which records the format version. If the version
+	of an existing database does not match _format_version, then it is
+	treated like a missing database, and all of its tables are replaced
+	when it is opened with create=True.
+
+	Subclasses define _format_version, and create their own tables in
+	_init_tables. The gid and perms arguments are applied to the database
+	file when it is created, like those of cache modules.
+	"""
+
+	_format_version = None
+
+	# Use a longer timeout than the default 5.0 seconds, since
+	# concurrent processes may hold the database lock while writing.
+	_timeout = 15
+
+	# If False, then the database is only created if its directory
+	# already exists and is writable.
+	_create_dirs = True
+
+	def __init__(self, filename, gid=-1, perms=-1):
+		self._filename = filename
+		self._gid = gid
+		self._perms = perms
+		self._connection = None
+		self._pid = None
+		self._db_module = self._import_sqlite()
+
+	@classmethod
+	def available(cls):
+		return cls._import_sqlite() is not None
+
+	@staticmethod
+	def _import_sqlite():
+		# sqlite3 is optional with >=python-2.5
+		try:
+			import sqlite3
+		except ImportError:
+			return None
+		return sqlite3
+
+	def _connect(self, create=False):
+		"""
+		Return a connection, or None if sqlite is unavailable, or if the
+		database does not exist or has an incompatible format version and
+		create is False, or if it can't be created.
+		"""
+		if self._db_module is None:
+			return None
+		if self._connection is not None and self._pid != os.getpid():
+			self._connection = None
+		if self._connection is None:
+			exists = os.path.exists(self._filename)
+			if not exists:
+				if not create:
+					return None
+				parent = os.path.dirname(self._filename)
+				if self._create_dirs:
+					try:
+						ensure_dirs(parent)
+					except (EnvironmentError, PortageException):
+						return None
+				elif not os.access(parent, os.W_OK):
+					return None
+			connection = self._db_module.connect(
+				_unicode_decode(self._filename), timeout=self._timeout)
+			if not self._check_version(connection):
+				if not create:
+					connection.close()
+					return None
+				self._create_tables(connection)
+				if not exists:
+					apply_secpass_permissions(self._filename,
+						gid=self._gid, mode=self._perms)
+			self._connection = connection
+			self._pid = os.getpid()
+		return self._connection
+
+	def _writable(self):
+		"""
+		Return True if the database exists and is writable, or if it
+		doesn't exist and it can be created by the current user.
+		"""
+		if os.path.exists(self._filename):
+			return os.access(self._filename, os.W_OK)
+		parent = os.path.dirname(self._filename)
+		if self._create_dirs:
+			while not os.path.exists(parent):
+				parent = os.path.dirname(parent)
+		return os.access(parent, os.W_OK)
+
+	def _check_version(self, connection):
+		try:
+			version = connection.execute(
+				"SELECT value FROM info WHERE key = 'version'").fetchone()
+		except self._db_module.Error:
+			return False
+		return version is not None and version[0] == self._format_version
+
+	def _create_tables(self, connection):
+		with connection:
+			for row in connection.execute("SELECT name FROM sqlite_master "
+				"WHERE type = 'table'").fetchall():
+				connection.execute("DROP TABLE %s" % row[0])
+			connection.execute("CREATE TABLE info "
+				"(key TEXT PRIMARY KEY, value TEXT)")
+			self._init_tables(connection)
+			connection.execute("INSERT INTO info VALUES ('version', ?)",
+				(self._format_version,))
+
+	def _init_tables(self, connection):
+		"""
+		Create the tables of the subclass, other than "info".
+		"""
+		raise NotImplementedError(self)
+
+	def _error(self, e):
+		writemsg(_("!!! Error accessing '%s': %s\n") %
+			(self._filename, e), noiselevel=-1)
+		self._connection = None
+
+	def _query(self, statement, params=()):
+		"""
+		Return all rows of a query, or an empty list if the database
+		does not exist or is not usable.
+		"""
+		try:
+			connection = self._connect()
+			if connection is None:
+				return []
+			return connection.execute(statement, params).fetchall()
+		except self._db_module.Error as e:
+			self._error(e)
+			return []
+
+	def close(self):
+		if self._connection is not None:
+			if self._pid == os.getpid():
+				self._connection.close()
+			self._connection = None
@@ -23,7 +23,6 @@ else:
 import portage
 portage.proxy.lazyimport.lazyimport(globals(),
 	'portage.repository.config:_gen_valid_repo',
-	'portage.util:cmp_sort_key',
 )
 from portage import _unicode_decode
 from portage.eapi import _get_eapi_attrs
@@ -268,6 +267,56 @@ def vercmp(ver1, ver2, silent=1):
 	rval = (r1 > r2) - (r1 < r2)
 	return rval
 	
+def _vercmp_key(ver):
+	"""
+	Create a key for sorting versions, such that comparison of the keys of
+	two versions gives the same result as vercmp() for them. This parses the
+	version only once, instead of once per comparison.
+
+	@param ver: version (see ver_regexp in portage.versions.py)
+	@type ver: string (example: "2.1.2-r3")
+	@rtype: tuple or None
+	@return: the sort key, or None if ver is invalid
+	"""
+	match = ver_regexp.match(ver)
+	if not match or not match.groups():
+		return None
+
+	components = []
+	if match.group(3):
+		for x in match.group(3)[1:].split("."):
+			if x[:1] == "0":
+				# vercmp compares these as decimal fractions (so that
+				# 1.02 < 1.1), which is equivalent to a string comparison
+				# of the digits without trailing zeros. They are always
+				# lower than components without a leading zero. Missing
+				# components are lower than any others, like the implicit
+				# -1 in vercmp, due to tuple comparison.
+				components.append((0, x.rstrip("0")))
+			else:
+				components.append((1, int(x)))
+
+	if match.group(5):
+		letter = ord(match.group(5))
+	else:
+		letter = -1
+
+	suffixes = []
+	for x in match.group(6).split("_")[1:]:
+		suffix, number = suffix_regexp.match(x).groups()
+		suffixes.append((suffix_value[suffix], int(number or 0)))
+	# Terminate with the value of the implicit _p-1 that vercmp uses
+	# for missing suffixes, so that 1_alpha < 1 < 1_p0.
+	suffixes.append((suffix_value["p"], -1))
+
+	if match.group(10):
+		revision = int(match.group(10))
+	else:
+		revision = 0
+
+	return (1 if match.group(1) else 0, int(match.group(2)),
+		tuple(components), letter, tuple(suffixes), revision)
+
 def pkgcmp(pkg1, pkg2):
 	"""
 	Compare 2 package versions created in pkgsplit format.
@@ -443,6 +492,19 @@ class _pkg_str(_unicode):
 					var = default
 		return var
 
+	@property
+	def version_key(self):
+		"""
+		A key for sorting by version, equivalent to comparison with
+		vercmp() (see _vercmp_key). It is computed once and cached.
+		"""
+		try:
+			return self.__dict__['_version_key']
+		except KeyError:
+			key = _vercmp_key(self.version)
+			self.__dict__['_version_key'] = key
+			return key
+
 	@property
 	def stable(self):
 		try:
@@ -517,50 +579,29 @@ def cpv_getversion(mycpv, eapi=None):
 def cpv_sort_key(eapi=None):
 	"""
 	Create an object for sorting cpvs, to be used as the 'key' parameter
-	in places like list.sort() or sorted(). This calls catpkgsplit() once for
-	each cpv and caches the result. If a given cpv is invalid or two cpvs
-	have different category/package names, then plain string (> and <)
-	comparison is used.
+	in places like list.sort() or sorted(). The key of each cpv consists of
+	its category/package name and its version_key, so that versions are
+	parsed only once per cpv. Invalid cpvs are sorted by plain string (>
+	and <) comparison.
 
 	@rtype: key object for sorting
 	@return: object for use as the 'key' parameter in places like
 		list.sort() or sorted()
 	"""
 
-	split_cache = {}
-
-	def cmp_cpv(cpv1, cpv2):
-
-		split1 = split_cache.get(cpv1, False)
-		if split1 is False:
-			split1 = None
-			try:
-				split1 = cpv1.cpv
-			except AttributeError:
-				try:
-					split1 = _pkg_str(cpv1, eapi=eapi)
-				except InvalidData:
-					pass
-			split_cache[cpv1] = split1
-
-		split2 = split_cache.get(cpv2, False)
-		if split2 is False:
-			split2 = None
+	def sort_key(cpv):
+		try:
+			cpv = cpv.cpv
+		except AttributeError:
 			try:
-				split2 = cpv2.cpv
-			except AttributeError:
-				try:
-					split2 = _pkg_str(cpv2, eapi=eapi)
-				except InvalidData:
-					pass
-			split_cache[cpv2] = split2
-
-		if split1 is None or split2 is None or split1.cp != split2.cp:
-			return (cpv1 > cpv2) - (cpv1 < cpv2)
+				cpv = _pkg_str(cpv, eapi=eapi)
+			except InvalidData:
+				# Invalid cpvs sort before valid cpvs with
+				# the same string value.
+				return (cpv, ())
+		return (cpv.cp, cpv.version_key)
 
-		return vercmp(split1.version, split2.version)
-
-	return cmp_sort_key(cmp_cpv)
+	return sort_key
 
 def catsplit(mydep):
 	return mydep.split("/", 1)
@@ -571,17 +612,10 @@ def best(mymatches, eapi=None):
 		return ""
 	if len(mymatches) == 1:
 		return mymatches[0]
-	bestmatch = mymatches[0]
-	try:
-		v2 = bestmatch.version
-	except AttributeError:
-		v2 = _pkg_str(bestmatch, eapi=eapi).version
-	for x in mymatches[1:]:
+	def version_key(x):
 		try:
-			v1 = x.version
+			return x.cpv.version_key
 		except AttributeError:
-			v1 = _pkg_str(x, eapi=eapi).version
-		if vercmp(v1, v2) > 0:
-			bestmatch = x
-			v2 = v1
-	return bestmatch
+			return _pkg_str(x, eapi=eapi).version_key
+	# max returns the first of equal matches, as vercmp did
+	return max(mymatches, key=version_key)